@@ -0,0 +1,188 @@
+"""Vectorized analytics over a family's transactions.
+
+A :class:`TransactionFrame` holds one date range of a family's transactions
+as parallel numpy arrays: epoch-second dates, float amounts, and integer
+codes for type, category and user. Totals, per-category breakdowns and
+monthly series are then ``np.bincount`` group-bys over those codes, so
+recomputing a view (another user filter, a sub-range) costs microseconds
+once the frame is loaded.
+
+Frames also cover archived periods (see :mod:`archive`): a monthly summary
+enters the frame as one row holding the month's total, with ``counts``
+recording how many transactions it stands for.
+
+:class:`AnalyticsEngine` keeps the most recently used frames per family and
+keys them on :func:`cache.family_version`; any write that calls
+``invalidate_family`` makes the family's frames unreachable.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import Request
+
+from archive import cold_rows
+from cache import LRUCache, family_version
+
+TYPES = ("income", "expense", "investment", "transfer")
+OTHER_TYPE = len(TYPES)  # code for any type not listed above
+TYPE_CODES = {name: code for code, name in enumerate(TYPES)}
+UNKNOWN_CATEGORY = "Unknown"
+
+
+def epoch_seconds(values) -> np.ndarray:
+    """ISO date strings (or datetimes) to int64 epoch seconds; offsets are ignored, as in the queries."""
+    return np.array([str(v)[:19] for v in values], dtype="datetime64[s]").astype(np.int64)
+
+
+def _bound(value: Optional[datetime]) -> Optional[int]:
+    return None if value is None else int(np.datetime64(value.replace(tzinfo=None), "s").astype(np.int64))
+
+
+@dataclass
+class TransactionFrame:
+    dates: np.ndarray        # int64 epoch seconds
+    amounts: np.ndarray      # float64
+    types: np.ndarray        # int8 codes into TYPES, OTHER_TYPE otherwise
+    categories: np.ndarray   # int32 codes into category_names, -1 without a category
+    users: np.ndarray        # int32 codes into user_ids
+    counts: np.ndarray       # int64 transactions per row: 1, or the size of an archived summary
+    summarized: np.ndarray   # bool, True for the rows of archived summaries
+    category_ids: List[str]
+    category_names: List[str]
+    user_ids: List[str]
+    _user_codes: Dict[str, int] = field(default_factory=dict, repr=False)
+
+    def __len__(self):
+        return len(self.amounts)
+
+    @classmethod
+    def build(cls, transactions: List[dict], categories: List[dict]) -> "TransactionFrame":
+        names = {c["id"]: c.get("name", UNKNOWN_CATEGORY) for c in categories}
+        category_codes: Dict[str, int] = {}
+        user_codes: Dict[str, int] = {}
+        category_column, user_column = [], []
+        for t in transactions:
+            category_id = t.get("category_id")
+            category_column.append(
+                category_codes.setdefault(category_id, len(category_codes)) if category_id else -1
+            )
+            user_column.append(user_codes.setdefault(t.get("user_id"), len(user_codes)))
+        category_ids = list(category_codes)
+        return cls(
+            dates=epoch_seconds([t["date"] for t in transactions]),
+            amounts=np.array([t["amount"] for t in transactions], dtype=np.float64),
+            types=np.array([TYPE_CODES.get(t.get("type"), OTHER_TYPE) for t in transactions], dtype=np.int8),
+            categories=np.array(category_column, dtype=np.int32),
+            users=np.array(user_column, dtype=np.int32),
+            counts=np.array([t.get("count", 1) for t in transactions], dtype=np.int64),
+            summarized=np.array(["count" in t for t in transactions], dtype=bool),
+            category_ids=category_ids,
+            category_names=[names.get(c, UNKNOWN_CATEGORY) for c in category_ids],
+            user_ids=list(user_codes),
+            _user_codes=user_codes,
+        )
+
+    def mask(self, user_id: Optional[str] = None, start: Optional[datetime] = None,
+             end: Optional[datetime] = None) -> Optional[np.ndarray]:
+        """Boolean row selector, or ``None`` for every row. ``end`` is exclusive."""
+        selected = None
+        if user_id:
+            code = self._user_codes.get(user_id, -1)
+            selected = self.users == code
+        for bound, compare in ((_bound(start), np.greater_equal), (_bound(end), np.less)):
+            if bound is not None:
+                in_range = compare(self.dates, bound)
+                selected = in_range if selected is None else selected & in_range
+        return selected
+
+
+def _select(frame: TransactionFrame, mask: Optional[np.ndarray], *columns):
+    if mask is None:
+        return [getattr(frame, c) for c in columns]
+    return [getattr(frame, c)[mask] for c in columns]
+
+
+def count(frame: TransactionFrame, mask: Optional[np.ndarray] = None) -> int:
+    """Number of transactions, including those behind archived summaries."""
+    counts, = _select(frame, mask, "counts")
+    return int(counts.sum())
+
+
+def totals(frame: TransactionFrame, mask: Optional[np.ndarray] = None) -> Dict[str, float]:
+    """Sum of amounts per transaction type."""
+    types, amounts = _select(frame, mask, "types", "amounts")
+    sums = np.bincount(types, weights=amounts, minlength=len(TYPES) + 1)
+    return {name: float(sums[code]) for code, name in enumerate(TYPES)}
+
+
+def by_category(frame: TransactionFrame, mask: Optional[np.ndarray] = None,
+                types=("income", "expense", "investment")) -> Dict[str, Dict[str, float]]:
+    """``{type: {category name: total}}``; transactions without a category are skipped."""
+    type_codes, category_codes, amounts = _select(frame, mask, "types", "categories", "amounts")
+    width = len(frame.category_ids)
+    result: Dict[str, Dict[str, float]] = {name: {} for name in types}
+    if width == 0:
+        return result
+    has_category = category_codes >= 0
+    index = type_codes[has_category].astype(np.int64) * width + category_codes[has_category]
+    size = (len(TYPES) + 1) * width
+    sums = np.bincount(index, weights=amounts[has_category], minlength=size).reshape(-1, width)
+    counts = np.bincount(index, minlength=size).reshape(-1, width)
+    for name in types:
+        code = TYPE_CODES[name]
+        breakdown = result[name]
+        for category in np.flatnonzero(counts[code]):
+            label = frame.category_names[category]
+            breakdown[label] = breakdown.get(label, 0.0) + float(sums[code, category])
+    return result
+
+
+def monthly(frame: TransactionFrame, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """12 x len(TYPES) array of totals by calendar month (row 0 is January) and type."""
+    dates, type_codes, amounts = _select(frame, mask, "dates", "types", "amounts")
+    months = dates.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64) % 12
+    index = months * (len(TYPES) + 1) + type_codes
+    sums = np.bincount(index, weights=amounts, minlength=12 * (len(TYPES) + 1))
+    return sums.reshape(12, len(TYPES) + 1)[:, :len(TYPES)]
+
+
+class AnalyticsEngine:
+    """Per-family LRU of :class:`TransactionFrame` objects keyed by date range."""
+
+    def __init__(self, max_families: int = 256, frames_per_family: int = 8):
+        self.frames_per_family = frames_per_family
+        self._families = LRUCache(max_families)  # family_id -> (version, LRUCache)
+        self.hits = 0
+        self.misses = 0
+
+    async def frame(self, repos, family_id: str, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None) -> TransactionFrame:
+        version = family_version(family_id)
+        entry: Optional[Tuple[int, LRUCache]] = self._families.get(family_id)
+        if entry is None or entry[0] != version:
+            entry = (version, LRUCache(self.frames_per_family))
+            self._families.put(family_id, entry)
+        frames = entry[1]
+        key = (start, end)
+        frame = frames.get(key)
+        if frame is not None:
+            self.hits += 1
+            return frame
+        self.misses += 1
+        transactions = await repos.transactions.list(family_id, start=start, end=end)
+        transactions += await cold_rows(repos, family_id, start, end)
+        categories = await repos.categories.list_by_family(family_id)
+        frame = TransactionFrame.build(transactions, categories)
+        # A write during the load bumped the version; the frame is stale, so do not keep it
+        if family_version(family_id) == version:
+            frames.put(key, frame)
+        return frame
+
+    def invalidate(self, family_id: str) -> None:
+        self._families.pop(family_id)
+
+
+def get_analytics(request: Request) -> AnalyticsEngine:
+    return request.app.state.analytics
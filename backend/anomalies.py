@@ -0,0 +1,279 @@
+"""Streaming detection of unusual spending per category.
+
+For every (family, expense category) the detector keeps running statistics
+that are updated in O(1) per transaction:
+
+  * Welford mean and variance of single transaction amounts, plus an EWMA
+    of them to show the recent level,
+  * Welford mean and variance of completed monthly totals, and the total of
+    the month in progress.
+
+A transaction is flagged when its amount is more than ``ANOMALY_SIGMA``
+standard deviations above the category's mean (after at least
+:data:`MIN_TRANSACTIONS`), and a month when its running total first crosses
+the same bound over past months (after at least :data:`MIN_MONTHS`).
+
+State lives in process, per family, and follows the detector's own
+transaction writes: ``create_transaction`` feeds each new expense through
+:meth:`AnomalyDetector.observe`, edits and deletes take the old document
+back out and the recurring scheduler adds what it posts, all through
+:meth:`AnomalyDetector.record`, so no write rescans the history. The EWMA
+cannot be unwound and keeps a removed amount until it decays.
+
+The state is built by replaying the family's history in date order, which
+also recovers the list of past anomalies. A write to a family without state
+(first use, or evicted from the ``max_families`` LRU) starts the replay in
+the background and raises nothing itself, so no insert waits for it. A read
+replays inline when there is no state, and when it comes at least
+``ANOMALY_REFRESH_SECONDS`` (300) after the build while the family's data
+version (see :mod:`cache`) moved past the last write the state followed:
+imports, another worker's writes and category changes are picked up then,
+at most one replay per interval.
+"""
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, List, Optional
+import asyncio
+import logging
+import math
+import os
+import time
+
+from fastapi import Request
+
+from cache import LRUCache, family_version
+
+logger = logging.getLogger(__name__)
+
+MIN_TRANSACTIONS = 5
+MIN_MONTHS = 3
+EWMA_ALPHA = 0.1
+MAX_GAP_MONTHS = 24  # empty months filled in as zero spend, at most this many
+RECENT_ANOMALIES = 100
+
+
+@dataclass
+class RunningStats:
+    """Welford mean and variance, with removal so a single value can be replaced."""
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def remove(self, value: float) -> None:
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        mean = (self.count * self.mean - value) / (self.count - 1)
+        self.m2 = max(0.0, self.m2 - (value - self.mean) * (value - mean))
+        self.mean = mean
+        self.count -= 1
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def bound(self, sigma: float) -> float:
+        return self.mean + sigma * self.std
+
+
+def month_key(date) -> str:
+    return str(date)[:7]
+
+
+def _next_month(key: str) -> str:
+    year, month = int(key[:4]), int(key[5:7])
+    return f"{year + month // 12}-{month % 12 + 1:02d}"
+
+
+@dataclass
+class CategoryStats:
+    amounts: RunningStats = field(default_factory=RunningStats)
+    ewma: Optional[float] = None
+    months: Dict[str, float] = field(default_factory=dict)  # month -> total
+    monthly: RunningStats = field(default_factory=RunningStats)  # over every month but the open one
+    open_month: Optional[str] = None
+
+    def _advance(self, month: str) -> None:
+        """Close months up to ``month``, which becomes the month in progress."""
+        if self.open_month is not None:
+            self.monthly.add(self.months.get(self.open_month, 0.0))
+            gap = _next_month(self.open_month)
+            for _ in range(MAX_GAP_MONTHS):
+                if gap >= month:
+                    break
+                self.months[gap] = 0.0
+                self.monthly.add(0.0)
+                gap = _next_month(gap)
+        self.open_month = month
+
+    def observe(self, doc: dict, sigma: float) -> List[dict]:
+        amount, month = float(doc["amount"]), month_key(doc["date"])
+        found = []
+        base = {"transaction_id": doc["id"], "category_id": doc["category_id"], "date": doc["date"], "month": month}
+
+        if self.amounts.count >= MIN_TRANSACTIONS and amount > self.amounts.bound(sigma):
+            found.append({
+                **base, "kind": "transaction", "amount": amount,
+                "mean": round(self.amounts.mean, 2), "std": round(self.amounts.std, 2),
+                "sigma": round((amount - self.amounts.mean) / self.amounts.std, 2) if self.amounts.std else None,
+            })
+        self.amounts.add(amount)
+        self.ewma = amount if self.ewma is None else EWMA_ALPHA * amount + (1 - EWMA_ALPHA) * self.ewma
+
+        if self.open_month is None or month > self.open_month:
+            self._advance(month)
+        previous = self.months.get(month, 0.0)
+        total = self.months[month] = previous + amount
+        if month != self.open_month:
+            # Back-dated into a closed month: swap its total in the monthly statistics
+            self.monthly.remove(previous)
+            self.monthly.add(total)
+        elif self.monthly.count >= MIN_MONTHS:
+            bound = self.monthly.bound(sigma)
+            if previous <= bound < total:
+                found.append({
+                    **base, "kind": "month_to_date", "total": round(total, 2),
+                    "mean": round(self.monthly.mean, 2), "std": round(self.monthly.std, 2),
+                    "sigma": round((total - self.monthly.mean) / self.monthly.std, 2) if self.monthly.std else None,
+                })
+        return found
+
+    def remove(self, doc: dict) -> None:
+        amount, month = float(doc["amount"]), month_key(doc["date"])
+        self.amounts.remove(amount)
+        if month not in self.months:
+            return
+        previous = self.months[month]
+        total = self.months[month] = previous - amount
+        if month != self.open_month:
+            self.monthly.remove(previous)
+            self.monthly.add(total)
+
+    def summary(self, sigma: float) -> dict:
+        return {
+            "transactions": self.amounts.count,
+            "mean_amount": round(self.amounts.mean, 2),
+            "std_amount": round(self.amounts.std, 2),
+            "ewma_amount": round(self.ewma or 0.0, 2),
+            "month": self.open_month,
+            "month_to_date": round(self.months.get(self.open_month, 0.0), 2),
+            "monthly_mean": round(self.monthly.mean, 2),
+            "monthly_std": round(self.monthly.std, 2),
+            "monthly_bound": round(self.monthly.bound(sigma), 2) if self.monthly.count >= MIN_MONTHS else None,
+        }
+
+
+@dataclass
+class FamilyAnomalies:
+    version: int = 0  # family data version of the last write followed
+    built_at: float = field(default_factory=time.monotonic)
+    categories: Dict[str, CategoryStats] = field(default_factory=dict)
+    recent: Deque[dict] = field(default_factory=lambda: deque(maxlen=RECENT_ANOMALIES))
+
+    def observe(self, doc: dict, sigma: float) -> List[dict]:
+        if doc.get("type") != "expense" or not doc.get("category_id"):
+            return []
+        stats = self.categories.get(doc["category_id"])
+        if stats is None:
+            stats = self.categories[doc["category_id"]] = CategoryStats()
+        found = stats.observe(doc, sigma)
+        self.recent.extend(found)
+        return found
+
+    def remove(self, doc: dict) -> None:
+        if doc.get("type") != "expense" or doc.get("category_id") not in self.categories:
+            return
+        self.categories[doc["category_id"]].remove(doc)
+        if any(a["transaction_id"] == doc["id"] for a in self.recent):
+            self.recent = deque((a for a in self.recent if a["transaction_id"] != doc["id"]),
+                                maxlen=RECENT_ANOMALIES)
+
+
+class AnomalyDetector:
+    """Per-family :class:`FamilyAnomalies`, advanced one transaction write at a time."""
+
+    def __init__(self, sigma: float = 3.0, refresh_seconds: float = 300.0, max_families: int = 256):
+        self.sigma = sigma
+        self.refresh_seconds = refresh_seconds
+        self._families = LRUCache(max_families)
+        self._building: Dict[str, asyncio.Task] = {}
+        self.rebuilds = 0
+
+    @classmethod
+    def from_env(cls, env=None) -> "AnomalyDetector":
+        env = os.environ if env is None else env
+        return cls(
+            sigma=float(env.get("ANOMALY_SIGMA", 3.0)),
+            refresh_seconds=float(env.get("ANOMALY_REFRESH_SECONDS", 300)),
+        )
+
+    async def family(self, repos, family_id: str) -> FamilyAnomalies:
+        version = family_version(family_id)
+        state: Optional[FamilyAnomalies] = self._families.get(family_id)
+        if state is not None and (
+            state.version == version or time.monotonic() - state.built_at < self.refresh_seconds
+        ):
+            return state
+        building = self._building.get(family_id)
+        if state is None and building is not None:
+            return await asyncio.shield(building)
+        return await self._build(repos, family_id)
+
+    async def _build(self, repos, family_id: str) -> FamilyAnomalies:
+        state = FamilyAnomalies(family_version(family_id))
+        history = await repos.transactions.list(family_id, type="expense")
+        history.sort(key=lambda t: (str(t["date"]), str(t.get("created_at"))))
+        for doc in history:
+            state.observe(doc, self.sigma)
+        self.rebuilds += 1
+        self._families.put(family_id, state)
+        return state
+
+    def _build_later(self, repos, family_id: str) -> None:
+        if family_id in self._building:
+            return
+        task = self._building[family_id] = asyncio.get_running_loop().create_task(self._build(repos, family_id))
+
+        def done(finished: asyncio.Task) -> None:
+            self._building.pop(family_id, None)
+            if not finished.cancelled() and finished.exception() is not None:
+                logger.warning("Could not build the anomaly state of family %s: %s", family_id, finished.exception())
+
+        task.add_done_callback(done)
+
+    def record(self, family_id: str, version: int, docs: Iterable[dict] = (),
+               removed: Optional[dict] = None) -> List[dict]:
+        """Apply one write that moved ``family_id`` to ``version``; returns the anomalies ``docs`` raised.
+
+        ``removed`` is the previous document of an edit or delete. Nothing is
+        kept for a family whose state has not been built yet.
+        """
+        state: Optional[FamilyAnomalies] = self._families.get(family_id)
+        if state is None:
+            return []
+        if removed is not None:
+            state.remove(removed)
+        found = []
+        for doc in sorted(docs, key=lambda t: (str(t["date"]), str(t.get("created_at")))):
+            found += state.observe(doc, self.sigma)
+        if state.version == version - 1:
+            state.version = version
+        return found
+
+    def observe(self, repos, family_id: str, version: int, doc: dict) -> List[dict]:
+        """Anomalies raised by ``doc``, the insert that moved ``family_id`` to ``version``."""
+        if family_id in self._families:
+            return self.record(family_id, version, [doc])
+        # No state: the replay, which includes ``doc``, runs in the background
+        self._build_later(repos, family_id)
+        return []
+
+
+def get_anomaly_detector(request: Request) -> AnomalyDetector:
+    return request.app.state.anomalies
@@ -0,0 +1,153 @@
+"""Hot/cold archival of old transactions.
+
+The ``archive_transactions`` job (see :mod:`jobs`) moves a family's
+transactions dated before a month-aligned cutoff, by default
+``ARCHIVE_HORIZON_MONTHS`` (24) months back (see :class:`Archiver`), in
+batches of ``ARCHIVE_BATCH_SIZE`` (1000), from ``transactions`` into
+``transactions_archive``, and keeps one summary per (month, type, category,
+user) of what was archived (see :class:`repositories.base.ArchiveRepository`).
+The hot collection, and its indexes, then only hold recent activity.
+
+:func:`cold_rows` is how the analytics frames read the archived part of a
+range: whole archived months come back as one row per summary, carrying a
+``count`` of the transactions it stands for, and the partial months at the
+edges of a custom range as the archived rows themselves. Hot rows are always
+read as well, so a transaction back-dated into an archived month is counted
+and is moved on the next run. Archived transactions can no longer be edited
+or deleted one by one.
+
+Until the job moves the horizon at the end of its run, figures for the
+months it is archiving are short; it invalidates the family's caches when
+it is done.
+"""
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+import os
+import re
+
+from cache import invalidate_family
+
+HORIZON_MONTHS = 24
+BATCH_SIZE = 1000
+MONTH = re.compile(r"\d{4}-(0[1-9]|1[0-2])")
+
+
+def month_key(value: datetime) -> str:
+    return f"{value.year}-{value.month:02d}"
+
+
+def month_start(key: str) -> datetime:
+    return datetime(int(key[:4]), int(key[5:7]), 1)
+
+
+def _floor(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(value: datetime) -> datetime:
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def default_cutoff(now: Optional[datetime] = None, months: int = HORIZON_MONTHS) -> str:
+    """The month ``months`` before ``now``'s; everything dated earlier is archived."""
+    now = now or datetime.now()
+    index = now.year * 12 + now.month - 1 - months
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def summary_row(summary: dict) -> dict:
+    """A summary in the shape of a transaction, dated on the first of its month."""
+    return {
+        "date": f"{summary['month']}-01T00:00:00",
+        "amount": summary["amount"],
+        "type": summary.get("type"),
+        "category_id": summary.get("category_id"),
+        "user_id": summary.get("user_id"),
+        "count": summary["count"],
+    }
+
+
+async def cold_rows(repos, family_id: str, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None) -> List[dict]:
+    """Archived data in ``[start, end)``: summary rows for whole months, archived rows for partial ones."""
+    horizon = await repos.archive.horizon(family_id)
+    if horizon is None:
+        return []
+    start = start.replace(tzinfo=None) if start is not None else None
+    end = end.replace(tzinfo=None) if end is not None else None
+    limit = month_start(horizon)
+    if start is not None and start >= limit:
+        return []
+    end = limit if end is None or end > limit else end
+    if start is not None and start >= end:
+        return []
+
+    first_full = start if start is None or start == _floor(start) else _next_month(start)
+    last_full = _floor(end)  # exclusive
+    if first_full is not None and first_full >= last_full:
+        # Within a single month
+        return await repos.archive.list(family_id, start, end)
+
+    summaries = await repos.archive.summaries(
+        family_id, month_key(first_full) if first_full is not None else None, month_key(last_full)
+    )
+    rows = [summary_row(s) for s in summaries]
+    if start is not None and start < first_full:
+        rows += await repos.archive.list(family_id, start, first_full)
+    if last_full < end:
+        rows += await repos.archive.list(family_id, last_full, end)
+    return rows
+
+
+async def archive_family(repos, family_id: str, cutoff: str,
+                         progress: Optional[Callable[[float, str], Awaitable[None]]] = None,
+                         batch_size: int = BATCH_SIZE) -> dict:
+    """Move ``family_id``'s transactions dated before ``cutoff`` (``"YYYY-MM"``) to the archive.
+
+    Each batch is copied, summarized, then deleted from ``transactions``, so
+    an interrupted run leaves nothing unaccounted for: a re-run finds the
+    rows still in ``transactions``, skips the archived ids and recomputes
+    the summaries of their months from the archive.
+    """
+    end = month_start(cutoff)
+    total = await repos.transactions.count(family_id, end=end) if progress is not None else 0
+    moved, months = 0, set()
+    while True:
+        batch = await repos.transactions.list(family_id, end=end, limit=batch_size)
+        if not batch:
+            break
+        touched = sorted({str(doc["date"])[:7] for doc in batch})
+        await repos.archive.insert_many(batch)
+        await repos.archive.summarize(family_id, touched)
+        moved += await repos.transactions.delete_many([doc["id"] for doc in batch])
+        months.update(touched)
+        if progress is not None:
+            # Rows back-dated into the range meanwhile can take it past the count read at the start
+            await progress(min(moved / total, 1.0) if total else 1.0, f"{moved} of {total} transactions archived")
+    await repos.archive.set_horizon(family_id, cutoff)
+    if moved:
+        invalidate_family(family_id)
+    return {"cutoff": cutoff, "archived": moved, "months": len(months)}
+
+
+class Archiver:
+    """How the ``archive_transactions`` job archives: its default horizon and batch size."""
+
+    def __init__(self, horizon_months: int = HORIZON_MONTHS, batch_size: int = BATCH_SIZE):
+        self.horizon_months = horizon_months
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_env(cls, env=None) -> "Archiver":
+        env = os.environ if env is None else env
+        return cls(
+            horizon_months=int(env.get("ARCHIVE_HORIZON_MONTHS", HORIZON_MONTHS)),
+            batch_size=int(env.get("ARCHIVE_BATCH_SIZE", BATCH_SIZE)),
+        )
+
+    def default_cutoff(self, now: Optional[datetime] = None) -> str:
+        return default_cutoff(now, self.horizon_months)
+
+    async def archive_family(self, repos, family_id: str, cutoff: str,
+                             progress: Optional[Callable[[float, str], Awaitable[None]]] = None) -> dict:
+        return await archive_family(repos, family_id, cutoff, progress, self.batch_size)
@@ -51,7 +51,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     payload = decode_token(token)
     user_id = payload.get("sub")
     family_id = payload.get("family_id")
-    if user_id is None:
+    # Scoped tokens (e.g. the event stream's) open only their own endpoint
+    if user_id is None or payload.get("scope") is not None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -0,0 +1,225 @@
+"""Journaled, optionally coalesced, account balance updates.
+
+A transaction's balance change is journaled in the transaction itself: it
+is inserted with ``balance_pending: true`` and a ``balance_flush`` id, and
+:func:`apply_journaled` then applies the summed deltas, skipping accounts
+that already carry that flush id (see ``AccountRepository.adjust_balances``),
+and clears the flag. The id stays on the accounts until the flag is
+cleared, so a replay finds it however many flushes came in between. The balances therefore move only once a transaction
+exists, and at most once: :meth:`BalanceCoalescer.recover` replays whatever
+is still pending after ``BALANCE_RECOVERY_SECONDS`` (at startup and then on
+that interval) under its recorded flush id. ``create_transaction`` uses the
+transaction id as the flush id, the recurring scheduler and the import job
+one id per batch.
+
+Each posted transaction normally moves one or two account balances with its
+own write, and a busy family's few accounts become the hot documents every
+write waits on. With ``BALANCE_COALESCE_MS`` set, :class:`BalanceCoalescer`
+gathers the posted transactions instead, untagged, and applies them per
+account in one ``bulk_write`` every window, or as soon as
+``BALANCE_COALESCE_BATCH`` transactions are waiting, so the number of
+account writes follows the number of flushes rather than the number of
+transactions. A flush first tags its transactions with its own flush id.
+
+Balances read between a post and its flush lag by at most the window; the
+flush records the new balances in the sync change log.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+import asyncio
+import logging
+import os
+import uuid
+
+from fastapi import Request
+
+import sync
+
+logger = logging.getLogger(__name__)
+
+
+def balance_deltas(transactions: List[dict]) -> Dict[str, float]:
+    """Net account balance change of ``transactions``, with the rules ``create_transaction`` applies."""
+    deltas: Dict[str, float] = {}
+
+    def add(account_id, amount):
+        deltas[account_id] = deltas.get(account_id, 0.0) + amount
+
+    for t in transactions:
+        if t["type"] in ("transfer", "investment"):
+            if t.get("account_id") and t.get("to_account_id"):
+                add(t["account_id"], -t["amount"])
+                add(t["to_account_id"], t["amount"])
+        elif t.get("account_id"):
+            add(t["account_id"], t["amount"] if t["type"] == "income" else -t["amount"])
+    return deltas
+
+
+def journal(docs: List[dict], flush_id: Optional[str] = None) -> None:
+    """Mark ``docs``, before they are inserted, as having their balance change still to apply."""
+    for doc in docs:
+        if balance_deltas([doc]):
+            doc["balance_pending"] = True
+            if flush_id is not None:
+                doc["balance_flush"] = flush_id
+
+
+async def apply_journaled(repos, flush_id: str, docs: List[dict], tag: bool = False) -> None:
+    """Apply the balance change of journaled ``docs`` once, under ``flush_id``, and clear their flag."""
+    docs = [doc for doc in docs if doc.get("balance_pending")]
+    if not docs:
+        return
+    ids = [doc["id"] for doc in docs]
+    if tag:
+        await repos.transactions.update_many(ids, {"balance_flush": flush_id})
+    deltas = balance_deltas(docs)
+    await repos.accounts.adjust_balances(deltas, flush_id=flush_id)
+    await repos.transactions.update_many(ids, {"balance_pending": False})
+    # Nothing journals this flush any more: no replay needs its id on the accounts
+    repos.accounts.settle(flush_id, deltas)
+    for doc in docs:
+        doc["balance_pending"] = False
+    accounts: Dict[str, Set[str]] = defaultdict(set)
+    for doc in docs:
+        accounts[doc["family_id"]].update(filter(None, (doc.get("account_id"), doc.get("to_account_id"))))
+    for family_id, account_ids in accounts.items():
+        await sync.record(repos, family_id, await sync.account_changes(repos, family_id, account_ids))
+
+
+class BalanceCoalescer:
+    """Batches balance deltas per account and recovers the journal; see the module docstring.
+
+    Coalescing is off when ``window`` is 0; recovery always runs.
+    """
+
+    def __init__(self, window: float = 0.0, batch_size: int = 100, recovery_after: float = 60.0):
+        self.window = window
+        self.batch_size = batch_size
+        self.recovery_after = recovery_after
+        self.repositories = None
+        self.flushes = 0
+        self._pending: List[dict] = []  # transaction docs
+        self._wake: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @classmethod
+    def from_env(cls, env=None) -> "BalanceCoalescer":
+        env = os.environ if env is None else env
+        return cls(
+            window=float(env.get("BALANCE_COALESCE_MS", 0)) / 1000,
+            batch_size=int(env.get("BALANCE_COALESCE_BATCH", 100)),
+            recovery_after=float(env.get("BALANCE_RECOVERY_SECONDS", 60)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def start(self, repositories) -> None:
+        self.repositories = repositories
+        self._lock = asyncio.Lock()
+        if not self._tasks:
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._recover_periodically())]
+            if self.enabled:
+                self._wake, self._full = asyncio.Event(), asyncio.Event()
+                self._tasks.append(loop.create_task(self._run()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pending:
+            await self.flush()
+
+    def journal(self, doc: dict) -> None:
+        """Journal ``doc`` before its insert: under its own id, or untagged for the next flush."""
+        journal([doc], None if self.enabled else doc["id"])
+
+    async def post(self, repos, doc: dict) -> None:
+        """Apply, or queue when coalescing, the change of ``doc``, inserted after :meth:`journal`."""
+        if not doc.get("balance_pending"):
+            return
+        if self.enabled:
+            self.add(doc)
+        else:
+            await apply_journaled(repos, doc["balance_flush"], [doc])
+
+    async def resume(self, repos, doc: dict) -> None:
+        """Finish the change of ``doc``, inserted by an earlier attempt that may have died before applying it.
+
+        A tagged change is replayed under its flush id; an untagged one may
+        still be queued in this process, so it is left to :meth:`recover`.
+        """
+        if doc.get("balance_pending") and doc.get("balance_flush"):
+            await apply_journaled(repos, doc["balance_flush"], [doc])
+
+    def add(self, doc: dict) -> None:
+        """Queue ``doc``'s balance change; ``doc`` must have been inserted with ``balance_pending: true``."""
+        self._pending.append(doc)
+        if self._wake is not None:
+            self._wake.set()
+            if len(self._pending) >= self.batch_size:
+                self._full.set()
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            self._full.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # The transactions stay journaled as pending; recover() applies them later
+                logger.exception("Balance flush failed")
+
+    async def _recover_periodically(self):
+        while True:
+            try:
+                await self.recover()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Balance recovery failed")
+            await asyncio.sleep(self.recovery_after)
+
+    async def flush(self) -> int:
+        """Apply every queued delta; returns the number of transactions flushed."""
+        batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        await self._apply(str(uuid.uuid4()), batch, tag=True)
+        return len(batch)
+
+    async def _apply(self, flush_id: str, docs: List[dict], tag: bool) -> None:
+        async with self._lock:
+            await apply_journaled(self.repositories, flush_id, docs, tag=tag)
+            self.flushes += 1
+
+    async def recover(self, now: Optional[datetime] = None) -> int:
+        """Apply journaled changes older than ``recovery_after``; returns the number of transactions."""
+        cutoff = (now or datetime.utcnow()) - timedelta(seconds=self.recovery_after)
+        pending = await self.repositories.transactions.list_balance_pending(cutoff.isoformat())
+        flushes: Dict[Optional[str], List[dict]] = defaultdict(list)
+        for doc in pending:
+            flushes[doc.get("balance_flush")].append(doc)
+        for flush_id, docs in flushes.items():
+            # Untagged rows never reached a flush; tagged ones are replayed under their own id
+            await self._apply(flush_id or str(uuid.uuid4()), docs, tag=flush_id is None)
+        if pending:
+            logger.info("Recovered %d journaled balance changes", len(pending))
+        return len(pending)
+
+
+def get_balance_coalescer(request: Request) -> BalanceCoalescer:
+    return request.app.state.balances
@@ -0,0 +1,74 @@
+"""Per-family data versions and a small LRU, shared by every derived-data cache.
+
+Anything computed from a family's transactions or categories (analytics
+frames, forecasts, distributions, ...) is keyed on :func:`family_version`.
+Handlers that write such data call :func:`invalidate_family`, which bumps
+the version so stale entries can never be served again, and tells the
+registered listeners so they can free memory straight away.
+"""
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional
+import threading
+
+_lock = threading.Lock()
+_versions: Dict[str, int] = {}
+_listeners: List[Callable[[str], None]] = []
+
+
+def family_version(family_id: str) -> int:
+    return _versions.get(family_id, 0)
+
+
+def invalidate_family(family_id: Optional[str]) -> int:
+    """Mark everything derived from ``family_id``'s data as stale; returns the new version."""
+    if not family_id:
+        return 0
+    with _lock:
+        version = _versions[family_id] = _versions.get(family_id, 0) + 1
+    for listener in list(_listeners):
+        listener(family_id)
+    return version
+
+
+def on_invalidate(listener: Callable[[str], None]) -> Callable[[str], None]:
+    if listener not in _listeners:
+        _listeners.append(listener)
+    return listener
+
+
+def remove_listener(listener: Callable[[str], None]) -> None:
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key."""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, object]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def put(self, key, value) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        self._data.clear()
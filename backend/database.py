@@ -0,0 +1,172 @@
+"""MongoDB connection management.
+
+The process shares one AsyncIOMotorClient between every router. The client is
+created by the application lifespan (see ``server.create_app``) rather than at
+import time, so modules can be imported without a configured environment.
+"""
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pydantic import BaseModel
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+from dotenv import load_dotenv
+from pathlib import Path
+from typing import List, Mapping, Optional, Union
+import os
+
+from monitoring import MongoCommandListener
+
+ROOT_DIR = Path(__file__).parent
+
+
+def load_env():
+    """Load backend/.env into the process environment (existing variables win)."""
+    load_dotenv(ROOT_DIR / '.env')
+
+
+class MongoSettings(BaseModel):
+    """Connection and pool settings, read from MONGO_* environment variables."""
+    url: str
+    db_name: str
+    app_name: str = "spend-tracker"
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    max_connecting: int = 2
+    max_idle_time_ms: Optional[int] = None
+    wait_queue_timeout_ms: Optional[int] = None
+    connect_timeout_ms: int = 10000
+    server_selection_timeout_ms: int = 10000
+    socket_timeout_ms: Optional[int] = None
+    compressors: List[str] = []
+    zlib_compression_level: Optional[int] = None
+    read_concern: Optional[str] = None  # local, majority, linearizable, ...
+    write_concern_w: Optional[Union[int, str]] = None  # 1, 2, "majority"
+    write_concern_journal: Optional[bool] = None
+    write_concern_timeout_ms: Optional[int] = None
+    retry_writes: bool = True
+    ensure_indexes: bool = True
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "MongoSettings":
+        """Build settings from the environment (loading backend/.env first)."""
+        if env is None:
+            load_env()
+            env = os.environ
+
+        def _int(name):
+            value = env.get(name)
+            return int(value) if value not in (None, "") else None
+
+        def _bool(name):
+            value = env.get(name)
+            if value in (None, ""):
+                return None
+            return value.strip().lower() in ("1", "true", "yes", "on")
+
+        values = {
+            "url": env.get("MONGO_URL", "mongodb://localhost:27017"),
+            "db_name": env.get("DB_NAME", "spend_tracker"),
+            "app_name": env.get("MONGO_APP_NAME"),
+            "max_pool_size": _int("MONGO_MAX_POOL_SIZE"),
+            "min_pool_size": _int("MONGO_MIN_POOL_SIZE"),
+            "max_connecting": _int("MONGO_MAX_CONNECTING"),
+            "max_idle_time_ms": _int("MONGO_MAX_IDLE_TIME_MS"),
+            "wait_queue_timeout_ms": _int("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+            "connect_timeout_ms": _int("MONGO_CONNECT_TIMEOUT_MS"),
+            "server_selection_timeout_ms": _int("MONGO_SERVER_SELECTION_TIMEOUT_MS"),
+            "socket_timeout_ms": _int("MONGO_SOCKET_TIMEOUT_MS"),
+            "zlib_compression_level": _int("MONGO_ZLIB_COMPRESSION_LEVEL"),
+            "read_concern": env.get("MONGO_READ_CONCERN") or None,
+            "write_concern_journal": _bool("MONGO_WRITE_CONCERN_JOURNAL"),
+            "write_concern_timeout_ms": _int("MONGO_WRITE_CONCERN_TIMEOUT_MS"),
+            "retry_writes": _bool("MONGO_RETRY_WRITES"),
+            "ensure_indexes": _bool("MONGO_ENSURE_INDEXES"),
+        }
+
+        compressors = env.get("MONGO_COMPRESSORS", "")
+        values["compressors"] = [c.strip() for c in compressors.split(",") if c.strip()]
+
+        w = env.get("MONGO_WRITE_CONCERN_W")
+        if w:
+            values["write_concern_w"] = int(w) if w.isdigit() else w
+
+        # Unset variables fall back to the field defaults
+        return cls(**{k: v for k, v in values.items() if v is not None})
+
+    def client_kwargs(self) -> dict:
+        """Keyword arguments for AsyncIOMotorClient."""
+        kwargs = {
+            "appname": self.app_name,
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "maxConnecting": self.max_connecting,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "retryWrites": self.retry_writes,
+        }
+        if self.max_idle_time_ms is not None:
+            kwargs["maxIdleTimeMS"] = self.max_idle_time_ms
+        if self.wait_queue_timeout_ms is not None:
+            kwargs["waitQueueTimeoutMS"] = self.wait_queue_timeout_ms
+        if self.socket_timeout_ms is not None:
+            kwargs["socketTimeoutMS"] = self.socket_timeout_ms
+        if self.compressors:
+            kwargs["compressors"] = ",".join(self.compressors)
+        if self.zlib_compression_level is not None:
+            kwargs["zlibCompressionLevel"] = self.zlib_compression_level
+        return kwargs
+
+    def read_concern_obj(self) -> Optional[ReadConcern]:
+        return ReadConcern(self.read_concern) if self.read_concern else None
+
+    def write_concern_obj(self) -> Optional[WriteConcern]:
+        if (self.write_concern_w is None and self.write_concern_journal is None
+                and self.write_concern_timeout_ms is None):
+            return None
+        return WriteConcern(
+            w=self.write_concern_w,
+            j=self.write_concern_journal,
+            wtimeout=self.write_concern_timeout_ms,
+        )
+
+
+_client: Optional[AsyncIOMotorClient] = None
+_db: Optional[AsyncIOMotorDatabase] = None
+
+
+def connect(settings: Optional[MongoSettings] = None) -> AsyncIOMotorDatabase:
+    """Create the shared client. Calling it again returns the existing database."""
+    global _client, _db
+    if _db is not None:
+        return _db
+
+    settings = settings or MongoSettings.from_env()
+    _client = AsyncIOMotorClient(
+        settings.url, event_listeners=[MongoCommandListener()], **settings.client_kwargs()
+    )
+    _db = _client.get_database(
+        settings.db_name,
+        read_concern=settings.read_concern_obj(),
+        write_concern=settings.write_concern_obj(),
+    )
+    return _db
+
+
+def close():
+    """Close the shared client and release its pool."""
+    global _client, _db
+    if _client is not None:
+        _client.close()
+    _client = None
+    _db = None
+
+
+def get_client() -> AsyncIOMotorClient:
+    if _client is None:
+        raise RuntimeError("MongoDB client is not connected; is the app lifespan running?")
+    return _client
+
+
+def get_db() -> AsyncIOMotorDatabase:
+    if _db is None:
+        raise RuntimeError("MongoDB client is not connected; is the app lifespan running?")
+    return _db
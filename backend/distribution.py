@@ -0,0 +1,137 @@
+"""Distribution of a family's transaction amounts over a period.
+
+``GET /api/dashboard/distribution`` answers in one request what the Compare
+tab would otherwise gather from many: per-category percentiles (p50, p90,
+p99) and amount histograms, and how spending spreads over the days of the
+week and the hours of the day.
+
+Everything is computed from an :class:`analytics.TransactionFrame` with
+numpy: rows are sorted once by (category, amount), so the percentiles of
+every category come from one vectorized interpolation over the sorted
+segments, and the day and hour profiles are ``np.bincount`` group-bys.
+Results are cached per family data version (see :mod:`cache`) and query.
+
+Archived months (see :mod:`archive`) only exist as monthly totals, which
+say nothing about single amounts or times of day; they are left out and
+counted in ``summarized_transactions``.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import Request
+
+import analytics
+from analytics import AnalyticsEngine, TransactionFrame
+from cache import LRUCache, family_version
+
+PERCENTILES = (50, 90, 99)
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday
+
+
+def segment_percentiles(values: np.ndarray, starts: np.ndarray, lengths: np.ndarray, q: float) -> np.ndarray:
+    """``q``-th percentile of each sorted segment of ``values``, interpolated as ``np.percentile`` does."""
+    position = starts + (lengths - 1) * (q / 100.0)
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, starts + lengths - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def histogram(values: np.ndarray, bins: int) -> dict:
+    counts, edges = np.histogram(values, bins=bins)
+    return {"edges": [round(float(e), 2) for e in edges], "counts": counts.tolist()}
+
+
+def _summary(values: np.ndarray, percentiles: Dict[int, float], bins: int) -> dict:
+    return {
+        "count": int(len(values)),
+        "total": round(float(values.sum()), 2),
+        "mean": round(float(values.mean()), 2),
+        **{f"p{q}": round(percentiles[q], 2) for q in PERCENTILES},
+        "histogram": histogram(values, bins),
+    }
+
+
+def profile(keys: np.ndarray, amounts: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    return np.bincount(keys, weights=amounts, minlength=size), np.bincount(keys, minlength=size)
+
+
+def compute(frame: TransactionFrame, type: str = "expense", user_id: Optional[str] = None, bins: int = 20) -> dict:
+    """The distribution body for ``frame``'s transactions of ``type`` (optionally one user's)."""
+    selected = frame.types == analytics.TYPE_CODES[type]
+    user_mask = frame.mask(user_id=user_id)
+    if user_mask is not None:
+        selected &= user_mask
+    summarized = int(frame.counts[selected & frame.summarized].sum())
+    selected &= ~frame.summarized
+    amounts, dates, categories = frame.amounts[selected], frame.dates[selected], frame.categories[selected]
+
+    body = {"type": type, "transactions": int(len(amounts)), "summarized_transactions": summarized,
+            "overall": None, "categories": [], "day_of_week": [], "hour_of_day": []}
+    if len(amounts) == 0:
+        return body
+
+    ordered = np.sort(amounts)
+    whole = np.array([0]), np.array([len(ordered)])
+    body["overall"] = _summary(ordered, {q: float(segment_percentiles(ordered, *whole, q)[0]) for q in PERCENTILES}, bins)
+
+    # One sort by (category, amount) gives every category a contiguous, sorted segment
+    order = np.lexsort((amounts, categories))
+    by_category, sorted_amounts = categories[order], amounts[order]
+    codes, starts, lengths = np.unique(by_category, return_index=True, return_counts=True)
+    percentiles = {q: segment_percentiles(sorted_amounts, starts, lengths, q) for q in PERCENTILES}
+    rows: List[dict] = []
+    for i, code in enumerate(codes):
+        values = sorted_amounts[starts[i]:starts[i] + lengths[i]]
+        rows.append({
+            "category_id": frame.category_ids[code] if code >= 0 else None,
+            "category_name": frame.category_names[code] if code >= 0 else None,
+            **_summary(values, {q: float(percentiles[q][i]) for q in PERCENTILES}, bins),
+        })
+    rows.sort(key=lambda row: row["total"], reverse=True)
+    body["categories"] = rows
+
+    days = dates // 86400
+    weekday_totals, weekday_counts = profile((days + EPOCH_WEEKDAY) % 7, amounts, 7)
+    hour_totals, hour_counts = profile((dates // 3600) % 24, amounts, 24)
+    body["day_of_week"] = [
+        {"day": DAYS[d], "total": round(float(weekday_totals[d]), 2), "count": int(weekday_counts[d])}
+        for d in range(7)
+    ]
+    body["hour_of_day"] = [
+        {"hour": h, "total": round(float(hour_totals[h]), 2), "count": int(hour_counts[h])}
+        for h in range(24)
+    ]
+    return body
+
+
+class Distributions:
+    """Per-family cache of :func:`compute` results, dropped when the family's data version moves."""
+
+    def __init__(self, engine: AnalyticsEngine, max_families: int = 256, queries_per_family: int = 16):
+        self.engine = engine
+        self.queries_per_family = queries_per_family
+        self._families = LRUCache(max_families)  # family_id -> (version, LRUCache of query -> body)
+        self.computed = 0
+
+    async def get(self, repos, family_id: str, start: datetime, end: datetime, type: str = "expense",
+                  user_id: Optional[str] = None, bins: int = 20) -> dict:
+        version = family_version(family_id)
+        entry = self._families.get(family_id)
+        if entry is None or entry[0] != version:
+            entry = (version, LRUCache(self.queries_per_family))
+            self._families.put(family_id, entry)
+        key = (start, end, type, user_id, bins)
+        body = entry[1].get(key)
+        if body is None:
+            frame = await self.engine.frame(repos, family_id, start, end)
+            body = compute(frame, type, user_id, bins)
+            self.computed += 1
+            if family_version(family_id) == version:
+                entry[1].put(key, body)
+        return body
+
+
+def get_distributions(request: Request) -> Distributions:
+    return request.app.state.distributions
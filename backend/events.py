@@ -0,0 +1,160 @@
+"""In-process pub/sub and the server-sent event stream.
+
+Mutating endpoints publish small events to a topic per family (and per user,
+for things that concern someone outside the family, like the outcome of
+their join request). ``GET /api/events/stream`` relays a client's topics as
+server-sent events, so the budget ticker and the pending-approval screen can
+react to changes instead of polling.
+
+``EventSource`` cannot send headers, so a browser authenticates the stream
+in its URL, where access logs and proxies record it. The URL therefore never
+carries the access token: the client first asks ``POST /api/events/token``
+for a stream token, valid for ``STREAM_TOKEN_SECONDS`` and only here, and
+fetches a fresh one for every reconnect.
+
+Events live only in this process: with several workers, a client sees the
+events published by the worker its stream is connected to.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from datetime import timedelta
+from typing import Dict, List, Optional, Set
+import asyncio
+import itertools
+import logging
+
+import orjson
+
+from auth import create_access_token, decode_token, get_current_user
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100
+HEARTBEAT_SECONDS = 15.0
+RETRY_MS = 5000
+STREAM_TOKEN_SECONDS = 60
+STREAM_SCOPE = "events"
+
+
+def family_topic(family_id: str) -> str:
+    return f"family:{family_id}"
+
+
+def user_topic(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+class EventBus:
+    """Fan-out of events to per-subscriber queues. Publishing never blocks."""
+
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._topics: Dict[str, Set[asyncio.Queue]] = {}
+        self._ids = itertools.count(1)
+
+    def subscribe(self, topics: List[str]) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        for topic in topics:
+            self._topics.setdefault(topic, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        for topic, queues in list(self._topics.items()):
+            queues.discard(queue)
+            if not queues:
+                del self._topics[topic]
+
+    def subscriber_count(self, topic: str) -> int:
+        return len(self._topics.get(topic, ()))
+
+    def publish(self, topic: str, type: str, data: Optional[dict] = None) -> None:
+        queues = self._topics.get(topic)
+        if not queues:
+            return
+        event = {"id": next(self._ids), "type": type, "data": data or {}}
+        for queue in list(queues):
+            if queue.full():
+                # A stalled client loses its oldest event rather than holding up publishers
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+def get_event_bus(request: Request) -> EventBus:
+    return request.app.state.events
+
+
+def format_event(event: dict) -> bytes:
+    return (
+        f"id: {event['id']}\nevent: {event['type']}\n".encode()
+        + b"data: " + orjson.dumps(event["data"]) + b"\n\n"
+    )
+
+
+optional_bearer = HTTPBearer(auto_error=False)
+
+
+async def get_stream_user(
+    token: Optional[str] = Query(None, description="Stream token from POST /api/events/token"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer),
+) -> dict:
+    if credentials is not None:
+        payload = decode_token(credentials.credentials)
+        if payload.get("scope") is not None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    elif token:
+        payload = decode_token(token)
+        # Only a stream token may travel in the URL
+        if payload.get("scope") != STREAM_SCOPE:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    else:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    return {"user_id": payload["sub"], "family_id": payload.get("family_id"), "role": payload.get("role")}
+
+
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+
+@router.post("/token")
+async def create_stream_token(current_user: dict = Depends(get_current_user)):
+    """A short-lived token that opens ``GET /api/events/stream`` and nothing else."""
+    token = create_access_token(
+        {"sub": current_user["user_id"], "family_id": current_user["family_id"], "role": current_user["role"],
+         "scope": STREAM_SCOPE},
+        expires_delta=timedelta(seconds=STREAM_TOKEN_SECONDS),
+    )
+    return {"token": token, "expires_in": STREAM_TOKEN_SECONDS}
+
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    current_user: dict = Depends(get_stream_user),
+    bus: EventBus = Depends(get_event_bus)
+):
+    """Server-sent events for the caller's family and for the caller personally."""
+    topics = [user_topic(current_user["user_id"])]
+    if current_user["family_id"]:
+        topics.append(family_topic(current_user["family_id"]))
+    queue = bus.subscribe(topics)
+
+    async def events():
+        try:
+            yield f"retry: {RETRY_MS}\n: connected\n\n".encode()
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                yield format_event(event)
+        finally:
+            bus.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
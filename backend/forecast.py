@@ -0,0 +1,173 @@
+"""Cash-flow forecasts from a family's monthly history.
+
+Every series (income, expense and investment totals, and each category
+within them) is modelled as a least-squares linear trend over the completed
+months of history plus an additive seasonal offset per calendar month, the
+mean residual for that month once at least a year of history exists. All
+series are fitted in one ``lstsq`` call.
+
+A fitted model projects :data:`MAX_HORIZON` months up front, so a request
+for N months is a slice. Models are cached per family and refitted only
+when the family's data version (see :mod:`cache`) or the current month
+changes.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import Request
+
+import analytics
+from analytics import AnalyticsEngine, TransactionFrame
+from cache import LRUCache, family_version
+
+HISTORY_MONTHS = 36
+MAX_HORIZON = 24
+FORECAST_TYPES = ("income", "expense", "investment")
+
+
+def month_index(year: int, month: int) -> int:
+    """Months since January 1970."""
+    return (year - 1970) * 12 + month - 1
+
+
+def from_month_index(index: int) -> Tuple[int, int]:
+    return 1970 + index // 12, index % 12 + 1
+
+
+def monthly_matrix(frame: TransactionFrame, first_month: int, months: int):
+    """Totals by month and type, and by month, type and category, as arrays.
+
+    Returns ``(totals, by_category)`` shaped ``(months, types)`` and
+    ``(months, types, categories)``, types in :data:`FORECAST_TYPES` order.
+    """
+    width = len(analytics.TYPES) + 1
+    codes = [analytics.TYPE_CODES[name] for name in FORECAST_TYPES]
+    month = frame.dates.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64) - first_month
+    inside = (month >= 0) & (month < months)
+    month, types, amounts, categories = (
+        month[inside], frame.types[inside].astype(np.int64), frame.amounts[inside], frame.categories[inside]
+    )
+    totals = np.bincount(month * width + types, weights=amounts, minlength=months * width)
+    totals = totals.reshape(months, width)[:, codes]
+
+    n_categories = max(len(frame.category_ids), 1)
+    has_category = categories >= 0
+    index = (month[has_category] * width + types[has_category]) * n_categories + categories[has_category]
+    by_category = np.bincount(index, weights=amounts[has_category], minlength=months * width * n_categories)
+    by_category = by_category.reshape(months, width, n_categories)[:, codes, :len(frame.category_ids)]
+    return totals, by_category
+
+
+def fit(history: np.ndarray, first_month: int, horizon: int = MAX_HORIZON) -> np.ndarray:
+    """Project each column of ``history`` (months x series) ``horizon`` months ahead."""
+    months, series = history.shape
+    if months == 0 or series == 0:
+        return np.zeros((horizon, series))
+    t = np.arange(months, dtype=np.float64)
+    if months >= 2:
+        design = np.column_stack([np.ones(months), t])
+        coefficients, *_ = np.linalg.lstsq(design, history, rcond=None)
+    else:
+        coefficients = np.vstack([history.mean(axis=0), np.zeros(series)])
+
+    seasonal = np.zeros((12, series))
+    if months >= 12:
+        residuals = history - np.column_stack([np.ones(months), t]) @ coefficients
+        calendar = (first_month + np.arange(months)) % 12
+        counts = np.bincount(calendar, minlength=12)
+        for column in range(series):
+            seasonal[:, column] = np.bincount(calendar, weights=residuals[:, column], minlength=12)
+        seasonal /= np.maximum(counts, 1)[:, None]
+        seasonal -= seasonal[counts > 0].mean(axis=0)
+
+    future = np.arange(months, months + horizon, dtype=np.float64)
+    projected = np.column_stack([np.ones(horizon), future]) @ coefficients
+    projected += seasonal[(first_month + months + np.arange(horizon)) % 12]
+    return np.clip(projected, 0, None)
+
+
+@dataclass
+class ForecastModel:
+    first_month: int           # month index of the first forecast month
+    history: Tuple[int, int]   # month indexes of the first and last month fitted
+    totals: np.ndarray         # (MAX_HORIZON, len(FORECAST_TYPES))
+    categories: List[Dict[str, np.ndarray]]  # per type: category name -> (MAX_HORIZON,)
+
+    def months(self, count: int) -> List[dict]:
+        rows = []
+        for step in range(count):
+            year, month = from_month_index(self.first_month + step)
+            income, expense, investment = (round(float(v), 2) for v in self.totals[step])
+            row = {
+                "year": year,
+                "month": month,
+                "income": income,
+                "expense": expense,
+                "investment": investment,
+                "closing_balance": round(income - expense, 2),  # Investment doesn't reduce closing balance
+            }
+            for name, series in zip(FORECAST_TYPES, self.categories):
+                row[f"{name}_by_category"] = {
+                    category: round(float(values[step]), 2) for category, values in series.items()
+                }
+            rows.append(row)
+        return rows
+
+
+def build_model(frame: TransactionFrame, current_month: int) -> ForecastModel:
+    start = current_month - HISTORY_MONTHS
+    totals, by_category = monthly_matrix(frame, start, HISTORY_MONTHS)
+    active = np.flatnonzero(totals.any(axis=1) | by_category.any(axis=(1, 2)))
+    first = int(active[0]) if len(active) else HISTORY_MONTHS
+    totals, by_category = totals[first:], by_category[first:]
+
+    # One column per type total, then one per (type, category) seen in the history
+    columns = [totals]
+    labels = []
+    for type_position in range(len(FORECAST_TYPES)):
+        seen = np.flatnonzero(by_category[:, type_position, :].any(axis=0))
+        columns.append(by_category[:, type_position, seen])
+        labels.extend((type_position, frame.category_names[c]) for c in seen)
+    projected = fit(np.hstack(columns), start + first)
+
+    categories: List[Dict[str, np.ndarray]] = [{} for _ in FORECAST_TYPES]
+    for offset, (type_position, name) in enumerate(labels, start=len(FORECAST_TYPES)):
+        series = categories[type_position]
+        series[name] = series.get(name, 0) + projected[:, offset]
+    return ForecastModel(
+        first_month=current_month,
+        history=(start + first, current_month - 1),
+        totals=projected[:, :len(FORECAST_TYPES)],
+        categories=categories,
+    )
+
+
+class Forecaster:
+    """Fitted :class:`ForecastModel` per family, refitted when the data version or month changes."""
+
+    def __init__(self, engine: AnalyticsEngine, max_families: int = 256):
+        self.engine = engine
+        self._models = LRUCache(max_families)  # family_id -> (version, current month, model)
+        self.fits = 0
+
+    async def model(self, repos, family_id: str, now: Optional[datetime] = None) -> ForecastModel:
+        now = now or datetime.now()
+        current = month_index(now.year, now.month)
+        version = family_version(family_id)
+        cached = self._models.get(family_id)
+        if cached is not None and cached[:2] == (version, current):
+            return cached[2]
+        start_year, start_month = from_month_index(current - HISTORY_MONTHS)
+        frame = await self.engine.frame(
+            repos, family_id, datetime(start_year, start_month, 1), datetime(now.year, now.month, 1)
+        )
+        model = build_model(frame, current)
+        self.fits += 1
+        self._models.put(family_id, (version, current, model))
+        return model
+
+
+def get_forecaster(request: Request) -> Forecaster:
+    return request.app.state.forecaster
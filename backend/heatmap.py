@@ -0,0 +1,86 @@
+"""Daily income and expense totals for a calendar heatmap.
+
+``GET /api/dashboard/calendar?year=`` returns one entry per day of the
+year, so a client can draw a heatmap without downloading the year's
+transactions. The totals come from one ``$group`` on the day part of the
+ISO ``date`` (see ``TransactionRepository.daily_totals``), plus the same
+group over ``transactions_archive`` when the year reaches behind the
+archive horizon (see :mod:`archive`): archived rows keep their dates, the
+monthly summaries are not needed here.
+
+Results are cached per family data version (see :mod:`cache`), so a year
+is grouped once and again only after the next write.
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from fastapi import Request
+
+from archive import month_start
+from cache import LRUCache, family_version
+
+TYPES = ("income", "expense")
+
+
+def year_bounds(year: int):
+    return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+
+
+def build(year: int, groups) -> dict:
+    """One ``{"date", "income", "expense", "count"}`` per day of ``year`` from ``daily_totals`` groups."""
+    first = date(year, 1, 1)
+    days = [
+        {"date": (first + timedelta(days=i)).isoformat(), "income": 0.0, "expense": 0.0, "count": 0}
+        for i in range((date(year + 1, 1, 1) - first).days)
+    ]
+    for group in groups:
+        if group["type"] not in TYPES:
+            continue
+        day = days[(date.fromisoformat(group["day"]) - first).days]
+        day[group["type"]] += group["amount"]
+        day["count"] += group["count"]
+    for day in days:
+        day["income"] = round(day["income"], 2)
+        day["expense"] = round(day["expense"], 2)
+    return {
+        "year": year,
+        "days": days,
+        "max_income": max(day["income"] for day in days),
+        "max_expense": max(day["expense"] for day in days),
+    }
+
+
+class CalendarHeatmap:
+    """Per-family cache of :func:`build` results, dropped when the family's data version moves."""
+
+    def __init__(self, max_families: int = 256, queries_per_family: int = 8):
+        self.queries_per_family = queries_per_family
+        self._families = LRUCache(max_families)  # family_id -> (version, LRUCache of (year, user) -> body)
+        self.computed = 0
+
+    async def get(self, repos, family_id: str, year: int, user_id: Optional[str] = None) -> dict:
+        version = family_version(family_id)
+        entry = self._families.get(family_id)
+        if entry is None or entry[0] != version:
+            entry = (version, LRUCache(self.queries_per_family))
+            self._families.put(family_id, entry)
+        key = (year, user_id)
+        body = entry[1].get(key)
+        if body is None:
+            body = build(year, await self.groups(repos, family_id, year, user_id))
+            self.computed += 1
+            if family_version(family_id) == version:
+                entry[1].put(key, body)
+        return body
+
+    async def groups(self, repos, family_id: str, year: int, user_id: Optional[str] = None):
+        start, end = year_bounds(year)
+        groups = await repos.transactions.daily_totals(family_id, start, end, user_id)
+        horizon = await repos.archive.horizon(family_id)
+        if horizon is not None and month_start(horizon) > start:
+            groups += await repos.archive.daily_totals(family_id, start, min(end, month_start(horizon)), user_id)
+        return groups
+
+
+def get_calendar_heatmap(request: Request) -> CalendarHeatmap:
+    return request.app.state.calendar_heatmap
@@ -0,0 +1,130 @@
+"""``Idempotency-Key`` support for ``POST /api/transactions``.
+
+A client that retries a request with the same key gets the original
+response back instead of a second transaction and a second balance update.
+Outcomes are kept per user and key in the ``idempotency_keys`` collection
+for ``IDEMPOTENCY_TTL_HOURS`` (24), removed by a TTL index, and completed
+ones are also held in a per-process LRU, so a replay costs at most one
+lookup.
+
+The first request reserves the key with a ``pending`` record before doing
+any work. A retry arriving while it runs gets ``409``; if the first request
+died (its lock, ``IDEMPOTENCY_LOCK_SECONDS``, expired) the retry takes the
+key over. The transaction id is derived from the user, the key and the
+time the key was reserved, so whoever acquires the key and finds the
+transaction already inserted is handed it to finish (``create_transaction``
+runs the same steps after the insert as a first attempt) instead of posting
+it again, while a key reused after its record expired posts a new one. A
+key reused with a different body is rejected with ``422``. A request that
+fails before its insert releases its key; one that fails after it keeps the
+key until the lock expires.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+import hashlib
+import os
+import uuid
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from cache import LRUCache
+
+KEY_NAMESPACE = uuid.UUID("4f9e8a52-6c1d-4b7e-9a0f-2d3c5e7b9f10")
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+def record_id(user_id: str, key: str) -> str:
+    return f"{user_id}:{key}"
+
+
+def fingerprint(body: str) -> str:
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def transaction_id(user_id: str, key: str, reserved_at: str) -> str:
+    """The id the transaction posted under ``key`` gets, stable across retries of one reservation."""
+    return str(uuid.uuid5(KEY_NAMESPACE, f"{record_id(user_id, key)}@{reserved_at}"))
+
+
+def replay(response: dict) -> JSONResponse:
+    return JSONResponse(response["body"], status_code=response["status_code"], headers={REPLAY_HEADER: "true"})
+
+
+@dataclass
+class Claim:
+    """What :meth:`IdempotencyStore.begin` found: a response to replay, or the key held for the caller."""
+    replay: Optional[JSONResponse] = None
+    transaction_id: Optional[str] = None  # to post under, when the key is held
+    posted: Optional[dict] = None  # inserted by an earlier attempt: finish it rather than post again
+
+
+class IdempotencyStore:
+    """Reserves keys, records responses and replays them; see the module docstring."""
+
+    def __init__(self, ttl: timedelta = timedelta(hours=24), lock: timedelta = timedelta(seconds=60),
+                 max_cached: int = 10000):
+        self.ttl = ttl
+        self.lock = lock
+        self._cache = LRUCache(max_cached)  # record id -> (fingerprint, response, expires_at)
+        self.replays = 0
+
+    @classmethod
+    def from_env(cls, env=None) -> "IdempotencyStore":
+        env = os.environ if env is None else env
+        return cls(
+            ttl=timedelta(hours=float(env.get("IDEMPOTENCY_TTL_HOURS", 24))),
+            lock=timedelta(seconds=float(env.get("IDEMPOTENCY_LOCK_SECONDS", 60))),
+        )
+
+    def _replay(self, body_hash: str, stored_hash: str, response: dict) -> JSONResponse:
+        if stored_hash != body_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        self.replays += 1
+        return replay(response)
+
+    async def begin(self, repos, user_id: str, key: str, body_hash: str) -> Claim:
+        """A stored response to replay, or the key held for the caller to do the work."""
+        rid = record_id(user_id, key)
+        now = datetime.utcnow()
+        cached = self._cache.get(rid)
+        if cached is not None and cached[2] > now:
+            return Claim(replay=self._replay(body_hash, cached[0], cached[1]))
+
+        record = await repos.idempotency.get(rid)
+        reserved_at = now.isoformat()
+        acquired = record is None and await repos.idempotency.reserve({
+            "id": rid, "user_id": user_id, "fingerprint": body_hash, "status": "pending",
+            "locked_until": (now + self.lock).isoformat(), "created_at": reserved_at,
+            "expires_at": now + self.ttl,
+        })
+        if not acquired:
+            record = record or await repos.idempotency.get(rid)
+            if record is None:  # expired between the two reads
+                return await self.begin(repos, user_id, key, body_hash)
+            if record["status"] == "completed":
+                self._cache.put(rid, (record["fingerprint"], record["response"], record["expires_at"]))
+                return Claim(replay=self._replay(body_hash, record["fingerprint"], record["response"]))
+            if record["fingerprint"] != body_hash:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+            if not await repos.idempotency.take_over(rid, now.isoformat(), (now + self.lock).isoformat()):
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+            reserved_at = record["created_at"]
+        claim = Claim(transaction_id=transaction_id(user_id, key, reserved_at))
+        # An earlier attempt under this reservation may have got as far as the insert
+        claim.posted = await repos.transactions.get(claim.transaction_id)
+        return claim
+
+    async def complete(self, repos, user_id: str, key: str, body_hash: str, body, status_code: int = 200) -> None:
+        rid = record_id(user_id, key)
+        response = {"status_code": status_code, "body": body}
+        await repos.idempotency.complete(rid, {"response": response})
+        self._cache.put(rid, (body_hash, response, datetime.utcnow() + self.ttl))
+
+    async def release(self, repos, user_id: str, key: str) -> None:
+        await repos.idempotency.release(record_id(user_id, key))
+
+
+def get_idempotency(request: Request) -> IdempotencyStore:
+    return request.app.state.idempotency
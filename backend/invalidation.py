@@ -0,0 +1,211 @@
+"""Cross-process invalidation of the per-family caches.
+
+:func:`cache.invalidate_family` only reaches the caches of the worker that
+handled the write. With several uvicorn workers, :class:`InvalidationBus`
+makes every worker see every invalidation:
+
+  * each local invalidation is published as a ``$inc`` of the family's
+    counter in the ``cache_versions`` collection (coalesced, one update
+    per family per flush, all sent concurrently);
+  * each worker follows that collection, with a change stream when MongoDB
+    runs as a replica set, or by polling it every
+    ``CACHE_INVALIDATION_POLL_SECONDS`` on a standalone server, and
+    invalidates its own caches for families another worker bumped.
+
+The version collection is followed rather than the data collections
+themselves: delete events carry only ``_id``, not the family, while every
+write path already goes through ``invalidate_family``. Each update stamps
+the counter with its ``origin`` and returns the version it produced; a
+worker skips a new version only when it carries its own origin and every
+version since the last one seen is one its acknowledged writes produced.
+A bump not yet written, or written but not yet acknowledged, is never
+taken for one of its own, so another worker's bump seen meanwhile is
+applied straight away (at worst an own bump costs one extra
+invalidation). The delay is bounded by the poll interval (or change
+stream latency) plus one flush.
+
+``CACHE_INVALIDATION`` is ``auto`` (change stream, else polling; the
+default), ``change_stream``, ``poll`` or ``off``. The in-memory backend is
+single-process, so the bus stays off there.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+import asyncio
+import logging
+import os
+import uuid
+
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure, PyMongoError
+
+from cache import invalidate_family, on_invalidate, remove_listener
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "cache_versions"
+MODES = ("auto", "change_stream", "poll", "off")
+
+
+class InvalidationBus:
+    """Publishes local invalidations and applies other workers'; see the module docstring."""
+
+    def __init__(self, mode: str = "auto", poll_interval: float = 1.0):
+        if mode not in MODES:
+            raise ValueError(f"CACHE_INVALIDATION must be one of {', '.join(MODES)}")
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.worker_id = uuid.uuid4().hex
+        self.active_mode: Optional[str] = None  # what is actually running
+        self.collection = None
+        self.applied = 0  # invalidations received from other workers
+        self._pending: Dict[str, int] = {}  # family_id -> bumps not yet published
+        self._own: Dict[str, Set[int]] = {}  # family_id -> versions our acknowledged writes produced, not yet observed
+        self._seen: Dict[str, int] = {}  # family_id -> highest version observed
+        self._applying = False
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks = []
+
+    @classmethod
+    def from_env(cls, env=None) -> "InvalidationBus":
+        env = os.environ if env is None else env
+        return cls(
+            mode=env.get("CACHE_INVALIDATION", "auto").lower(),
+            poll_interval=float(env.get("CACHE_INVALIDATION_POLL_SECONDS", 1.0)),
+        )
+
+    def start(self, repositories) -> None:
+        db = getattr(repositories, "db", None)
+        if self.mode == "off" or db is None:
+            return
+        self.collection = db[COLLECTION]
+        self._wake = asyncio.Event()
+        on_invalidate(self._local)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._publish()), loop.create_task(self._follow())]
+
+    async def stop(self) -> None:
+        remove_listener(self._local)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.active_mode = None
+
+    # ---- publishing -------------------------------------------------------------
+    def _local(self, family_id: str) -> None:
+        if self._applying:
+            return
+        self._pending[family_id] = self._pending.get(family_id, 0) + 1
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _publish(self) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            pending, self._pending = self._pending, {}
+            if not pending:
+                continue
+            results = await asyncio.gather(
+                *(self._bump(family_id, bumps) for family_id, bumps in pending.items()),
+                return_exceptions=True
+            )
+            error = None
+            for (family_id, bumps), result in zip(pending.items(), results):
+                if isinstance(result, BaseException):
+                    if not isinstance(result, PyMongoError):
+                        raise result
+                    error = result
+                    self._pending[family_id] = self._pending.get(family_id, 0) + bumps
+                else:
+                    self._written(family_id, result, bumps)
+            if error is not None:
+                logger.warning("Could not publish cache invalidations: %s", error)
+                await asyncio.sleep(self.poll_interval)
+                self._wake.set()
+
+    async def _bump(self, family_id: str, bumps: int) -> int:
+        doc = await self.collection.find_one_and_update(
+            {"family_id": family_id},
+            {"$inc": {"version": bumps}, "$set": {"origin": self.worker_id},
+             "$currentDate": {"updated_at": True}},
+            projection={"version": 1, "_id": 0}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return doc["version"]
+
+    def _written(self, family_id: str, version: int, bumps: int) -> None:
+        """Note that our write of ``bumps`` took the family's counter to ``version``."""
+        seen = self._seen.get(family_id)
+        own = self._own.setdefault(family_id, set())
+        # A version already observed before the write was acknowledged was handled then
+        own.update(v for v in range(version - bumps + 1, version + 1) if seen is None or v > seen)
+
+    # ---- following --------------------------------------------------------------
+    def observe(self, family_id: str, version: int, origin: Optional[str] = None) -> bool:
+        """Apply a counter value read back from the collection; ``True`` if caches were invalidated."""
+        previous = self._seen.get(family_id)
+        if previous is not None and version <= previous:
+            return False
+        self._seen[family_id] = version
+        own = self._own.get(family_id, set())
+        span = range(previous + 1, version + 1) if previous is not None else None
+        if span is not None and origin == self.worker_id and own.issuperset(span):
+            own.difference_update(span)
+            return False
+        # Another worker bumped it (or this is the first value seen: assume so)
+        own.difference_update([v for v in own if v <= version])
+        self._applying = True
+        try:
+            invalidate_family(family_id)
+        finally:
+            self._applying = False
+        self.applied += 1
+        return True
+
+    async def _follow(self) -> None:
+        if self.mode in ("auto", "change_stream"):
+            try:
+                await self._watch()
+                return
+            except OperationFailure as exc:
+                if self.mode == "change_stream":
+                    raise
+                logger.info("Change streams unavailable (%s); polling %s instead", exc, COLLECTION)
+        await self._poll()
+
+    async def _watch(self) -> None:
+        resume_token = None
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        while True:
+            try:
+                async with self.collection.watch(
+                    pipeline, full_document="updateLookup", resume_after=resume_token
+                ) as stream:
+                    self.active_mode = "change_stream"
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        doc = change.get("fullDocument")
+                        if doc:
+                            self.observe(doc["family_id"], doc["version"], doc.get("origin"))
+            except OperationFailure:
+                if self.active_mode is None:
+                    raise  # never started: not a replica set
+                logger.warning("Cache invalidation change stream failed; resuming", exc_info=True)
+            except PyMongoError:
+                logger.warning("Cache invalidation change stream interrupted; resuming", exc_info=True)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _poll(self) -> None:
+        self.active_mode = "poll"
+        # Re-read a window behind the newest change so commits landing out of order are not missed;
+        # observe() ignores versions it has already seen.
+        window = timedelta(seconds=max(2 * self.poll_interval, 1.0))
+        since = datetime.utcnow() - window
+        while True:
+            try:
+                async for doc in self.collection.find({"updated_at": {"$gte": since - window}}, {"_id": 0}):
+                    self.observe(doc["family_id"], doc["version"], doc.get("origin"))
+                    since = max(since, doc["updated_at"])
+            except PyMongoError as exc:
+                logger.warning("Could not poll %s: %s", COLLECTION, exc)
+            await asyncio.sleep(self.poll_interval)
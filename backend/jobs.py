@@ -0,0 +1,425 @@
+"""Persistent background jobs for heavy recomputes.
+
+Admins enqueue work with ``POST /api/jobs`` and follow it at
+``GET /api/jobs/{id}`` instead of holding an HTTP request open. Jobs are
+documents in the ``jobs`` collection, so they survive restarts and any
+worker process can run them.
+
+:class:`JobWorkers` runs ``JOB_WORKERS`` asyncio workers in the app
+lifespan. A worker claims a job atomically, which leases it for
+``JOB_LEASE_SECONDS``; the lease is renewed while the handler runs and with
+every progress report. A job whose worker died is claimed again once its
+lease expires. A failed attempt is retried after ``JOB_BACKOFF_SECONDS``,
+doubling each time, until ``max_attempts`` is used up.
+
+Handlers are registered with :func:`job_handler` and receive a
+:class:`JobContext`. They must be safe to re-run: an attempt can be cut off
+at any point.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import logging
+import os
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import ValidationError
+
+import archive
+import forecast
+import sync
+from analytics import TransactionFrame
+from auth import get_admin_user, get_current_user
+from balances import apply_journaled, balance_deltas, journal
+from cache import invalidate_family
+from events import family_topic
+from ledger import TransactionRejected, check_transaction
+from models import Job, JobCreate, TransactionCreate, Transaction
+from repositories import Repositories, get_repositories
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """Another worker took the job over; the current attempt must stop."""
+
+
+class JobFailed(Exception):
+    """Raised by a handler to fail the job without retrying, e.g. on invalid parameters."""
+
+
+@dataclass
+class JobContext:
+    repos: Repositories
+    job: dict
+    worker_id: str
+    lease_seconds: float
+    archiver: archive.Archiver = field(default_factory=archive.Archiver)
+
+    @property
+    def family_id(self) -> str:
+        return self.job["family_id"]
+
+    @property
+    def params(self) -> dict:
+        return self.job.get("params") or {}
+
+    async def progress(self, fraction: float, message: Optional[str] = None) -> None:
+        """Report progress (0..1); also renews the lease."""
+        fields = {
+            "progress": round(min(max(fraction, 0.0), 1.0), 4),
+            "lease_expires_at": (datetime.utcnow() + timedelta(seconds=self.lease_seconds)).isoformat(),
+        }
+        if message is not None:
+            fields["message"] = message
+        if not await self.repos.jobs.update_leased(self.job["id"], self.worker_id, fields):
+            raise LeaseLost(self.job["id"])
+
+
+Handler = Callable[[JobContext], Awaitable[Optional[dict]]]
+HANDLERS: Dict[str, Handler] = {}
+
+
+def job_handler(name: str) -> Callable[[Handler], Handler]:
+    def register(handler: Handler) -> Handler:
+        HANDLERS[name] = handler
+        return handler
+    return register
+
+
+class JobWorkers:
+    """Worker pool claiming jobs from the repository; see the module docstring."""
+
+    def __init__(self, concurrency: int = 2, poll_interval: float = 2.0, lease_seconds: float = 60.0,
+                 backoff_seconds: float = 10.0, archiver: Optional[archive.Archiver] = None):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.backoff_seconds = backoff_seconds
+        self.archiver = archiver or archive.Archiver()
+        self.repositories = None
+        self.events = None
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._name = uuid.uuid4().hex[:8]
+
+    @classmethod
+    def from_env(cls, env=None) -> "JobWorkers":
+        env = os.environ if env is None else env
+        return cls(
+            concurrency=int(env.get("JOB_WORKERS", 2)),
+            poll_interval=float(env.get("JOB_POLL_SECONDS", 2)),
+            lease_seconds=float(env.get("JOB_LEASE_SECONDS", 60)),
+            backoff_seconds=float(env.get("JOB_BACKOFF_SECONDS", 10)),
+            archiver=archive.Archiver.from_env(env),
+        )
+
+    def start(self, repositories, events=None) -> None:
+        self.repositories = repositories
+        self.events = events
+        self._wake = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._work(f"{self._name}-{n}")) for n in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, repos: Repositories, family_id: str, type: str, params: Optional[dict] = None,
+                      user_id: Optional[str] = None, max_attempts: int = 3) -> dict:
+        job = Job(type=type, params=params or {}, family_id=family_id, created_by_user_id=user_id,
+                  max_attempts=max_attempts)
+        doc = job.model_dump()
+        for field in ("run_at", "created_at"):
+            doc[field] = doc[field].isoformat()
+        await repos.jobs.insert(doc)
+        if self._wake is not None:
+            self._wake.set()
+        return doc
+
+    async def _work(self, worker_id: str) -> None:
+        while True:
+            try:
+                ran = await self.run_once(worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job worker %s failed to claim a job", worker_id)
+                ran = False
+            if not ran:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run_once(self, worker_id: str = "inline") -> bool:
+        """Claim and run one job; ``False`` when none was due."""
+        repos = self.repositories
+        now = datetime.utcnow()
+        job = await repos.jobs.claim(worker_id, now, now + timedelta(seconds=self.lease_seconds))
+        if job is None:
+            return False
+        context = JobContext(repos, job, worker_id, self.lease_seconds, self.archiver)
+        handler = HANDLERS.get(job["type"])
+        if job["attempts"] > job["max_attempts"]:
+            await self._finish(context, "failed", error=job.get("error") or "Lease expired on every attempt")
+        elif handler is None:
+            await self._finish(context, "failed", error=f"Unknown job type '{job['type']}'")
+        else:
+            await self._execute(context, handler)
+        return True
+
+    async def _execute(self, context: JobContext, handler: Handler) -> None:
+        job = context.job
+        heartbeat = asyncio.ensure_future(self._heartbeat(context))
+        try:
+            result = await handler(context)
+        except LeaseLost:
+            logger.warning("Job %s was taken over by another worker", job["id"])
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.exception("Job %s (%s) attempt %d failed", job["id"], job["type"], job["attempts"])
+            if job["attempts"] < job["max_attempts"] and not isinstance(exc, JobFailed):
+                delay = self.backoff_seconds * 2 ** (job["attempts"] - 1)
+                await context.repos.jobs.update_leased(job["id"], context.worker_id, {
+                    "status": "queued", "error": str(exc), "worker_id": None, "lease_expires_at": None,
+                    "run_at": (datetime.utcnow() + timedelta(seconds=delay)).isoformat(),
+                })
+            else:
+                await self._finish(context, "failed", error=str(exc))
+            return
+        finally:
+            heartbeat.cancel()
+        await self._finish(context, "succeeded", result=result or {})
+
+    async def _heartbeat(self, context: JobContext) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            lease = datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+            await context.repos.jobs.update_leased(
+                context.job["id"], context.worker_id, {"lease_expires_at": lease.isoformat()}
+            )
+
+    async def _finish(self, context: JobContext, status: str, result: Optional[dict] = None,
+                      error: Optional[str] = None) -> None:
+        fields = {"status": status, "finished_at": datetime.utcnow().isoformat(), "lease_expires_at": None}
+        if status == "succeeded":
+            fields.update(progress=1.0, result=result, error=None)
+        else:
+            fields["error"] = error
+        if await context.repos.jobs.update_leased(context.job["id"], context.worker_id, fields):
+            if self.events is not None:
+                self.events.publish(family_topic(context.family_id), "job.finished",
+                                    {"id": context.job["id"], "type": context.job["type"], "status": status})
+
+
+def get_job_workers(request: Request) -> JobWorkers:
+    return request.app.state.jobs
+
+
+# ============= HANDLERS =============
+RECOMPUTE_ATTEMPTS = 3
+
+
+@job_handler("recompute_balances")
+async def recompute_balances(job: JobContext) -> dict:
+    """Reset every account's balance to its opening balance plus its transactions.
+
+    Accounts are read before the transactions, so every change in a balance
+    read is in the list: journaled rows count only for the accounts carrying
+    their flush id (see :mod:`balances`). A correction is applied only if
+    the balance is still the one it was computed from; an account a posting
+    moved in between is computed again, at most ``RECOMPUTE_ATTEMPTS`` times,
+    and counted as skipped if it keeps moving.
+    """
+    corrections: Dict[str, float] = {}
+    remaining: Optional[Set[str]] = None  # account ids still to check; None for every one
+    total = 0
+    for attempt in range(RECOMPUTE_ATTEMPTS):
+        accounts = [a for a in await job.repos.accounts.list_by_family(job.family_id)
+                    if remaining is None or a["id"] in remaining]
+        total = total or len(accounts)
+        await job.progress(0.1 + 0.8 * attempt / RECOMPUTE_ATTEMPTS, "Loading transactions")
+        transactions = await job.repos.transactions.list(job.family_id, limit=None)
+        transactions += await job.repos.archive.list(job.family_id)
+        deltas = balance_deltas([t for t in transactions if not t.get("balance_pending")])
+        journaled: Dict[str, List[dict]] = {}
+        for t in transactions:
+            if t.get("balance_pending") and t.get("balance_flush"):
+                journaled.setdefault(t["balance_flush"], []).append(t)
+        flush_deltas = {flush_id: balance_deltas(rows) for flush_id, rows in journaled.items()}
+        remaining = set()
+        for account in accounts:
+            expected = account.get("opening_balance", 0.0) + deltas.get(account["id"], 0.0) + sum(
+                flush_deltas[flush_id].get(account["id"], 0.0)
+                for flush_id in account.get("applied_flushes", ()) if flush_id in flush_deltas
+            )
+            current = account.get("current_balance", 0.0)
+            if abs(expected - current) <= 1e-9:
+                continue
+            if await job.repos.accounts.correct_balance(account["id"], current, expected - current):
+                corrections[account["id"]] = expected - current
+            else:
+                remaining.add(account["id"])
+        if not remaining:
+            break
+    await sync.record(job.repos, job.family_id, await sync.account_changes(job.repos, job.family_id, corrections))
+    return {"accounts": total, "corrected": len(corrections), "skipped": len(remaining)}
+
+
+@job_handler("rebuild_carryovers")
+async def rebuild_carryovers(job: JobContext) -> dict:
+    """Recompute the family's monthly carry-over balances in order, from its first month to now."""
+    transactions = await job.repos.transactions.list(job.family_id, limit=None)
+    transactions += await archive.cold_rows(job.repos, job.family_id)
+    if not transactions:
+        return {"months": 0}
+    frame = TransactionFrame.build(transactions, [])
+    first = int(frame.dates.min().astype("datetime64[s]").astype("datetime64[M]").astype("int64"))
+    now = datetime.now()
+    months = forecast.month_index(now.year, now.month) - first + 1
+    totals, _ = forecast.monthly_matrix(frame, first, months)
+    closing, loan = 0.0, 0.0
+    for step in range(months):
+        income, expense, _investment = totals[step]
+        opening, inherited_loan = closing, loan
+        # Same rule as the dashboard: investment only moves money between accounts
+        net = income + opening - expense
+        closing = net if net > 0 else 0.0
+        loan = inherited_loan + abs(net) if net < 0 else inherited_loan
+        year, month = forecast.from_month_index(first + step)
+        await job.repos.balances.upsert(job.family_id, month, year, None, {
+            "opening_balance": float(opening),
+            "closing_balance": float(closing),
+            "has_loan": loan > 0,
+            "loan_amount": float(loan),
+            "created_at": datetime.utcnow().isoformat(),
+        })
+        await job.progress((step + 1) / months, f"{year}-{month:02d}")
+    return {"months": months, "closing_balance": float(closing), "loan_amount": float(loan)}
+
+
+IMPORT_BATCH = 500
+
+
+@job_handler("import_transactions")
+async def import_transactions(job: JobContext) -> dict:
+    """Insert ``params["transactions"]`` (TransactionCreate fields) in batches.
+
+    Every row must pass :func:`ledger.check_transaction` against the
+    family's accounts and categories, read once, or the job fails naming
+    the row. Ids derive from the job id and row position, so a retried
+    attempt skips the rows an earlier one inserted. Each batch is journaled
+    under its own flush id (see :mod:`balances`); a retry also applies the
+    balance change of rows an earlier attempt inserted but did not get to
+    apply, under the flush id they were stored with, so none is applied
+    twice.
+    """
+    rows = job.params.get("transactions") or []
+    user = await job.repos.users.get(job.job.get("created_by_user_id")) or {}
+    accounts = {a["id"]: a for a in await job.repos.accounts.list_by_family(job.family_id)}
+    categories = {c["id"]: c for c in await job.repos.categories.list_by_family(job.family_id)}
+    namespace = uuid.UUID(job.job["id"])
+    inserted_total, posted = 0, []
+    for start in range(0, len(rows), IMPORT_BATCH):
+        docs = []
+        for position, row in enumerate(rows[start:start + IMPORT_BATCH], start=start):
+            try:
+                data = TransactionCreate(**row)
+            except ValidationError as exc:
+                raise JobFailed(f"Row {position}: {exc.errors()[0]['msg']}")
+            try:
+                check_transaction(data, job.family_id, accounts, categories)
+            except TransactionRejected as exc:
+                raise JobFailed(f"Row {position}: {exc.detail}")
+            transaction = Transaction(
+                **data.model_dump(), id=str(uuid.uuid5(namespace, str(position))), family_id=job.family_id,
+                user_id=user.get("id"), user_name=user.get("name"), user_icon=user.get("profile_icon"),
+            )
+            doc = transaction.model_dump()
+            doc["date"] = doc["date"].isoformat()
+            doc["created_at"] = doc["created_at"].isoformat()
+            docs.append(doc)
+        flush_id = str(uuid.uuid4())
+        journal(docs, flush_id)
+        inserted = set(await job.repos.transactions.insert_many(docs))
+        batch = [doc for doc in docs if doc["id"] in inserted]
+        await apply_journaled(job.repos, flush_id, batch)
+        # Rows an earlier attempt inserted but did not get to apply, replayed under their own flush id
+        unapplied: Dict[str, List[dict]] = {}
+        for doc in docs:
+            if doc["id"] not in inserted and doc.get("balance_pending"):
+                stored = await job.repos.transactions.get(doc["id"])
+                if stored is not None and stored.get("balance_pending"):
+                    unapplied.setdefault(stored["balance_flush"], []).append(stored)
+        for earlier, stored in unapplied.items():
+            await apply_journaled(job.repos, earlier, stored)
+        posted += batch
+        inserted_total += len(batch)
+        await job.progress((start + len(docs)) / len(rows), f"{start + len(docs)} of {len(rows)} rows")
+    if posted:
+        invalidate_family(job.family_id)
+        await sync.record(job.repos, job.family_id, [("transactions", doc["id"], doc) for doc in posted])
+    return {"rows": len(rows), "inserted": inserted_total}
+
+
+@job_handler("archive_transactions")
+async def archive_transactions(job: JobContext) -> dict:
+    """Move transactions dated before ``params["before"]`` (``YYYY-MM``, default
+    ``ARCHIVE_HORIZON_MONTHS`` back) into the archive; see :mod:`archive`."""
+    cutoff = job.params.get("before") or job.archiver.default_cutoff()
+    if not isinstance(cutoff, str) or not archive.MONTH.fullmatch(cutoff):
+        raise JobFailed("before must be a month as YYYY-MM")
+    if cutoff > archive.month_key(datetime.now()):
+        raise JobFailed("before cannot be later than the current month")
+    return await job.archiver.archive_family(job.repos, job.family_id, cutoff, job.progress)
+
+
+# ============= ENDPOINTS =============
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+
+@router.post("", response_model=Job, status_code=202)
+async def create_job(
+    job_data: JobCreate,
+    current_user: dict = Depends(get_admin_user),
+    repos: Repositories = Depends(get_repositories),
+    workers: JobWorkers = Depends(get_job_workers)
+):
+    """Queue heavy work for the family. Admin only."""
+    if job_data.type not in HANDLERS:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown job type; expected one of {', '.join(sorted(HANDLERS))}"
+        )
+    return await workers.enqueue(
+        repos, current_user["family_id"], job_data.type, job_data.params, user_id=current_user["user_id"]
+    )
+
+
+@router.get("", response_model=List[Job])
+async def list_jobs(
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    """The family's most recent jobs."""
+    return await repos.jobs.list_by_family(current_user["family_id"])
+
+
+@router.get("/{job_id}", response_model=Job)
+async def get_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    """Status, progress and result of a job."""
+    job = await repos.jobs.get(job_id)
+    if not job or job.get("family_id") != current_user["family_id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -0,0 +1,60 @@
+"""Rules a transaction must satisfy before it is stored.
+
+``POST /api/transactions`` and the import job both go through
+:func:`check_transaction`, so an imported row is held to the same rules as
+one entered by hand: transfers and investments name both accounts, income
+and expenses a category, and every account or category named belongs to
+the family the transaction is posted to. Balance updates match accounts by
+id alone (see ``AccountRepository.adjust_balances``), so the last rule is
+what keeps a transaction from moving another family's balances.
+"""
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from models import TransactionCreate
+
+ACCOUNT_TYPES = ("transfer", "investment")  # types moving money from account_id to to_account_id
+
+
+class TransactionRejected(HTTPException):
+    """A transaction breaking one of the rules; the API answers with its status code."""
+
+
+def _owned(docs: Dict[str, Optional[dict]], doc_id: str, family_id: str) -> bool:
+    doc = docs.get(doc_id)
+    return doc is not None and doc.get("family_id") == family_id
+
+
+def check_transaction(data: TransactionCreate, family_id: str, accounts: Dict[str, Optional[dict]],
+                      categories: Dict[str, Optional[dict]]) -> None:
+    """Raise :class:`TransactionRejected` unless ``data`` may be posted to ``family_id``.
+
+    ``accounts`` and ``categories`` map ids to documents (``None`` when
+    missing) and must hold at least the ones ``data`` names.
+    """
+    if data.type in ACCOUNT_TYPES:
+        if not data.account_id or not data.to_account_id:
+            raise TransactionRejected(
+                status_code=400,
+                detail=f"{data.type.capitalize()} requires both account_id (from) and to_account_id"
+            )
+        if not _owned(accounts, data.account_id, family_id) or not _owned(accounts, data.to_account_id, family_id):
+            raise TransactionRejected(status_code=404, detail="Account not found")
+        return
+    if not data.category_id:
+        raise TransactionRejected(status_code=400, detail="Category required for this transaction type")
+    if not _owned(categories, data.category_id, family_id):
+        raise TransactionRejected(status_code=404, detail="Category not found")
+    if data.account_id and not _owned(accounts, data.account_id, family_id):
+        raise TransactionRejected(status_code=404, detail="Account not found")
+
+
+async def referenced(repos, data: TransactionCreate) -> Tuple[Dict[str, Optional[dict]], Dict[str, Optional[dict]]]:
+    """The accounts and categories :func:`check_transaction` needs for ``data``, one read each."""
+    account_ids = [data.account_id, data.to_account_id] if data.type in ACCOUNT_TYPES else [data.account_id]
+    accounts = {account_id: await repos.accounts.get(account_id) for account_id in account_ids if account_id}
+    categories = {}
+    if data.type not in ACCOUNT_TYPES and data.category_id:
+        categories[data.category_id] = await repos.categories.get(data.category_id)
+    return accounts, categories
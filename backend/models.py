@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from datetime import datetime
 import uuid
 
@@ -42,6 +42,57 @@ class Transaction(TransactionBase):
     user_id: Optional[str] = None  # Track which user created the transaction
     user_name: Optional[str] = None  # For display purposes
     user_icon: Optional[str] = None  # For display purposes
+    recurring_id: Optional[str] = None  # Template this transaction was posted from
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class RecurringTransactionBase(BaseModel):
+    amount: float
+    category_id: Optional[str] = None
+    type: Literal["income", "expense", "investment", "transfer"]
+    description: Optional[str] = None
+    account_id: Optional[str] = None
+    to_account_id: Optional[str] = None
+    schedule: str  # Cron expression: minute hour day-of-month month day-of-week
+    start_date: datetime
+    end_date: Optional[datetime] = None
+
+class RecurringTransactionCreate(RecurringTransactionBase):
+    pass
+
+class RecurringTransaction(RecurringTransactionBase):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    family_id: Optional[str] = None
+    user_id: Optional[str] = None
+    user_name: Optional[str] = None
+    user_icon: Optional[str] = None
+    next_run: Optional[datetime] = None  # Next occurrence to post; None once the schedule has ended
+    active: bool = True
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class JobCreate(BaseModel):
+    type: str  # One of the registered job handlers, e.g. "recompute_balances"
+    params: dict = Field(default_factory=dict)
+
+class Job(JobCreate):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    family_id: Optional[str] = None
+    created_by_user_id: Optional[str] = None
+    status: Literal["queued", "running", "succeeded", "failed"] = "queued"
+    progress: float = 0.0  # 0..1
+    message: Optional[str] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    max_attempts: int = 3
+    run_at: datetime = Field(default_factory=datetime.utcnow)  # Not before; pushed back between retries
+    lease_expires_at: Optional[datetime] = None
+    worker_id: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -123,6 +174,23 @@ class PeriodStats(BaseModel):
     investment_by_category: dict
 
 
+class PivotFilters(BaseModel):
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None  # Exclusive
+    types: Optional[List[Literal["income", "expense", "investment", "transfer"]]] = None
+    category_ids: Optional[List[Optional[str]]] = None  # null selects uncategorized transactions
+    account_ids: Optional[List[Optional[str]]] = None
+    user_ids: Optional[List[str]] = None
+
+class PivotQuery(BaseModel):
+    measures: List[Literal["sum", "count", "avg"]] = Field(default_factory=lambda: ["sum"], min_length=1)
+    # Rows are grouped, and sorted, by the dimensions in this order
+    dimensions: List[Literal["type", "category", "account", "user", "day", "week", "month", "quarter", "year"]] = Field(
+        default_factory=list, max_length=4
+    )
+    filters: PivotFilters = Field(default_factory=PivotFilters)
+
+
 # ============= AUTH & USER MODELS =============
 class UserBase(BaseModel):
     name: str
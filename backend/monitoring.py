@@ -0,0 +1,118 @@
+"""Database command events.
+
+Every command the backend sends to MongoDB is published here as a
+:class:`CommandEvent`: by a pymongo ``CommandListener`` for the Motor backend,
+and directly by the in-memory backend, so consumers see the same stream
+offline. Subscribers are plain callables and must be cheap; pymongo invokes
+them on the driver's worker threads.
+"""
+from contextvars import ContextVar
+from pymongo import monitoring
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import threading
+
+# Handshake, auth and heartbeat traffic is not interesting to consumers
+IGNORED_COMMANDS = frozenset({
+    "hello", "ismaster", "isMaster", "ping", "buildinfo", "buildInfo",
+    "saslStart", "saslContinue", "getnonce", "authenticate", "endSessions",
+    "killCursors",
+})
+
+
+class CommandEvent(NamedTuple):
+    collection: str
+    command: str
+    duration: float  # seconds
+    succeeded: bool = True
+    n_returned: Optional[int] = None
+    filter: Optional[dict] = None
+    database: Optional[str] = None
+
+
+# "METHOD /route/template" of the request being served. Motor copies the
+# context into its executor, so subscribers see it on driver threads too.
+current_route: ContextVar[Optional[str]] = ContextVar("current_route", default=None)
+
+Subscriber = Callable[[CommandEvent], None]
+
+_subscribers: List[Subscriber] = []
+
+
+def subscribe(subscriber: Subscriber) -> Subscriber:
+    if subscriber not in _subscribers:
+        _subscribers.append(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber: Subscriber) -> None:
+    if subscriber in _subscribers:
+        _subscribers.remove(subscriber)
+
+
+def publish(event: CommandEvent) -> None:
+    for subscriber in list(_subscribers):
+        subscriber(event)
+
+
+def _command_filter(command_name: str, command: dict) -> Optional[dict]:
+    if command_name in ("find", "count", "distinct"):
+        return command.get("filter") or command.get("query")
+    if command_name == "aggregate":
+        return {"pipeline": command.get("pipeline")}
+    if command_name in ("update", "delete"):
+        statements = command.get(command_name + "s") or []
+        return statements[0].get("q") if statements else None
+    if command_name == "findAndModify":
+        return command.get("query")
+    return None
+
+
+def _n_returned(reply: dict) -> Optional[int]:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        if batch is not None:
+            return len(batch)
+    if "n" in reply:
+        return reply["n"]
+    return None
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Feeds pymongo command monitoring into :func:`publish`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple, Tuple[str, Optional[dict]]] = {}
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        key = (event.connection_id, event.request_id)
+        with self._lock:
+            self._pending[key] = (collection, _command_filter(event.command_name, event.command))
+
+    def _finish(self, event, succeeded, reply=None):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        collection, command_filter = pending
+        publish(CommandEvent(
+            collection=collection,
+            command=event.command_name,
+            duration=event.duration_micros / 1e6,
+            succeeded=succeeded,
+            n_returned=_n_returned(reply) if reply else None,
+            filter=command_filter,
+            database=event.database_name,
+        ))
+
+    def succeeded(self, event):
+        self._finish(event, True, event.reply)
+
+    def failed(self, event):
+        self._finish(event, False)
@@ -0,0 +1,175 @@
+"""Pivot queries over a family's transactions.
+
+``POST /api/analytics/query`` takes a :class:`models.PivotQuery`: measures
+(``sum``, ``count``, ``avg`` of ``amount``), dimensions (``type``,
+``category``, ``account``, ``user``, and ``day`` / ``week`` / ``month`` /
+``quarter`` / ``year`` of the date) and filters, so the Compare tab can
+build a category x month pivot, or any other, without a new endpoint.
+
+:func:`compile_pipeline` turns the query into one aggregation: a
+``$match`` on ``family_id`` and the date range first, so it is served by
+the ``(family_id, date)`` index, then a ``$group`` on the dimensions, whose
+date parts are cut from the ISO ``date`` string, and ``$sort`` / ``$limit``.
+Every group carries its sum and count; ``avg`` is derived from them, which
+lets the groups of ``transactions_archive`` (when the range reaches behind
+the archive horizon, see :mod:`archive`) be merged in exactly.
+
+The limit is ``PIVOT_MAX_GROUPS`` (5000) plus one: a query with more
+groups than that is refused with ``422`` rather than cut short. Results are
+cached per family data version (see :mod:`cache`), keyed on the normalized
+query, so equivalent queries share an entry.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+import json
+import os
+
+from fastapi import HTTPException, Request
+
+from archive import month_start
+from cache import LRUCache, family_version
+from models import PivotQuery
+
+MAX_GROUPS = int(os.environ.get("PIVOT_MAX_GROUPS", 5000))
+
+
+def _date_part(length: int) -> dict:
+    return {"$substrBytes": ["$date", 0, length]}
+
+
+DIMENSIONS = {
+    "type": "$type",
+    "category": "$category_id",
+    "account": "$account_id",
+    "user": "$user_id",
+    "day": _date_part(10),
+    "week": {"$dateToString": {"format": "%G-W%V", "date": {"$dateFromString": {"dateString": _date_part(10)}}}},
+    "month": _date_part(7),
+    "quarter": {"$concat": [_date_part(4), "-Q", {"$toString": {"$toInt": {"$ceil": {
+        "$divide": [{"$toInt": {"$substrBytes": ["$date", 5, 2]}}, 3]
+    }}}}]},
+    "year": _date_part(4),
+}
+FILTERS = {"types": "type", "category_ids": "category_id", "account_ids": "account_id", "user_ids": "user_id"}
+LABELS = {"category": "categories", "account": "accounts"}  # dimension -> repository with names
+
+
+def _naive(value: Optional[datetime]) -> Optional[str]:
+    return value.replace(tzinfo=None).isoformat() if value is not None else None
+
+
+def _unique(values) -> list:
+    return sorted(set(values), key=lambda v: (v is not None, v or ""))
+
+
+def normalize(query: PivotQuery) -> dict:
+    """``query`` with duplicates dropped and lists ordered, so equivalent queries compare equal."""
+    filters = query.filters
+    return {
+        "measures": sorted(set(query.measures)),
+        "dimensions": list(dict.fromkeys(query.dimensions)),
+        "start": _naive(filters.start_date),
+        "end": _naive(filters.end_date),
+        **{name: _unique(getattr(filters, name)) for name in FILTERS if getattr(filters, name) is not None},
+    }
+
+
+def compile_pipeline(family_id: str, query: dict, start: Optional[str] = None, end: Optional[str] = None,
+                     limit: int = MAX_GROUPS) -> List[dict]:
+    """The aggregation for a :func:`normalize`-d ``query``; ``start`` / ``end`` default to its range."""
+    match = {"family_id": family_id}
+    dates = {}
+    if start or query["start"]:
+        dates["$gte"] = start or query["start"]
+    if end or query["end"]:
+        dates["$lt"] = end or query["end"]
+    if dates:
+        match["date"] = dates
+    for name, field in FILTERS.items():
+        if name in query:
+            match[field] = {"$in": query[name]}
+    group_id = {name: DIMENSIONS[name] for name in query["dimensions"]} or None
+    return [
+        {"$match": match},
+        {"$group": {"_id": group_id, "sum": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+        {"$limit": limit + 1},
+    ]
+
+
+def merge(query: dict, *sources: List[dict]) -> List[dict]:
+    """Rows of the requested measures from the groups of one or more pipelines."""
+    dimensions = query["dimensions"]
+    merged: Dict[tuple, dict] = {}
+    for groups in sources:
+        for group in groups:
+            key = tuple((group["_id"] or {}).get(name) for name in dimensions)
+            row = merged.setdefault(key, {"sum": 0.0, "count": 0})
+            row["sum"] += group["sum"]
+            row["count"] += group["count"]
+    rows = []
+    for key in sorted(merged, key=lambda k: tuple((v is not None, v or "") for v in k)):
+        total = merged[key]
+        values = {"sum": round(total["sum"], 2), "count": total["count"],
+                  "avg": round(total["sum"] / total["count"], 2) if total["count"] else None}
+        rows.append({**dict(zip(dimensions, key)), **{m: values[m] for m in query["measures"]}})
+    return rows
+
+
+class PivotEngine:
+    """Runs pivot queries, with results cached per family data version and normalized query."""
+
+    def __init__(self, max_groups: int = MAX_GROUPS, max_families: int = 256, queries_per_family: int = 32):
+        self.max_groups = max_groups
+        self.queries_per_family = queries_per_family
+        self._families = LRUCache(max_families)  # family_id -> (version, LRUCache of query key -> body)
+        self.computed = 0
+
+    async def run(self, repos, family_id: str, query: PivotQuery) -> dict:
+        normalized = normalize(query)
+        key = json.dumps(normalized, sort_keys=True)
+        version = family_version(family_id)
+        entry = self._families.get(family_id)
+        if entry is None or entry[0] != version:
+            entry = (version, LRUCache(self.queries_per_family))
+            self._families.put(family_id, entry)
+        body = entry[1].get(key)
+        if body is None:
+            body = await self._compute(repos, family_id, normalized)
+            self.computed += 1
+            if family_version(family_id) == version:
+                entry[1].put(key, body)
+        return body
+
+    def _check(self, count: int) -> None:
+        if count > self.max_groups:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Query produces more than {self.max_groups} rows; narrow the filters or drop a dimension"
+            )
+
+    async def _compute(self, repos, family_id: str, query: dict) -> dict:
+        sources = [await repos.transactions.aggregate(compile_pipeline(family_id, query, limit=self.max_groups))]
+        self._check(len(sources[0]))
+        horizon = await repos.archive.horizon(family_id)
+        if horizon is not None:
+            limit = month_start(horizon).isoformat()
+            if query["start"] is None or query["start"] < limit:
+                end = min(query["end"], limit) if query["end"] else limit
+                sources.append(await repos.archive.aggregate(
+                    compile_pipeline(family_id, query, end=end, limit=self.max_groups)
+                ))
+        rows = merge(query, *sources)
+        self._check(len(rows))
+
+        for dimension, repository in LABELS.items():
+            if dimension in query["dimensions"]:
+                docs = await getattr(repos, repository).list_by_family(family_id)
+                names = {doc["id"]: doc.get("name") for doc in docs}
+                for row in rows:
+                    row[f"{dimension}_name"] = names.get(row[dimension])
+        return {"measures": query["measures"], "dimensions": query["dimensions"], "rows": rows}
+
+
+def get_pivot_engine(request: Request) -> PivotEngine:
+    return request.app.state.pivots
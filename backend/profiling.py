@@ -0,0 +1,225 @@
+"""Opt-in profiling of a single request.
+
+An admin adds ``X-Profile: inline`` (or ``?profile=inline``) to any request
+and gets back, instead of the normal response, a JSON report with:
+
+  * the top functions from cProfile, by cumulative time
+  * the tracemalloc peak and the largest allocation sites
+  * every database command the request issued, with duration and
+    documents returned
+
+``X-Profile: save`` serves the normal response and writes the report (plus
+a ``.prof`` file for snakeviz/pstats) under ``PROFILE_DIR``; the path is
+returned in the ``X-Profile-Report`` header. Requests from non-admins are
+served normally. ``PROFILING_ENABLED=false`` turns the hook off entirely.
+
+cProfile and tracemalloc are process-wide, so only one request is profiled
+at a time and its numbers include whatever else the event loop ran
+meanwhile; profile on a quiet worker for clean results.
+"""
+from contextvars import ContextVar
+from datetime import datetime
+from fastapi import HTTPException
+from typing import List, Optional
+from urllib.parse import parse_qs
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+import uuid
+
+from auth import decode_token
+from monitoring import CommandEvent, subscribe
+
+logger = logging.getLogger(__name__)
+
+MODES = ("inline", "save")
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 15
+
+# Commands issued by the request being profiled. Motor runs pymongo on a
+# thread pool but copies the caller's context, so the listener sees this too.
+_commands: ContextVar[Optional[List[CommandEvent]]] = ContextVar("profiled_commands", default=None)
+
+
+@subscribe
+def _record_command(event: CommandEvent) -> None:
+    commands = _commands.get()
+    if commands is not None:
+        commands.append(event)
+
+
+def _enabled() -> bool:
+    return os.environ.get("PROFILING_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def _requested_mode(scope) -> Optional[str]:
+    headers = dict(scope.get("headers") or [])
+    mode = headers.get(b"x-profile", b"").decode("latin-1").lower()
+    if not mode:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        mode = (query.get("profile") or [""])[0].lower()
+    if mode in ("1", "true"):
+        mode = "inline"
+    return mode if mode in MODES else None
+
+
+def _is_admin(scope) -> bool:
+    headers = dict(scope.get("headers") or [])
+    scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        payload = decode_token(token)
+    except HTTPException:
+        return False
+    return payload.get("role") == "admin" and payload.get("scope") is None
+
+
+def _function_stats(profiler: cProfile.Profile) -> List[dict]:
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (calls, primitive, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "own_ms": round(own * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3),
+        })
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return rows[:TOP_FUNCTIONS]
+
+
+def _command_report(commands: List[CommandEvent]) -> dict:
+    return {
+        "count": len(commands),
+        "total_ms": round(sum(c.duration for c in commands) * 1000, 3),
+        "commands": [
+            {
+                "collection": c.collection,
+                "command": c.command,
+                "duration_ms": round(c.duration * 1000, 3),
+                "n_returned": c.n_returned,
+                "succeeded": c.succeeded,
+                "filter": c.filter,
+            }
+            for c in commands
+        ],
+    }
+
+
+class ProfilingMiddleware:
+    """ASGI middleware implementing the profiling hook described above."""
+
+    def __init__(self, app, directory: Optional[str] = None):
+        self.app = app
+        self.directory = directory or os.environ.get("PROFILE_DIR", "/tmp/spend-tracker-profiles")
+        self._lock = asyncio.Lock()
+
+    async def __call__(self, scope, receive, send):
+        mode = _requested_mode(scope) if scope["type"] == "http" and _enabled() else None
+        if mode is None or not _is_admin(scope):
+            await self.app(scope, receive, send)
+            return
+        if self._lock.locked():
+            await self.app(scope, receive, self._with_header(send, b"x-profile-status", b"busy"))
+            return
+        async with self._lock:
+            await self._profile(mode, scope, receive, send)
+
+    @staticmethod
+    def _with_header(send, name: bytes, value: bytes):
+        async def wrapped(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (name, value)]}
+            await send(message)
+        return wrapped
+
+    async def _profile(self, mode, scope, receive, send):
+        start_message, body = None, []
+
+        async def capture(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+
+        commands: List[CommandEvent] = []
+        token = _commands.set(commands)
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - started
+            _commands.reset(token)
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+
+        if start_message is None:
+            start_message = {"type": "http.response.start", "status": 500, "headers": []}
+        status = start_message["status"]
+        payload = b"".join(body)
+        report = {
+            "request": {
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": status,
+                "duration_ms": round(duration * 1000, 3),
+                "response_bytes": len(payload),
+            },
+            "db": _command_report(commands),
+            "memory": {
+                "peak_bytes": peak,
+                "top_allocations": [
+                    {"location": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+                ],
+            },
+            "functions": _function_stats(profiler),
+        }
+
+        if mode == "save":
+            path = self._save(report, profiler)
+            headers = [*start_message.get("headers", []), (b"x-profile-report", path.encode())]
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": payload})
+            return
+
+        content = json.dumps(report, default=str).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(content)).encode()),
+                (b"x-profiled-status", str(status).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": content})
+
+    def _save(self, report: dict, profiler: cProfile.Profile) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        stem = os.path.join(
+            self.directory, f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        )
+        profiler.dump_stats(stem + ".prof")
+        with open(stem + ".json", "w") as fh:
+            json.dump(report, fh, indent=2, default=str)
+        logger.info("Saved profile of %s %s to %s.json", report["request"]["method"],
+                    report["request"]["path"], stem)
+        return stem + ".json"
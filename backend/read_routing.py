@@ -0,0 +1,144 @@
+"""Read preference for the read-heavy analytics routes.
+
+The ``/dashboard/*`` and ``/budget/*`` endpoints aggregate a family's
+history and can be served from replica set secondaries, leaving the primary
+to the transaction writes. Their handlers take
+``Depends(analytics_repositories("dashboard"))`` (or ``"budget"``) instead of
+``get_repositories``; every other route, and every write, keeps the primary.
+Writes issued through an analytics view (the monthly balance upsert of
+``/dashboard/stats``) still go to the primary: read preference only applies
+to reads.
+
+``ANALYTICS_READ_PREFERENCE`` sets the mode for every route group
+(``primary``, the default, ``primaryPreferred``, ``secondaryPreferred``,
+``secondary`` or ``nearest``) and ``ANALYTICS_MAX_STALENESS_SECONDS`` (at
+least 90, MongoDB's minimum; 90 by default) how far behind a secondary may
+be to be picked. ``ANALYTICS_READ_PREFERENCE_<GROUP>`` overrides one group,
+as ``mode`` or ``mode:seconds``.
+
+A family written within the staleness bound is read from the primary: a
+lagging secondary would otherwise show a user the dashboard without the
+transaction they just added, and the per-version caches (see :mod:`cache`)
+would keep that stale result until the next write. Invalidations from other
+workers arrive through the same listener (see :mod:`invalidation`).
+"""
+from typing import Dict, Optional, Tuple
+import os
+import threading
+import time
+
+from fastapi import Depends, Request
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+from auth import get_current_user
+from cache import on_invalidate, remove_listener
+from repositories import Repositories, get_repositories
+
+GROUPS = ("dashboard", "budget")
+MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondaryPreferred": SecondaryPreferred,
+    "secondary": Secondary,
+    "nearest": Nearest,
+}
+MIN_STALENESS_SECONDS = 90
+
+Preference = Tuple[str, Optional[int]]  # (mode, max staleness seconds)
+
+
+def parse_preference(value: str, default_staleness: int = MIN_STALENESS_SECONDS) -> Preference:
+    """``"mode"`` or ``"mode:seconds"``; ``ValueError`` when invalid."""
+    mode, _, seconds = value.strip().partition(":")
+    if mode not in MODES:
+        raise ValueError(f"Read preference must be one of {', '.join(MODES)}, not {mode!r}")
+    if mode == "primary":
+        return mode, None
+    staleness = int(seconds) if seconds else default_staleness
+    if staleness < MIN_STALENESS_SECONDS:
+        raise ValueError(f"maxStalenessSeconds must be at least {MIN_STALENESS_SECONDS}")
+    return mode, staleness
+
+
+def read_preference(preference: Preference):
+    mode, staleness = preference
+    if mode == "primary":
+        return Primary()
+    return MODES[mode](max_staleness=staleness)
+
+
+class ReadRouting:
+    """Per route group read preferences, with recently written families pinned to the primary."""
+
+    def __init__(self, preferences: Optional[Dict[str, Preference]] = None):
+        self.preferences = {group: ("primary", None) for group in GROUPS}
+        self.preferences.update(preferences or {})
+        self.pinned = 0  # reads sent to the primary because of a recent write
+        self._written: Dict[str, float] = {}  # family_id -> monotonic time of the last write
+        self._lock = threading.Lock()
+        self._views: Dict[str, Tuple[Repositories, Repositories]] = {}  # group -> (base, view)
+        self._window = max((s for _, s in self.preferences.values() if s), default=0)
+
+    @classmethod
+    def from_env(cls, env=None) -> "ReadRouting":
+        env = os.environ if env is None else env
+        staleness = int(env.get("ANALYTICS_MAX_STALENESS_SECONDS", MIN_STALENESS_SECONDS))
+        default = env.get("ANALYTICS_READ_PREFERENCE", "primary")
+        return cls({
+            group: parse_preference(env.get(f"ANALYTICS_READ_PREFERENCE_{group.upper()}", default), staleness)
+            for group in GROUPS
+        })
+
+    def start(self) -> None:
+        if self._window:
+            on_invalidate(self._written_to)
+
+    def stop(self) -> None:
+        remove_listener(self._written_to)
+        self._views.clear()
+
+    def _written_to(self, family_id: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._written[family_id] = now
+            if len(self._written) > 10000:
+                cutoff = now - self._window
+                self._written = {f: t for f, t in self._written.items() if t >= cutoff}
+
+    def recently_written(self, family_id: Optional[str], seconds: int) -> bool:
+        written = self._written.get(family_id) if family_id else None
+        return written is not None and time.monotonic() - written < seconds
+
+    def repositories(self, repositories: Repositories, group: str, family_id: Optional[str] = None) -> Repositories:
+        """The repositories ``group``'s handlers should read ``family_id``'s data through."""
+        mode, staleness = self.preferences[group]
+        if mode == "primary":
+            return repositories
+        if staleness and self.recently_written(family_id, staleness):
+            self.pinned += 1
+            return repositories
+        cached = self._views.get(group)
+        if cached is None or cached[0] is not repositories:
+            cached = self._views[group] = (repositories, repositories.with_read_preference(
+                read_preference((mode, staleness))
+            ))
+        return cached[1]
+
+
+def get_read_routing(request: Request) -> ReadRouting:
+    return request.app.state.read_routing
+
+
+def analytics_repositories(group: str):
+    """Dependency returning the repositories ``group``'s routes read through."""
+    if group not in GROUPS:
+        raise ValueError(f"Unknown route group {group!r}")
+
+    def dependency(
+        current_user: dict = Depends(get_current_user),
+        repos: Repositories = Depends(get_repositories),
+        routing: ReadRouting = Depends(get_read_routing)
+    ) -> Repositories:
+        return routing.repositories(repos, group, current_user.get("family_id"))
+
+    return dependency
@@ -0,0 +1,288 @@
+"""Recurring transaction templates and the scheduler that posts them.
+
+A template carries a cron expression (``minute hour day-of-month month
+day-of-week``, or one of ``@hourly``, ``@daily``, ``@weekly``, ``@monthly``,
+``@yearly``) and the ISO date of its next occurrence, ``next_run``.
+:class:`RecurringScheduler` runs in the app lifespan and every
+``RECURRING_INTERVAL_SECONDS`` materializes what is due across all
+families, one batch of templates at a time:
+
+  1. one query for up to ``RECURRING_BATCH_SIZE`` due templates,
+  2. one ``insert_many`` for all their occurrences, journaled with the
+     batch's flush id (see :mod:`balances`),
+  3. one bulk ``$inc`` of the account balances, summed per account,
+  4. one bulk update advancing every template's ``next_run``,
+
+then, per family that got postings, one read of the accounts they moved
+and two change-log writes for delta sync (see :mod:`sync`), one for those
+accounts and one for the new rows, which also go to the anomaly detector
+(see :mod:`anomalies`).
+
+A posted transaction's id is derived from its template id and occurrence
+time, so the unique index on ``id`` is the idempotency key: after a crash or
+restart, or with several workers running the scheduler, re-posting an
+occurrence is a skipped duplicate, and balances only move for the rows that
+were actually inserted. Rows inserted by a run that died before step 3
+stay journaled and the balance recovery applies them.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import uuid
+
+from balances import apply_journaled, journal
+from cache import invalidate_family
+from events import family_topic
+import sync
+
+logger = logging.getLogger(__name__)
+
+# Namespace for transaction ids derived from (template, occurrence)
+OCCURRENCE_NAMESPACE = uuid.UUID("2ddf63a9-1d09-43a9-8696-91b7c3d798f2")
+
+ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+}
+FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day of month", 1, 31), ("month", 1, 12), ("day of week", 0, 7))
+
+
+def _parse_field(text: str, name: str, low: int, high: int) -> FrozenSet[int]:
+    values: Set[int] = set()
+    for part in text.split(","):
+        spec, _, step_text = part.partition("/")
+        try:
+            step = int(step_text) if step_text else 1
+            if spec == "*":
+                first, last = low, high
+            elif "-" in spec:
+                first, last = (int(v) for v in spec.split("-", 1))
+            else:
+                first = int(spec)
+                last = high if step_text else first
+        except ValueError:
+            raise ValueError(f"Invalid {name} field '{text}'")
+        if step < 1 or not low <= first <= last <= high:
+            raise ValueError(f"Invalid {name} field '{text}'")
+        values.update(range(first, last + 1, step))
+    return frozenset(values)
+
+
+@dataclass(frozen=True)
+class CronSchedule:
+    minutes: Tuple[int, ...]
+    hours: Tuple[int, ...]
+    days: FrozenSet[int]
+    months: FrozenSet[int]
+    weekdays: FrozenSet[int]  # 0 is Sunday
+    any_day: bool
+    any_weekday: bool
+
+    @classmethod
+    def parse(cls, expression: str) -> "CronSchedule":
+        """Parse a five-field cron expression; raises ``ValueError`` when it is invalid."""
+        text = ALIASES.get(expression.strip().lower(), expression)
+        parts = text.split()
+        if len(parts) != len(FIELDS):
+            raise ValueError("Schedule must have 5 fields: minute hour day-of-month month day-of-week")
+        minutes, hours, days, months, weekdays = (
+            _parse_field(part, *field) for part, field in zip(parts, FIELDS)
+        )
+        return cls(
+            minutes=tuple(sorted(minutes)),
+            hours=tuple(sorted(hours)),
+            days=days,
+            months=months,
+            weekdays=frozenset(d % 7 for d in weekdays),
+            any_day=parts[2].startswith("*"),
+            any_weekday=parts[4].startswith("*"),
+        )
+
+    def _day_matches(self, day: date) -> bool:
+        in_month = day.day in self.days
+        in_week = (day.isoweekday() % 7) in self.weekdays
+        # As in cron: when both day fields are restricted, either one matching is enough
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_at_or_after(self, moment: datetime) -> Optional[datetime]:
+        """First occurrence at or after ``moment``; ``None`` if there is none in the next five years."""
+        if moment.second or moment.microsecond:
+            moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day, horizon = moment.date(), moment.date() + timedelta(days=5 * 366)
+        while day <= horizon:
+            if day.month not in self.months:
+                day = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+                continue
+            if self._day_matches(day):
+                earliest = moment.hour * 60 + moment.minute if day == moment.date() else 0
+                for hour in self.hours:
+                    if hour * 60 + self.minutes[-1] < earliest:
+                        continue
+                    for minute in self.minutes:
+                        if hour * 60 + minute >= earliest:
+                            return datetime.combine(day, time(hour, minute))
+            day += timedelta(days=1)
+        return None
+
+    def next_after(self, moment: datetime) -> Optional[datetime]:
+        return self.next_at_or_after(moment.replace(second=0, microsecond=0) + timedelta(minutes=1))
+
+
+@lru_cache(maxsize=1024)
+def parse_schedule(expression: str) -> CronSchedule:
+    """Parsed schedules are shared; templates use a handful of distinct expressions."""
+    return CronSchedule.parse(expression)
+
+
+def first_run(schedule: str, start: datetime, end: Optional[datetime] = None) -> Optional[datetime]:
+    run = parse_schedule(schedule).next_at_or_after(start)
+    if run is None or (end is not None and run > end):
+        return None
+    return run
+
+
+def occurrence_id(template_id: str, when: datetime) -> str:
+    return str(uuid.uuid5(OCCURRENCE_NAMESPACE, f"{template_id}/{when.isoformat()}"))
+
+
+def occurrence_doc(template: dict, when: datetime, posted_at: datetime) -> dict:
+    """The transaction posted for ``template`` at ``when``, shaped like ``Transaction.model_dump()``."""
+    return {
+        "id": occurrence_id(template["id"], when),
+        "amount": template["amount"],
+        "category_id": template.get("category_id"),
+        "type": template["type"],
+        "description": template.get("description"),
+        "date": when.isoformat(),
+        "account_id": template.get("account_id"),
+        "to_account_id": template.get("to_account_id"),
+        "family_id": template.get("family_id"),
+        "user_id": template.get("user_id"),
+        "user_name": template.get("user_name"),
+        "user_icon": template.get("user_icon"),
+        "recurring_id": template["id"],
+        "created_at": posted_at.isoformat(),
+    }
+
+
+class RecurringScheduler:
+    """Background task posting due occurrences; see the module docstring."""
+
+    def __init__(self, interval: float = 60.0, batch_size: int = 500, max_catch_up: int = 366):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_catch_up = max_catch_up  # occurrences per template per batch
+        self.repositories = None
+        self.events = None
+        self.anomalies = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls, env=None) -> "RecurringScheduler":
+        env = os.environ if env is None else env
+        return cls(
+            interval=float(env.get("RECURRING_INTERVAL_SECONDS", 60)),
+            batch_size=int(env.get("RECURRING_BATCH_SIZE", 500)),
+        )
+
+    def start(self, repositories, events=None, anomalies=None) -> None:
+        self.repositories = repositories
+        self.events = events
+        self.anomalies = anomalies
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Recurring transaction run failed")
+            await asyncio.sleep(self.interval)
+
+    def occurrences(self, template: dict, now: datetime) -> Tuple[List[datetime], Optional[datetime]]:
+        """Occurrences of ``template`` due by ``now`` and the next run after them."""
+        schedule = parse_schedule(template["schedule"])
+        end = datetime.fromisoformat(template["end_date"]) if template.get("end_date") else None
+        due = []
+        run = datetime.fromisoformat(template["next_run"])
+        while run is not None and run <= now and len(due) < self.max_catch_up:
+            if end is not None and run > end:
+                run = None
+                break
+            due.append(run)
+            run = schedule.next_after(run)
+        if run is not None and end is not None and run > end:
+            run = None
+        return due, run
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        """Post everything due by ``now``; returns the number of transactions inserted."""
+        async with self._lock:
+            now = now or datetime.now()
+            posted = 0
+            while True:
+                templates = await self.repositories.recurring.list_due(now, limit=self.batch_size)
+                if not templates:
+                    break
+                posted += await self._post_batch(templates, now)
+                if len(templates) < self.batch_size:
+                    break
+            return posted
+
+    async def _post_batch(self, templates: List[dict], now: datetime) -> int:
+        repos = self.repositories
+        docs, next_runs = [], {}
+        for template in templates:
+            try:
+                due, next_runs[template["id"]] = self.occurrences(template, now)
+            except ValueError as exc:
+                logger.warning("Deactivating recurring transaction %s: %s", template["id"], exc)
+                next_runs[template["id"]] = None
+                continue
+            docs.extend(occurrence_doc(template, when, now) for when in due)
+
+        flush_id = str(uuid.uuid4())
+        journal(docs, flush_id)
+        inserted = set(await repos.transactions.insert_many(docs))
+        posted = [doc for doc in docs if doc["id"] in inserted]
+        # Also records the accounts it moved in the change log
+        await apply_journaled(repos, flush_id, posted)
+        await repos.recurring.set_next_runs(next_runs)
+
+        per_family: Dict[str, List[dict]] = {}
+        for doc in posted:
+            per_family.setdefault(doc["family_id"], []).append(doc)
+        for family_id, docs in per_family.items():
+            version = invalidate_family(family_id)
+            await sync.record(repos, family_id, [("transactions", doc["id"], doc) for doc in docs])
+            found = self.anomalies.record(family_id, version, docs) if self.anomalies is not None else []
+            if self.events is not None:
+                self.events.publish(family_topic(family_id), "recurring.posted", {"count": len(docs)})
+                for anomaly in found:
+                    self.events.publish(family_topic(family_id), "anomaly.detected", anomaly)
+        if posted:
+            logger.info("Posted %d recurring transactions for %d families", len(posted), len(per_family))
+        return len(posted)
@@ -0,0 +1,30 @@
+"""Data access layer.
+
+Route handlers receive a :class:`Repositories` through ``Depends(get_repositories)``.
+The application lifespan picks the backend: MongoDB through Motor by default,
+or the in-memory backend when ``REPOSITORY_BACKEND=memory`` (or when the app
+factory is handed one explicitly, as the tests and benchmarks do).
+"""
+from fastapi import Request
+
+from repositories.base import (
+    Repositories, UserRepository, FamilyRepository, MemberRepository,
+    JoinRequestRepository, CategoryRepository, AccountRepository,
+    TransactionRepository, ArchiveRepository, RecurringRepository, ChangeRepository, JobRepository,
+    IdempotencyRepository, BalanceRepository
+)
+from repositories.memory import InMemoryRepositories
+from repositories.mongo import MotorRepositories
+
+
+def get_repositories(request: Request) -> Repositories:
+    return request.app.state.repositories
+
+
+__all__ = [
+    "Repositories", "UserRepository", "FamilyRepository", "MemberRepository",
+    "JoinRequestRepository", "CategoryRepository", "AccountRepository",
+    "TransactionRepository", "ArchiveRepository", "RecurringRepository", "ChangeRepository", "JobRepository",
+    "IdempotencyRepository", "BalanceRepository",
+    "InMemoryRepositories", "MotorRepositories", "get_repositories",
+]
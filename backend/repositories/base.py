@@ -0,0 +1,392 @@
+"""Repository interfaces.
+
+Every document is a plain dict in the shape stored in MongoDB (no ``_id``,
+datetimes as ISO strings). Date bounds are ``datetime`` objects; both
+backends compare them against the stored ISO strings, the same way MongoDB
+does. ``end`` bounds are exclusive.
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+# Backstop on the flush ids an account keeps; settled ones are dropped long before (see adjust_balances)
+FLUSH_HISTORY = 1000
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def get(self, user_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_by_email(self, email: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def insert(self, doc: dict) -> None: ...
+
+    @abstractmethod
+    async def update(self, user_id: str, fields: dict) -> None: ...
+
+    @abstractmethod
+    async def delete(self, user_id: str) -> int: ...
+
+
+class FamilyRepository(ABC):
+    @abstractmethod
+    async def get(self, family_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_by_code(self, family_code: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_by_admin(self, user_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def insert(self, doc: dict) -> None: ...
+
+    @abstractmethod
+    async def delete(self, family_id: str) -> int: ...
+
+
+class MemberRepository(ABC):
+    @abstractmethod
+    async def get_by_user(self, user_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def list_by_family(self, family_id: str, limit: int = 100) -> List[dict]: ...
+
+    @abstractmethod
+    async def insert(self, doc: dict) -> None: ...
+
+    @abstractmethod
+    async def delete_by_user(self, user_id: str) -> int: ...
+
+    @abstractmethod
+    async def remove(self, family_id: str, user_id: str) -> int: ...
+
+
+class JoinRequestRepository(ABC):
+    @abstractmethod
+    async def insert(self, doc: dict) -> None: ...
+
+    @abstractmethod
+    async def get_pending(self, request_id: str, family_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_pending_for_user(self, user_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def list_pending(self, family_id: str, limit: int = 100) -> List[dict]: ...
+
+    @abstractmethod
+    async def set_status(self, request_id: str, status: str) -> None: ...
+
+
+class CategoryRepository(ABC):
+    @abstractmethod
+    async def insert(self, doc: dict) -> None: ...
+
+    @abstractmethod
+    async def get(self, category_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def delete(self, category_id: str) -> int: ...
+
+    @abstractmethod
+    async def list_by_family(self, family_id: str) -> List[dict]: ...
+
+    @abstractmethod
+    async def list_visible(self, family_id: str, user_id: str, type: Optional[str] = None) -> List[dict]:
+        """Shared categories of the family plus the user's personal ones."""
+
+    @abstractmethod
+    async def list_with_limit(self, family_id: str, type: str, field: str) -> List[dict]:
+        """Categories of ``type`` where ``field`` (budget_limit, investment_target) is set."""
+
+
+class AccountRepository(ABC):
+    @abstractmethod
+    async def insert(self, doc: dict) -> None: ...
+
+    @abstractmethod
+    async def get(self, account_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def delete(self, account_id: str) -> int: ...
+
+    @abstractmethod
+    async def list_by_family(self, family_id: str) -> List[dict]: ...
+
+    @abstractmethod
+    async def list_visible(self, family_id: str, user_id: str) -> List[dict]:
+        """Family accounts plus the user's personal accounts."""
+
+    @abstractmethod
+    async def list_by_ids(self, family_id: str, account_ids: List[str]) -> List[dict]:
+        """The accounts of ``family_id`` among ``account_ids``, in one query."""
+
+    @abstractmethod
+    async def adjust_balance(self, account_id: str, delta: float) -> None: ...
+
+    @abstractmethod
+    async def adjust_balances(self, deltas: Dict[str, float], flush_id: Optional[str] = None) -> None:
+        """Apply several balance changes in one round trip.
+
+        With a ``flush_id``, accounts that already applied that flush are
+        skipped, so a flush can be replayed safely. The id stays on the
+        account until :meth:`settle` reports its flush done, and is dropped
+        by the next write to the account, so an account keeps the flushes
+        that can still be replayed, however many others apply meanwhile.
+        """
+
+    @abstractmethod
+    async def correct_balance(self, account_id: str, based_on: float, delta: float) -> bool:
+        """Add ``delta`` only if the balance is still ``based_on``; ``False`` if it moved meanwhile."""
+
+    @abstractmethod
+    def settle(self, flush_id: str, account_ids) -> None:
+        """Note that ``flush_id`` is no longer journaled anywhere, so its id can leave ``account_ids``."""
+
+
+class TransactionRepository(ABC):
+    @abstractmethod
+    async def insert(self, doc: dict) -> None: ...
+
+    @abstractmethod
+    async def insert_many(self, docs: List[dict]) -> List[str]:
+        """Insert ``docs`` in one round trip, skipping ids that already exist; returns the ids inserted."""
+
+    @abstractmethod
+    async def get(self, transaction_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def update(self, transaction_id: str, fields: dict) -> None: ...
+
+    @abstractmethod
+    async def delete(self, transaction_id: str) -> int: ...
+
+    @abstractmethod
+    async def delete_many(self, transaction_ids: List[str]) -> int: ...
+
+    @abstractmethod
+    async def update_many(self, transaction_ids: List[str], fields: dict) -> None: ...
+
+    @abstractmethod
+    async def list_balance_pending(self, created_before: str) -> List[dict]:
+        """Transactions created before ``created_before`` whose balance change is still journaled as pending."""
+
+    @abstractmethod
+    async def list(
+        self,
+        family_id: str,
+        user_id: Optional[str] = None,
+        type: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: int = 10000,
+    ) -> List[dict]: ...
+
+    @abstractmethod
+    async def count(self, family_id: str, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None) -> int: ...
+
+    @abstractmethod
+    async def list_by_category(
+        self,
+        category_id: str,
+        type: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: int = 10000,
+    ) -> List[dict]: ...
+
+    @abstractmethod
+    async def daily_totals(self, family_id: str, start: datetime, end: datetime,
+                           user_id: Optional[str] = None) -> List[dict]:
+        """``{"day", "type", "amount", "count"}`` per ``"YYYY-MM-DD"`` day and type in ``[start, end)``."""
+
+    @abstractmethod
+    async def aggregate(self, pipeline: List[dict]) -> List[dict]:
+        """Run an aggregation pipeline such as :func:`pivot.compile_pipeline` builds."""
+
+
+class ArchiveRepository(ABC):
+    """Transactions moved out of ``transactions`` and their monthly summaries.
+
+    A summary covers one (family, month, type, category, user) with the
+    ``amount`` total and row ``count`` of the archived rows; ``month`` is
+    ``"YYYY-MM"``. The horizon is the first month not archived yet.
+    """
+
+    @abstractmethod
+    async def insert_many(self, docs: List[dict]) -> List[str]:
+        """Archive ``docs``, skipping ids already archived; returns the ids inserted."""
+
+    @abstractmethod
+    async def list(
+        self,
+        family_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: Optional[int] = None,
+    ) -> List[dict]: ...
+
+    @abstractmethod
+    async def summarize(self, family_id: str, months: List[str]) -> int:
+        """Recompute the summaries of ``months`` from the archived rows; returns how many were written."""
+
+    @abstractmethod
+    async def summaries(self, family_id: str, start_month: Optional[str] = None,
+                        end_month: Optional[str] = None) -> List[dict]:
+        """Summaries with ``start_month <= month < end_month``."""
+
+    @abstractmethod
+    async def daily_totals(self, family_id: str, start: datetime, end: datetime,
+                           user_id: Optional[str] = None) -> List[dict]:
+        """Archived rows grouped as in :meth:`TransactionRepository.daily_totals`."""
+
+    @abstractmethod
+    async def aggregate(self, pipeline: List[dict]) -> List[dict]:
+        """Run an aggregation pipeline over the archived rows."""
+
+    @abstractmethod
+    async def horizon(self, family_id: str) -> Optional[str]: ...
+
+    @abstractmethod
+    async def set_horizon(self, family_id: str, month: str) -> None:
+        """Move the horizon forward to ``month``; an earlier month leaves it unchanged."""
+
+
+class RecurringRepository(ABC):
+    """Recurring transaction templates; ``next_run`` is the ISO date of the next occurrence to post."""
+
+    @abstractmethod
+    async def insert(self, doc: dict) -> None: ...
+
+    @abstractmethod
+    async def get(self, template_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def delete(self, template_id: str) -> int: ...
+
+    @abstractmethod
+    async def list_by_family(self, family_id: str) -> List[dict]: ...
+
+    @abstractmethod
+    async def list_due(self, now: datetime, limit: int = 1000) -> List[dict]:
+        """Active templates of every family whose ``next_run`` is at or before ``now``, oldest first."""
+
+    @abstractmethod
+    async def set_next_runs(self, next_runs: Dict[str, Optional[datetime]]) -> None:
+        """Advance several templates in one round trip; ``None`` deactivates a finished template."""
+
+
+class ChangeRepository(ABC):
+    """Per-family change log for delta sync.
+
+    Holds the latest change of each document, numbered from a per-family
+    sequence: ``{family_id, collection, doc_id, seq, deleted, doc, at}``,
+    where ``doc`` is the document as written (``None`` for a tombstone).
+    """
+
+    @abstractmethod
+    async def record(self, family_id: str, changes: List[Tuple[str, str, Optional[dict]]]) -> int:
+        """Log ``(collection, doc_id, doc)`` changes, ``doc=None`` for a deletion; returns the last sequence number."""
+
+    @abstractmethod
+    async def state(self, family_id: str) -> dict:
+        """``{"seq": latest sequence number, "horizon": highest sequence number compacted away}``."""
+
+    @abstractmethod
+    async def since(self, family_id: str, seq: int, limit: int = 1000) -> List[dict]:
+        """Changes after ``seq``, in sequence order."""
+
+    @abstractmethod
+    async def compact(self, before: datetime) -> int:
+        """Drop tombstones logged before ``before``, raising each family's horizon; returns how many."""
+
+
+class JobRepository(ABC):
+    """Persistent background job queue; a claim leases a job to one worker until ``lease_expires_at``."""
+
+    @abstractmethod
+    async def insert(self, doc: dict) -> None: ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def list_by_family(self, family_id: str, limit: int = 50) -> List[dict]:
+        """Most recent first."""
+
+    @abstractmethod
+    async def claim(self, worker_id: str, now: datetime, lease_until: datetime) -> Optional[dict]:
+        """Atomically take the oldest queued job due by ``now``, or a running one whose lease expired."""
+
+    @abstractmethod
+    async def update_leased(self, job_id: str, worker_id: str, fields: dict) -> bool:
+        """Set ``fields`` on a running job while ``worker_id`` still holds it; ``False`` once the lease is lost."""
+
+
+class IdempotencyRepository(ABC):
+    """Outcomes of requests sent with an ``Idempotency-Key``, keyed by ``id`` (user and key).
+
+    A record is ``pending`` while its request runs, holding a lock until
+    ``locked_until``, then ``completed`` with the response. ``expires_at``
+    is a ``datetime``; expired records are dropped (by a TTL index on MongoDB).
+    """
+
+    @abstractmethod
+    async def get(self, record_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def reserve(self, doc: dict) -> bool:
+        """Insert a pending record; ``False`` if one with the same id exists."""
+
+    @abstractmethod
+    async def take_over(self, record_id: str, now: str, locked_until: str) -> bool:
+        """Re-lock a pending record whose lock expired before ``now``; ``False`` if it was not."""
+
+    @abstractmethod
+    async def complete(self, record_id: str, fields: dict) -> None: ...
+
+    @abstractmethod
+    async def release(self, record_id: str) -> None: ...
+
+
+class BalanceRepository(ABC):
+    """Monthly carry-over balances, per family or per family member."""
+
+    @abstractmethod
+    async def get(self, family_id: str, month: int, year: int, user_id: Optional[str] = None) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def upsert(self, family_id: str, month: int, year: int, user_id: Optional[str], fields: dict) -> None: ...
+
+
+class Repositories:
+    """The set of repositories one backend provides."""
+    users: UserRepository
+    families: FamilyRepository
+    members: MemberRepository
+    join_requests: JoinRequestRepository
+    categories: CategoryRepository
+    accounts: AccountRepository
+    transactions: TransactionRepository
+    archive: ArchiveRepository
+    recurring: RecurringRepository
+    changes: ChangeRepository
+    jobs: JobRepository
+    idempotency: IdempotencyRepository
+    balances: BalanceRepository
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+    def with_read_preference(self, read_preference) -> "Repositories":
+        """Repositories reading with a pymongo ``read_preference``; writes still go to the primary."""
+        return self
+
+    async def explain(self, collection: str, command: str, filter: Optional[dict]) -> Optional[dict]:
+        """Execution plan for a monitored find/aggregate, shaped like MongoDB's explain output."""
+        return None
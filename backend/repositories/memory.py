@@ -0,0 +1,804 @@
+"""In-memory repositories with hash indexes.
+
+Used by the tests, the benchmarks and ``REPOSITORY_BACKEND=memory`` local
+runs. Rows are kept in insertion order and every read returns copies, so the
+results are deterministic and callers may mutate them freely. Each table
+operation publishes the monitoring event the equivalent MongoDB command
+would, so operation counts match between backends.
+"""
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set
+import math
+import time
+import uuid
+
+from monitoring import CommandEvent, publish
+
+from repositories.base import (
+    Repositories, UserRepository, FamilyRepository, MemberRepository,
+    JoinRequestRepository, CategoryRepository, AccountRepository,
+    TransactionRepository, ArchiveRepository, RecurringRepository, ChangeRepository, JobRepository,
+    IdempotencyRepository, BalanceRepository, FLUSH_HISTORY
+)
+
+
+def date_filter(start, end) -> Optional[Callable[[dict], bool]]:
+    """Predicate comparing the ISO-string ``date`` against bounds, as MongoDB would."""
+    if start is None and end is None:
+        return None
+    low = start.isoformat() if start is not None else None
+    high = end.isoformat() if end is not None else None
+
+    def matches(doc):
+        value = doc.get("date")
+        if value is None:
+            return False
+        return (low is None or value >= low) and (high is None or value < high)
+    return matches
+
+
+def daily_totals(docs) -> List[dict]:
+    """Group ``docs`` as the ``$group`` of the Motor ``daily_totals`` does."""
+    groups: Dict[tuple, dict] = {}
+    for doc in docs:
+        group = groups.setdefault((str(doc["date"])[:10], doc.get("type")), {"amount": 0.0, "count": 0})
+        group["amount"] += doc["amount"]
+        group["count"] += 1
+    return [{"day": day, "type": type_, **group} for (day, type_), group in groups.items()]
+
+
+# A small aggregation evaluator: the stages and operators the analytics
+# pipelines use (see pivot.compile_pipeline), with MongoDB's semantics.
+COMPARISONS = {
+    "$gte": lambda value, bound: value is not None and value >= bound,
+    "$gt": lambda value, bound: value is not None and value > bound,
+    "$lte": lambda value, bound: value is not None and value <= bound,
+    "$lt": lambda value, bound: value is not None and value < bound,
+    "$in": lambda value, options: value in options,
+    "$ne": lambda value, other: value != other,
+}
+OPERATORS = {
+    "$substrBytes": lambda text, start, length: ("" if text is None else str(text))[start:start + length],
+    "$concat": lambda *parts: None if None in parts else "".join(parts),
+    "$toString": lambda value: None if value is None else str(value),
+    "$toInt": lambda value: None if value is None else int(value),
+    "$ceil": lambda value: None if value is None else math.ceil(value),
+    "$divide": lambda a, b: None if a is None or b is None else a / b,
+}
+
+
+def matches_query(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            if not all(COMPARISONS[op](value, bound) for op, bound in condition.items()):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def evaluate(expression, doc: dict):
+    if isinstance(expression, str) and expression.startswith("$"):
+        return doc.get(expression[1:])
+    if isinstance(expression, list):
+        return [evaluate(e, doc) for e in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if not any(key.startswith("$") for key in expression):
+        return {key: evaluate(value, doc) for key, value in expression.items()}
+    (op, argument), = expression.items()
+    if op == "$dateFromString":
+        return datetime.fromisoformat(evaluate(argument["dateString"], doc))
+    if op == "$dateToString":
+        value = evaluate(argument["date"], doc)
+        year, week, _ = value.isocalendar()
+        return value.strftime(argument["format"].replace("%G", str(year)).replace("%V", f"{week:02d}"))
+    arguments = evaluate(argument, doc)
+    return OPERATORS[op](*arguments) if isinstance(argument, list) else OPERATORS[op](arguments)
+
+
+def sort_key(value):
+    """MongoDB's cross-type order: null, numbers, strings, documents."""
+    if value is None:
+        return (0,)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, dict):
+        return (3, tuple(sort_key(v) for v in value.values()))
+    return (2, str(value))
+
+
+def aggregate(table: "Table", pipeline: List[dict]) -> List[dict]:
+    """Run ``pipeline`` over ``table``; a leading ``$match`` is narrowed through its indexes."""
+    stages = list(pipeline)
+    if stages and "$match" in stages[0]:
+        query = stages.pop(0)["$match"]
+        equals = {field: value for field, value in query.items() if not isinstance(value, dict)}
+        docs = table.find(lambda doc: matches_query(doc, query), **equals)
+    else:
+        docs = table.find()
+    for stage in stages:
+        (name, spec), = stage.items()
+        if name == "$match":
+            docs = [doc for doc in docs if matches_query(doc, spec)]
+        elif name == "$group":
+            groups: Dict[str, dict] = {}
+            for doc in docs:
+                key = evaluate(spec["_id"], doc)
+                group = groups.setdefault(repr(key), {"_id": key, **{f: 0 for f in spec if f != "_id"}})
+                for field, accumulator in spec.items():
+                    if field != "_id":
+                        (op, expression), = accumulator.items()
+                        if op != "$sum":
+                            raise NotImplementedError(f"Accumulator {op} is not supported in memory")
+                        value = evaluate(expression, doc)
+                        group[field] += value if isinstance(value, (int, float)) else 0
+            docs = list(groups.values())
+        elif name == "$sort":
+            for field, direction in reversed(list(spec.items())):
+                docs.sort(key=lambda doc: sort_key(doc.get(field)), reverse=direction < 0)
+        elif name == "$limit":
+            docs = docs[:spec]
+        else:
+            raise NotImplementedError(f"Stage {name} is not supported in memory")
+    return docs
+
+
+class Table:
+    """Rows keyed by ``id`` with ordered hash indexes on selected fields."""
+
+    def __init__(self, name, indexed=(), unique=()):
+        self.name = name
+        self.rows: Dict[str, dict] = {}
+        self.unique = tuple(unique)
+        self.indexes: Dict[str, Dict[object, Dict[str, None]]] = {
+            field: defaultdict(dict) for field in (*indexed, *unique)
+        }
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _index(self, doc):
+        for field, index in self.indexes.items():
+            index[doc.get(field)][doc["id"]] = None
+
+    def _publish(self, command, started, n_returned=None, filter=None):
+        publish(CommandEvent(
+            collection=self.name,
+            command=command,
+            duration=time.perf_counter() - started,
+            n_returned=n_returned,
+            filter=filter,
+        ))
+
+    def _unindex(self, doc):
+        for field, index in self.indexes.items():
+            bucket = index.get(doc.get(field))
+            if bucket is not None:
+                bucket.pop(doc["id"], None)
+                if not bucket:
+                    del index[doc.get(field)]
+
+    def insert(self, doc: dict) -> None:
+        started = time.perf_counter()
+        doc = dict(doc)
+        doc.setdefault("id", str(uuid.uuid4()))
+        if doc["id"] in self.rows:
+            raise DuplicateKeyError(f"duplicate id {doc['id']}")
+        for field in self.unique:
+            if self.indexes[field].get(doc.get(field)):
+                raise DuplicateKeyError(f"duplicate {field} {doc.get(field)}")
+        self.rows[doc["id"]] = doc
+        self._index(doc)
+        self._publish("insert", started, n_returned=1)
+
+    def insert_many(self, docs: List[dict]) -> List[str]:
+        """Unordered bulk insert: rows whose id or unique fields already exist are skipped."""
+        started = time.perf_counter()
+        inserted = []
+        for doc in docs:
+            doc = dict(doc)
+            doc.setdefault("id", str(uuid.uuid4()))
+            if doc["id"] in self.rows or any(self.indexes[f].get(doc.get(f)) for f in self.unique):
+                continue
+            self.rows[doc["id"]] = doc
+            self._index(doc)
+            inserted.append(doc["id"])
+        self._publish("insert", started, n_returned=len(inserted))
+        return inserted
+
+    def get(self, row_id) -> Optional[dict]:
+        started = time.perf_counter()
+        doc = self.rows.get(row_id)
+        self._publish("find", started, n_returned=int(doc is not None), filter={"id": row_id})
+        return dict(doc) if doc is not None else None
+
+    def _update(self, doc, fields):
+        self._unindex(doc)
+        doc.update(fields)
+        self._index(doc)
+
+    def update(self, row_id, fields: dict) -> int:
+        started = time.perf_counter()
+        doc = self.rows.get(row_id)
+        if doc is not None:
+            self._update(doc, fields)
+        self._publish("update", started, n_returned=int(doc is not None), filter={"id": row_id})
+        return int(doc is not None)
+
+    def upsert(self, equals: dict, fields: dict) -> None:
+        """Update the first row matching ``equals`` or insert a new one."""
+        started = time.perf_counter()
+        doc = next(self.candidates(equals), None)
+        if doc is not None:
+            self._update(doc, fields)
+        else:
+            doc = {"id": str(uuid.uuid4()), **equals, **fields}
+            self.rows[doc["id"]] = doc
+            self._index(doc)
+        self._publish("update", started, n_returned=1, filter=equals)
+
+    def increment(self, row_id, field, delta) -> int:
+        started = time.perf_counter()
+        doc = self.rows.get(row_id)
+        if doc is not None:
+            doc[field] = doc.get(field, 0) + delta
+        self._publish("update", started, n_returned=int(doc is not None), filter={"id": row_id})
+        return int(doc is not None)
+
+    def bulk_update(self, changes: Dict[str, dict], increment: bool = False) -> int:
+        """``$set`` (or ``$inc``) per row id in one operation, like an unordered ``bulk_write``."""
+        started = time.perf_counter()
+        matched = 0
+        for row_id, fields in changes.items():
+            doc = self.rows.get(row_id)
+            if doc is None:
+                continue
+            matched += 1
+            if increment:
+                fields = {field: doc.get(field, 0) + delta for field, delta in fields.items()}
+            self._update(doc, fields)
+        self._publish("update", started, n_returned=matched)
+        return matched
+
+    def _delete(self, row_id) -> int:
+        doc = self.rows.pop(row_id, None)
+        if doc is None:
+            return 0
+        self._unindex(doc)
+        return 1
+
+    def delete(self, row_id) -> int:
+        started = time.perf_counter()
+        deleted = self._delete(row_id)
+        self._publish("delete", started, n_returned=deleted, filter={"id": row_id})
+        return deleted
+
+    def delete_many(self, row_ids: List[str]) -> int:
+        started = time.perf_counter()
+        deleted = sum(self._delete(row_id) for row_id in row_ids)
+        self._publish("delete", started, n_returned=deleted, filter={"id": {"$in": list(row_ids)}})
+        return deleted
+
+    def delete_one(self, **equals) -> int:
+        """Delete the first row matching ``equals``."""
+        started = time.perf_counter()
+        doc = next(self.candidates(equals), None)
+        deleted = self._delete(doc["id"]) if doc is not None else 0
+        self._publish("delete", started, n_returned=deleted, filter=equals)
+        return deleted
+
+    def explain(self, equals: dict) -> dict:
+        """How :meth:`candidates` would serve ``equals``, in MongoDB explain terms."""
+        indexed = [f for f in equals if f in self.indexes]
+        if indexed:
+            best = min(indexed, key=lambda f: len(self.indexes[f].get(equals[f], ())))
+            examined = len(self.indexes[best].get(equals[best], ()))
+            scan = {"stage": "IXSCAN", "indexName": best, "keysExamined": examined}
+        else:
+            examined = len(self.rows)
+            scan = {"stage": "COLLSCAN"}
+        returned = sum(1 for _ in self.candidates(equals))
+        return {
+            "queryPlanner": {"namespace": self.name, "winningPlan": {"stage": "FETCH", "inputStage": scan}},
+            "executionStats": {
+                "nReturned": returned,
+                "totalDocsExamined": examined,
+                "totalKeysExamined": examined if indexed else 0,
+            },
+        }
+
+    def candidates(self, equals: dict):
+        """Rows matching ``equals``, narrowed through the smallest usable index."""
+        indexed = [f for f in equals if f in self.indexes]
+        if indexed:
+            best = min(indexed, key=lambda f: len(self.indexes[f].get(equals[f], ())))
+            ids = self.indexes[best].get(equals[best], {})
+            rows = (self.rows[i] for i in list(ids))
+        else:
+            rows = list(self.rows.values())
+        for doc in rows:
+            if all(doc.get(f) == v for f, v in equals.items()):
+                yield doc
+
+    def find(self, predicate: Optional[Callable[[dict], bool]] = None, limit: Optional[int] = None,
+             **equals) -> List[dict]:
+        started = time.perf_counter()
+        found = []
+        for doc in self.candidates(equals):
+            if predicate is None or predicate(doc):
+                found.append(dict(doc))
+                if limit is not None and len(found) >= limit:
+                    break
+        self._publish("find", started, n_returned=len(found), filter=equals)
+        return found
+
+    def find_one(self, predicate=None, **equals) -> Optional[dict]:
+        found = self.find(predicate, limit=1, **equals)
+        return found[0] if found else None
+
+
+class InMemoryUserRepository(UserRepository):
+    def __init__(self):
+        self.table = Table("users", unique=("email",))
+
+    async def get(self, user_id):
+        return self.table.get(user_id)
+
+    async def get_by_email(self, email):
+        return self.table.find_one(email=email)
+
+    async def insert(self, doc):
+        self.table.insert(doc)
+
+    async def update(self, user_id, fields):
+        self.table.update(user_id, fields)
+
+    async def delete(self, user_id):
+        return self.table.delete(user_id)
+
+
+class InMemoryFamilyRepository(FamilyRepository):
+    def __init__(self):
+        self.table = Table("families", indexed=("family_code", "admin_user_id"))
+
+    async def get(self, family_id):
+        return self.table.get(family_id)
+
+    async def get_by_code(self, family_code):
+        return self.table.find_one(family_code=family_code)
+
+    async def get_by_admin(self, user_id):
+        return self.table.find_one(admin_user_id=user_id)
+
+    async def insert(self, doc):
+        self.table.insert(doc)
+
+    async def delete(self, family_id):
+        return self.table.delete(family_id)
+
+
+class InMemoryMemberRepository(MemberRepository):
+    def __init__(self):
+        self.table = Table("family_members", indexed=("user_id", "family_id"))
+
+    async def get_by_user(self, user_id):
+        return self.table.find_one(user_id=user_id)
+
+    async def list_by_family(self, family_id, limit=100):
+        return self.table.find(family_id=family_id, limit=limit)
+
+    async def insert(self, doc):
+        self.table.insert(doc)
+
+    async def delete_by_user(self, user_id):
+        return self.table.delete_one(user_id=user_id)
+
+    async def remove(self, family_id, user_id):
+        return self.table.delete_one(family_id=family_id, user_id=user_id)
+
+
+class InMemoryJoinRequestRepository(JoinRequestRepository):
+    def __init__(self):
+        self.table = Table("join_requests", indexed=("family_id", "user_id"))
+
+    async def insert(self, doc):
+        self.table.insert(doc)
+
+    async def get_pending(self, request_id, family_id):
+        request = self.table.get(request_id)
+        if request and request["family_id"] == family_id and request["status"] == "pending":
+            return request
+        return None
+
+    async def get_pending_for_user(self, user_id):
+        return self.table.find_one(user_id=user_id, status="pending")
+
+    async def list_pending(self, family_id, limit=100):
+        return self.table.find(family_id=family_id, status="pending", limit=limit)
+
+    async def set_status(self, request_id, status):
+        self.table.update(request_id, {"status": status})
+
+
+class InMemoryCategoryRepository(CategoryRepository):
+    def __init__(self):
+        self.table = Table("categories", indexed=("family_id",))
+
+    async def insert(self, doc):
+        self.table.insert(doc)
+
+    async def get(self, category_id):
+        return self.table.get(category_id)
+
+    async def delete(self, category_id):
+        return self.table.delete(category_id)
+
+    async def list_by_family(self, family_id):
+        return self.table.find(family_id=family_id, limit=1000)
+
+    async def list_visible(self, family_id, user_id, type=None):
+        equals = {"family_id": family_id}
+        if type:
+            equals["type"] = type
+        return self.table.find(
+            lambda c: c.get("is_shared") is True or c.get("created_by_user_id") == user_id,
+            limit=1000, **equals
+        )
+
+    async def list_with_limit(self, family_id, type, field):
+        return self.table.find(
+            lambda c: c.get(field) is not None, limit=1000, family_id=family_id, type=type
+        )
+
+
+class InMemoryAccountRepository(AccountRepository):
+    def __init__(self):
+        self.table = Table("accounts", indexed=("family_id",))
+        self._settled: Dict[str, Set[str]] = {}  # account_id -> flush ids to drop on its next write
+
+    async def insert(self, doc):
+        self.table.insert(doc)
+
+    async def get(self, account_id):
+        return self.table.get(account_id)
+
+    async def delete(self, account_id):
+        return self.table.delete(account_id)
+
+    async def list_by_family(self, family_id):
+        return self.table.find(family_id=family_id, limit=1000)
+
+    async def list_visible(self, family_id, user_id):
+        return self.table.find(
+            lambda a: a.get("owner_type") == "family" or a.get("owner_user_id") == user_id,
+            limit=1000, family_id=family_id
+        )
+
+    async def list_by_ids(self, family_id, account_ids):
+        wanted = set(account_ids)
+        return self.table.find(lambda a: a["id"] in wanted, family_id=family_id)
+
+    async def adjust_balance(self, account_id, delta):
+        self.table.increment(account_id, "current_balance", delta)
+
+    async def adjust_balances(self, deltas, flush_id=None):
+        if not deltas:
+            return
+        if flush_id is None:
+            self.table.bulk_update(
+                {account_id: {"current_balance": delta} for account_id, delta in deltas.items()}, increment=True
+            )
+            return
+        changes = {}
+        for account_id, delta in deltas.items():
+            doc = self.table.rows.get(account_id)
+            if doc is None or flush_id in doc.get("applied_flushes", ()):
+                continue
+            settled = self._settled.pop(account_id, set())
+            kept = [f for f in doc.get("applied_flushes", ()) if f not in settled]
+            changes[account_id] = {
+                "current_balance": doc.get("current_balance", 0) + delta,
+                "applied_flushes": [*kept, flush_id][-FLUSH_HISTORY:],
+            }
+        self.table.bulk_update(changes)
+
+    async def correct_balance(self, account_id, based_on, delta):
+        doc = self.table.rows.get(account_id)
+        if doc is None or doc.get("current_balance", 0) != based_on:
+            return False
+        return bool(self.table.increment(account_id, "current_balance", delta))
+
+    def settle(self, flush_id, account_ids):
+        for account_id in account_ids:
+            self._settled.setdefault(account_id, set()).add(flush_id)
+
+
+class InMemoryTransactionRepository(TransactionRepository):
+    def __init__(self):
+        self.table = Table("transactions", indexed=("family_id", "category_id", "balance_pending"))
+
+    async def insert(self, doc):
+        self.table.insert(doc)
+
+    async def insert_many(self, docs):
+        return self.table.insert_many(docs) if docs else []
+
+    async def get(self, transaction_id):
+        return self.table.get(transaction_id)
+
+    async def update(self, transaction_id, fields):
+        self.table.update(transaction_id, fields)
+
+    async def delete(self, transaction_id):
+        return self.table.delete(transaction_id)
+
+    async def delete_many(self, transaction_ids):
+        return self.table.delete_many(transaction_ids) if transaction_ids else 0
+
+    async def update_many(self, transaction_ids, fields):
+        if transaction_ids:
+            self.table.bulk_update({transaction_id: fields for transaction_id in transaction_ids})
+
+    async def list_balance_pending(self, created_before):
+        return self.table.find(lambda t: str(t.get("created_at")) < created_before, balance_pending=True)
+
+    async def list(self, family_id, user_id=None, type=None, start=None, end=None, limit=10000):
+        equals = {"family_id": family_id}
+        if user_id:
+            equals["user_id"] = user_id
+        if type:
+            equals["type"] = type
+        return self.table.find(date_filter(start, end), limit=limit, **equals)
+
+    async def count(self, family_id, start=None, end=None):
+        return len(self.table.find(date_filter(start, end), family_id=family_id))
+
+    async def list_by_category(self, category_id, type, start=None, end=None, limit=10000):
+        return self.table.find(date_filter(start, end), limit=limit, category_id=category_id, type=type)
+
+    async def daily_totals(self, family_id, start, end, user_id=None):
+        return daily_totals(await self.list(family_id, user_id=user_id, start=start, end=end, limit=None))
+
+    async def aggregate(self, pipeline):
+        return aggregate(self.table, pipeline)
+
+
+class InMemoryArchiveRepository(ArchiveRepository):
+    def __init__(self):
+        self.table = Table("transactions_archive", indexed=("family_id",))
+        self.summary_table = Table("transaction_summaries", indexed=("family_id", "month"))
+        self.state_table = Table("archive_state", unique=("family_id",))
+
+    async def insert_many(self, docs):
+        return self.table.insert_many(docs) if docs else []
+
+    async def list(self, family_id, start=None, end=None, limit=None):
+        return self.table.find(date_filter(start, end), limit=limit, family_id=family_id)
+
+    async def summarize(self, family_id, months):
+        wanted = set(months)
+        groups: Dict[tuple, dict] = {}
+        for doc in self.table.find(lambda r: str(r.get("date"))[:7] in wanted, family_id=family_id):
+            key = (str(doc["date"])[:7], doc.get("type"), doc.get("category_id"), doc.get("user_id"))
+            group = groups.setdefault(key, {"amount": 0.0, "count": 0})
+            group["amount"] += doc["amount"]
+            group["count"] += 1
+        for (month, type_, category_id, user_id), fields in groups.items():
+            self.summary_table.upsert({
+                "family_id": family_id, "month": month, "type": type_,
+                "category_id": category_id, "user_id": user_id,
+            }, fields)
+        return len(groups)
+
+    async def summaries(self, family_id, start_month=None, end_month=None):
+        return self.summary_table.find(
+            lambda r: (start_month is None or r["month"] >= start_month)
+            and (end_month is None or r["month"] < end_month),
+            family_id=family_id
+        )
+
+    async def daily_totals(self, family_id, start, end, user_id=None):
+        equals = {"family_id": family_id}
+        if user_id:
+            equals["user_id"] = user_id
+        return daily_totals(self.table.find(date_filter(start, end), **equals))
+
+    async def aggregate(self, pipeline):
+        return aggregate(self.table, pipeline)
+
+    async def horizon(self, family_id):
+        state = self.state_table.find_one(family_id=family_id)
+        return state["horizon"] if state else None
+
+    async def set_horizon(self, family_id, month):
+        state = self.state_table.find_one(family_id=family_id)
+        if state is None or state["horizon"] < month:
+            self.state_table.upsert({"family_id": family_id}, {"horizon": month})
+
+
+class InMemoryRecurringRepository(RecurringRepository):
+    def __init__(self):
+        self.table = Table("recurring_transactions", indexed=("family_id", "active"))
+
+    async def insert(self, doc):
+        self.table.insert(doc)
+
+    async def get(self, template_id):
+        return self.table.get(template_id)
+
+    async def delete(self, template_id):
+        return self.table.delete(template_id)
+
+    async def list_by_family(self, family_id):
+        return self.table.find(family_id=family_id, limit=1000)
+
+    async def list_due(self, now, limit=1000):
+        cutoff = now.isoformat()
+        due = self.table.find(lambda r: r.get("next_run") is not None and r["next_run"] <= cutoff, active=True)
+        due.sort(key=lambda r: r["next_run"])
+        return due[:limit]
+
+    async def set_next_runs(self, next_runs):
+        if next_runs:
+            self.table.bulk_update({
+                template_id: {"next_run": next_run.isoformat() if next_run else None, "active": next_run is not None}
+                for template_id, next_run in next_runs.items()
+            })
+
+
+class InMemoryChangeRepository(ChangeRepository):
+    def __init__(self):
+        self.table = Table("changes", indexed=("family_id", "deleted"))
+        self.counters = Table("change_counters", unique=("family_id",))
+
+    async def record(self, family_id, changes):
+        counter = self.counters.find_one(family_id=family_id)
+        if counter is None:
+            self.counters.insert({"family_id": family_id, "seq": 0, "horizon": 0})
+            counter = self.counters.find_one(family_id=family_id)
+        self.counters.increment(counter["id"], "seq", len(changes))
+        seq = counter["seq"] + len(changes)
+        first = seq - len(changes) + 1
+        at = datetime.utcnow().isoformat()
+        for n, (collection, doc_id, doc) in enumerate(changes):
+            self.table.upsert(
+                {"family_id": family_id, "collection": collection, "doc_id": doc_id},
+                {"seq": first + n, "deleted": doc is None, "doc": doc, "at": at}
+            )
+        return seq
+
+    async def state(self, family_id):
+        counter = self.counters.find_one(family_id=family_id) or {}
+        return {"seq": counter.get("seq", 0), "horizon": counter.get("horizon", 0)}
+
+    async def since(self, family_id, seq, limit=1000):
+        changes = self.table.find(lambda c: c["seq"] > seq, family_id=family_id)
+        changes.sort(key=lambda c: c["seq"])
+        return changes[:limit]
+
+    async def compact(self, before):
+        cutoff = before.isoformat()
+        expired = self.table.find(lambda c: c["at"] < cutoff, deleted=True)
+        horizons: Dict[str, int] = {}
+        for change in expired:
+            horizons[change["family_id"]] = max(horizons.get(change["family_id"], 0), change["seq"])
+        for family_id, seq in horizons.items():
+            counter = self.counters.find_one(family_id=family_id)
+            if counter is not None and counter.get("horizon", 0) < seq:
+                self.counters.update(counter["id"], {"horizon": seq})
+        for change in expired:
+            self.table.delete(change["id"])
+        return len(expired)
+
+
+class InMemoryJobRepository(JobRepository):
+    def __init__(self):
+        self.table = Table("jobs", indexed=("family_id", "status"))
+
+    async def insert(self, doc):
+        self.table.insert(doc)
+
+    async def get(self, job_id):
+        return self.table.get(job_id)
+
+    async def list_by_family(self, family_id, limit=50):
+        jobs = self.table.find(family_id=family_id)
+        jobs.sort(key=lambda j: j["created_at"], reverse=True)
+        return jobs[:limit]
+
+    async def claim(self, worker_id, now, lease_until):
+        now = now.isoformat()
+        due = self.table.find(lambda j: j["run_at"] <= now, status="queued")
+        due += self.table.find(lambda j: j["lease_expires_at"] < now, status="running")
+        if not due:
+            return None
+        job = min(due, key=lambda j: j["run_at"])
+        self.table.update(job["id"], {
+            "status": "running", "worker_id": worker_id, "started_at": now,
+            "lease_expires_at": lease_until.isoformat(), "attempts": job["attempts"] + 1,
+        })
+        return self.table.get(job["id"])
+
+    async def update_leased(self, job_id, worker_id, fields):
+        job = self.table.find_one(id=job_id, worker_id=worker_id, status="running")
+        if job is None:
+            return False
+        self.table.update(job_id, fields)
+        return True
+
+
+class InMemoryIdempotencyRepository(IdempotencyRepository):
+    def __init__(self):
+        self.table = Table("idempotency_keys")
+
+    def _expire(self, record_id):
+        doc = self.table.rows.get(record_id)
+        if doc is not None and doc["expires_at"] <= datetime.utcnow():
+            self.table._delete(record_id)
+
+    async def get(self, record_id):
+        self._expire(record_id)
+        return self.table.get(record_id)
+
+    async def reserve(self, doc):
+        self._expire(doc["id"])
+        try:
+            self.table.insert(doc)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def take_over(self, record_id, now, locked_until):
+        doc = self.table.rows.get(record_id)
+        if doc is None or doc.get("status") != "pending" or doc.get("locked_until", "") >= now:
+            return False
+        return bool(self.table.update(record_id, {"locked_until": locked_until}))
+
+    async def complete(self, record_id, fields):
+        self.table.update(record_id, {**fields, "status": "completed"})
+
+    async def release(self, record_id):
+        self.table.delete(record_id)
+
+
+class InMemoryBalanceRepository(BalanceRepository):
+    def __init__(self):
+        self.table = Table("monthly_balances", indexed=("family_id",))
+
+    async def get(self, family_id, month, year, user_id=None):
+        return self.table.find_one(family_id=family_id, month=month, year=year, user_id=user_id)
+
+    async def upsert(self, family_id, month, year, user_id, fields):
+        self.table.upsert({"family_id": family_id, "month": month, "year": year, "user_id": user_id}, fields)
+
+
+class InMemoryRepositories(Repositories):
+    def __init__(self):
+        self.users = InMemoryUserRepository()
+        self.families = InMemoryFamilyRepository()
+        self.members = InMemoryMemberRepository()
+        self.join_requests = InMemoryJoinRequestRepository()
+        self.categories = InMemoryCategoryRepository()
+        self.accounts = InMemoryAccountRepository()
+        self.transactions = InMemoryTransactionRepository()
+        self.archive = InMemoryArchiveRepository()
+        self.recurring = InMemoryRecurringRepository()
+        self.changes = InMemoryChangeRepository()
+        self.jobs = InMemoryJobRepository()
+        self.idempotency = InMemoryIdempotencyRepository()
+        self.balances = InMemoryBalanceRepository()
+
+    async def explain(self, collection, command, filter):
+        tables = {repo.table.name: repo.table for repo in vars(self).values() if hasattr(repo, "table")}
+        table = tables.get(collection)
+        if table is None:
+            return None
+        # Aggregations and operator filters have no equality prefix to narrow on
+        equals = {k: v for k, v in (filter or {}).items() if not k.startswith("$") and not isinstance(v, dict)}
+        if command != "find":
+            equals = {}
+        return table.explain(equals)
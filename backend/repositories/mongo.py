@@ -0,0 +1,665 @@
+"""Motor (MongoDB) repositories."""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from bson import SON
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+import logging
+import uuid
+
+from repositories.base import (
+    Repositories, UserRepository, FamilyRepository, MemberRepository,
+    JoinRequestRepository, CategoryRepository, AccountRepository,
+    TransactionRepository, ArchiveRepository, RecurringRepository, ChangeRepository, JobRepository,
+    IdempotencyRepository, BalanceRepository, FLUSH_HISTORY
+)
+
+logger = logging.getLogger(__name__)
+
+NO_ID = {"_id": 0}
+DUPLICATE_KEY = 11000
+
+
+def date_range(start: Optional[datetime], end: Optional[datetime]) -> Optional[dict]:
+    """Range filter on an ISO-string date field."""
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = start.isoformat()
+    if end is not None:
+        bounds["$lt"] = end.isoformat()
+    return bounds or None
+
+
+async def daily_totals(collection, family_id, start, end, user_id=None) -> List[dict]:
+    """One ``$group`` on the day prefix of the ISO ``date``, per type."""
+    match = {"family_id": family_id, "date": date_range(start, end)}
+    if user_id:
+        match["user_id"] = user_id
+    groups = await collection.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {"day": {"$substrBytes": ["$date", 0, 10]}, "type": "$type"},
+            "amount": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+        }},
+    ]).to_list(None)
+    return [{**group["_id"], "amount": group["amount"], "count": group["count"]} for group in groups]
+
+
+class MotorUserRepository(UserRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, user_id):
+        return await self.collection.find_one({"id": user_id}, NO_ID)
+
+    async def get_by_email(self, email):
+        return await self.collection.find_one({"email": email}, NO_ID)
+
+    async def insert(self, doc):
+        await self.collection.insert_one(dict(doc))
+
+    async def update(self, user_id, fields):
+        await self.collection.update_one({"id": user_id}, {"$set": fields})
+
+    async def delete(self, user_id):
+        result = await self.collection.delete_one({"id": user_id})
+        return result.deleted_count
+
+
+class MotorFamilyRepository(FamilyRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, family_id):
+        return await self.collection.find_one({"id": family_id}, NO_ID)
+
+    async def get_by_code(self, family_code):
+        return await self.collection.find_one({"family_code": family_code}, NO_ID)
+
+    async def get_by_admin(self, user_id):
+        return await self.collection.find_one({"admin_user_id": user_id}, NO_ID)
+
+    async def insert(self, doc):
+        await self.collection.insert_one(dict(doc))
+
+    async def delete(self, family_id):
+        result = await self.collection.delete_one({"id": family_id})
+        return result.deleted_count
+
+
+class MotorMemberRepository(MemberRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get_by_user(self, user_id):
+        return await self.collection.find_one({"user_id": user_id}, NO_ID)
+
+    async def list_by_family(self, family_id, limit=100):
+        return await self.collection.find({"family_id": family_id}, NO_ID).to_list(limit)
+
+    async def insert(self, doc):
+        await self.collection.insert_one(dict(doc))
+
+    async def delete_by_user(self, user_id):
+        result = await self.collection.delete_one({"user_id": user_id})
+        return result.deleted_count
+
+    async def remove(self, family_id, user_id):
+        result = await self.collection.delete_one({"family_id": family_id, "user_id": user_id})
+        return result.deleted_count
+
+
+class MotorJoinRequestRepository(JoinRequestRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, doc):
+        await self.collection.insert_one(dict(doc))
+
+    async def get_pending(self, request_id, family_id):
+        return await self.collection.find_one(
+            {"id": request_id, "family_id": family_id, "status": "pending"}, NO_ID
+        )
+
+    async def get_pending_for_user(self, user_id):
+        return await self.collection.find_one({"user_id": user_id, "status": "pending"}, NO_ID)
+
+    async def list_pending(self, family_id, limit=100):
+        return await self.collection.find(
+            {"family_id": family_id, "status": "pending"}, NO_ID
+        ).to_list(limit)
+
+    async def set_status(self, request_id, status):
+        await self.collection.update_one({"id": request_id}, {"$set": {"status": status}})
+
+
+class MotorCategoryRepository(CategoryRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, doc):
+        await self.collection.insert_one(dict(doc))
+
+    async def get(self, category_id):
+        return await self.collection.find_one({"id": category_id}, NO_ID)
+
+    async def delete(self, category_id):
+        result = await self.collection.delete_one({"id": category_id})
+        return result.deleted_count
+
+    async def list_by_family(self, family_id):
+        return await self.collection.find({"family_id": family_id}, NO_ID).to_list(1000)
+
+    async def list_visible(self, family_id, user_id, type=None):
+        query = {"family_id": family_id}
+        if type:
+            query["type"] = type
+        query["$or"] = [{"is_shared": True}, {"created_by_user_id": user_id}]
+        return await self.collection.find(query, NO_ID).to_list(1000)
+
+    async def list_with_limit(self, family_id, type, field):
+        return await self.collection.find({
+            "family_id": family_id,
+            "type": type,
+            field: {"$exists": True, "$ne": None}
+        }, NO_ID).to_list(1000)
+
+
+class MotorAccountRepository(AccountRepository):
+    def __init__(self, collection):
+        self.collection = collection
+        self._settled: Dict[str, Set[str]] = {}  # account_id -> flush ids to drop on its next write
+
+    async def insert(self, doc):
+        await self.collection.insert_one(dict(doc))
+
+    async def get(self, account_id):
+        return await self.collection.find_one({"id": account_id}, NO_ID)
+
+    async def delete(self, account_id):
+        result = await self.collection.delete_one({"id": account_id})
+        return result.deleted_count
+
+    async def list_by_family(self, family_id):
+        return await self.collection.find({"family_id": family_id}, NO_ID).to_list(1000)
+
+    async def list_visible(self, family_id, user_id):
+        return await self.collection.find({
+            "family_id": family_id,
+            "$or": [{"owner_type": "family"}, {"owner_user_id": user_id}]
+        }, NO_ID).to_list(1000)
+
+    async def list_by_ids(self, family_id, account_ids):
+        return await self.collection.find(
+            {"family_id": family_id, "id": {"$in": list(account_ids)}}, NO_ID
+        ).to_list(None)
+
+    async def adjust_balance(self, account_id, delta):
+        await self.collection.update_one({"id": account_id}, {"$inc": {"current_balance": delta}})
+
+    async def adjust_balances(self, deltas, flush_id=None):
+        if not deltas:
+            return
+        if flush_id is None:
+            await self.collection.bulk_write([
+                UpdateOne({"id": account_id}, {"$inc": {"current_balance": delta}})
+                for account_id, delta in deltas.items()
+            ], ordered=False)
+            return
+        updates = []
+        for account_id, delta in deltas.items():
+            settled = sorted(self._settled.pop(account_id, ()))
+            kept = {"$ifNull": ["$applied_flushes", []]}
+            if settled:
+                kept = {"$filter": {"input": kept, "cond": {"$not": [{"$in": ["$$this", settled]}]}}}
+            # A pipeline update, so the settled ids leave in the same write that adds this one
+            updates.append(UpdateOne({"id": account_id, "applied_flushes": {"$ne": flush_id}}, [{"$set": {
+                "current_balance": {"$add": [{"$ifNull": ["$current_balance", 0]}, delta]},
+                "applied_flushes": {"$slice": [{"$concatArrays": [kept, [flush_id]]}, -FLUSH_HISTORY]},
+            }}]))
+        await self.collection.bulk_write(updates, ordered=False)
+
+    async def correct_balance(self, account_id, based_on, delta):
+        result = await self.collection.update_one(
+            {"id": account_id, "current_balance": based_on}, {"$inc": {"current_balance": delta}}
+        )
+        return result.matched_count == 1
+
+    def settle(self, flush_id, account_ids):
+        for account_id in account_ids:
+            self._settled.setdefault(account_id, set()).add(flush_id)
+
+
+class MotorTransactionRepository(TransactionRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, doc):
+        await self.collection.insert_one(dict(doc))
+
+    async def insert_many(self, docs):
+        if not docs:
+            return []
+        skipped = set()
+        try:
+            await self.collection.insert_many([dict(doc) for doc in docs], ordered=False)
+        except BulkWriteError as exc:
+            errors = exc.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+            skipped = {error["index"] for error in errors}
+        return [doc["id"] for position, doc in enumerate(docs) if position not in skipped]
+
+    async def get(self, transaction_id):
+        return await self.collection.find_one({"id": transaction_id}, NO_ID)
+
+    async def update(self, transaction_id, fields):
+        await self.collection.update_one({"id": transaction_id}, {"$set": fields})
+
+    async def delete(self, transaction_id):
+        result = await self.collection.delete_one({"id": transaction_id})
+        return result.deleted_count
+
+    async def delete_many(self, transaction_ids):
+        if not transaction_ids:
+            return 0
+        result = await self.collection.delete_many({"id": {"$in": list(transaction_ids)}})
+        return result.deleted_count
+
+    async def update_many(self, transaction_ids, fields):
+        if transaction_ids:
+            await self.collection.update_many({"id": {"$in": list(transaction_ids)}}, {"$set": fields})
+
+    async def list_balance_pending(self, created_before):
+        return await self.collection.find(
+            {"balance_pending": True, "created_at": {"$lt": created_before}}, NO_ID
+        ).to_list(None)
+
+    async def list(self, family_id, user_id=None, type=None, start=None, end=None, limit=10000):
+        query = {"family_id": family_id}
+        if user_id:
+            query["user_id"] = user_id
+        if type:
+            query["type"] = type
+        dates = date_range(start, end)
+        if dates:
+            query["date"] = dates
+        return await self.collection.find(query, NO_ID).to_list(limit)
+
+    async def count(self, family_id, start=None, end=None):
+        query = {"family_id": family_id}
+        dates = date_range(start, end)
+        if dates:
+            query["date"] = dates
+        return await self.collection.count_documents(query)
+
+    async def list_by_category(self, category_id, type, start=None, end=None, limit=10000):
+        query = {"category_id": category_id, "type": type}
+        dates = date_range(start, end)
+        if dates:
+            query["date"] = dates
+        return await self.collection.find(query, NO_ID).to_list(limit)
+
+    async def daily_totals(self, family_id, start, end, user_id=None):
+        return await daily_totals(self.collection, family_id, start, end, user_id)
+
+    async def aggregate(self, pipeline):
+        return await self.collection.aggregate(pipeline).to_list(None)
+
+
+class MotorArchiveRepository(ArchiveRepository):
+    def __init__(self, collection, summaries, state):
+        self.collection = collection
+        self.summary_collection = summaries
+        self.state = state
+
+    async def insert_many(self, docs):
+        return await MotorTransactionRepository(self.collection).insert_many(docs)
+
+    async def list(self, family_id, start=None, end=None, limit=None):
+        query = {"family_id": family_id}
+        dates = date_range(start, end)
+        if dates:
+            query["date"] = dates
+        return await self.collection.find(query, NO_ID).to_list(limit)
+
+    async def summarize(self, family_id, months):
+        if not months:
+            return 0
+        first, last = min(months), max(months)
+        year, month = int(last[:4]), int(last[5:7])
+        after_last = f"{year + month // 12}-{month % 12 + 1:02d}"
+        groups = await self.collection.aggregate([
+            {"$match": {"family_id": family_id, "date": {"$gte": first, "$lt": after_last}}},
+            {"$group": {
+                "_id": {
+                    "month": {"$substrBytes": ["$date", 0, 7]}, "type": "$type",
+                    "category_id": "$category_id", "user_id": "$user_id",
+                },
+                "amount": {"$sum": "$amount"},
+                "count": {"$sum": 1},
+            }},
+            {"$match": {"_id.month": {"$in": list(months)}}},
+        ]).to_list(None)
+        if groups:
+            await self.summary_collection.bulk_write([
+                UpdateOne(
+                    {"family_id": family_id, **group["_id"]},
+                    {"$set": {"amount": group["amount"], "count": group["count"]}},
+                    upsert=True
+                )
+                for group in groups
+            ], ordered=False)
+        return len(groups)
+
+    async def summaries(self, family_id, start_month=None, end_month=None):
+        query = {"family_id": family_id}
+        months = {}
+        if start_month is not None:
+            months["$gte"] = start_month
+        if end_month is not None:
+            months["$lt"] = end_month
+        if months:
+            query["month"] = months
+        return await self.summary_collection.find(query, NO_ID).to_list(None)
+
+    async def daily_totals(self, family_id, start, end, user_id=None):
+        return await daily_totals(self.collection, family_id, start, end, user_id)
+
+    async def aggregate(self, pipeline):
+        return await self.collection.aggregate(pipeline).to_list(None)
+
+    async def horizon(self, family_id):
+        state = await self.state.find_one({"family_id": family_id}, NO_ID)
+        return state["horizon"] if state else None
+
+    async def set_horizon(self, family_id, month):
+        await self.state.update_one({"family_id": family_id}, {"$max": {"horizon": month}}, upsert=True)
+
+
+class MotorRecurringRepository(RecurringRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, doc):
+        await self.collection.insert_one(dict(doc))
+
+    async def get(self, template_id):
+        return await self.collection.find_one({"id": template_id}, NO_ID)
+
+    async def delete(self, template_id):
+        result = await self.collection.delete_one({"id": template_id})
+        return result.deleted_count
+
+    async def list_by_family(self, family_id):
+        return await self.collection.find({"family_id": family_id}, NO_ID).to_list(1000)
+
+    async def list_due(self, now, limit=1000):
+        return await self.collection.find(
+            {"active": True, "next_run": {"$lte": now.isoformat()}}, NO_ID
+        ).sort("next_run", ASCENDING).to_list(limit)
+
+    async def set_next_runs(self, next_runs):
+        if next_runs:
+            await self.collection.bulk_write([
+                UpdateOne({"id": template_id}, {"$set": {
+                    "next_run": next_run.isoformat() if next_run else None, "active": next_run is not None
+                }})
+                for template_id, next_run in next_runs.items()
+            ], ordered=False)
+
+
+class MotorChangeRepository(ChangeRepository):
+    def __init__(self, collection, counters):
+        self.collection = collection
+        self.counters = counters
+
+    async def record(self, family_id, changes):
+        counter = await self.counters.find_one_and_update(
+            {"family_id": family_id}, {"$inc": {"seq": len(changes)}},
+            upsert=True, return_document=ReturnDocument.AFTER, projection=NO_ID
+        )
+        first = counter["seq"] - len(changes) + 1
+        at = datetime.utcnow().isoformat()
+        # Only ever move an entry forward; a concurrent older write loses on the unique key
+        operations = [
+            UpdateOne(
+                {"family_id": family_id, "collection": collection, "doc_id": doc_id, "seq": {"$lt": first + n}},
+                {"$set": {"seq": first + n, "deleted": doc is None, "doc": doc, "at": at}},
+                upsert=True
+            )
+            for n, (collection, doc_id, doc) in enumerate(changes)
+        ]
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as exc:
+            if any(error.get("code") != DUPLICATE_KEY for error in exc.details.get("writeErrors", [])):
+                raise
+        return counter["seq"]
+
+    async def state(self, family_id):
+        counter = await self.counters.find_one({"family_id": family_id}, NO_ID) or {}
+        return {"seq": counter.get("seq", 0), "horizon": counter.get("horizon", 0)}
+
+    async def since(self, family_id, seq, limit=1000):
+        return await self.collection.find(
+            {"family_id": family_id, "seq": {"$gt": seq}}, NO_ID
+        ).sort("seq", ASCENDING).to_list(limit)
+
+    async def compact(self, before):
+        expired = {"deleted": True, "at": {"$lt": before.isoformat()}}
+        horizons = await self.collection.aggregate([
+            {"$match": expired},
+            {"$group": {"_id": "$family_id", "seq": {"$max": "$seq"}}},
+        ]).to_list(None)
+        if not horizons:
+            return 0
+        await self.counters.bulk_write([
+            UpdateOne({"family_id": h["_id"]}, {"$max": {"horizon": h["seq"]}}) for h in horizons
+        ], ordered=False)
+        result = await self.collection.delete_many(expired)
+        return result.deleted_count
+
+
+class MotorJobRepository(JobRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, doc):
+        await self.collection.insert_one(dict(doc))
+
+    async def get(self, job_id):
+        return await self.collection.find_one({"id": job_id}, NO_ID)
+
+    async def list_by_family(self, family_id, limit=50):
+        return await self.collection.find(
+            {"family_id": family_id}, NO_ID
+        ).sort("created_at", DESCENDING).to_list(limit)
+
+    async def claim(self, worker_id, now, lease_until):
+        now = now.isoformat()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                {"status": "running", "lease_expires_at": {"$lt": now}},
+            ]},
+            {
+                "$set": {"status": "running", "worker_id": worker_id, "started_at": now,
+                         "lease_expires_at": lease_until.isoformat()},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", ASCENDING)], return_document=ReturnDocument.AFTER, projection=NO_ID
+        )
+
+    async def update_leased(self, job_id, worker_id, fields):
+        result = await self.collection.update_one(
+            {"id": job_id, "worker_id": worker_id, "status": "running"}, {"$set": fields}
+        )
+        return result.matched_count == 1
+
+
+class MotorIdempotencyRepository(IdempotencyRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, record_id):
+        # The TTL monitor runs once a minute; do not serve what it has yet to remove
+        return await self.collection.find_one(
+            {"id": record_id, "expires_at": {"$gt": datetime.utcnow()}}, NO_ID
+        )
+
+    async def reserve(self, doc):
+        await self.collection.delete_one({"id": doc["id"], "expires_at": {"$lte": datetime.utcnow()}})
+        try:
+            await self.collection.insert_one(dict(doc))
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def take_over(self, record_id, now, locked_until):
+        result = await self.collection.update_one(
+            {"id": record_id, "status": "pending", "locked_until": {"$lt": now}},
+            {"$set": {"locked_until": locked_until}}
+        )
+        return result.modified_count == 1
+
+    async def complete(self, record_id, fields):
+        await self.collection.update_one({"id": record_id}, {"$set": {**fields, "status": "completed"}})
+
+    async def release(self, record_id):
+        await self.collection.delete_one({"id": record_id})
+
+
+class MotorBalanceRepository(BalanceRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, family_id, month, year, user_id=None):
+        return await self.collection.find_one(
+            {"family_id": family_id, "month": month, "year": year, "user_id": user_id}, NO_ID
+        )
+
+    async def upsert(self, family_id, month, year, user_id, fields):
+        await self.collection.update_one(
+            {"family_id": family_id, "month": month, "year": year, "user_id": user_id},
+            {"$set": fields, "$setOnInsert": {"id": str(uuid.uuid4())}},
+            upsert=True
+        )
+
+
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "families": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("family_code", ASCENDING)]),
+        IndexModel([("admin_user_id", ASCENDING)]),
+    ],
+    "family_members": [
+        IndexModel([("user_id", ASCENDING)]),
+        IndexModel([("family_id", ASCENDING)]),
+    ],
+    "join_requests": [
+        IndexModel([("id", ASCENDING)]),
+        IndexModel([("family_id", ASCENDING), ("status", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING)]),
+    ],
+    "categories": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("family_id", ASCENDING), ("type", ASCENDING)]),
+    ],
+    "accounts": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("family_id", ASCENDING)]),
+    ],
+    "transactions": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("family_id", ASCENDING), ("date", ASCENDING)]),
+        IndexModel([("family_id", ASCENDING), ("user_id", ASCENDING), ("date", ASCENDING)]),
+        IndexModel([("category_id", ASCENDING), ("type", ASCENDING), ("date", ASCENDING)]),
+        IndexModel([("balance_pending", ASCENDING), ("created_at", ASCENDING)],
+                   partialFilterExpression={"balance_pending": True}),
+    ],
+    "transactions_archive": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("family_id", ASCENDING), ("date", ASCENDING)]),
+    ],
+    "transaction_summaries": [
+        IndexModel([("family_id", ASCENDING), ("month", ASCENDING), ("type", ASCENDING),
+                    ("category_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+    ],
+    "archive_state": [
+        IndexModel([("family_id", ASCENDING)], unique=True),
+    ],
+    "recurring_transactions": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("family_id", ASCENDING)]),
+        IndexModel([("active", ASCENDING), ("next_run", ASCENDING)]),
+    ],
+    "changes": [
+        IndexModel([("family_id", ASCENDING), ("collection", ASCENDING), ("doc_id", ASCENDING)], unique=True),
+        IndexModel([("family_id", ASCENDING), ("seq", ASCENDING)]),
+        IndexModel([("deleted", ASCENDING), ("at", ASCENDING)]),
+    ],
+    "change_counters": [
+        IndexModel([("family_id", ASCENDING)], unique=True),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)]),
+        IndexModel([("family_id", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "cache_versions": [
+        IndexModel([("family_id", ASCENDING)], unique=True),
+        IndexModel([("updated_at", ASCENDING)]),
+    ],
+    "idempotency_keys": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "monthly_balances": [
+        IndexModel([("family_id", ASCENDING), ("year", ASCENDING), ("month", ASCENDING), ("user_id", ASCENDING)]),
+    ],
+}
+
+
+class MotorRepositories(Repositories):
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.users = MotorUserRepository(db.users)
+        self.families = MotorFamilyRepository(db.families)
+        self.members = MotorMemberRepository(db.family_members)
+        self.join_requests = MotorJoinRequestRepository(db.join_requests)
+        self.categories = MotorCategoryRepository(db.categories)
+        self.accounts = MotorAccountRepository(db.accounts)
+        self.transactions = MotorTransactionRepository(db.transactions)
+        self.archive = MotorArchiveRepository(db.transactions_archive, db.transaction_summaries, db.archive_state)
+        self.recurring = MotorRecurringRepository(db.recurring_transactions)
+        self.changes = MotorChangeRepository(db.changes, db.change_counters)
+        self.jobs = MotorJobRepository(db.jobs)
+        self.idempotency = MotorIdempotencyRepository(db.idempotency_keys)
+        self.balances = MotorBalanceRepository(db.monthly_balances)
+
+    async def ensure_indexes(self):
+        for collection, indexes in INDEXES.items():
+            try:
+                await self.db[collection].create_indexes(indexes)
+            except OperationFailure as exc:
+                # e.g. duplicate emails in legacy data; keep serving without the index
+                logger.warning("Could not create indexes on %s: %s", collection, exc)
+
+    def with_read_preference(self, read_preference):
+        return MotorRepositories(self.db.with_options(read_preference=read_preference))
+
+    async def explain(self, collection, command, filter):
+        if command == "aggregate":
+            pipeline = (filter or {}).get("pipeline") or []
+            explained = SON([("aggregate", collection), ("pipeline", pipeline), ("cursor", {})])
+        else:
+            explained = SON([("find", collection), ("filter", filter or {})])
+        return await self.db.command("explain", explained, verbosity="executionStats")
@@ -0,0 +1,152 @@
+"""Fast JSON responses for rows we wrote ourselves.
+
+Returning dicts from an endpoint with ``response_model=List[Model]`` makes
+FastAPI validate every row into a model and serialize it back out, which
+dominates the cost of large list endpoints. Rows read back from our own
+collections were built from those models on the way in, so
+:func:`model_rows` only projects them onto the model's fields (filling
+defaults for fields older documents lack) and :func:`rows_response`
+serializes them with orjson. Returning a ``Response`` makes FastAPI skip
+``response_model`` processing; keep the declaration for the OpenAPI schema.
+
+Dates stay as the ISO strings they are stored as.
+
+List endpoints negotiate their encoding from the Accept header (see
+:func:`list_encoding`):
+
+  * ``application/json`` (default): an array of row objects
+  * ``application/vnd.spendtracker.columnar+json``: one array per field,
+    with low-cardinality string columns (user and category ids, names,
+    icons) dictionary-encoded, see :func:`columnar`
+  * ``application/msgpack`` and
+    ``application/vnd.spendtracker.columnar+msgpack``: the same two layouts
+    in MessagePack, when the optional ``msgpack`` package is installed
+"""
+from fastapi import Request
+from fastapi.responses import ORJSONResponse, Response
+from starlette.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+try:
+    import msgpack
+except ImportError:  # optional; msgpack media types are then not offered
+    msgpack = None
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.spendtracker.columnar+json"
+MSGPACK = "application/msgpack"
+COLUMNAR_MSGPACK = "application/vnd.spendtracker.columnar+msgpack"
+
+_ALIASES = {"application/x-msgpack": MSGPACK, "*/*": JSON, "application/*": JSON}
+
+_projections: Dict[Type[BaseModel], Tuple[tuple, dict]] = {}
+
+
+def _projection(model: Type[BaseModel]):
+    projection = _projections.get(model)
+    if projection is None:
+        defaults = {}
+        for name, field in model.model_fields.items():
+            if field.default is not PydanticUndefined:
+                defaults[name] = lambda value=field.default: value
+            elif field.default_factory is not None:
+                defaults[name] = field.default_factory
+        projection = _projections[model] = (tuple(model.model_fields), defaults)
+    return projection
+
+
+def model_rows(rows: Iterable[dict], model: Type[BaseModel]) -> List[dict]:
+    """``rows`` restricted to ``model``'s fields, in field order, without validation."""
+    names, defaults = _projection(model)
+    projected = []
+    for row in rows:
+        item = {}
+        for name in names:
+            if name in row:
+                item[name] = row[name]
+            elif name in defaults:
+                item[name] = defaults[name]()
+        projected.append(item)
+    return projected
+
+
+def columnar(rows: List[dict], model: Type[BaseModel]) -> dict:
+    """Column-oriented form of projected ``rows``.
+
+    ``{"count": n, "columns": {field: [values...]}, "dictionaries": {field: [distinct...]}}``;
+    for a field listed in ``dictionaries`` its column holds indexes into that list.
+    A string column is dictionary-encoded when at most half its values are distinct.
+    """
+    names, _ = _projection(model)
+    columns, dictionaries = {}, {}
+    for name in names:
+        values = [row.get(name) for row in rows]
+        if len(values) > 1 and all(v is None or isinstance(v, str) for v in values):
+            codes: Dict[Optional[str], int] = {}
+            encoded = [codes.setdefault(v, len(codes)) for v in values]
+            if len(codes) * 2 <= len(values):
+                dictionaries[name] = list(codes)
+                values = encoded
+        columns[name] = values
+    return {"count": len(rows), "columns": columns, "dictionaries": dictionaries}
+
+
+def _accepted(accept: str) -> List[str]:
+    ranked = []
+    for position, part in enumerate(accept.split(",")):
+        media_type, *params = (p.strip() for p in part.split(";"))
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            ranked.append((-quality, position, media_type.lower()))
+    return [media_type for _, _, media_type in sorted(ranked)]
+
+
+def list_encoding(request: Request) -> str:
+    """Dependency choosing the list encoding from the Accept header; JSON if nothing else matches."""
+    supported = {JSON, COLUMNAR_JSON}
+    if msgpack is not None:
+        supported |= {MSGPACK, COLUMNAR_MSGPACK}
+    for media_type in _accepted(request.headers.get("accept", "")):
+        media_type = _ALIASES.get(media_type, media_type)
+        if media_type in supported:
+            return media_type
+    return JSON
+
+
+def rows_response(rows: Iterable[dict], model: Type[BaseModel], encoding: str = JSON) -> Response:
+    rows = model_rows(rows, model)
+    headers = {"Vary": "Accept"}
+    if encoding == JSON:
+        return ORJSONResponse(rows, headers=headers)
+    if encoding == COLUMNAR_JSON:
+        return ORJSONResponse(columnar(rows, model), headers=headers, media_type=COLUMNAR_JSON)
+    content = columnar(rows, model) if encoding == COLUMNAR_MSGPACK else rows
+    body = msgpack.packb(content, use_bin_type=True, default=_isoformat)
+    return Response(body, headers=headers, media_type=encoding)
+
+
+def _isoformat(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"cannot serialize {type(value).__name__}")
+
+
+class StreamingAwareGZipMiddleware(GZipMiddleware):
+    """GZip that leaves server-sent event streams alone; compressed events would sit in the buffer."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            accept = dict(scope.get("headers") or []).get(b"accept", b"")
+            if b"text/event-stream" in accept:
+                await self.app(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
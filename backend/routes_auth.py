@@ -1,9 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends, status
-from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import timedelta
-from dotenv import load_dotenv
-from pathlib import Path
-import os
 
 from models import (
     User, UserCreate, UserLogin, UserInDB, Token,
@@ -15,24 +11,21 @@ from auth import (
     get_current_user, get_admin_user,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
-
-# Load environment variables
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
-# Get database connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+from repositories import Repositories, get_repositories
+from events import EventBus, family_topic, user_topic, get_event_bus
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
 
 @router.post("/register", response_model=Token)
-async def register(user_data: UserCreate):
+async def register(
+    user_data: UserCreate,
+    repos: Repositories = Depends(get_repositories),
+    bus: EventBus = Depends(get_event_bus)
+):
     """Register a new user. Can either create a new family or join an existing one."""
     # Check if user already exists
-    existing_user = await db.users.find_one({"email": user_data.email})
+    existing_user = await repos.users.get_by_email(user_data.email)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -48,15 +41,15 @@ async def register(user_data: UserCreate):
     
     user_doc = user_in_db.model_dump()
     user_doc["created_at"] = user_doc["created_at"].isoformat()
-    await db.users.insert_one(user_doc)
+    await repos.users.insert(user_doc)
     
     # Check if user wants to join existing family
     if user_data.family_code:
         # Find family by code
-        family = await db.families.find_one({"family_code": user_data.family_code.upper()}, {"_id": 0})
+        family = await repos.families.get_by_code(user_data.family_code.upper())
         if not family:
             # Cleanup: delete the created user
-            await db.users.delete_one({"id": user.id})
+            await repos.users.delete(user.id)
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid family code. Please check and try again."
@@ -73,7 +66,8 @@ async def register(user_data: UserCreate):
         )
         request_doc = join_request.model_dump()
         request_doc["created_at"] = request_doc["created_at"].isoformat()
-        await db.join_requests.insert_one(request_doc)
+        await repos.join_requests.insert(request_doc)
+        bus.publish(family_topic(family["id"]), "join_request.created", request_doc)
         
         # Create a temporary family for the user until approved
         temp_family = Family(
@@ -82,7 +76,7 @@ async def register(user_data: UserCreate):
         )
         temp_family_doc = temp_family.model_dump()
         temp_family_doc["created_at"] = temp_family_doc["created_at"].isoformat()
-        await db.families.insert_one(temp_family_doc)
+        await repos.families.insert(temp_family_doc)
         
         # Add user to temp family
         family_member = FamilyMember(
@@ -92,7 +86,7 @@ async def register(user_data: UserCreate):
         )
         member_doc = family_member.model_dump()
         member_doc["joined_at"] = member_doc["joined_at"].isoformat()
-        await db.family_members.insert_one(member_doc)
+        await repos.members.insert(member_doc)
         
         # Create access token with temp family (will be updated upon approval)
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -113,7 +107,7 @@ async def register(user_data: UserCreate):
         )
         family_doc = family.model_dump()
         family_doc["created_at"] = family_doc["created_at"].isoformat()
-        await db.families.insert_one(family_doc)
+        await repos.families.insert(family_doc)
         
         # Add user as family member with admin role
         family_member = FamilyMember(
@@ -123,7 +117,7 @@ async def register(user_data: UserCreate):
         )
         member_doc = family_member.model_dump()
         member_doc["joined_at"] = member_doc["joined_at"].isoformat()
-        await db.family_members.insert_one(member_doc)
+        await repos.members.insert(member_doc)
         
         # Create access token
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -140,10 +134,10 @@ async def register(user_data: UserCreate):
 
 
 @router.post("/login", response_model=Token)
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, repos: Repositories = Depends(get_repositories)):
     """Login user and return JWT token"""
     # Find user by email
-    user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
+    user = await repos.users.get_by_email(credentials.email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -158,7 +152,7 @@ async def login(credentials: UserLogin):
         )
     
     # Get user's family and role
-    family_member = await db.family_members.find_one({"user_id": user["id"]}, {"_id": 0})
+    family_member = await repos.members.get_by_user(user["id"])
     if not family_member:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -180,11 +174,15 @@ async def login(credentials: UserLogin):
 
 
 @router.get("/me", response_model=User)
-async def get_me(current_user: dict = Depends(get_current_user)):
+async def get_me(
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
     """Get current user information"""
-    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0, "password_hash": 0})
+    user = await repos.users.get(current_user["user_id"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    user.pop("password_hash", None)
     
     # Convert datetime
     if isinstance(user.get('created_at'), str):
@@ -195,20 +193,23 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 
 
 @router.get("/family")
-async def get_family_info(current_user: dict = Depends(get_current_user)):
+async def get_family_info(
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
     """Get current user's family information"""
     # Get family
-    family = await db.families.find_one({"id": current_user["family_id"]}, {"_id": 0})
+    family = await repos.families.get(current_user["family_id"])
     if not family:
         raise HTTPException(status_code=404, detail="Family not found")
     
     # Get all family members
-    members = await db.family_members.find({"family_id": current_user["family_id"]}, {"_id": 0}).to_list(100)
+    members = await repos.members.list_by_family(current_user["family_id"])
     
     # Get user details for each member
     member_details = []
     for member in members:
-        user = await db.users.find_one({"id": member["user_id"]}, {"_id": 0, "password_hash": 0})
+        user = await repos.users.get(member["user_id"])
         if user:
             member_details.append({
                 "user_id": user["id"],
@@ -230,10 +231,15 @@ async def get_family_info(current_user: dict = Depends(get_current_user)):
 
 
 @router.post("/join-family", response_model=Token)
-async def join_family(family_code: str, current_user: dict = Depends(get_current_user)):
+async def join_family(
+    family_code: str,
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    bus: EventBus = Depends(get_event_bus)
+):
     """Join an existing family using family code. Will leave current family if applicable."""
     # Find family by code
-    family = await db.families.find_one({"family_code": family_code.upper()}, {"_id": 0})
+    family = await repos.families.get_by_code(family_code.upper())
     if not family:
         raise HTTPException(status_code=404, detail="Invalid family code")
     
@@ -245,12 +251,10 @@ async def join_family(family_code: str, current_user: dict = Depends(get_current
         )
     
     # Remove user from current family
-    existing_member = await db.family_members.find_one({"user_id": current_user["user_id"]})
+    existing_member = await repos.members.get_by_user(current_user["user_id"])
     if existing_member:
         # Check if user is the only admin of their current family
-        current_family_members = await db.family_members.find({
-            "family_id": existing_member["family_id"]
-        }).to_list(100)
+        current_family_members = await repos.members.list_by_family(existing_member["family_id"])
         
         admin_count = sum(1 for m in current_family_members if m.get("role") == "admin")
         
@@ -261,7 +265,7 @@ async def join_family(family_code: str, current_user: dict = Depends(get_current
             )
         
         # Remove from current family
-        await db.family_members.delete_one({"user_id": current_user["user_id"]})
+        await repos.members.delete_by_user(current_user["user_id"])
     
     # Add user to new family as member
     family_member = FamilyMember(
@@ -271,7 +275,10 @@ async def join_family(family_code: str, current_user: dict = Depends(get_current
     )
     member_doc = family_member.model_dump()
     member_doc["joined_at"] = member_doc["joined_at"].isoformat()
-    await db.family_members.insert_one(member_doc)
+    await repos.members.insert(member_doc)
+    if existing_member:
+        bus.publish(family_topic(existing_member["family_id"]), "member.left", {"user_id": current_user["user_id"]})
+    bus.publish(family_topic(family["id"]), "member.joined", {"user_id": current_user["user_id"]})
     
     # Create new token with updated family_id
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -291,7 +298,8 @@ async def join_family(family_code: str, current_user: dict = Depends(get_current
 async def update_profile(
     name: str = None,
     profile_icon: str = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
 ):
     """Update user profile"""
     update_data = {}
@@ -303,10 +311,7 @@ async def update_profile(
     if not update_data:
         raise HTTPException(status_code=400, detail="No data to update")
     
-    await db.users.update_one(
-        {"id": current_user["user_id"]},
-        {"$set": update_data}
-    )
+    await repos.users.update(current_user["user_id"], update_data)
     
     return {"message": "Profile updated successfully"}
 
@@ -314,7 +319,9 @@ async def update_profile(
 @router.post("/remove-member")
 async def remove_family_member(
     user_id: str,
-    current_user: dict = Depends(get_admin_user)
+    current_user: dict = Depends(get_admin_user),
+    repos: Repositories = Depends(get_repositories),
+    bus: EventBus = Depends(get_event_bus)
 ):
     """Remove a member from the family (admin only)"""
     # Can't remove yourself
@@ -325,24 +332,24 @@ async def remove_family_member(
         )
     
     # Remove the family member
-    result = await db.family_members.delete_one({
-        "family_id": current_user["family_id"],
-        "user_id": user_id
-    })
+    deleted = await repos.members.remove(current_user["family_id"], user_id)
     
-    if result.deleted_count == 0:
+    if deleted == 0:
         raise HTTPException(status_code=404, detail="Member not found")
     
+    removed = {"user_id": user_id, "family_id": current_user["family_id"]}
+    bus.publish(family_topic(current_user["family_id"]), "member.removed", removed)
+    bus.publish(user_topic(user_id), "member.removed", removed)
     return {"message": "Member removed successfully"}
 
 
 @router.get("/pending-requests")
-async def get_pending_requests(current_user: dict = Depends(get_admin_user)):
+async def get_pending_requests(
+    current_user: dict = Depends(get_admin_user),
+    repos: Repositories = Depends(get_repositories)
+):
     """Get all pending join requests for the family (admin only)"""
-    requests = await db.join_requests.find({
-        "family_id": current_user["family_id"],
-        "status": "pending"
-    }, {"_id": 0}).to_list(100)
+    requests = await repos.join_requests.list_pending(current_user["family_id"])
     
     return {"requests": requests}
 
@@ -350,7 +357,9 @@ async def get_pending_requests(current_user: dict = Depends(get_admin_user)):
 @router.post("/approve-request")
 async def approve_join_request(
     request_data: dict,
-    current_user: dict = Depends(get_admin_user)
+    current_user: dict = Depends(get_admin_user),
+    repos: Repositories = Depends(get_repositories),
+    bus: EventBus = Depends(get_event_bus)
 ):
     """Approve a pending join request (admin only)"""
     request_id = request_data.get("request_id")
@@ -358,22 +367,18 @@ async def approve_join_request(
         raise HTTPException(status_code=400, detail="request_id is required")
     
     # Find the request
-    request = await db.join_requests.find_one({
-        "id": request_id,
-        "family_id": current_user["family_id"],
-        "status": "pending"
-    })
+    request = await repos.join_requests.get_pending(request_id, current_user["family_id"])
     
     if not request:
         raise HTTPException(status_code=404, detail="Request not found")
     
     # Remove user from their temp family
-    await db.family_members.delete_one({"user_id": request["user_id"]})
+    await repos.members.delete_by_user(request["user_id"])
     
     # Delete the temp family
-    temp_family = await db.families.find_one({"admin_user_id": request["user_id"]})
+    temp_family = await repos.families.get_by_admin(request["user_id"])
     if temp_family:
-        await db.families.delete_one({"id": temp_family["id"]})
+        await repos.families.delete(temp_family["id"])
     
     # Add user to the actual family as member
     family_member = FamilyMember(
@@ -383,13 +388,14 @@ async def approve_join_request(
     )
     member_doc = family_member.model_dump()
     member_doc["joined_at"] = member_doc["joined_at"].isoformat()
-    await db.family_members.insert_one(member_doc)
+    await repos.members.insert(member_doc)
     
     # Update request status
-    await db.join_requests.update_one(
-        {"id": request_id},
-        {"$set": {"status": "approved"}}
-    )
+    await repos.join_requests.set_status(request_id, "approved")
+    
+    decision = {"request_id": request_id, "user_id": request["user_id"], "family_id": current_user["family_id"]}
+    bus.publish(family_topic(current_user["family_id"]), "join_request.approved", decision)
+    bus.publish(user_topic(request["user_id"]), "join_request.approved", decision)
     
     return {"message": "Request approved successfully"}
 
@@ -397,7 +403,9 @@ async def approve_join_request(
 @router.post("/reject-request")
 async def reject_join_request(
     request_data: dict,
-    current_user: dict = Depends(get_admin_user)
+    current_user: dict = Depends(get_admin_user),
+    repos: Repositories = Depends(get_repositories),
+    bus: EventBus = Depends(get_event_bus)
 ):
     """Reject a pending join request (admin only)"""
     request_id = request_data.get("request_id")
@@ -405,35 +413,32 @@ async def reject_join_request(
         raise HTTPException(status_code=400, detail="request_id is required")
     
     # Find the request
-    request = await db.join_requests.find_one({
-        "id": request_id,
-        "family_id": current_user["family_id"],
-        "status": "pending"
-    })
+    request = await repos.join_requests.get_pending(request_id, current_user["family_id"])
     
     if not request:
         raise HTTPException(status_code=404, detail="Request not found")
     
     # Update request status
-    await db.join_requests.update_one(
-        {"id": request_id},
-        {"$set": {"status": "rejected"}}
-    )
+    await repos.join_requests.set_status(request_id, "rejected")
+    
+    decision = {"request_id": request_id, "user_id": request["user_id"], "family_id": current_user["family_id"]}
+    bus.publish(family_topic(current_user["family_id"]), "join_request.rejected", decision)
+    bus.publish(user_topic(request["user_id"]), "join_request.rejected", decision)
     
     return {"message": "Request rejected"}
 
 
 @router.get("/my-join-status")
-async def get_my_join_status(current_user: dict = Depends(get_current_user)):
+async def get_my_join_status(
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
     """Check if user has pending join requests"""
-    request = await db.join_requests.find_one({
-        "user_id": current_user["user_id"],
-        "status": "pending"
-    }, {"_id": 0})
+    request = await repos.join_requests.get_pending_for_user(current_user["user_id"])
     
     if request:
         # Get the family name
-        family = await db.families.find_one({"id": request["family_id"]}, {"_id": 0})
+        family = await repos.families.get(request["family_id"])
         return {
             "has_pending": True,
             "family_name": family.get("name") if family else "Unknown Family",
@@ -0,0 +1,195 @@
+"""Ranked full-text search over a family's transactions.
+
+Each family gets an in-process inverted index from the words of a
+transaction's description, category name and account names to the
+transactions containing them. A MongoDB text index was not used because
+category and account names live in other collections, and the in-memory
+backend needs the same behaviour.
+
+An index is built on a family's first search and then kept current by the
+transaction write endpoints through :meth:`SearchIndex.record`, which
+applies the change only when the index is exactly one data version (see
+:mod:`cache`) behind. Any other write to the family (category or account
+changes, recurring postings, another worker) leaves the index behind, and
+it is rebuilt, with fresh names, on the next search.
+
+Every query word must match a word of the transaction, exactly or as a
+prefix ("elec" finds "electricity"). Results are ranked by tf-idf, then
+newest first, and paged with an opaque cursor holding the last result's
+sort key.
+"""
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+import base64
+import json
+import math
+import re
+
+from fastapi import HTTPException, Request
+
+from cache import LRUCache, family_version
+
+WORD = re.compile(r"\w+")
+PREFIX_WEIGHT = 0.8  # a prefix match counts a little less than the whole word
+
+SortKey = Tuple[float, str, str]  # (score, date, id), ranked descending
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return WORD.findall(text.lower()) if text else []
+
+
+def encode_cursor(key: SortKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    try:
+        score, date, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(score), str(date), str(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+class FamilyIndex:
+    """Inverted index over one family's transactions."""
+
+    def __init__(self, version: int, category_names: Dict[str, str], account_names: Dict[str, str]):
+        self.version = version
+        self.category_names = category_names
+        self.account_names = account_names
+        self.docs: Dict[str, dict] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}  # word -> {transaction id: occurrences}
+        self._words: Dict[str, List[str]] = {}  # transaction id -> its distinct words
+        self._vocabulary: Optional[List[str]] = None  # sorted words, for prefix lookups
+
+    def _text(self, doc: dict) -> str:
+        return " ".join(filter(None, (
+            doc.get("description"),
+            self.category_names.get(doc.get("category_id")),
+            self.account_names.get(doc.get("account_id")),
+            self.account_names.get(doc.get("to_account_id")),
+        )))
+
+    def add(self, doc: dict) -> None:
+        self.remove(doc["id"])
+        counts: Dict[str, int] = {}
+        for word in tokenize(self._text(doc)):
+            counts[word] = counts.get(word, 0) + 1
+        for word, count in counts.items():
+            posting = self.postings.get(word)
+            if posting is None:
+                posting = self.postings[word] = {}
+                self._vocabulary = None
+            posting[doc["id"]] = count
+        self.docs[doc["id"]] = doc
+        self._words[doc["id"]] = list(counts)
+
+    def remove(self, row_id: str) -> None:
+        if self.docs.pop(row_id, None) is None:
+            return
+        for word in self._words.pop(row_id):
+            posting = self.postings[word]
+            del posting[row_id]
+            if not posting:
+                del self.postings[word]
+                self._vocabulary = None
+
+    def _expand(self, term: str) -> List[str]:
+        """Indexed words equal to or starting with ``term``."""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        words = []
+        for word in self._vocabulary[bisect_left(self._vocabulary, term):]:
+            if not word.startswith(term):
+                break
+            words.append(word)
+        return words
+
+    def search(self, query: str) -> List[Tuple[SortKey, dict]]:
+        """Matching transactions with their sort keys, best first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.docs:
+            return []
+        total = len(self.docs)
+        scores: Optional[Dict[str, float]] = None
+        for term in terms:
+            term_scores: Dict[str, float] = {}
+            for word in self._expand(term):
+                posting = self.postings[word]
+                weight = math.log(1 + total / len(posting)) * (1.0 if word == term else PREFIX_WEIGHT)
+                for row_id, count in posting.items():
+                    score = weight * (1 + math.log(count))
+                    if score > term_scores.get(row_id, 0.0):
+                        term_scores[row_id] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {row_id: scores[row_id] + s for row_id, s in term_scores.items() if row_id in scores}
+            if not scores:
+                return []
+        ranked = [
+            ((round(score, 6), str(self.docs[row_id].get("date")), row_id), self.docs[row_id])
+            for row_id, score in scores.items()
+        ]
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return ranked
+
+
+class SearchIndex:
+    """Per-family :class:`FamilyIndex` objects, least recently searched evicted first."""
+
+    def __init__(self, max_families: int = 64):
+        self._families = LRUCache(max_families)
+        self.builds = 0
+
+    async def family(self, repos, family_id: str) -> FamilyIndex:
+        version = family_version(family_id)
+        index: Optional[FamilyIndex] = self._families.get(family_id)
+        if index is not None and index.version == version:
+            return index
+        categories = await repos.categories.list_by_family(family_id)
+        accounts = await repos.accounts.list_by_family(family_id)
+        index = FamilyIndex(
+            version,
+            {c["id"]: c.get("name", "") for c in categories},
+            {a["id"]: a.get("name", "") for a in accounts},
+        )
+        for doc in await repos.transactions.list(family_id):
+            index.add(doc)
+        self.builds += 1
+        self._families.put(family_id, index)
+        return index
+
+    def record(self, family_id: str, version: int, doc: Optional[dict] = None,
+               removed: Optional[str] = None) -> None:
+        """Apply one transaction write that moved ``family_id`` to ``version``."""
+        index: Optional[FamilyIndex] = self._families.get(family_id)
+        if index is None:
+            return
+        if index.version != version - 1:
+            self._families.pop(family_id)
+            return
+        if removed is not None:
+            index.remove(removed)
+        if doc is not None:
+            index.add(doc)
+        index.version = version
+
+    async def search(self, repos, family_id: str, query: str, limit: int = 20,
+                     cursor: Optional[str] = None) -> dict:
+        index = await self.family(repos, family_id)
+        ranked = index.search(query)
+        if cursor:
+            after = decode_cursor(cursor)
+            ranked = [item for item in ranked if item[0] < after]
+        page = ranked[:limit]
+        return {
+            "total": len(ranked),
+            "results": [{**doc, "score": key[0]} for key, doc in page],
+            "next_cursor": encode_cursor(page[-1][0]) if len(ranked) > limit else None,
+        }
+
+
+def get_search_index(request: Request) -> SearchIndex:
+    return request.app.state.search
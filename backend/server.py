@@ -1,47 +1,78 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
-from dotenv import load_dotenv
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
 import os
 import logging
-from pathlib import Path
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime
-from collections import defaultdict
 
 from models import (
     Category, CategoryCreate,
     Transaction, TransactionCreate,
+    RecurringTransaction, RecurringTransactionCreate,
     Account, AccountCreate,
-    MonthlyStats, BudgetStatus, InvestmentTargetStatus, MonthlyBalance, PeriodStats
+    MonthlyStats, BudgetStatus, InvestmentTargetStatus, MonthlyBalance, PeriodStats,
+    PivotQuery
 )
 from auth import get_current_user, get_admin_user
 from routes_auth import router as auth_router
+from database import MongoSettings
+from repositories import Repositories, InMemoryRepositories, MotorRepositories, get_repositories
+from slow_queries import SlowQueryLog
+from responses import model_rows, rows_response, list_encoding, StreamingAwareGZipMiddleware
+from events import EventBus, family_topic, get_event_bus, router as events_router
+from analytics import AnalyticsEngine, get_analytics
+import analytics
+from distribution import Distributions, get_distributions
+from forecast import Forecaster, get_forecaster, MAX_HORIZON
+import forecast
+from heatmap import CalendarHeatmap, get_calendar_heatmap
+from pivot import PivotEngine, get_pivot_engine
+from cache import invalidate_family
+from recurring import RecurringScheduler
+from search import SearchIndex, get_search_index
+from anomalies import AnomalyDetector, get_anomaly_detector
+from sync import ChangeFeed, ChangeLogCompactor, router as sync_router
+from jobs import JobWorkers, router as jobs_router
+from invalidation import InvalidationBus
+from balances import BalanceCoalescer, get_balance_coalescer
+from idempotency import IdempotencyStore, get_idempotency, fingerprint, replay as idempotent_replay
+from read_routing import ReadRouting, analytics_repositories
+import sync
+import ledger
+import recurring
+import database
+import metrics
+import profiling
 
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+# Create API router
+api_router = APIRouter(prefix="/api")
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Dashboard and budget reads may go to secondaries (see read_routing); everything else uses the primary
+dashboard_reads = analytics_repositories("dashboard")
+budget_reads = analytics_repositories("budget")
 
-# Create the main app
-app = FastAPI(title="Spend Tracker")
 
-# Create API router
-api_router = APIRouter(prefix="/api")
+def month_bounds(month: int, year: int):
+    """Start (inclusive) and end (exclusive) of a calendar month."""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
 
-# Include auth router
-app.include_router(auth_router)
+# Fractions of a budget at which a budget.threshold event is published
+BUDGET_ALERT_LEVELS = (0.9, 1.0)
 
 
 # ============= CATEGORY ENDPOINTS =============
 @api_router.post("/categories", response_model=Category)
 async def create_category(
     category_data: CategoryCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
 ):
     """Create a new category. All members can create shared categories. Only admin can set budget limits."""
     # Only admin can set budget limits
@@ -62,50 +93,44 @@ async def create_category(
     category_doc = category.model_dump()
     category_doc["created_at"] = category_doc["created_at"].isoformat()
     
-    await db.categories.insert_one(category_doc)
+    await repos.categories.insert(category_doc)
+    invalidate_family(category_doc["family_id"])
+    await sync.record(repos, category_doc["family_id"], [("categories", category_doc["id"], category_doc)])
     return category
 
 
 @api_router.get("/categories", response_model=List[Category])
 async def get_categories(
     type: Optional[str] = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    encoding: str = Depends(list_encoding)
 ):
     """Get categories for current family. Returns shared + user's personal categories."""
-    query = {"family_id": current_user["family_id"]}
-    
-    if type:
-        query["type"] = type
-    
     # Get shared categories + user's personal categories
-    categories = await db.categories.find({
-        **query,
-        "$or": [
-            {"is_shared": True},
-            {"created_by_user_id": current_user["user_id"]}
-        ]
-    }, {"_id": 0}).to_list(1000)
-    
-    for cat in categories:
-        if isinstance(cat.get('created_at'), str):
-            cat['created_at'] = datetime.fromisoformat(cat['created_at'])
-    return categories
+    categories = await repos.categories.list_visible(
+        current_user["family_id"], current_user["user_id"], type
+    )
+    return rows_response(categories, Category, encoding)
 
 
 @api_router.delete("/categories/{category_id}")
 async def delete_category(
     category_id: str,
-    current_user: dict = Depends(get_admin_user)
+    current_user: dict = Depends(get_admin_user),
+    repos: Repositories = Depends(get_repositories)
 ):
     """Delete a category. Admin only."""
     # Find the category
-    category = await db.categories.find_one({"id": category_id})
+    category = await repos.categories.get(category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    result = await db.categories.delete_one({"id": category_id})
-    if result.deleted_count == 0:
+    deleted = await repos.categories.delete(category_id)
+    if deleted == 0:
         raise HTTPException(status_code=404, detail="Category not found")
+    invalidate_family(category.get("family_id"))
+    await sync.record(repos, category.get("family_id"), [("categories", category_id, None)])
     return {"message": "Category deleted successfully"}
 
 
@@ -113,7 +138,8 @@ async def delete_category(
 @api_router.post("/accounts", response_model=Account)
 async def create_account(
     account_data: AccountCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
 ):
     """Create a new account (bank, credit card, cash, other)"""
     account = Account(**account_data.model_dump())
@@ -127,38 +153,36 @@ async def create_account(
     account_doc = account.model_dump()
     account_doc["created_at"] = account_doc["created_at"].isoformat()
     
-    await db.accounts.insert_one(account_doc)
+    await repos.accounts.insert(account_doc)
+    # Account names feed the search index and the pivot labels
+    invalidate_family(account_doc["family_id"])
+    await sync.record(repos, account_doc["family_id"], [("accounts", account_doc["id"], account_doc)])
     return account
 
 
 @api_router.get("/accounts", response_model=List[Account])
 async def get_accounts(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    encoding: str = Depends(list_encoding)
 ):
     """Get all accounts for current family (family accounts + user's personal accounts)"""
-    accounts = await db.accounts.find({
-        "family_id": current_user["family_id"],
-        "$or": [
-            {"owner_type": "family"},
-            {"owner_user_id": current_user["user_id"]}
-        ]
-    }, {"_id": 0}).to_list(1000)
-    
-    for acc in accounts:
-        if isinstance(acc.get('created_at'), str):
-            acc['created_at'] = datetime.fromisoformat(acc['created_at'])
-    return accounts
+    accounts = await repos.accounts.list_visible(current_user["family_id"], current_user["user_id"])
+    return rows_response(accounts, Account, encoding)
 
 
 @api_router.delete("/accounts/{account_id}")
 async def delete_account(
     account_id: str,
-    current_user: dict = Depends(get_admin_user)
+    current_user: dict = Depends(get_admin_user),
+    repos: Repositories = Depends(get_repositories)
 ):
     """Delete an account. Admin only."""
-    result = await db.accounts.delete_one({"id": account_id})
-    if result.deleted_count == 0:
+    deleted = await repos.accounts.delete(account_id)
+    if deleted == 0:
         raise HTTPException(status_code=404, detail="Account not found")
+    invalidate_family(current_user["family_id"])
+    await sync.record(repos, current_user["family_id"], [("accounts", account_id, None)])
     return {"message": "Account deleted successfully"}
 
 
@@ -166,78 +190,85 @@ async def delete_account(
 @api_router.post("/transactions", response_model=Transaction)
 async def create_transaction(
     transaction_data: TransactionCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    bus: EventBus = Depends(get_event_bus),
+    search_index: SearchIndex = Depends(get_search_index),
+    detector: AnomalyDetector = Depends(get_anomaly_detector),
+    balances: BalanceCoalescer = Depends(get_balance_coalescer),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    idempotency: IdempotencyStore = Depends(get_idempotency)
 ):
-    # Handle transfer and investment transactions (both move money between accounts)
-    if transaction_data.type == "transfer" or transaction_data.type == "investment":
-        if not transaction_data.account_id or not transaction_data.to_account_id:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"{transaction_data.type.capitalize()} requires both account_id (from) and to_account_id"
-            )
-        
-        # Update account balances
-        from_account = await db.accounts.find_one({"id": transaction_data.account_id})
-        to_account = await db.accounts.find_one({"id": transaction_data.to_account_id})
-        
-        if not from_account or not to_account:
-            raise HTTPException(status_code=404, detail="Account not found")
-        
-        # Deduct from source account
-        await db.accounts.update_one(
-            {"id": transaction_data.account_id},
-            {"$inc": {"current_balance": -transaction_data.amount}}
-        )
-        
-        # Add to destination account
-        await db.accounts.update_one(
-            {"id": transaction_data.to_account_id},
-            {"$inc": {"current_balance": transaction_data.amount}}
-        )
-    else:
-        # Verify category exists for income and expense transactions
-        if not transaction_data.category_id:
-            raise HTTPException(status_code=400, detail="Category required for this transaction type")
-        
-        category = await db.categories.find_one({"id": transaction_data.category_id})
-        if not category:
-            raise HTTPException(status_code=404, detail="Category not found")
-        
-        # Update account balance for income and expense transactions
-        if transaction_data.account_id:
-            account = await db.accounts.find_one({"id": transaction_data.account_id})
-            if not account:
-                raise HTTPException(status_code=404, detail="Account not found")
-            
-            # Income increases balance, expense decreases balance
-            balance_change = transaction_data.amount if transaction_data.type == "income" else -transaction_data.amount
-            await db.accounts.update_one(
-                {"id": transaction_data.account_id},
-                {"$inc": {"current_balance": balance_change}}
+    """Create a transaction. A retry with the same ``Idempotency-Key`` header replays the first response."""
+    if not idempotency_key:
+        return await post_transaction(transaction_data, current_user, repos, bus, search_index, detector, balances)
+
+    user_id = current_user["user_id"]
+    body_hash = fingerprint(transaction_data.model_dump_json())
+    claim = await idempotency.begin(repos, user_id, idempotency_key, body_hash)
+    if claim.replay is not None:
+        return claim.replay
+    try:
+        if claim.posted is not None:
+            # An earlier attempt got as far as the insert: run the steps it may not have reached
+            await balances.resume(repos, claim.posted)
+            await publish_transaction(claim.posted, repos, bus, search_index, detector)
+            result = Transaction(**claim.posted)
+        else:
+            result = await post_transaction(
+                transaction_data, current_user, repos, bus, search_index, detector, balances,
+                transaction_id=claim.transaction_id
             )
+    except Exception:
+        # Once the transaction is stored the key stays held: a retry taking it over finishes it
+        if await repos.transactions.get(claim.transaction_id) is None:
+            await idempotency.release(repos, user_id, idempotency_key)
+        raise
+    # Stored as the client receives it, i.e. shaped by the response model
+    body = Transaction.model_validate(jsonable_encoder(result)).model_dump(mode="json")
+    await idempotency.complete(repos, user_id, idempotency_key, body_hash, body)
+    if claim.posted is not None:
+        return idempotent_replay({"status_code": 200, "body": body})
+    return result
+
+
+async def post_transaction(
+    transaction_data: TransactionCreate, current_user: dict, repos: Repositories, bus: EventBus,
+    search_index: SearchIndex, detector: AnomalyDetector, balances: BalanceCoalescer,
+    transaction_id: Optional[str] = None
+):
+    # Transfers and investments name both accounts, income and expenses a category, all of this family
+    accounts, categories = await ledger.referenced(repos, transaction_data)
+    ledger.check_transaction(transaction_data, current_user["family_id"], accounts, categories)
     
-    # Check budget limit for expense categories
+    # Check budget limit for expense categories (on the primary: it must see the writes just made)
     budget_warning = None
+    budget_alert = None
     if transaction_data.type == "expense" and transaction_data.category_id:
-        category = await db.categories.find_one({"id": transaction_data.category_id})
+        category = await repos.categories.get(transaction_data.category_id)
         if category and category.get("budget_limit"):
             now = datetime.now()
-            month_transactions = await db.transactions.find({
-                "category_id": transaction_data.category_id,
-                "type": "expense"
-            }, {"_id": 0}).to_list(10000)
+            month_start, month_end = month_bounds(now.month, now.year)
+            month_transactions = await repos.transactions.list_by_category(
+                transaction_data.category_id, "expense", month_start, month_end
+            )
             
-            current_spent = 0
-            for trans in month_transactions:
-                trans_date = trans.get('date')
-                if isinstance(trans_date, str):
-                    trans_date = datetime.fromisoformat(trans_date)
-                if trans_date.month == now.month and trans_date.year == now.year:
-                    current_spent += trans['amount']
+            current_spent = sum(trans['amount'] for trans in month_transactions)
             
             new_total = current_spent + transaction_data.amount
             budget_limit = category["budget_limit"]
             
+            crossed = [level for level in BUDGET_ALERT_LEVELS
+                       if current_spent < level * budget_limit <= new_total]
+            if crossed:
+                budget_alert = {
+                    "category_id": category["id"],
+                    "category_name": category["name"],
+                    "level": crossed[-1],
+                    "spent": new_total,
+                    "budget_limit": budget_limit,
+                }
+            
             if new_total >= budget_limit:
                 budget_warning = {
                     "message": f"Budget limit reached! Spending ₹{new_total:.2f} of ₹{budget_limit:.2f} budget for {category['name']}",
@@ -248,11 +279,13 @@ async def create_transaction(
                 }
     
     transaction = Transaction(**transaction_data.model_dump())
+    if transaction_id:
+        transaction.id = transaction_id
     transaction.family_id = current_user["family_id"]
     transaction.user_id = current_user["user_id"]
     
     # Get user details for display
-    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    user = await repos.users.get(current_user["user_id"])
     if user:
         transaction.user_name = user.get("name")
         transaction.user_icon = user.get("profile_icon", "user-circle")
@@ -260,8 +293,14 @@ async def create_transaction(
     transaction_doc = transaction.model_dump()
     transaction_doc["date"] = transaction_doc["date"].isoformat()
     transaction_doc["created_at"] = transaction_doc["created_at"].isoformat()
+    # Update account balances: transfers and investments move money from account_id to to_account_id,
+    # income increases and expense decreases the balance. The change is journaled in the document and
+    # applied once it is stored, so a retry finding the transaction cannot apply it twice (see balances).
+    balances.journal(transaction_doc)
     
-    await db.transactions.insert_one(transaction_doc)
+    await repos.transactions.insert(transaction_doc)
+    await balances.post(repos, transaction_doc)
+    await publish_transaction(transaction_doc, repos, bus, search_index, detector, budget_alert)
     
     # Return transaction with budget warning if exists
     if budget_warning:
@@ -273,66 +312,100 @@ async def create_transaction(
     return transaction
 
 
+async def publish_transaction(
+    transaction_doc: dict, repos: Repositories, bus: EventBus, search_index: SearchIndex,
+    detector: AnomalyDetector, budget_alert: Optional[dict] = None
+) -> None:
+    """What follows the insert of a transaction: caches, search index, change log, anomalies and events."""
+    family_id = transaction_doc["family_id"]
+    version = invalidate_family(family_id)
+    search_index.record(family_id, version, doc=transaction_doc)
+    await sync.record(repos, family_id, [("transactions", transaction_doc["id"], transaction_doc)])
+    anomalies = detector.observe(repos, family_id, version, transaction_doc)
+    
+    topic = family_topic(family_id)
+    bus.publish(topic, "transaction.created", transaction_doc)
+    if budget_alert:
+        bus.publish(topic, "budget.threshold", budget_alert)
+    for anomaly in anomalies:
+        bus.publish(topic, "anomaly.detected", anomaly)
+
+
 @api_router.get("/transactions", response_model=List[Transaction])
 async def get_transactions(
     month: Optional[int] = None,
     year: Optional[int] = None,
     type: Optional[str] = None,
     user_id: Optional[str] = None,  # Filter by user (for "My Transactions" view)
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    encoding: str = Depends(list_encoding)
 ):
     """Get transactions for current family. Can filter by user_id for personal view."""
-    query = {"family_id": current_user["family_id"]}
-    
-    if type:
-        query["type"] = type
-    
-    if user_id:
-        query["user_id"] = user_id
-    
-    transactions = await db.transactions.find(query, {"_id": 0}).to_list(10000)
-    
-    # Convert ISO strings to datetime
-    for trans in transactions:
-        if isinstance(trans.get('date'), str):
-            trans['date'] = datetime.fromisoformat(trans['date'])
-        if isinstance(trans.get('created_at'), str):
-            trans['created_at'] = datetime.fromisoformat(trans['created_at'])
-    
-    # Filter by month/year if provided
-    if month or year:
-        filtered = []
-        for trans in transactions:
-            if month and trans['date'].month != month:
-                continue
-            if year and trans['date'].year != year:
-                continue
-            filtered.append(trans)
-        transactions = filtered
+    # Narrow to the year (or month) in the query; a bare month is filtered below
+    start = end = None
+    if year:
+        start, end = month_bounds(month, year) if month else (datetime(year, 1, 1), datetime(year + 1, 1, 1))
+    
+    transactions = await repos.transactions.list(
+        current_user["family_id"], user_id=user_id, type=type, start=start, end=end
+    )
+    
+    # A bare month (no year) matches that month in any year; dates are ISO strings
+    if month and not year:
+        transactions = [t for t in transactions if int(str(t['date'])[5:7]) == month]
     
     # Sort by date descending
-    transactions.sort(key=lambda x: x['date'], reverse=True)
+    transactions.sort(key=lambda x: str(x['date']), reverse=True)
     
-    return transactions
+    return rows_response(transactions, Transaction, encoding)
+
+
+@api_router.get("/transactions/search")
+async def search_transactions(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    search_index: SearchIndex = Depends(get_search_index)
+):
+    """Transactions whose description, category or account name match ``q``, best match first.
+
+    Pass the returned ``next_cursor`` as ``cursor`` for the next page.
+    """
+    result = await search_index.search(repos, current_user["family_id"], q, limit=limit, cursor=cursor)
+    rows = model_rows(result["results"], Transaction)
+    result["results"] = [{**row, "score": doc["score"]} for row, doc in zip(rows, result["results"])]
+    return ORJSONResponse(result)
 
 
 @api_router.put("/transactions/{transaction_id}", response_model=Transaction)
 async def update_transaction(
     transaction_id: str,
     transaction_data: TransactionCreate,
-    current_user: dict = Depends(get_admin_user)
+    current_user: dict = Depends(get_admin_user),
+    repos: Repositories = Depends(get_repositories),
+    bus: EventBus = Depends(get_event_bus),
+    search_index: SearchIndex = Depends(get_search_index),
+    detector: AnomalyDetector = Depends(get_anomaly_detector)
 ):
     """Update transaction. Admin only."""
-    existing = await db.transactions.find_one({"id": transaction_id})
+    existing = await repos.transactions.get(transaction_id)
     if not existing:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
     update_data = transaction_data.model_dump()
     update_data["date"] = update_data["date"].isoformat()
     
-    await db.transactions.update_one({"id": transaction_id}, {"$set": update_data})
+    await repos.transactions.update(transaction_id, update_data)
     
-    updated = await db.transactions.find_one({"id": transaction_id}, {"_id": 0})
+    updated = await repos.transactions.get(transaction_id)
+    version = invalidate_family(existing["family_id"])
+    search_index.record(existing["family_id"], version, doc=updated)
+    detector.record(existing["family_id"], version, [updated], removed=existing)
+    await sync.record(repos, existing["family_id"], [("transactions", transaction_id, updated)])
+    bus.publish(family_topic(existing["family_id"]), "transaction.updated", dict(updated))
     if isinstance(updated.get('date'), str):
         updated['date'] = datetime.fromisoformat(updated['date'])
     if isinstance(updated.get('created_at'), str):
@@ -344,21 +417,109 @@ async def update_transaction(
 @api_router.delete("/transactions/{transaction_id}")
 async def delete_transaction(
     transaction_id: str,
-    current_user: dict = Depends(get_admin_user)
+    current_user: dict = Depends(get_admin_user),
+    repos: Repositories = Depends(get_repositories),
+    bus: EventBus = Depends(get_event_bus),
+    search_index: SearchIndex = Depends(get_search_index),
+    detector: AnomalyDetector = Depends(get_anomaly_detector)
 ):
     """Delete transaction. Admin only."""
-    existing = await db.transactions.find_one({"id": transaction_id})
+    existing = await repos.transactions.get(transaction_id)
     if not existing:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    result = await db.transactions.delete_one({"id": transaction_id})
-    if result.deleted_count == 0:
+    deleted = await repos.transactions.delete(transaction_id)
+    if deleted == 0:
         raise HTTPException(status_code=404, detail="Transaction not found")
+    version = invalidate_family(existing["family_id"])
+    search_index.record(existing["family_id"], version, removed=transaction_id)
+    detector.record(existing["family_id"], version, removed=existing)
+    await sync.record(repos, existing["family_id"], [("transactions", transaction_id, None)])
+    bus.publish(family_topic(existing["family_id"]), "transaction.deleted", {"id": transaction_id})
     return {"message": "Transaction deleted successfully"}
 
 
+# ============= RECURRING TRANSACTION ENDPOINTS =============
+@api_router.post("/recurring", response_model=RecurringTransaction)
+async def create_recurring_transaction(
+    template_data: RecurringTransactionCreate,
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    """Create a template that the scheduler posts as a transaction on every occurrence of its schedule."""
+    try:
+        next_run = recurring.first_run(template_data.schedule, template_data.start_date, template_data.end_date)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    if template_data.type == "transfer" or template_data.type == "investment":
+        if not template_data.account_id or not template_data.to_account_id:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{template_data.type.capitalize()} requires both account_id (from) and to_account_id"
+            )
+        for account_id in (template_data.account_id, template_data.to_account_id):
+            if not await repos.accounts.get(account_id):
+                raise HTTPException(status_code=404, detail="Account not found")
+    else:
+        if not template_data.category_id:
+            raise HTTPException(status_code=400, detail="Category required for this transaction type")
+        if not await repos.categories.get(template_data.category_id):
+            raise HTTPException(status_code=404, detail="Category not found")
+        if template_data.account_id and not await repos.accounts.get(template_data.account_id):
+            raise HTTPException(status_code=404, detail="Account not found")
+
+    template = RecurringTransaction(**template_data.model_dump())
+    template.family_id = current_user["family_id"]
+    template.user_id = current_user["user_id"]
+    template.next_run = next_run
+    template.active = next_run is not None
+    user = await repos.users.get(current_user["user_id"])
+    if user:
+        template.user_name = user.get("name")
+        template.user_icon = user.get("profile_icon", "user-circle")
+
+    doc = template.model_dump()
+    for field in ("start_date", "end_date", "next_run", "created_at"):
+        if doc[field] is not None:
+            doc[field] = doc[field].isoformat()
+    await repos.recurring.insert(doc)
+    return template
+
+
+@api_router.get("/recurring", response_model=List[RecurringTransaction])
+async def get_recurring_transactions(
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    encoding: str = Depends(list_encoding)
+):
+    """Recurring transaction templates of the current family."""
+    templates = await repos.recurring.list_by_family(current_user["family_id"])
+    templates.sort(key=lambda t: str(t.get("created_at")))
+    return rows_response(templates, RecurringTransaction, encoding)
+
+
+@api_router.delete("/recurring/{template_id}")
+async def delete_recurring_transaction(
+    template_id: str,
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    """Stop a recurring transaction. Transactions already posted are kept."""
+    template = await repos.recurring.get(template_id)
+    if not template or template.get("family_id") != current_user["family_id"]:
+        raise HTTPException(status_code=404, detail="Recurring transaction not found")
+    if current_user.get("role") != "admin" and template.get("user_id") != current_user["user_id"]:
+        raise HTTPException(status_code=403, detail="Only the creator or an admin can delete this")
+    await repos.recurring.delete(template_id)
+    return {"message": "Recurring transaction deleted successfully"}
+
+
 # ============= DASHBOARD STATS =============
-async def get_previous_month_balance(month: int, year: int, family_id: str, user_id: Optional[str] = None):
+async def get_previous_month_balance(
+    repos: Repositories, engine: AnalyticsEngine, month: int, year: int,
+    family_id: str, user_id: Optional[str] = None
+):
     """Get the closing balance from previous month for a family or specific user"""
     prev_month = month - 1
     prev_year = year
@@ -367,41 +528,18 @@ async def get_previous_month_balance(month: int, year: int, family_id: str, user
         prev_year = year - 1
     
     # Check if balance exists
-    balance_query = {
-        "month": prev_month,
-        "year": prev_year,
-        "family_id": family_id
-    }
-    if user_id:
-        balance_query["user_id"] = user_id
-    
-    balance = await db.monthly_balances.find_one(balance_query)
+    balance = await repos.balances.get(family_id, prev_month, prev_year, user_id)
     
     if balance:
         return balance.get("closing_balance", 0), balance.get("loan_amount", 0)
     
     # Calculate if not exists
-    trans_query = {"family_id": family_id}
-    if user_id:
-        trans_query["user_id"] = user_id
-    
-    transactions = await db.transactions.find(trans_query, {"_id": 0}).to_list(10000)
-    prev_income = 0
-    prev_expense = 0
-    
-    for trans in transactions:
-        trans_date = trans.get('date')
-        if isinstance(trans_date, str):
-            trans_date = datetime.fromisoformat(trans_date)
-        if trans_date.month == prev_month and trans_date.year == prev_year:
-            if trans['type'] == 'income':
-                prev_income += trans['amount']
-            elif trans['type'] == 'expense':
-                prev_expense += trans['amount']
-            # Investment and transfer don't affect closing balance calculation
+    start, end = month_bounds(prev_month, prev_year)
+    frame = await engine.frame(repos, family_id, start, end)
+    sums = analytics.totals(frame, frame.mask(user_id=user_id))
     
     # closing_balance = income - expense (investment is just moving money between accounts)
-    prev_closing_balance = prev_income - prev_expense
+    prev_closing_balance = sums["income"] - sums["expense"]
     prev_loan = abs(prev_closing_balance) if prev_closing_balance < 0 else 0
     
     return prev_closing_balance if prev_closing_balance > 0 else 0, prev_loan
@@ -412,7 +550,9 @@ async def get_dashboard_stats(
     month: Optional[int] = None,
     year: Optional[int] = None,
     user_id: Optional[str] = None,  # Filter by specific user for "My Transactions" view
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(dashboard_reads),
+    engine: AnalyticsEngine = Depends(get_analytics)
 ):
     """Get dashboard stats. Can filter by user_id for personal view."""
     if not month:
@@ -422,30 +562,19 @@ async def get_dashboard_stats(
     
     # Get opening balance from previous month
     opening_balance, inherited_loan = await get_previous_month_balance(
-        month, year, current_user["family_id"], user_id
+        repos, engine, month, year, current_user["family_id"], user_id
     )
     
-    # Get all transactions for this family
-    query = {"family_id": current_user["family_id"]}
-    if user_id:
-        query["user_id"] = user_id
-    
-    transactions = await db.transactions.find(query, {"_id": 0}).to_list(10000)
-    
-    # Convert dates and filter
-    filtered = []
-    for trans in transactions:
-        if isinstance(trans.get('date'), str):
-            trans['date'] = datetime.fromisoformat(trans['date'])
-        if trans['date'].month == month and trans['date'].year == year:
-            filtered.append(trans)
-    
-    transactions = filtered
+    # Get this month's transactions for this family
+    start, end = month_bounds(month, year)
+    frame = await engine.frame(repos, current_user["family_id"], start, end)
+    selected = frame.mask(user_id=user_id)
     
     # Calculate stats
-    total_income = sum(t['amount'] for t in transactions if t['type'] == 'income')
-    total_expense = sum(t['amount'] for t in transactions if t['type'] == 'expense')
-    total_investment = sum(t['amount'] for t in transactions if t['type'] == 'investment')
+    sums = analytics.totals(frame, selected)
+    total_income = sums["income"]
+    total_expense = sums["expense"]
+    total_investment = sums["investment"]
     
     # Add opening balance to income
     total_income_with_carryover = total_income + opening_balance
@@ -455,52 +584,26 @@ async def get_dashboard_stats(
     closing_balance = net_closing_balance if net_closing_balance > 0 else 0
     loan_amount = inherited_loan + abs(net_closing_balance) if net_closing_balance < 0 else inherited_loan
     
-    # Group by category
-    income_by_category = defaultdict(float)
-    expense_by_category = defaultdict(float)
-    investment_by_category = defaultdict(float)
-    
-    # Get all categories for names
-    categories = await db.categories.find({}, {"_id": 0}).to_list(1000)
-    category_map = {cat['id']: cat['name'] for cat in categories}
-    
-    for trans in transactions:
-        if trans.get('category_id'):  # Skip transfers
-            category_name = category_map.get(trans['category_id'], 'Unknown')
-            if trans['type'] == 'income':
-                income_by_category[category_name] += trans['amount']
-            elif trans['type'] == 'expense':
-                expense_by_category[category_name] += trans['amount']
-            elif trans['type'] == 'investment':
-                investment_by_category[category_name] += trans['amount']
+    # Group by category (transfers have none and are skipped)
+    breakdown = analytics.by_category(frame, selected)
+    income_by_category = breakdown["income"]
+    expense_by_category = breakdown["expense"]
+    investment_by_category = breakdown["investment"]
     
     # Add carryover as income category
     if opening_balance > 0:
         income_by_category['Previous Month Balance'] = opening_balance
     
     # Save/update monthly balance
-    balance_query = {
-        "month": month,
-        "year": year,
-        "family_id": current_user["family_id"]
-    }
-    if user_id:
-        balance_query["user_id"] = user_id
-    
-    await db.monthly_balances.update_one(
-        balance_query,
+    await repos.balances.upsert(
+        current_user["family_id"], month, year, user_id,
         {
-            "$set": {
-                "opening_balance": opening_balance,
-                "closing_balance": closing_balance,
-                "has_loan": loan_amount > 0,
-                "loan_amount": loan_amount,
-                "family_id": current_user["family_id"],
-                "user_id": user_id,
-                "created_at": datetime.utcnow().isoformat()
-            }
-        },
-        upsert=True
+            "opening_balance": opening_balance,
+            "closing_balance": closing_balance,
+            "has_loan": loan_amount > 0,
+            "loan_amount": loan_amount,
+            "created_at": datetime.utcnow().isoformat()
+        }
     )
     
     return {
@@ -517,48 +620,104 @@ async def get_dashboard_stats(
         "income_by_category": dict(income_by_category),
         "expense_by_category": dict(expense_by_category),
         "investment_by_category": dict(investment_by_category),
-        "transaction_count": len(transactions)
+        "transaction_count": analytics.count(frame, selected)
     }
 
 
 @api_router.get("/dashboard/monthly-trend")
 async def get_monthly_trend(
     year: Optional[int] = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(dashboard_reads),
+    engine: AnalyticsEngine = Depends(get_analytics)
 ):
     if not year:
         year = datetime.now().year
     
-    transactions = await db.transactions.find(
-        {"family_id": current_user["family_id"]},
-        {"_id": 0}
-    ).to_list(10000)
-    
-    # Convert dates
-    for trans in transactions:
-        if isinstance(trans.get('date'), str):
-            trans['date'] = datetime.fromisoformat(trans['date'])
-    
-    # Filter by year
-    transactions = [t for t in transactions if t['date'].year == year]
-    
-    # Group by month
-    monthly_data = {}
-    for month in range(1, 13):
-        month_trans = [t for t in transactions if t['date'].month == month]
-        income = sum(t['amount'] for t in month_trans if t['type'] == 'income')
-        expense = sum(t['amount'] for t in month_trans if t['type'] == 'expense')
-        investment = sum(t['amount'] for t in month_trans if t['type'] == 'investment')
-        
-        monthly_data[month] = {
+    frame = await engine.frame(
+        repos, current_user["family_id"], datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    )
+    series = analytics.monthly(frame)
+    income, expense, investment = (
+        analytics.TYPE_CODES[name] for name in ("income", "expense", "investment")
+    )
+    
+    return [
+        {
             "month": month,
-            "income": income,
-            "expense": expense,
-            "investment": investment,
-            "closing_balance": income - expense  # Investment doesn't reduce closing balance
+            "income": float(row[income]),
+            "expense": float(row[expense]),
+            "investment": float(row[investment]),
+            "closing_balance": float(row[income] - row[expense])  # Investment doesn't reduce closing balance
         }
-    
-    return list(monthly_data.values())
+        for month, row in enumerate(series, start=1)
+    ]
+
+
+@api_router.get("/dashboard/forecast")
+async def get_forecast(
+    months: int = Query(6, ge=1, le=MAX_HORIZON),
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(dashboard_reads),
+    forecaster: Forecaster = Depends(get_forecaster)
+):
+    """Projected income, expense, investment and closing balance for the coming months."""
+    model = await forecaster.model(repos, current_user["family_id"])
+    first_year, first_month = forecast.from_month_index(model.history[0])
+    last_year, last_month = forecast.from_month_index(model.history[1])
+    return {
+        "months": months,
+        "history_start": f"{first_year}-{first_month:02d}",
+        "history_end": f"{last_year}-{last_month:02d}",
+        "forecast": model.months(months)
+    }
+
+
+@api_router.get("/dashboard/calendar")
+async def get_calendar(
+    year: Optional[int] = Query(None, ge=1970, le=9998),
+    user_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(dashboard_reads),
+    heatmap: CalendarHeatmap = Depends(get_calendar_heatmap)
+):
+    """Daily income and expense totals for every day of ``year`` (the current one by default)."""
+    body = await heatmap.get(repos, current_user["family_id"], year or datetime.now().year, user_id)
+    return {"user_id": user_id, **body}
+
+
+@api_router.get("/dashboard/anomalies")
+async def get_anomalies(
+    limit: int = Query(50, ge=1, le=100),
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(dashboard_reads),
+    detector: AnomalyDetector = Depends(get_anomaly_detector)
+):
+    """Recent unusual expenses, newest first, and the running statistics behind them per category."""
+    state = await detector.family(repos, current_user["family_id"])
+    names = {c["id"]: c["name"] for c in await repos.categories.list_by_family(current_user["family_id"])}
+    anomalies = [
+        {**anomaly, "category_name": names.get(anomaly["category_id"], analytics.UNKNOWN_CATEGORY)}
+        for anomaly in list(state.recent)[::-1][:limit]
+    ]
+    categories = [
+        {"category_id": category_id, "category_name": names.get(category_id, analytics.UNKNOWN_CATEGORY),
+         **stats.summary(detector.sigma)}
+        for category_id, stats in state.categories.items()
+    ]
+    return {"sigma": detector.sigma, "anomalies": anomalies, "categories": categories}
+
+
+# ============= ANALYTICS QUERY =============
+@api_router.post("/analytics/query")
+async def query_analytics(
+    query: PivotQuery,
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(dashboard_reads),
+    pivots: PivotEngine = Depends(get_pivot_engine)
+):
+    """Sum, count or average of amounts grouped by any pivot dimensions, e.g. category x month."""
+    return await pivots.run(repos, current_user["family_id"], query)
 
 
 # ============= BUDGET ENDPOINTS =============
@@ -566,7 +725,8 @@ async def get_monthly_trend(
 async def get_budget_status(
     month: Optional[int] = None,
     year: Optional[int] = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(budget_reads)
 ):
     """Get budget status. Only shows shared categories (managed by admin)."""
     if not month:
@@ -575,29 +735,15 @@ async def get_budget_status(
         year = datetime.now().year
     
     # Get all expense categories with budget limits for this family
-    categories = await db.categories.find({
-        "family_id": current_user["family_id"],
-        "type": "expense",
-        "budget_limit": {"$exists": True, "$ne": None}
-    }, {"_id": 0}).to_list(1000)
+    categories = await repos.categories.list_with_limit(current_user["family_id"], "expense", "budget_limit")
+    start, end = month_bounds(month, year)
     
     budget_statuses = []
     
     for category in categories:
         # Get transactions for this category in the specified month
-        transactions = await db.transactions.find({
-            "category_id": category["id"],
-            "type": "expense"
-        }, {"_id": 0}).to_list(10000)
-        
-        # Filter by month/year and calculate spent
-        spent = 0
-        for trans in transactions:
-            trans_date = trans.get('date')
-            if isinstance(trans_date, str):
-                trans_date = datetime.fromisoformat(trans_date)
-            if trans_date.month == month and trans_date.year == year:
-                spent += trans['amount']
+        transactions = await repos.transactions.list_by_category(category["id"], "expense", start, end)
+        spent = sum(trans['amount'] for trans in transactions)
         
         budget_limit = category.get("budget_limit", 0)
         remaining = budget_limit - spent
@@ -628,7 +774,8 @@ async def get_budget_status(
 async def get_investment_targets(
     month: Optional[int] = None,
     year: Optional[int] = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(dashboard_reads)
 ):
     """Get investment target status for all investment categories."""
     if not month:
@@ -637,29 +784,17 @@ async def get_investment_targets(
         year = datetime.now().year
     
     # Get all investment categories with targets for this family
-    categories = await db.categories.find({
-        "family_id": current_user["family_id"],
-        "type": "investment",
-        "investment_target": {"$exists": True, "$ne": None}
-    }, {"_id": 0}).to_list(1000)
+    categories = await repos.categories.list_with_limit(
+        current_user["family_id"], "investment", "investment_target"
+    )
+    start, end = month_bounds(month, year)
     
     target_statuses = []
     
     for category in categories:
         # Get transactions for this category in the specified month
-        transactions = await db.transactions.find({
-            "category_id": category["id"],
-            "type": "investment"
-        }, {"_id": 0}).to_list(10000)
-        
-        # Filter by month/year and calculate invested amount
-        invested = 0
-        for trans in transactions:
-            trans_date = trans.get('date')
-            if isinstance(trans_date, str):
-                trans_date = datetime.fromisoformat(trans_date)
-            if trans_date.month == month and trans_date.year == year:
-                invested += trans['amount']
+        transactions = await repos.transactions.list_by_category(category["id"], "investment", start, end)
+        invested = sum(trans['amount'] for trans in transactions)
         
         investment_target = category.get("investment_target", 0)
         remaining = investment_target - invested
@@ -687,20 +822,11 @@ async def get_investment_targets(
 
 
 # ============= PERIOD COMPARISON ENDPOINTS =============
-@api_router.get("/dashboard/period-stats")
-async def get_period_stats(
-    period_type: str = "monthly",  # monthly, quarterly, half-yearly, annual, custom
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    month: Optional[int] = None,
-    year: Optional[int] = None,
-    quarter: Optional[int] = None,
-    half: Optional[int] = None,
-    user_id: Optional[str] = None,  # Filter by user
-    current_user: dict = Depends(get_current_user)
+def period_bounds(
+    period_type: str, start_date: Optional[str], end_date: Optional[str], month: Optional[int],
+    year: Optional[int], quarter: Optional[int], half: Optional[int]
 ):
-    """Get statistics for different time periods. Can filter by user."""
-    
+    """Start (inclusive) and end (exclusive) of a period-stats style period."""
     if period_type == "custom" and start_date and end_date:
         start = datetime.fromisoformat(start_date)
         end = datetime.fromisoformat(end_date)
@@ -741,45 +867,43 @@ async def get_period_stats(
         end = datetime(year + 1, 1, 1)
     else:
         raise HTTPException(status_code=400, detail="Invalid period type")
+    return start, end
+
+
+@api_router.get("/dashboard/period-stats")
+async def get_period_stats(
+    period_type: str = "monthly",  # monthly, quarterly, half-yearly, annual, custom
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    quarter: Optional[int] = None,
+    half: Optional[int] = None,
+    user_id: Optional[str] = None,  # Filter by user
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(dashboard_reads),
+    engine: AnalyticsEngine = Depends(get_analytics)
+):
+    """Get statistics for different time periods. Can filter by user."""
     
-    # Get transactions in range
-    trans_query = {"family_id": current_user["family_id"]}
-    if user_id:
-        trans_query["user_id"] = user_id
-    
-    transactions = await db.transactions.find(trans_query, {"_id": 0}).to_list(10000)
+    start, end = period_bounds(period_type, start_date, end_date, month, year, quarter, half)
     
-    filtered = []
-    for trans in transactions:
-        trans_date = trans.get('date')
-        if isinstance(trans_date, str):
-            trans_date = datetime.fromisoformat(trans_date)
-        if start <= trans_date < end:
-            filtered.append(trans)
+    # Get transactions in range
+    frame = await engine.frame(repos, current_user["family_id"], start, end)
+    selected = frame.mask(user_id=user_id)
     
     # Calculate stats
-    total_income = sum(t['amount'] for t in filtered if t['type'] == 'income')
-    total_expense = sum(t['amount'] for t in filtered if t['type'] == 'expense')
-    total_investment = sum(t['amount'] for t in filtered if t['type'] == 'investment')
+    sums = analytics.totals(frame, selected)
+    total_income = sums["income"]
+    total_expense = sums["expense"]
+    total_investment = sums["investment"]
     net_closing_balance = total_income - total_expense  # Investment doesn't reduce closing balance
     
-    # Group by category
-    income_by_category = defaultdict(float)
-    expense_by_category = defaultdict(float)
-    investment_by_category = defaultdict(float)
-    
-    categories = await db.categories.find({}, {"_id": 0}).to_list(1000)
-    category_map = {cat['id']: cat['name'] for cat in categories}
-    
-    for trans in filtered:
-        if trans.get('category_id'):  # Skip transfers
-            category_name = category_map.get(trans['category_id'], 'Unknown')
-            if trans['type'] == 'income':
-                income_by_category[category_name] += trans['amount']
-            elif trans['type'] == 'expense':
-                expense_by_category[category_name] += trans['amount']
-            elif trans['type'] == 'investment':
-                investment_by_category[category_name] += trans['amount']
+    # Group by category (transfers have none and are skipped)
+    breakdown = analytics.by_category(frame, selected)
+    income_by_category = breakdown["income"]
+    expense_by_category = breakdown["expense"]
+    investment_by_category = breakdown["investment"]
     
     return {
         "period_type": period_type,
@@ -792,21 +916,37 @@ async def get_period_stats(
         "income_by_category": dict(income_by_category),
         "expense_by_category": dict(expense_by_category),
         "investment_by_category": dict(investment_by_category),
-        "transaction_count": len(filtered)
+        "transaction_count": analytics.count(frame, selected)
     }
 
 
-# Include router
-app.include_router(api_router)
+@api_router.get("/dashboard/distribution")
+async def get_distribution(
+    period_type: str = "monthly",  # same periods as /dashboard/period-stats
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    quarter: Optional[int] = None,
+    half: Optional[int] = None,
+    type: Literal["income", "expense", "investment"] = "expense",
+    user_id: Optional[str] = None,
+    bins: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(dashboard_reads),
+    distributions: Distributions = Depends(get_distributions)
+):
+    """Per-category percentiles and histograms of amounts, and day-of-week / hour-of-day profiles."""
+    start, end = period_bounds(period_type, start_date, end_date, month, year, quarter, half)
+    body = await distributions.get(repos, current_user["family_id"], start, end, type, user_id, bins)
+    return {"period_type": period_type, "start_date": start.isoformat(), "end_date": end.isoformat(), **body}
+
+
+# ============= METRICS =============
+async def metrics_endpoint():
+    """Prometheus scrape target."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
 # Logging
 logging.basicConfig(
@@ -815,6 +955,123 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the repositories and the runtime monitors for the app's lifetime."""
+    monitor = metrics.EventLoopMonitor()
+    monitor.start()
+    try:
+        async with repositories_lifespan(app):
+            slow_queries = app.state.slow_queries = SlowQueryLog.from_env()
+            slow_queries.start(app.state.repositories)
+            invalidation = app.state.invalidation = InvalidationBus.from_env()
+            invalidation.start(app.state.repositories)
+            app.state.read_routing.start()
+            app.state.balances.start(app.state.repositories)
+            scheduler = app.state.recurring = RecurringScheduler.from_env()
+            scheduler.start(app.state.repositories, app.state.events, app.state.anomalies)
+            compactor = app.state.change_log_compactor = ChangeLogCompactor.from_env()
+            compactor.start(app.state.repositories)
+            app.state.jobs.start(app.state.repositories, app.state.events)
+            try:
+                yield
+            finally:
+                await app.state.jobs.stop()
+                await compactor.stop()
+                await scheduler.stop()
+                await app.state.balances.stop()
+                app.state.read_routing.stop()
+                await invalidation.stop()
+                await slow_queries.stop()
+    finally:
+        await monitor.stop()
+
+
+@asynccontextmanager
+async def repositories_lifespan(app: FastAPI):
+    """Set up the repositories on startup and release them on shutdown.
+
+    An app created with explicit repositories uses them as-is; otherwise
+    REPOSITORY_BACKEND selects MongoDB (default) or the in-memory backend.
+    """
+    if app.state.repositories is not None:
+        yield
+        return
+
+    if os.environ.get("REPOSITORY_BACKEND", "mongo") == "memory":
+        logger.info("Using in-memory repositories")
+        app.state.repositories = InMemoryRepositories()
+        try:
+            yield
+        finally:
+            app.state.repositories = None
+        return
+
+    settings = app.state.mongo_settings or MongoSettings.from_env()
+    repositories = MotorRepositories(database.connect(settings))
+    if settings.ensure_indexes:
+        await repositories.ensure_indexes()
+    app.state.repositories = repositories
+    logger.info(
+        "Connected to MongoDB database %s (maxPoolSize=%s)",
+        settings.db_name, settings.max_pool_size
+    )
+    try:
+        yield
+    finally:
+        app.state.repositories = None
+        database.close()
+        logger.info("MongoDB client closed")
+
+
+def create_app(
+    mongo_settings: Optional[MongoSettings] = None,
+    repositories: Optional[Repositories] = None
+) -> FastAPI:
+    """Build the FastAPI application. Settings default to the environment."""
+    database.load_env()
+    app = FastAPI(title="Spend Tracker", lifespan=lifespan)
+    app.state.mongo_settings = mongo_settings
+    app.state.repositories = repositories
+    app.state.events = EventBus()
+    app.state.analytics = AnalyticsEngine()
+    app.state.forecaster = Forecaster(app.state.analytics)
+    app.state.distributions = Distributions(app.state.analytics)
+    app.state.calendar_heatmap = CalendarHeatmap()
+    app.state.pivots = PivotEngine()
+    app.state.search = SearchIndex()
+    app.state.anomalies = AnomalyDetector.from_env()
+    app.state.jobs = JobWorkers.from_env()
+    app.state.read_routing = ReadRouting.from_env()
+    app.state.idempotency = IdempotencyStore.from_env()
+    app.state.balances = BalanceCoalescer.from_env()
+    app.state.change_feed = ChangeFeed.from_env()
+
+    app.include_router(auth_router)
+    app.include_router(api_router)
+    app.include_router(events_router)
+    app.include_router(sync_router)
+    app.include_router(jobs_router)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+    app.add_middleware(profiling.ProfilingMiddleware)
+    gzip_level = int(os.environ.get("GZIP_LEVEL", 6))
+    if gzip_level > 0:
+        app.add_middleware(
+            StreamingAwareGZipMiddleware,
+            minimum_size=int(os.environ.get("GZIP_MINIMUM_SIZE", 1000)),
+            compresslevel=gzip_level,
+        )
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    return app
+
+
+app = create_app()
@@ -0,0 +1,162 @@
+"""Slow-query log with explain plans.
+
+Subscribes to the database command stream (see :mod:`monitoring`) and logs
+every ``find`` or ``aggregate`` slower than ``SLOW_QUERY_MS`` together with
+its filter, the route that issued it, and a summary of the query plan:
+winning stages (``COLLSCAN`` is what we are hunting), documents and keys
+examined versus documents returned.
+
+The plan is fetched with ``explain`` on the event loop after the command
+has finished, never on the request path. Each query shape is explained at
+most once per ``SLOW_QUERY_EXPLAIN_COOLDOWN`` seconds; in between, slow
+queries are logged without a plan. ``explain`` commands are not in the
+watched set, so explaining cannot trigger itself.
+"""
+from collections import deque
+from typing import Deque, Dict, Optional, Set
+import asyncio
+import logging
+import os
+import time
+
+from monitoring import CommandEvent, current_route, subscribe, unsubscribe
+
+logger = logging.getLogger("slow_queries")
+
+WATCHED_COMMANDS = frozenset({"find", "aggregate"})
+
+
+def query_shape(value):
+    """``value`` with literals replaced by ``1``, so queries differing only in ids share a shape."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [query_shape(item) for item in value]
+    return 1
+
+
+def _find_key(node, key):
+    if isinstance(node, dict):
+        if key in node:
+            return node[key]
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+    for child in children:
+        found = _find_key(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def summarize_plan(explain: Optional[dict]) -> Optional[dict]:
+    """Winning stages and execution counters from an explain document."""
+    if not explain:
+        return None
+    stages = []
+    node = _find_key(_find_key(explain, "queryPlanner"), "winningPlan")
+    while isinstance(node, dict):
+        stage = node.get("stage", "?")
+        if node.get("indexName"):
+            stage += f" {node['indexName']}"
+        stages.append(stage)
+        node = node.get("inputStage") or (node.get("inputStages") or [None])[0]
+    stats = _find_key(explain, "executionStats") or {}
+    return {
+        "plan": " <- ".join(stages) or None,
+        "collscan": "COLLSCAN" in (s.split(" ")[0] for s in stages),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "n_returned": stats.get("nReturned"),
+    }
+
+
+class SlowQueryLog:
+    """Command subscriber that logs slow reads; see the module docstring."""
+
+    def __init__(self, threshold_ms: float = 100.0, explain: bool = True,
+                 explain_cooldown: float = 60.0, history: int = 100):
+        self.threshold = threshold_ms / 1000.0
+        self.explain = explain
+        self.explain_cooldown = explain_cooldown
+        self.recent: Deque[dict] = deque(maxlen=history)
+        self.repositories = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._explained_at: Dict[str, float] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls, env=None) -> "SlowQueryLog":
+        env = os.environ if env is None else env
+        return cls(
+            threshold_ms=float(env.get("SLOW_QUERY_MS", 100)),
+            explain=env.get("SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes"),
+            explain_cooldown=float(env.get("SLOW_QUERY_EXPLAIN_COOLDOWN", 60)),
+        )
+
+    def start(self, repositories) -> None:
+        self.repositories = repositories
+        self._loop = asyncio.get_running_loop()
+        subscribe(self)
+
+    async def stop(self) -> None:
+        unsubscribe(self)
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._loop = None
+
+    def __call__(self, event: CommandEvent) -> None:
+        # May run on a driver thread; only touch the loop through call_soon_threadsafe
+        if event.command not in WATCHED_COMMANDS or event.duration < self.threshold:
+            return
+        entry = {
+            "collection": event.collection,
+            "command": event.command,
+            "duration_ms": round(event.duration * 1000, 3),
+            "route": current_route.get(),
+            "filter": event.filter,
+            "n_returned": event.n_returned,
+            "plan": None,
+        }
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            self._log(entry)
+            return
+        try:
+            loop.call_soon_threadsafe(self._schedule, event, entry)
+        except RuntimeError:  # loop closed between the check and the call
+            self._log(entry)
+
+    def _schedule(self, event: CommandEvent, entry: dict) -> None:
+        shape = repr((event.collection, event.command, query_shape(event.filter)))
+        now = time.monotonic()
+        if not self.explain or now - self._explained_at.get(shape, float("-inf")) < self.explain_cooldown:
+            self._log(entry)
+            return
+        self._explained_at[shape] = now
+        task = asyncio.ensure_future(self._explain(event, entry))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, event: CommandEvent, entry: dict) -> None:
+        try:
+            explain = await self.repositories.explain(event.collection, event.command, event.filter)
+            entry["plan"] = summarize_plan(explain)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # explain is best effort; never lose the log line
+            entry["plan"] = {"error": str(exc)}
+        self._log(entry)
+
+    def _log(self, entry: dict) -> None:
+        self.recent.append(entry)
+        plan = entry["plan"] or {}
+        logger.warning(
+            "Slow %s on %s took %.1f ms (route=%s, returned=%s, examined=%s, plan=%s) filter=%s",
+            entry["command"], entry["collection"], entry["duration_ms"], entry["route"],
+            entry["n_returned"], plan.get("docs_examined"), plan.get("plan") or plan.get("error"),
+            entry["filter"],
+        )
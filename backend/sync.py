@@ -0,0 +1,196 @@
+"""Delta sync of a family's categories, accounts and transactions.
+
+Write endpoints log every change through :func:`record` into the family's
+change log (see :class:`repositories.base.ChangeRepository`), which keeps
+only the latest change per document, numbered from a per-family sequence.
+Deletions leave tombstones. ``GET /api/sync?since=<seq>`` returns what
+changed after ``seq`` plus the sequence number to send next time; after a
+single edit that is one small document rather than the whole dataset.
+
+The sequence numbers are taken before the entries are written, so a number
+missing from the log may belong to a write still in flight; the returned
+``seq`` never moves past such a gap (see :func:`cursor`), and changes after
+it are sent again on the next sync.
+
+``since=0``, or a ``since`` older than the log's horizon, gets a full
+snapshot with ``reset: true``. The horizon moves when
+:class:`ChangeLogCompactor` drops tombstones older than
+``SYNC_TOMBSTONE_DAYS``, which keeps the log at one entry per live
+document plus recent deletions.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+import os
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import ORJSONResponse
+
+from auth import get_current_user
+from models import Account, Category, Transaction
+from repositories import Repositories, get_repositories
+from responses import model_rows
+
+logger = logging.getLogger(__name__)
+
+MODELS = {"categories": Category, "accounts": Account, "transactions": Transaction}
+PAGE_SIZE = 1000
+SETTLE_SECONDS = 5.0
+
+Change = Tuple[str, str, Optional[dict]]  # (collection, doc id, doc or None when deleted)
+
+
+async def record(repos: Repositories, family_id: Optional[str], changes: Iterable[Change]) -> None:
+    changes = list(changes)
+    if family_id and changes:
+        await repos.changes.record(family_id, changes)
+
+
+async def account_changes(repos: Repositories, family_id: str,
+                          account_ids: Iterable[Optional[str]]) -> List[Change]:
+    """Current snapshots of ``family_id``'s accounts whose balance a write just moved, in one read."""
+    account_ids = list(dict.fromkeys(filter(None, account_ids)))
+    if not account_ids:
+        return []
+    return [("accounts", account["id"], account)
+            for account in await repos.accounts.list_by_ids(family_id, account_ids)]
+
+
+def cursor(changes: List[dict], since: int, now: Optional[datetime] = None,
+           settle_seconds: float = SETTLE_SECONDS) -> int:
+    """The sequence number a client can resume from after receiving ``changes`` (read after ``since``).
+
+    A gap in the numbers is either an entry since moved forward or one still
+    being written. A gap followed by an entry logged within the last
+    ``settle_seconds`` may be the latter, so the cursor stops before it.
+    """
+    settled = (now or datetime.utcnow()) - timedelta(seconds=settle_seconds)
+    position = since
+    for change in changes:
+        if change["seq"] != position + 1 and datetime.fromisoformat(change["at"]) > settled:
+            break
+        position = change["seq"]
+    return position
+
+
+def visible(collection: str, doc: dict, user_id: str) -> bool:
+    """The visibility rules of the list endpoints: other members' personal categories and accounts are hidden."""
+    if collection == "categories":
+        return doc.get("is_shared", True) or doc.get("created_by_user_id") == user_id
+    if collection == "accounts":
+        return doc.get("owner_type") == "family" or doc.get("owner_user_id") == user_id
+    return True
+
+
+class ChangeFeed:
+    """How ``GET /api/sync`` pages the change log; ``SYNC_SETTLE_SECONDS`` is how long a gap may be in flight."""
+
+    def __init__(self, settle_seconds: float = SETTLE_SECONDS):
+        self.settle_seconds = settle_seconds
+
+    @classmethod
+    def from_env(cls, env=None) -> "ChangeFeed":
+        env = os.environ if env is None else env
+        return cls(settle_seconds=float(env.get("SYNC_SETTLE_SECONDS", SETTLE_SECONDS)))
+
+    def cursor(self, changes: List[dict], since: int, now: Optional[datetime] = None) -> int:
+        return cursor(changes, since, now, self.settle_seconds)
+
+
+def get_change_feed(request: Request) -> ChangeFeed:
+    return request.app.state.change_feed
+
+
+class ChangeLogCompactor:
+    """Background task dropping old tombstones every ``SYNC_COMPACT_INTERVAL_SECONDS``."""
+
+    def __init__(self, interval: float = 3600.0, retention: timedelta = timedelta(days=30)):
+        self.interval = interval
+        self.retention = retention
+        self.repositories = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, env=None) -> "ChangeLogCompactor":
+        env = os.environ if env is None else env
+        return cls(
+            interval=float(env.get("SYNC_COMPACT_INTERVAL_SECONDS", 3600)),
+            retention=timedelta(days=float(env.get("SYNC_TOMBSTONE_DAYS", 30))),
+        )
+
+    def start(self, repositories) -> None:
+        self.repositories = repositories
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change log compaction failed")
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        dropped = await self.repositories.changes.compact((now or datetime.utcnow()) - self.retention)
+        if dropped:
+            logger.info("Compacted %d tombstones from the change log", dropped)
+        return dropped
+
+
+router = APIRouter(prefix="/api/sync", tags=["sync"])
+
+
+@router.get("")
+async def sync_changes(
+    since: int = Query(0, ge=0, description="Sequence number returned by the previous sync"),
+    current_user: dict = Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    feed: ChangeFeed = Depends(get_change_feed)
+):
+    """Categories, accounts and transactions changed after ``since``.
+
+    Each collection comes back as ``{"upserted": [...], "deleted": [ids]}``.
+    With ``has_more`` set, call again with the returned ``seq`` straight away.
+    """
+    family_id, user_id = current_user["family_id"], current_user["user_id"]
+    state = await repos.changes.state(family_id)
+    body: Dict[str, object] = {"seq": state["seq"], "reset": False, "has_more": False}
+
+    if since == 0 or since < state["horizon"] or since > state["seq"]:
+        # Full snapshot; anything written while it is read is sent again next time
+        body["reset"] = True
+        snapshot = {
+            "categories": await repos.categories.list_visible(family_id, user_id),
+            "accounts": await repos.accounts.list_visible(family_id, user_id),
+            "transactions": await repos.transactions.list(family_id),
+        }
+        for collection, docs in snapshot.items():
+            body[collection] = {"upserted": model_rows(docs, MODELS[collection]), "deleted": []}
+        return ORJSONResponse(body)
+
+    changes = await repos.changes.since(family_id, since, limit=PAGE_SIZE)
+    body["seq"] = feed.cursor(changes, since)
+    body["has_more"] = len(changes) == PAGE_SIZE and body["seq"] > since
+    grouped: Dict[str, Tuple[List[dict], List[str]]] = {name: ([], []) for name in MODELS}
+    for change in changes:
+        upserted, deleted = grouped[change["collection"]]
+        if change["deleted"]:
+            deleted.append(change["doc_id"])
+        elif visible(change["collection"], change["doc"], user_id):
+            upserted.append(change["doc"])
+    for collection, (upserted, deleted) in grouped.items():
+        body[collection] = {"upserted": model_rows(upserted, MODELS[collection]), "deleted": deleted}
+    return ORJSONResponse(body)
@@ -4,13 +4,14 @@ Comprehensive Backend Test Suite for Spend Tracker Investment and Account Featur
 Tests all new Investment and Account features as per the review request.
 """
 
+import os
 import requests
 import json
 from datetime import datetime
 import uuid
 
-# Base URL from environment
-BASE_URL = "https://cashflow-radar.preview.emergentagent.com/api"
+# Base URL from environment; defaults to a locally started server
+BASE_URL = os.environ.get("BASE_URL", "http://localhost:8001/api")
 
 class SpendTrackerTester:
     def __init__(self):
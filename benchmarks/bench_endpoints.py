@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Endpoint benchmark suite.
+
+Generates a synthetic dataset (see datagen.py) for each requested size,
+then drives every /api endpoint in-process through the ASGI app and records,
+per endpoint and size:
+
+  * latency percentiles (p50/p95/p99, mean, max) in milliseconds
+  * database operations per request, by collection and command, counted
+    from the monitoring event stream (the same stream the pymongo command
+    listener feeds, so counts are identical against MongoDB)
+
+Results are written as JSON so runs from different commits can be compared:
+
+    python benchmarks/bench_endpoints.py --sizes 1x2x1 10x3x2 --output before.json
+    ... change code ...
+    python benchmarks/bench_endpoints.py --sizes 1x2x1 10x3x2 --output after.json
+    python benchmarks/bench_endpoints.py compare before.json after.json
+
+Sizes are FAMILIESxMEMBERSxYEARS. The in-memory backend is used by default;
+``--backend mongo`` runs against MONGO_URL using a scratch database per size
+that is dropped afterwards.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+import httpx
+
+from common import summarize, run_metadata
+from datagen import DataSpec, populate
+from auth import create_access_token
+import monitoring
+import server
+
+
+class OperationCounter:
+    """Counts database commands while enabled."""
+
+    def __init__(self):
+        self.enabled = False
+        self.counts = Counter()
+
+    def __call__(self, event):
+        if self.enabled:
+            self.counts[f"{event.collection}.{event.command}"] += 1
+
+
+class Context:
+    """Per-size state handed to the endpoint setup functions."""
+
+    def __init__(self, repos, dataset, seed):
+        self.repos = repos
+        self.dataset = dataset
+        self.rng = random.Random(seed)
+        self.iteration = 0
+        end = dataset.spec.end
+        self.month, self.year = end.month, end.year
+
+    @property
+    def family(self):
+        families = self.dataset.families
+        return families[self.iteration % len(families)]
+
+    def headers(self, token=None):
+        return {"Authorization": f"Bearer {token or self.family.admin_token}"}
+
+    def member_headers(self):
+        family = self.family
+        return self.headers(family.tokens[family.member_user_ids[-1]])
+
+    async def lone_user(self, pending_for=None):
+        """Insert a user with their own family (untimed); optionally a pending join request."""
+        repos = self.repos
+        user_id, family_id = str(uuid.uuid4()), str(uuid.uuid4())
+        now = datetime.utcnow().isoformat()
+        await repos.users.insert({"id": user_id, "name": "Newcomer", "email": f"{user_id}@example.com",
+                                  "profile_icon": "user-circle", "password_hash": "x", "created_at": now})
+        await repos.families.insert({"id": family_id, "name": "Temp", "admin_user_id": user_id,
+                                     "family_code": user_id[:8].upper(), "created_at": now})
+        await repos.members.insert({"id": str(uuid.uuid4()), "family_id": family_id, "user_id": user_id,
+                                    "role": "admin", "joined_at": now})
+        request_id = None
+        if pending_for:
+            request_id = str(uuid.uuid4())
+            await repos.join_requests.insert({
+                "id": request_id, "family_id": pending_for, "user_id": user_id, "user_name": "Newcomer",
+                "user_email": f"{user_id}@example.com", "user_icon": "user-circle",
+                "status": "pending", "created_at": now,
+            })
+        token = create_access_token({"sub": user_id, "family_id": family_id, "role": "admin"})
+        return user_id, token, request_id
+
+    def transaction_body(self, **overrides):
+        family = self.family
+        body = {
+            "amount": round(self.rng.lognormvariate(6.5, 0.6), 2),
+            "type": "expense",
+            "category_id": family.category_ids["Groceries"],
+            "account_id": family.account_ids[1],
+            "description": "Benchmark purchase",
+            "date": datetime(self.year, self.month, self.rng.randint(1, 28), 12).isoformat(),
+        }
+        body.update(overrides)
+        return body
+
+    async def insert_transaction(self):
+        doc = {**self.transaction_body(), "id": str(uuid.uuid4()), "family_id": self.family.family_id,
+               "user_id": self.family.admin_user_id, "created_at": datetime.utcnow().isoformat()}
+        await self.repos.transactions.insert(doc)
+        return doc["id"]
+
+
+# ---------------------------------------------------------------------------
+# Endpoint table: name -> async setup(ctx) returning httpx request kwargs.
+# Setup work (creating rows to delete, pending requests to approve, ...) is
+# not timed and its database operations are not counted.
+# ---------------------------------------------------------------------------
+
+async def _register(ctx):
+    return {"method": "POST", "url": "/api/auth/register",
+            "json": {"name": "Bench", "email": f"{uuid.uuid4()}@example.com", "password": "Bench123!"}}
+
+
+async def _login(ctx):
+    from datagen import PASSWORD
+    email = ctx.dataset.user_emails[ctx.family.admin_user_id]
+    return {"method": "POST", "url": "/api/auth/login", "json": {"email": email, "password": PASSWORD}}
+
+
+async def _me(ctx):
+    return {"method": "GET", "url": "/api/auth/me", "headers": ctx.headers()}
+
+
+async def _family(ctx):
+    return {"method": "GET", "url": "/api/auth/family", "headers": ctx.headers()}
+
+
+async def _join_family(ctx):
+    _, token, _ = await ctx.lone_user()
+    return {"method": "POST", "url": "/api/auth/join-family",
+            "params": {"family_code": ctx.family.family_code}, "headers": ctx.headers(token)}
+
+
+async def _update_profile(ctx):
+    return {"method": "PUT", "url": "/api/auth/update-profile",
+            "params": {"profile_icon": ctx.rng.choice(["user-circle", "smile", "star"])},
+            "headers": ctx.member_headers()}
+
+
+async def _remove_member(ctx):
+    user_id, _, _ = await ctx.lone_user()
+    await ctx.repos.members.insert({"id": str(uuid.uuid4()), "family_id": ctx.family.family_id,
+                                    "user_id": user_id, "role": "member", "joined_at": "2025-01-01T00:00:00"})
+    return {"method": "POST", "url": "/api/auth/remove-member", "params": {"user_id": user_id},
+            "headers": ctx.headers()}
+
+
+async def _pending_requests(ctx):
+    return {"method": "GET", "url": "/api/auth/pending-requests", "headers": ctx.headers()}
+
+
+async def _approve_request(ctx):
+    _, _, request_id = await ctx.lone_user(pending_for=ctx.family.family_id)
+    return {"method": "POST", "url": "/api/auth/approve-request", "json": {"request_id": request_id},
+            "headers": ctx.headers()}
+
+
+async def _reject_request(ctx):
+    _, _, request_id = await ctx.lone_user(pending_for=ctx.family.family_id)
+    return {"method": "POST", "url": "/api/auth/reject-request", "json": {"request_id": request_id},
+            "headers": ctx.headers()}
+
+
+async def _my_join_status(ctx):
+    return {"method": "GET", "url": "/api/auth/my-join-status", "headers": ctx.member_headers()}
+
+
+async def _create_category(ctx):
+    return {"method": "POST", "url": "/api/categories", "headers": ctx.headers(),
+            "json": {"name": f"Bench {ctx.iteration}", "type": "expense", "budget_limit": 1000}}
+
+
+async def _get_categories(ctx):
+    return {"method": "GET", "url": "/api/categories", "headers": ctx.headers()}
+
+
+async def _delete_category(ctx):
+    category_id = str(uuid.uuid4())
+    await ctx.repos.categories.insert({"id": category_id, "name": "Doomed", "type": "expense",
+                                       "is_shared": True, "family_id": ctx.family.family_id,
+                                       "created_at": "2025-01-01T00:00:00"})
+    return {"method": "DELETE", "url": f"/api/categories/{category_id}", "headers": ctx.headers()}
+
+
+async def _create_account(ctx):
+    return {"method": "POST", "url": "/api/accounts", "headers": ctx.headers(),
+            "json": {"name": f"Wallet {ctx.iteration}", "type": "cash", "opening_balance": 500}}
+
+
+async def _get_accounts(ctx):
+    return {"method": "GET", "url": "/api/accounts", "headers": ctx.headers()}
+
+
+async def _delete_account(ctx):
+    account_id = str(uuid.uuid4())
+    await ctx.repos.accounts.insert({"id": account_id, "name": "Doomed", "type": "cash",
+                                     "owner_type": "family", "family_id": ctx.family.family_id,
+                                     "opening_balance": 0, "current_balance": 0,
+                                     "created_at": "2025-01-01T00:00:00"})
+    return {"method": "DELETE", "url": f"/api/accounts/{account_id}", "headers": ctx.headers()}
+
+
+async def _create_transaction(ctx):
+    return {"method": "POST", "url": "/api/transactions", "headers": ctx.headers(),
+            "json": ctx.transaction_body()}
+
+
+async def _get_transactions(ctx):
+    return {"method": "GET", "url": "/api/transactions", "headers": ctx.headers(),
+            "params": {"month": ctx.month, "year": ctx.year}}
+
+
+async def _get_all_transactions(ctx):
+    return {"method": "GET", "url": "/api/transactions", "headers": ctx.headers()}
+
+
+async def _update_transaction(ctx):
+    transaction_id = await ctx.insert_transaction()
+    return {"method": "PUT", "url": f"/api/transactions/{transaction_id}", "headers": ctx.headers(),
+            "json": ctx.transaction_body(description="Edited")}
+
+
+async def _delete_transaction(ctx):
+    transaction_id = await ctx.insert_transaction()
+    return {"method": "DELETE", "url": f"/api/transactions/{transaction_id}", "headers": ctx.headers()}
+
+
+async def _dashboard_stats(ctx):
+    return {"method": "GET", "url": "/api/dashboard/stats", "headers": ctx.headers(),
+            "params": {"month": ctx.month, "year": ctx.year}}
+
+
+async def _monthly_trend(ctx):
+    return {"method": "GET", "url": "/api/dashboard/monthly-trend", "headers": ctx.headers(),
+            "params": {"year": ctx.year}}
+
+
+async def _budget_status(ctx):
+    return {"method": "GET", "url": "/api/budget/status", "headers": ctx.headers(),
+            "params": {"month": ctx.month, "year": ctx.year}}
+
+
+async def _investment_targets(ctx):
+    return {"method": "GET", "url": "/api/dashboard/investment-targets", "headers": ctx.headers(),
+            "params": {"month": ctx.month, "year": ctx.year}}
+
+
+async def _period_monthly(ctx):
+    return {"method": "GET", "url": "/api/dashboard/period-stats", "headers": ctx.headers(),
+            "params": {"period_type": "monthly", "month": ctx.month, "year": ctx.year}}
+
+
+async def _period_quarterly(ctx):
+    return {"method": "GET", "url": "/api/dashboard/period-stats", "headers": ctx.headers(),
+            "params": {"period_type": "quarterly", "quarter": 4, "year": ctx.year}}
+
+
+async def _period_annual(ctx):
+    return {"method": "GET", "url": "/api/dashboard/period-stats", "headers": ctx.headers(),
+            "params": {"period_type": "annual", "year": ctx.year}}
+
+
+ENDPOINTS = {
+    "POST /api/auth/register": _register,
+    "POST /api/auth/login": _login,
+    "GET /api/auth/me": _me,
+    "GET /api/auth/family": _family,
+    "POST /api/auth/join-family": _join_family,
+    "PUT /api/auth/update-profile": _update_profile,
+    "POST /api/auth/remove-member": _remove_member,
+    "GET /api/auth/pending-requests": _pending_requests,
+    "POST /api/auth/approve-request": _approve_request,
+    "POST /api/auth/reject-request": _reject_request,
+    "GET /api/auth/my-join-status": _my_join_status,
+    "POST /api/categories": _create_category,
+    "GET /api/categories": _get_categories,
+    "DELETE /api/categories/{id}": _delete_category,
+    "POST /api/accounts": _create_account,
+    "GET /api/accounts": _get_accounts,
+    "DELETE /api/accounts/{id}": _delete_account,
+    "POST /api/transactions": _create_transaction,
+    "GET /api/transactions (month)": _get_transactions,
+    "GET /api/transactions (all)": _get_all_transactions,
+    "PUT /api/transactions/{id}": _update_transaction,
+    "DELETE /api/transactions/{id}": _delete_transaction,
+    "GET /api/dashboard/stats": _dashboard_stats,
+    "GET /api/dashboard/monthly-trend": _monthly_trend,
+    "GET /api/budget/status": _budget_status,
+    "GET /api/dashboard/investment-targets": _investment_targets,
+    "GET /api/dashboard/period-stats (monthly)": _period_monthly,
+    "GET /api/dashboard/period-stats (quarterly)": _period_quarterly,
+    "GET /api/dashboard/period-stats (annual)": _period_annual,
+}
+
+# bcrypt dominates these; fewer iterations keep the suite quick
+SLOW_ENDPOINTS = {"POST /api/auth/register": 5, "POST /api/auth/login": 5}
+
+
+def parse_size(text):
+    families, members, years = (int(part) for part in text.lower().split("x"))
+    return families, members, years
+
+
+async def make_repositories(backend, label):
+    from repositories import InMemoryRepositories, MotorRepositories
+    if backend == "memory":
+        return InMemoryRepositories(), None
+    import database
+    settings = database.MongoSettings.from_env()
+    settings.db_name = f"{settings.db_name}_bench_{label}"
+    db = database.connect(settings)
+    await db.client.drop_database(settings.db_name)
+    repos = MotorRepositories(db)
+    await repos.ensure_indexes()
+
+    async def cleanup():
+        await db.client.drop_database(settings.db_name)
+        database.close()
+    return repos, cleanup
+
+
+async def bench_size(size, args, only):
+    families, members, years = parse_size(size)
+    spec = DataSpec(families=families, members=members, years=years, seed=args.seed)
+    repos, cleanup = await make_repositories(args.backend, size)
+
+    started = time.perf_counter()
+    dataset = await populate(repos, spec)
+    generate_seconds = time.perf_counter() - started
+
+    app = server.create_app(repositories=repos)
+    counter = monitoring.subscribe(OperationCounter())
+    ctx = Context(repos, dataset, args.seed)
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, setup in ENDPOINTS.items():
+                if only and not any(o in name for o in only):
+                    continue
+                iterations = min(args.iterations, SLOW_ENDPOINTS.get(name, args.iterations))
+                latencies, errors = [], 0
+                counter.counts = Counter()
+                for i in range(args.warmup + iterations):
+                    ctx.iteration = i
+                    request = await setup(ctx)
+                    measured = i >= args.warmup
+                    counter.enabled = measured
+                    start = time.perf_counter()
+                    response = await client.request(**request)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    counter.enabled = False
+                    if measured:
+                        latencies.append(elapsed)
+                        errors += response.status_code >= 400
+                ops = {key: round(count / iterations, 2) for key, count in sorted(counter.counts.items())}
+                results[name] = {
+                    **summarize(latencies),
+                    "errors": errors,
+                    "ops_per_request": round(sum(counter.counts.values()) / iterations, 2),
+                    "ops": ops,
+                }
+                print(f"  {name:<45} p50 {results[name]['p50_ms']:>8.2f} ms  "
+                      f"p99 {results[name]['p99_ms']:>8.2f} ms  ops {results[name]['ops_per_request']:>6}",
+                      file=sys.stderr)
+    finally:
+        monitoring.unsubscribe(counter)
+        if cleanup:
+            await cleanup()
+
+    return {
+        "size": size,
+        "families": families,
+        "members": members,
+        "years": years,
+        "transactions": dataset.transaction_count,
+        "generate_seconds": round(generate_seconds, 2),
+        "endpoints": results,
+    }
+
+
+async def run(args):
+    runs = []
+    for size in args.sizes:
+        print(f"Size {size}", file=sys.stderr)
+        runs.append(await bench_size(size, args, args.only))
+    output = {
+        "meta": run_metadata(backend=args.backend, iterations=args.iterations,
+                             warmup=args.warmup, seed=args.seed),
+        "runs": runs,
+    }
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text)
+    else:
+        print(text)
+
+
+def compare(args):
+    """Print p50/p95 ratios and op-count changes between two result files."""
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    with open(args.candidate) as fh:
+        candidate = json.load(fh)
+    base_runs = {r["size"]: r for r in baseline["runs"]}
+
+    regressions = 0
+    print(f"baseline {baseline['meta'].get('commit')}  candidate {candidate['meta'].get('commit')}")
+    for run in candidate["runs"]:
+        base = base_runs.get(run["size"])
+        if not base:
+            continue
+        print(f"\nSize {run['size']} ({run['transactions']} transactions)")
+        print(f"  {'endpoint':<45} {'p50 x':>7} {'p95 x':>7} {'ops':>11}")
+        for name, result in run["endpoints"].items():
+            before = base["endpoints"].get(name)
+            if not before:
+                continue
+            p50 = result["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("inf")
+            p95 = result["p95_ms"] / before["p95_ms"] if before["p95_ms"] else float("inf")
+            ops = f"{before['ops_per_request']:g}->{result['ops_per_request']:g}"
+            flag = ""
+            if p95 > args.threshold or result["ops_per_request"] > before["ops_per_request"]:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"  {name:<45} {p50:>7.2f} {p95:>7.2f} {ops:>11}{flag}")
+    return 1 if regressions else 0
+
+
+def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+        parser.add_argument("baseline")
+        parser.add_argument("candidate")
+        parser.add_argument("--threshold", type=float, default=1.25,
+                            help="p95 ratio above which an endpoint is flagged")
+        sys.exit(compare(parser.parse_args(sys.argv[2:])))
+
+    parser = argparse.ArgumentParser(description="Benchmark every /api endpoint in-process")
+    parser.add_argument("--sizes", nargs="+", default=["1x2x1", "10x3x2"],
+                        help="FAMILIESxMEMBERSxYEARS, e.g. 10x3x2")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--only", nargs="*", help="Only endpoints whose name contains one of these")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+MongoDB pool benchmark: two import-time clients vs. one shared, tuned client.
+
+Before the database module existed, server.py and routes_auth.py each built
+their own AsyncIOMotorClient, so every worker held two pools. This script
+reproduces both layouts against a live mongod and reports, for each:
+
+  * connections opened on the server (serverStatus.connections.current delta)
+  * request latency (p50/p95/p99) for a burst of concurrent reads split
+    across the "routers" the way the API splits them
+
+Usage:
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=bench \\
+        python benchmarks/bench_mongo_pool.py --concurrency 200 --requests 5000
+
+Pool settings for the "after" run come from the same MONGO_* variables the
+app uses (see backend/database.py).
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from common import percentile
+from database import MongoSettings
+
+
+async def current_connections(admin_client):
+    status = await admin_client.admin.command("serverStatus")
+    return status["connections"]["current"]
+
+
+async def seed(db, user_id):
+    await db.users.delete_many({"id": user_id})
+    await db.users.insert_one({"id": user_id, "email": f"{user_id}@example.com", "name": "Bench"})
+
+
+async def drive(dbs, user_id, total_requests, concurrency):
+    """Issue total_requests reads, alternating between the given databases."""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        db = dbs[i % len(dbs)]
+        async with semaphore:
+            start = time.perf_counter()
+            await db.users.find_one({"id": user_id}, {"_id": 0})
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total_requests)))
+    elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+
+async def run_layout(name, clients, settings, admin_client, args):
+    dbs = [client[settings.db_name] for client in clients]
+    user_id = f"bench-{uuid.uuid4()}"
+    await seed(dbs[0], user_id)
+
+    baseline = await current_connections(admin_client)
+    latencies, elapsed = await drive(dbs, user_id, args.requests, args.concurrency)
+    opened = await current_connections(admin_client) - baseline
+
+    await dbs[0].users.delete_many({"id": user_id})
+    for client in clients:
+        client.close()
+
+    return {
+        "layout": name,
+        "clients": len(clients),
+        "connections_opened": opened,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "throughput_rps": round(args.requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+async def main(args):
+    settings = MongoSettings.from_env()
+    admin_client = AsyncIOMotorClient(settings.url, maxPoolSize=1)
+
+    # Before: one default client per router module
+    before = await run_layout(
+        "per-module clients",
+        [AsyncIOMotorClient(settings.url), AsyncIOMotorClient(settings.url)],
+        settings, admin_client, args,
+    )
+    # After: the single client the lifespan creates
+    after = await run_layout(
+        "shared client",
+        [AsyncIOMotorClient(settings.url, **settings.client_kwargs())],
+        settings, admin_client, args,
+    )
+    admin_client.close()
+
+    results = {"settings": settings.client_kwargs(), "runs": [before, after]}
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    asyncio.run(main(parser.parse_args()))
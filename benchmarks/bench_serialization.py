@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Serialization cost of list responses: response_model path vs. orjson rows.
+
+Builds N synthetic transaction rows shaped like the stored documents and
+times, per response:
+
+  * before: what GET /transactions used to do - parse the ISO dates into
+    datetimes, let FastAPI validate the list against
+    ``response_model=List[Transaction]`` and encode it with JSONResponse
+  * after:  ``responses.rows_response`` - project onto the model's fields
+    and encode with orjson, no validation
+
+Both bodies are checked to decode to the same data before timing.
+
+    python benchmarks/bench_serialization.py --rows 10000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from common import summarize, run_metadata
+from models import Transaction
+from responses import rows_response
+
+
+def make_rows(count, seed=42):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    family_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    categories = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(15)]
+    rows = []
+    for _ in range(count):
+        when = (start + timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))).isoformat()
+        rows.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))), "amount": round(rng.lognormvariate(7, 1), 2),
+            "category_id": rng.choice(categories), "type": rng.choice(["income", "expense", "investment"]),
+            "description": rng.choice(["Groceries", "Fuel", "Rent", None]), "date": when,
+            "account_id": None, "to_account_id": None, "family_id": family_id,
+            "user_id": family_id, "user_name": "Bench", "user_icon": "user-circle", "created_at": when,
+        })
+    return rows
+
+
+async def before(rows, field):
+    rows = [dict(row) for row in rows]  # the handler mutated fresh rows from the repository
+    for row in rows:
+        row["date"] = datetime.fromisoformat(row["date"])
+        row["created_at"] = datetime.fromisoformat(row["created_at"])
+    content = await serialize_response(field=field, response_content=rows)
+    return JSONResponse(content).body
+
+
+async def after(rows, field):
+    return rows_response([dict(row) for row in rows], Transaction).body
+
+
+def run(fn, rows, field, repeat):
+    loop = asyncio.new_event_loop()
+    timings, body = [], b""
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = loop.run_until_complete(fn(rows, field))
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        loop.close()
+    return timings, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialization cost of list responses")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    field = create_response_field(name="Response_get_transactions", type_=List[Transaction])
+
+    _, expected = run(before, rows, field, 1)
+    _, actual = run(after, rows, field, 1)
+    assert json.loads(expected) == json.loads(actual), "fast path changed the response body"
+
+    results = {"meta": run_metadata(rows=args.rows, repeat=args.repeat), "runs": {}}
+    for name, fn in (("response_model", before), ("orjson_rows", after)):
+        timings, body = run(fn, rows, field, args.repeat)
+        results["runs"][name] = {**summarize(timings), "bytes": len(body)}
+        print(f"{name:<16} p50 {results['runs'][name]['p50_ms']:9.2f} ms  "
+              f"p95 {results['runs'][name]['p95_ms']:9.2f} ms  {len(body)} bytes")
+    speedup = results["runs"]["response_model"]["p50_ms"] / results["runs"]["orjson_rows"]["p50_ms"]
+    results["speedup_p50"] = round(speedup, 2)
+    print(f"speedup (p50): {speedup:.1f}x for {args.rows} rows")
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for the Spend Tracker backend.
+
+Creates N families x M members x K years of transactions with realistic
+monthly patterns (salary on the 1st, rent, weekly groceries, SIPs, the
+occasional big purchase), plus categories with budgets and investment
+targets, family and personal accounts, and consistent account balances.
+Everything is drawn from a seeded ``random.Random``, so the same arguments
+always produce the same dataset.
+
+Documents are written straight through a ``Repositories`` object, so the
+generator works with both backends:
+
+    from repositories import InMemoryRepositories
+    dataset = asyncio.run(populate(InMemoryRepositories(), DataSpec(families=10)))
+
+Run as a script to fill a MongoDB database for manual testing:
+
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=spend_bench \\
+        python benchmarks/datagen.py --families 20 --members 3 --years 2
+"""
+
+import argparse
+import asyncio
+import random
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+import common  # noqa: F401  (puts backend/ on sys.path)
+from auth import create_access_token, hash_password
+
+PASSWORD = "Bench123!"
+
+# name, type, color, (budget_limit | investment_target)
+CATEGORIES = [
+    ("Salary", "income", "#10B981", None),
+    ("Freelance", "income", "#34D399", None),
+    ("Interest", "income", "#6EE7B7", None),
+    ("Rent", "expense", "#EF4444", 30000),
+    ("Groceries", "expense", "#F97316", 15000),
+    ("Utilities", "expense", "#F59E0B", 6000),
+    ("Transport", "expense", "#EAB308", 5000),
+    ("Dining", "expense", "#EC4899", 8000),
+    ("Shopping", "expense", "#8B5CF6", 10000),
+    ("Health", "expense", "#14B8A6", None),
+    ("Entertainment", "expense", "#6366F1", 4000),
+    ("Education", "expense", "#0EA5E9", None),
+    ("SIP", "investment", "#3B82F6", 20000),
+    ("Stocks", "investment", "#2563EB", 10000),
+    ("PPF", "investment", "#1D4ED8", None),
+]
+
+# category -> (occurrences per member-month, lognormal mu, sigma)
+SPENDING = {
+    "Groceries": (5, 7.3, 0.5),
+    "Utilities": (2, 7.4, 0.4),
+    "Transport": (8, 5.3, 0.6),
+    "Dining": (4, 6.6, 0.6),
+    "Shopping": (1.5, 7.8, 0.9),
+    "Health": (0.4, 7.5, 1.0),
+    "Entertainment": (2, 6.4, 0.6),
+    "Education": (0.2, 9.0, 0.7),
+}
+
+DESCRIPTIONS = {
+    "Groceries": ["BigBasket order", "Vegetable market", "Supermarket run", "Milk and bread"],
+    "Utilities": ["Electricity bill", "Water bill", "Broadband", "Mobile recharge", "Gas cylinder"],
+    "Transport": ["Metro card top-up", "Auto fare", "Fuel", "Cab to office"],
+    "Dining": ["Dinner out", "Coffee", "Lunch with team", "Food delivery"],
+    "Shopping": ["Clothes", "Electronics", "Home decor", "Books"],
+    "Health": ["Pharmacy", "Doctor visit", "Lab tests"],
+    "Entertainment": ["Movie tickets", "Streaming subscription", "Concert"],
+    "Education": ["Course fee", "School fees", "Workshop"],
+}
+
+
+@dataclass
+class DataSpec:
+    families: int = 1
+    members: int = 2
+    years: int = 1
+    seed: int = 42
+    end: date = date(2025, 12, 31)
+
+
+@dataclass
+class GeneratedFamily:
+    family_id: str
+    family_code: str
+    admin_user_id: str
+    member_user_ids: List[str]
+    category_ids: Dict[str, str]
+    account_ids: List[str]
+    tokens: Dict[str, str] = field(default_factory=dict)  # user_id -> bearer token
+
+    @property
+    def admin_token(self) -> str:
+        return self.tokens[self.admin_user_id]
+
+
+@dataclass
+class Dataset:
+    spec: DataSpec
+    families: List[GeneratedFamily]
+    user_emails: Dict[str, str]
+    transaction_count: int = 0
+    category_count: int = 0
+    account_count: int = 0
+
+    @property
+    def label(self) -> str:
+        s = self.spec
+        return f"{s.families}x{s.members}x{s.years}"
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _months(spec: DataSpec):
+    year, month = spec.end.year, spec.end.month
+    months = []
+    for _ in range(spec.years * 12):
+        months.append((year, month))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return list(reversed(months))
+
+
+def _day(rng, year, month, day=None):
+    if day is None:
+        next_month = date(year + (month == 12), month % 12 + 1, 1)
+        day = rng.randint(1, (next_month - timedelta(days=1)).day)
+    return datetime(year, month, day, rng.randint(7, 22), rng.randint(0, 59))
+
+
+async def populate(repos, spec: DataSpec) -> Dataset:
+    """Write a synthetic dataset into ``repos`` and describe what was created."""
+    rng = random.Random(spec.seed)
+    password_hash = hash_password(PASSWORD)  # bcrypt is slow; every user shares one hash
+    created_at = datetime(spec.end.year - spec.years, 1, 1).isoformat()
+    months = _months(spec)
+    dataset = Dataset(spec=spec, families=[], user_emails={})
+
+    for f in range(spec.families):
+        family_id = _uuid(rng)
+        user_ids = [_uuid(rng) for _ in range(spec.members)]
+        family_code = f"F{f:07d}"
+
+        for m, user_id in enumerate(user_ids):
+            email = f"user{f}_{m}@example.com"
+            dataset.user_emails[user_id] = email
+            await repos.users.insert({
+                "id": user_id, "name": f"Member {f}-{m}", "email": email,
+                "profile_icon": "user-circle", "password_hash": password_hash,
+                "created_at": created_at,
+            })
+            await repos.members.insert({
+                "id": _uuid(rng), "family_id": family_id, "user_id": user_id,
+                "role": "admin" if m == 0 else "member", "joined_at": created_at,
+            })
+        await repos.families.insert({
+            "id": family_id, "name": f"Family {f}", "admin_user_id": user_ids[0],
+            "family_code": family_code, "created_at": created_at,
+        })
+
+        category_ids = {}
+        for name, type, color, limit in CATEGORIES:
+            category_ids[name] = _uuid(rng)
+            await repos.categories.insert({
+                "id": category_ids[name], "name": name, "type": type, "color": color,
+                "budget_limit": limit if type == "expense" else None,
+                "investment_target": limit if type == "investment" else None,
+                "is_shared": True, "created_by_user_id": None,
+                "family_id": family_id, "created_at": created_at,
+            })
+
+        # One family bank account, then a bank account and a credit card per member
+        accounts = [{"id": _uuid(rng), "name": "Joint Account", "type": "bank",
+                     "opening_balance": 50000.0, "owner_type": "family", "owner_user_id": None}]
+        for m, user_id in enumerate(user_ids):
+            accounts.append({"id": _uuid(rng), "name": f"Savings {m}", "type": "bank",
+                             "opening_balance": 20000.0, "owner_type": "personal", "owner_user_id": user_id})
+            accounts.append({"id": _uuid(rng), "name": f"Card {m}", "type": "credit_card",
+                             "opening_balance": 0.0, "owner_type": "personal", "owner_user_id": user_id})
+        investment_account = {"id": _uuid(rng), "name": "Demat", "type": "other",
+                              "opening_balance": 0.0, "owner_type": "family", "owner_user_id": None}
+        accounts.append(investment_account)
+        balances = {a["id"]: a["opening_balance"] for a in accounts}
+
+        salaries = [round(rng.uniform(40000, 150000), -3) for _ in user_ids]
+        rent = round(rng.uniform(12000, 35000), -2)
+        transactions = []
+
+        def add(user_index, type, amount, when, category=None, account_id=None,
+                to_account_id=None, description=None):
+            amount = round(amount, 2)
+            user_id = user_ids[user_index]
+            transactions.append({
+                "id": _uuid(rng), "amount": amount,
+                "category_id": category_ids[category] if category else None,
+                "type": type, "description": description, "date": when.isoformat(),
+                "account_id": account_id, "to_account_id": to_account_id,
+                "family_id": family_id, "user_id": user_id,
+                "user_name": f"Member {f}-{user_index}", "user_icon": "user-circle",
+                "created_at": when.isoformat(),
+            })
+            if type == "income" and account_id:
+                balances[account_id] += amount
+            elif type == "expense" and account_id:
+                balances[account_id] -= amount
+            elif type in ("investment", "transfer"):
+                balances[account_id] -= amount
+                balances[to_account_id] += amount
+
+        for year, month in months:
+            for i, user_id in enumerate(user_ids):
+                savings, card = accounts[1 + 2 * i]["id"], accounts[2 + 2 * i]["id"]
+                add(i, "income", salaries[i] * rng.uniform(0.98, 1.05), _day(rng, year, month, 1),
+                    "Salary", savings, description="Monthly salary")
+                if rng.random() < 0.15:
+                    add(i, "income", rng.lognormvariate(9.5, 0.6), _day(rng, year, month),
+                        "Freelance", savings, description="Client payment")
+                if rng.random() < 0.3:
+                    add(i, "income", rng.lognormvariate(6.0, 0.5), _day(rng, year, month),
+                        "Interest", savings, description="Savings interest")
+                if i == 0:
+                    add(i, "expense", rent, _day(rng, year, month, 5), "Rent", accounts[0]["id"],
+                        description="House rent")
+                for category, (rate, mu, sigma) in SPENDING.items():
+                    # Spending drifts up over time and peaks around festivals
+                    season = 1.25 if month in (10, 11, 12) else 1.0
+                    count = int(rate * season) + (rng.random() < (rate * season) % 1)
+                    for _ in range(count):
+                        add(i, "expense", rng.lognormvariate(mu, sigma) * season,
+                            _day(rng, year, month), category,
+                            rng.choice([savings, card, None]),
+                            description=rng.choice(DESCRIPTIONS[category]))
+                add(i, "investment", round(salaries[i] * 0.1, -2), _day(rng, year, month, 10),
+                    "SIP", savings, investment_account["id"], description="Monthly SIP")
+                if rng.random() < 0.2:
+                    add(i, "investment", rng.lognormvariate(9.0, 0.7), _day(rng, year, month),
+                        rng.choice(["Stocks", "PPF"]), savings, investment_account["id"])
+                if rng.random() < 0.25:
+                    add(i, "transfer", rng.lognormvariate(8.5, 0.5), _day(rng, year, month),
+                        None, savings, accounts[0]["id"], description="Household contribution")
+
+        for account in accounts:
+            await repos.accounts.insert({
+                **account, "family_id": family_id,
+                "current_balance": round(balances[account["id"]], 2), "created_at": created_at,
+            })
+        transactions.sort(key=lambda t: t["date"])
+        for transaction in transactions:
+            await repos.transactions.insert(transaction)
+
+        generated = GeneratedFamily(
+            family_id=family_id, family_code=family_code, admin_user_id=user_ids[0],
+            member_user_ids=user_ids, category_ids=category_ids,
+            account_ids=[a["id"] for a in accounts],
+        )
+        for i, user_id in enumerate(user_ids):
+            generated.tokens[user_id] = create_access_token({
+                "sub": user_id, "family_id": family_id, "role": "admin" if i == 0 else "member",
+            })
+        dataset.families.append(generated)
+        dataset.transaction_count += len(transactions)
+        dataset.category_count += len(category_ids)
+        dataset.account_count += len(accounts)
+
+    return dataset
+
+
+async def _main(args):
+    import database
+    from repositories import MotorRepositories
+
+    repos = MotorRepositories(database.connect())
+    await repos.ensure_indexes()
+    dataset = await populate(repos, DataSpec(args.families, args.members, args.years, args.seed))
+    database.close()
+    print(f"Created {len(dataset.families)} families, {len(dataset.user_emails)} users, "
+          f"{dataset.transaction_count} transactions (password: {PASSWORD})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill MongoDB with synthetic Spend Tracker data")
+    parser.add_argument("--families", type=int, default=10)
+    parser.add_argument("--members", type=int, default=3)
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Concurrent load test for a running Spend Tracker API.
+
+Virtual users share one keep-alive HTTP client and repeatedly pick a
+scenario from a weighted mix until the run ends:
+
+  login_storm        POST /auth/login as fast as possible (bcrypt bound)
+  dashboard_polling  the requests the dashboard fires on load, issued
+                     together, followed by a short think time
+  bulk_insert        a burst of concurrent POST /transactions
+
+The report gives throughput, p50/p95/p99 latency and error rate for every
+request and scenario, so capacity can be compared release to release.
+
+Against a server you started yourself (defaults to LOADTEST_BASE_URL or
+http://localhost:8001/api):
+
+    python benchmarks/loadtest.py --users 20 --concurrency 50 --duration 30
+
+Or let the script start a local uvicorn worker on a free port, using the
+in-memory backend unless ``--spawn mongo`` is given:
+
+    python benchmarks/loadtest.py --spawn memory \\
+        --mix login_storm=1,dashboard_polling=6,bulk_insert=2 --output load.json
+
+Test users are registered through the API first; that setup is not measured.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List
+
+import httpx
+
+from common import BACKEND_DIR, summarize, run_metadata
+
+PASSWORD = "Load123!"
+DEFAULT_BASE_URL = os.environ.get("LOADTEST_BASE_URL", "http://localhost:8001/api")
+
+
+@dataclass
+class VirtualUser:
+    email: str
+    token: str
+    category_id: str
+    account_id: str
+    rng: random.Random = field(default_factory=random.Random)
+
+    @property
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+class Recorder:
+    """Latency and outcome of every request, grouped by scenario and request."""
+
+    def __init__(self):
+        self.samples: Dict[tuple, List[float]] = defaultdict(list)
+        self.errors: Dict[tuple, int] = defaultdict(int)
+        self.scenario_samples: Dict[str, List[float]] = defaultdict(list)
+        self.scenario_errors: Dict[str, int] = defaultdict(int)
+
+    async def request(self, client, scenario, name, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            response, failed = None, True
+        self.samples[(scenario, name)].append((time.perf_counter() - start) * 1000)
+        if failed:
+            self.errors[(scenario, name)] += 1
+        return response
+
+    async def scenario(self, name, coro):
+        errors_before = sum(n for (s, _), n in self.errors.items() if s == name)
+        start = time.perf_counter()
+        await coro
+        self.scenario_samples[name].append((time.perf_counter() - start) * 1000)
+        if sum(n for (s, _), n in self.errors.items() if s == name) > errors_before:
+            self.scenario_errors[name] += 1
+
+    def report(self, elapsed):
+        def block(samples, errors):
+            return {
+                **summarize(samples),
+                "throughput_rps": round(len(samples) / elapsed, 1),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+            }
+
+        all_samples = [ms for samples in self.samples.values() for ms in samples]
+        return {
+            "duration_s": round(elapsed, 2),
+            "total": block(all_samples, sum(self.errors.values())),
+            "scenarios": {
+                name: block(samples, self.scenario_errors[name])
+                for name, samples in sorted(self.scenario_samples.items())
+            },
+            "requests": {
+                f"{scenario} | {name}": block(samples, self.errors[(scenario, name)])
+                for (scenario, name), samples in sorted(self.samples.items())
+            },
+        }
+
+
+# ---------------------------------------------------------------------------
+# Scenarios: async fn(client, recorder, user, args)
+# ---------------------------------------------------------------------------
+
+def _transaction(user):
+    now = datetime.utcnow()
+    return {
+        "amount": round(user.rng.lognormvariate(6.5, 0.6), 2),
+        "type": "expense",
+        "category_id": user.category_id,
+        "account_id": user.account_id,
+        "description": "Load test purchase",
+        "date": now.replace(day=user.rng.randint(1, 28)).isoformat(),
+    }
+
+
+async def login_storm(client, recorder, user, args):
+    await recorder.request(client, "login_storm", "POST /auth/login", "POST", "/auth/login",
+                           json={"email": user.email, "password": PASSWORD})
+
+
+async def dashboard_polling(client, recorder, user, args):
+    now = datetime.utcnow()
+    period = {"month": now.month, "year": now.year}
+    calls = [
+        ("GET /dashboard/stats", "/dashboard/stats", period),
+        ("GET /budget/status", "/budget/status", period),
+        ("GET /dashboard/investment-targets", "/dashboard/investment-targets", period),
+        ("GET /dashboard/monthly-trend", "/dashboard/monthly-trend", {"year": now.year}),
+        ("GET /transactions", "/transactions", period),
+        ("GET /accounts", "/accounts", None),
+    ]
+    await asyncio.gather(*(
+        recorder.request(client, "dashboard_polling", name, "GET", url, params=params, headers=user.headers)
+        for name, url, params in calls
+    ))
+    await asyncio.sleep(args.think_time)
+
+
+async def bulk_insert(client, recorder, user, args):
+    await asyncio.gather(*(
+        recorder.request(client, "bulk_insert", "POST /transactions", "POST", "/transactions",
+                         json=_transaction(user), headers=user.headers)
+        for _ in range(args.batch_size)
+    ))
+
+
+SCENARIOS = {
+    "login_storm": login_storm,
+    "dashboard_polling": dashboard_polling,
+    "bulk_insert": bulk_insert,
+}
+
+
+def parse_mix(text):
+    """'login_storm=1,dashboard_polling=4' -> {'login_storm': 1.0, 'dashboard_polling': 4.0}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# ---------------------------------------------------------------------------
+# Setup and driver
+# ---------------------------------------------------------------------------
+
+async def _check(response):
+    if response.status_code >= 400:
+        raise SystemExit(f"setup failed: {response.request.method} {response.request.url} "
+                         f"-> {response.status_code} {response.text}")
+    return response.json()
+
+
+async def create_users(client, count, seed):
+    """Register ``count`` users, each with their own family, category and account."""
+    run_id = uuid.uuid4().hex[:8]
+    users = []
+    for i in range(count):
+        email = f"load-{run_id}-{i}@example.com"
+        auth = await _check(await client.post("/auth/register", json={
+            "name": f"Load {i}", "email": email, "password": PASSWORD,
+        }))
+        headers = {"Authorization": f"Bearer {auth['access_token']}"}
+        category = await _check(await client.post("/categories", headers=headers, json={
+            "name": "Groceries", "type": "expense", "budget_limit": 20000,
+        }))
+        account = await _check(await client.post("/accounts", headers=headers, json={
+            "name": "Wallet", "type": "cash", "opening_balance": 100000,
+        }))
+        users.append(VirtualUser(email=email, token=auth["access_token"], category_id=category["id"],
+                                 account_id=account["id"], rng=random.Random(seed + i)))
+    return users
+
+
+async def run_load(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        users = await create_users(client, args.users, args.seed)
+        names, weights = list(args.mix), list(args.mix.values())
+        recorder = Recorder()
+        deadline = time.perf_counter() + args.duration
+
+        async def virtual_user(index):
+            rng = random.Random(args.seed * 1000 + index)
+            user = users[index % len(users)]
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                await recorder.scenario(name, SCENARIOS[name](client, recorder, user, args))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user(i) for i in range(args.concurrency)))
+        return recorder.report(time.perf_counter() - started)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(backend):
+    """Start uvicorn on a free local port and wait until it answers."""
+    port = _free_port()
+    env = {**os.environ, "REPOSITORY_BACKEND": backend}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}/api"
+    for _ in range(100):
+        if process.poll() is not None:
+            raise SystemExit(f"server exited with code {process.returncode}")
+        try:
+            httpx.get(f"{base_url}/auth/me", timeout=1)
+            return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("server did not start within 10 seconds")
+
+
+def print_report(report):
+    total = report["total"]
+    print(f"\n{total['n']} requests in {report['duration_s']}s: {total['throughput_rps']} req/s, "
+          f"error rate {total['error_rate']:.2%}")
+    for title, rows in (("scenario", report["scenarios"]), ("request", report["requests"])):
+        print(f"\n  {title:<58} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>8}")
+        for name, row in rows.items():
+            print(f"  {name:<58} {row['throughput_rps']:8.1f} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} "
+                  f"{row['p99_ms']:9.2f} {row['error_rate']:8.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the Spend Tracker API")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL,
+                        help="API root, e.g. http://localhost:8001/api (ignored with --spawn)")
+    parser.add_argument("--spawn", choices=["memory", "mongo"],
+                        help="start a local uvicorn server with this repository backend")
+    parser.add_argument("--mix", type=parse_mix,
+                        default=parse_mix("login_storm=1,dashboard_polling=6,bulk_insert=2"),
+                        help="weighted scenarios, e.g. login_storm=1,dashboard_polling=4")
+    parser.add_argument("--users", type=int, default=10, help="accounts registered before the run")
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--batch-size", type=int, default=10, help="transactions per bulk_insert")
+    parser.add_argument("--think-time", type=float, default=0.5, help="pause after each dashboard poll")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    process = None
+    if args.spawn:
+        process, args.base_url = spawn_server(args.spawn)
+    try:
+        report = asyncio.run(run_load(args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report["meta"] = run_metadata(
+        base_url=args.base_url, spawn=args.spawn, mix=args.mix, users=args.users,
+        concurrency=args.concurrency, duration=args.duration, batch_size=args.batch_size,
+        think_time=args.think_time, seed=args.seed,
+    )
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nWrote {args.output}")
+    sys.exit(1 if report["total"]["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,14 @@ Budget Alert Ticker Feature Test
 Tests the specific scenario for showing only categories at 90%+ of budget limit
 """
 
+import os
 import requests
 import json
 from datetime import datetime
 import uuid
 
-# Base URL from environment
-BASE_URL = "https://cashflow-radar.preview.emergentagent.com/api"
+# Base URL from environment; defaults to a locally started server
+BASE_URL = os.environ.get("BASE_URL", "http://localhost:8001/api")
 
 class BudgetTickerTester:
     def __init__(self):
@@ -18,6 +18,71 @@ api.interceptors.request.use((config) => {
 
 export default api;
 
+// Transaction lists are fetched column-oriented (backend/responses.py) to cut
+// payload size; rebuild the row objects the components expect.
+const COLUMNAR_JSON = 'application/vnd.spendtracker.columnar+json';
+
+export const fromColumnar = ({ count, columns, dictionaries = {} }) => {
+  const rows = Array.from({ length: count }, () => ({}));
+  Object.entries(columns).forEach(([field, values]) => {
+    const dictionary = dictionaries[field];
+    values.forEach((value, i) => {
+      rows[i][field] = dictionary ? dictionary[value] : value;
+    });
+  });
+  return rows;
+};
+
+const columnarRequest = {
+  headers: { Accept: `${COLUMNAR_JSON}, application/json;q=0.9` },
+  transformResponse: [
+    ...axios.defaults.transformResponse,
+    (data) => (data && data.columns ? fromColumnar(data) : data),
+  ],
+};
+
+// Server-sent events for the current family and user (backend/events.py).
+// The stream URL carries a short-lived stream token, never the access token,
+// so every (re)connect asks for a fresh one. Returns a function that closes the stream.
+const EVENTS_RETRY_MS = 5000;
+
+export const subscribeEvents = (handlers) => {
+  if (!localStorage.getItem('token') || typeof EventSource === 'undefined') return () => {};
+  let source = null;
+  let timer = null;
+  let closed = false;
+
+  const retry = () => {
+    if (!closed) timer = setTimeout(connect, EVENTS_RETRY_MS);
+  };
+  const connect = async () => {
+    let token;
+    try {
+      token = (await api.post('/events/token')).data.token;
+    } catch (e) {
+      retry();
+      return;
+    }
+    if (closed) return;
+    source = new EventSource(`${API}/events/stream?token=${encodeURIComponent(token)}`);
+    Object.entries(handlers).forEach(([type, handler]) => {
+      source.addEventListener(type, (event) => handler(JSON.parse(event.data)));
+    });
+    // EventSource would reconnect with the same, soon expired, token
+    source.onerror = () => {
+      source.close();
+      retry();
+    };
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(timer);
+    if (source) source.close();
+  };
+};
+
 // Category API
 export const categoryAPI = {
   getCategories: (type) => api.get('/categories', { params: { type } }),
@@ -27,8 +92,10 @@ export const categoryAPI = {
 
 // Transaction API
 export const transactionAPI = {
-  getTransactions: (params) => api.get('/transactions', { params }),
-  createTransaction: (data) => api.post('/transactions', data),
+  getTransactions: (params) => api.get('/transactions', { params, ...columnarRequest }),
+  searchTransactions: (q, cursor) => api.get('/transactions/search', { params: { q, cursor } }),
+  createTransaction: (data, idempotencyKey) => api.post('/transactions', data,
+    idempotencyKey ? { headers: { 'Idempotency-Key': idempotencyKey } } : undefined),
   updateTransaction: (id, data) => api.put(`/transactions/${id}`, data),
   deleteTransaction: (id) => api.delete(`/transactions/${id}`),
 };
@@ -47,6 +114,26 @@ export const dashboardAPI = {
   getBudgetStatus: (params) => api.get('/budget/status', { params }),
   getInvestmentTargets: (params) => api.get('/dashboard/investment-targets', { params }),
   getPeriodStats: (params) => api.get('/dashboard/period-stats', { params }),
+  getDistribution: (params) => api.get('/dashboard/distribution', { params }),
+  getCalendar: (params) => api.get('/dashboard/calendar', { params }),
+  getAnomalies: (params) => api.get('/dashboard/anomalies', { params }),
+};
+
+// Pivot queries: { measures, dimensions, filters }, e.g. dimensions ['category', 'month']
+export const analyticsAPI = {
+  query: (query) => api.post('/analytics/query', query),
+};
+
+// Delta sync: pass the seq from the previous response as `since`
+export const syncAPI = {
+  getChanges: (since = 0) => api.get('/sync', { params: { since } }),
+};
+
+// Background jobs (admin): queue heavy recomputes and poll their progress
+export const jobsAPI = {
+  createJob: (type, params = {}) => api.post('/jobs', { type, params }),
+  getJob: (id) => api.get(`/jobs/${id}`),
+  getJobs: () => api.get('/jobs'),
 };
 
 // Auth API
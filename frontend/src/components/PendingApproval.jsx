@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Card, CardContent, CardHeader, CardTitle } from './ui/card';
 import { Button } from './ui/button';
 import { useAuth } from '../AuthContext';
-import { authAPI } from '../api';
+import { authAPI, subscribeEvents } from '../api';
 import { Clock, RefreshCw, LogOut } from 'lucide-react';
 
 export default function PendingApproval() {
@@ -12,6 +12,11 @@ export default function PendingApproval() {
 
   useEffect(() => {
     checkStatus();
+    // The admin's decision is pushed to us; re-check instead of waiting for a manual refresh
+    return subscribeEvents({
+      'join_request.approved': checkStatus,
+      'join_request.rejected': checkStatus,
+    });
   }, []);
 
   const checkStatus = async () => {
@@ -17,13 +17,14 @@ Test Flow as per review request:
 5. Test Transfer (should also not affect profit)
 """
 
+import os
 import requests
 import json
 from datetime import datetime
 import uuid
 
-# Base URL from environment
-BASE_URL = "https://cashflow-radar.preview.emergentagent.com/api"
+# Base URL from environment; defaults to a locally started server
+BASE_URL = os.environ.get("BASE_URL", "http://localhost:8001/api")
 
 class InvestmentLogicTester:
     def __init__(self):
@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+# Backend modules import each other as top-level modules (uvicorn server:app)
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..", "backend")
+sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+
+
+@pytest.fixture
+def repos():
+    from repositories import InMemoryRepositories
+    return InMemoryRepositories()
+
+
+@pytest.fixture
+def app(repos):
+    import server
+    return server.create_app(repositories=repos)
+
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def register(client):
+    """Register a user and return auth headers for them."""
+    def _register(name="Asha", email=None, family_code=None):
+        payload = {
+            "name": name,
+            "email": email or f"{name.lower()}@example.com",
+            "password": "Secret123!",
+        }
+        if family_code:
+            payload["family_code"] = family_code
+        response = client.post("/api/auth/register", json=payload)
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return _register
+
+
+@pytest.fixture
+def admin_headers(register):
+    return register()
@@ -0,0 +1,65 @@
+"""Vectorized analytics engine and its invalidation."""
+import asyncio
+from datetime import datetime
+
+import analytics
+import cache
+from analytics import AnalyticsEngine, TransactionFrame
+
+TRANSACTIONS = [
+    {"date": "2025-01-05T10:00:00", "amount": 100.0, "type": "income", "category_id": "salary", "user_id": "u1"},
+    {"date": "2025-01-09T10:00:00", "amount": 30.0, "type": "expense", "category_id": "food", "user_id": "u1"},
+    {"date": "2025-02-01T00:00:00+00:00", "amount": 20.0, "type": "expense", "category_id": "food", "user_id": "u2"},
+    {"date": "2025-02-03T10:00:00", "amount": 50.0, "type": "transfer", "category_id": None, "user_id": "u2"},
+    {"date": "2025-02-04T10:00:00", "amount": 5.0, "type": "expense", "category_id": "gone", "user_id": "u2"},
+]
+CATEGORIES = [{"id": "salary", "name": "Salary"}, {"id": "food", "name": "Food"}]
+
+
+def test_group_bys():
+    frame = TransactionFrame.build(TRANSACTIONS, CATEGORIES)
+    assert analytics.totals(frame) == {"income": 100.0, "expense": 55.0, "investment": 0.0, "transfer": 50.0}
+
+    u2 = frame.mask(user_id="u2")
+    assert analytics.count(frame, u2) == 3
+    assert analytics.by_category(frame, u2) == {"income": {}, "expense": {"Food": 20.0, "Unknown": 5.0},
+                                                "investment": {}}
+    february = frame.mask(start=datetime(2025, 2, 1), end=datetime(2025, 3, 1))
+    assert analytics.totals(frame, february)["expense"] == 25.0
+
+    series = analytics.monthly(frame)
+    assert series.shape == (12, 4)
+    assert list(series[1]) == [0.0, 25.0, 0.0, 50.0]
+
+
+def test_engine_caches_per_version(repos):
+    async def scenario():
+        for t in TRANSACTIONS:
+            await repos.transactions.insert({**t, "family_id": "fam-analytics"})
+        engine = AnalyticsEngine()
+        first = await engine.frame(repos, "fam-analytics")
+        assert await engine.frame(repos, "fam-analytics") is first
+        cache.invalidate_family("fam-analytics")
+        assert await engine.frame(repos, "fam-analytics") is not first
+        return engine.hits, engine.misses
+
+    assert asyncio.run(scenario()) == (1, 2)
+
+
+def test_stats_reflect_writes(client, app, admin_headers):
+    category = client.post("/api/categories", json={"name": "Food", "type": "expense"},
+                           headers=admin_headers).json()
+    params = {"period_type": "annual", "year": 2025}
+
+    def expense():
+        return client.get("/api/dashboard/period-stats", params=params, headers=admin_headers).json()["total_expense"]
+
+    assert expense() == 0
+    assert expense() == 0
+    created = client.post("/api/transactions", headers=admin_headers, json={
+        "amount": 12.5, "type": "expense", "category_id": category["id"], "date": "2025-06-01T09:00:00",
+    }).json()
+    assert expense() == 12.5
+    client.delete(f"/api/transactions/{created['id']}", headers=admin_headers)
+    assert expense() == 0
+    assert app.state.analytics.hits >= 1
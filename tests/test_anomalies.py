@@ -0,0 +1,130 @@
+"""Streaming anomaly statistics and detection."""
+import asyncio
+from datetime import datetime
+import statistics
+
+import cache
+from anomalies import AnomalyDetector, FamilyAnomalies, RunningStats
+from recurring import RecurringScheduler
+
+
+def test_running_stats_match_batch():
+    values = [12.0, 15.5, 9.0, 30.0, 14.0, 11.0]
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    assert abs(stats.mean - statistics.mean(values)) < 1e-9
+    assert abs(stats.std - statistics.stdev(values)) < 1e-9
+    stats.remove(30.0)
+    stats.add(13.0)
+    replaced = [12.0, 15.5, 9.0, 13.0, 14.0, 11.0]
+    assert abs(stats.mean - statistics.mean(replaced)) < 1e-9
+    assert abs(stats.std - statistics.stdev(replaced)) < 1e-9
+
+
+def expense(n, date, amount):
+    return {"id": f"t{n}", "type": "expense", "category_id": "food", "date": date, "amount": amount}
+
+
+def test_transaction_and_month_anomalies():
+    state = FamilyAnomalies()
+    n = 0
+    for month in range(1, 5):
+        for day, amount in ((3, 40.0), (10, 55.0), (17, 45.0), (24, 50.0)):
+            n += 1
+            assert state.observe(expense(n, f"2025-{month:02d}-{day:02d}", amount), sigma=3.0) == []
+    assert state.observe(expense(100, "2025-05-02", 48.0), sigma=3.0) == []
+    found = state.observe(expense(101, "2025-05-03", 400.0), sigma=3.0)
+    # One huge transaction is both an outlier and pushes May past its usual total
+    assert [a["kind"] for a in found] == ["transaction", "month_to_date"]
+    assert found[1]["total"] == 448.0
+    # Already over the monthly bound: not raised again
+    assert "month_to_date" not in [a["kind"] for a in state.observe(expense(102, "2025-05-04", 200.0), sigma=3.0)]
+    # Back-dated spending updates that month's total instead of the open month
+    state.observe(expense(103, "2025-02-28", 10.0), sigma=3.0)
+    assert state.categories["food"].months["2025-02"] == 200.0
+
+
+def test_detector_follows_its_own_writes(repos):
+    async def scenario():
+        for n, amount in enumerate([40.0, 55.0, 45.0, 50.0, 48.0], start=1):
+            await repos.transactions.insert({**expense(n, f"2025-01-{n:02d}T09:00:00", amount), "family_id": "fam"})
+        detector = AnomalyDetector()
+        state = await detector.family(repos, "fam")
+        # Category changes, imports, other workers: nothing to replay before the refresh
+        cache.invalidate_family("fam")
+        assert await detector.family(repos, "fam") is state
+        removed = await repos.transactions.get("t2")
+        await repos.transactions.delete("t2")
+        detector.record("fam", cache.invalidate_family("fam"), removed=removed)
+        await repos.recurring.insert({
+            "id": "veg-box", "family_id": "fam", "user_id": "u1", "amount": 60.0, "type": "expense",
+            "category_id": "food", "schedule": "0 0 1 * *", "start_date": "2025-02-01T00:00:00",
+            "end_date": None, "next_run": "2025-02-01T00:00:00", "active": True,
+        })
+        scheduler = RecurringScheduler()
+        scheduler.repositories, scheduler.anomalies = repos, detector
+        assert await scheduler.run_once(datetime(2025, 3, 20)) == 2
+        followed = (await detector.family(repos, "fam")).categories["food"]
+        replayed = (await AnomalyDetector().family(repos, "fam")).categories["food"]
+        return detector.rebuilds, followed, replayed
+
+    rebuilds, followed, replayed = asyncio.run(scenario())
+    assert rebuilds == 1
+    assert followed.amounts.count == replayed.amounts.count == 6
+    assert abs(followed.amounts.mean - replayed.amounts.mean) < 1e-9
+    assert abs(followed.amounts.std - replayed.amounts.std) < 1e-9
+    assert followed.months == replayed.months
+    assert followed.open_month == "2025-03"
+    assert abs(followed.monthly.mean - replayed.monthly.mean) < 1e-9
+
+
+
+def test_a_cold_family_is_built_in_the_background(repos):
+    async def scenario():
+        for n in range(1, 7):
+            await repos.transactions.insert({**expense(n, f"2025-01-{n:02d}T09:00:00", 40.0), "family_id": "fam-c"})
+        detector = AnomalyDetector()
+        outlier = {**expense(7, "2025-01-07T09:00:00", 400.0), "family_id": "fam-c"}
+        await repos.transactions.insert(outlier)
+        # The insert does not wait for the replay, nor start a second one
+        assert detector.observe(repos, "fam-c", cache.invalidate_family("fam-c"), outlier) == []
+        assert detector.observe(repos, "fam-c", cache.invalidate_family("fam-c"), outlier) == []
+        state = await detector.family(repos, "fam-c")
+        return detector.rebuilds, state
+
+    rebuilds, state = asyncio.run(scenario())
+    assert rebuilds == 1
+    assert state.categories["food"].amounts.count == 7
+    assert [a["transaction_id"] for a in state.recent] == ["t7"]
+
+
+def test_stale_state_is_replayed_after_the_refresh(repos):
+    async def scenario():
+        await repos.transactions.insert({**expense(1, "2025-01-01T09:00:00", 40.0), "family_id": "fam-r"})
+        detector = AnomalyDetector(refresh_seconds=0)
+        first = await detector.family(repos, "fam-r")
+        # Nothing moved since the build: kept, however old
+        assert await detector.family(repos, "fam-r") is first
+        await repos.transactions.insert({**expense(2, "2025-01-02T09:00:00", 45.0), "family_id": "fam-r"})
+        cache.invalidate_family("fam-r")  # a write the detector did not follow, e.g. an import
+        state = await detector.family(repos, "fam-r")
+        return detector.rebuilds, state.categories["food"].amounts.count
+
+    assert asyncio.run(scenario()) == (2, 2)
+
+
+def test_anomalies_endpoint(client, admin_headers):
+    category = client.post("/api/categories", json={"name": "Food", "type": "expense"},
+                           headers=admin_headers).json()
+    for day, amount in enumerate([20, 22, 19, 21, 20, 300], start=1):
+        created = client.post("/api/transactions", headers=admin_headers, json={
+            "amount": amount, "type": "expense", "category_id": category["id"],
+            "date": f"2025-03-{day:02d}T09:00:00",
+        })
+        assert created.status_code == 200
+    result = client.get("/api/dashboard/anomalies", headers=admin_headers).json()
+    assert [(a["kind"], a["amount"], a["category_name"]) for a in result["anomalies"]] == [
+        ("transaction", 300.0, "Food")
+    ]
+    assert result["categories"][0]["transactions"] == 6
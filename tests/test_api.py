@@ -0,0 +1,136 @@
+"""End-to-end API tests against the in-memory repositories."""
+
+
+def create_category(client, headers, name, type, **extra):
+    response = client.post("/api/categories", json={"name": name, "type": type, **extra}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def create_transaction(client, headers, **payload):
+    response = client.post("/api/transactions", json=payload, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_login_and_me(client, admin_headers):
+    response = client.post("/api/auth/login", json={"email": "asha@example.com", "password": "Secret123!"})
+    assert response.status_code == 200
+    me = client.get("/api/auth/me", headers=admin_headers).json()
+    assert me["name"] == "Asha"
+    assert "password_hash" not in me
+
+    bad = client.post("/api/auth/login", json={"email": "asha@example.com", "password": "nope"})
+    assert bad.status_code == 401
+
+
+def test_duplicate_email_rejected(client, register):
+    register()
+    response = client.post("/api/auth/register", json={
+        "name": "Asha", "email": "asha@example.com", "password": "x"
+    })
+    assert response.status_code == 400
+
+
+def test_join_request_flow(client, admin_headers, register):
+    family = client.get("/api/auth/family", headers=admin_headers).json()
+    member_headers = register("Ravi", family_code=family["family_code"].lower())
+
+    status = client.get("/api/auth/my-join-status", headers=member_headers).json()
+    assert status == {"has_pending": True, "family_name": "Asha's Family", "status": "pending"}
+
+    pending = client.get("/api/auth/pending-requests", headers=admin_headers).json()["requests"]
+    assert [r["user_name"] for r in pending] == ["Ravi"]
+
+    response = client.post("/api/auth/approve-request", json={"request_id": pending[0]["id"]}, headers=admin_headers)
+    assert response.status_code == 200
+
+    members = client.get("/api/auth/family", headers=admin_headers).json()["members"]
+    assert sorted(m["name"] for m in members) == ["Asha", "Ravi"]
+    assert client.get("/api/auth/my-join-status", headers=member_headers).json() == {"has_pending": False}
+
+
+def test_members_cannot_delete(client, admin_headers, register):
+    family = client.get("/api/auth/family", headers=admin_headers).json()
+    member_headers = register("Ravi")
+    joined = client.post(f"/api/auth/join-family?family_code={family['family_code']}", headers=member_headers)
+    member_headers = {"Authorization": f"Bearer {joined.json()['access_token']}"}
+    category = create_category(client, admin_headers, "Rent", "expense")
+    assert client.delete(f"/api/categories/{category['id']}", headers=member_headers).status_code == 403
+    assert client.delete(f"/api/categories/{category['id']}", headers=admin_headers).status_code == 200
+
+
+def test_transactions_update_balances_and_stats(client, admin_headers):
+    salary = create_category(client, admin_headers, "Salary", "income")
+    rent = create_category(client, admin_headers, "Rent", "expense", budget_limit=1000)
+    sip = create_category(client, admin_headers, "SIP", "investment", investment_target=500)
+
+    bank = client.post("/api/accounts", json={
+        "name": "Bank", "type": "bank", "opening_balance": 100, "owner_type": "family"
+    }, headers=admin_headers).json()
+    fund = client.post("/api/accounts", json={"name": "Fund", "type": "other"}, headers=admin_headers).json()
+
+    create_transaction(client, admin_headers, amount=5000, type="income", category_id=salary["id"],
+                       account_id=bank["id"], date="2025-03-01T09:00:00")
+    create_transaction(client, admin_headers, amount=800, type="expense", category_id=rent["id"],
+                       account_id=bank["id"], date="2025-03-05T09:00:00")
+    create_transaction(client, admin_headers, amount=300, type="investment", category_id=sip["id"],
+                       account_id=bank["id"], to_account_id=fund["id"], date="2025-03-07T09:00:00")
+    create_transaction(client, admin_headers, amount=50, type="expense", category_id=rent["id"],
+                       date="2025-04-02T09:00:00")
+
+    accounts = {a["name"]: a for a in client.get("/api/accounts", headers=admin_headers).json()}
+    assert accounts["Bank"]["current_balance"] == 100 + 5000 - 800 - 300
+    assert accounts["Fund"]["current_balance"] == 300
+
+    march = client.get("/api/transactions?month=3&year=2025", headers=admin_headers).json()
+    assert [t["amount"] for t in march] == [300, 800, 5000]
+    assert len(client.get("/api/transactions?month=4", headers=admin_headers).json()) == 1
+
+    stats = client.get("/api/dashboard/stats?month=3&year=2025", headers=admin_headers).json()
+    assert stats["total_income"] == 5000
+    assert stats["total_expense"] == 800
+    assert stats["total_investment"] == 300
+    assert stats["expense_by_category"] == {"Rent": 800}
+    assert stats["transaction_count"] == 3
+
+    april = client.get("/api/dashboard/stats?month=4&year=2025", headers=admin_headers).json()
+    assert april["opening_balance"] == 4200
+    assert april["closing_balance"] == 4150
+
+    trend = client.get("/api/dashboard/monthly-trend?year=2025", headers=admin_headers).json()
+    assert trend[2] == {"month": 3, "income": 5000, "expense": 800, "investment": 300, "closing_balance": 4200}
+
+    period = client.get("/api/dashboard/period-stats?period_type=quarterly&quarter=2&year=2025",
+                        headers=admin_headers).json()
+    assert period["total_expense"] == 50
+
+    budget = client.get("/api/budget/status?month=3&year=2025", headers=admin_headers).json()
+    assert budget[0]["spent"] == 800 and budget[0]["status"] == "warning"
+
+    targets = client.get("/api/dashboard/investment-targets?month=3&year=2025", headers=admin_headers).json()
+    assert targets[0]["invested"] == 300 and targets[0]["status"] == "in_progress"
+
+
+def test_update_and_delete_transaction(client, admin_headers):
+    food = create_category(client, admin_headers, "Food", "expense")
+    created = create_transaction(client, admin_headers, amount=20, type="expense",
+                                 category_id=food["id"], date="2025-01-10T12:00:00")
+    payload = {"amount": 25, "type": "expense", "category_id": food["id"], "date": "2025-01-11T12:00:00"}
+    updated = client.put(f"/api/transactions/{created['id']}", json=payload, headers=admin_headers).json()
+    assert updated["amount"] == 25
+    assert client.delete(f"/api/transactions/{created['id']}", headers=admin_headers).status_code == 200
+    assert client.delete(f"/api/transactions/{created['id']}", headers=admin_headers).status_code == 404
+
+
+def test_other_families_accounts_are_rejected(client, admin_headers, register):
+    other = register(name="Ravi")
+    foreign = client.post("/api/accounts", json={"name": "Ravi Bank", "type": "bank"}, headers=other).json()
+    own = client.post("/api/accounts", json={"name": "Cash", "type": "cash"}, headers=admin_headers).json()
+    response = client.post("/api/transactions", headers=admin_headers, json={
+        "amount": 50, "type": "transfer", "account_id": own["id"], "to_account_id": foreign["id"],
+        "date": "2025-01-03T09:00:00",
+    })
+    assert response.status_code == 404
+    balances = {a["id"]: a["current_balance"] for a in client.get("/api/accounts", headers=other).json()}
+    assert balances[foreign["id"]] == 0.0
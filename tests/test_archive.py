@@ -0,0 +1,75 @@
+"""Archival of old transactions into monthly summaries."""
+import asyncio
+from datetime import datetime
+
+from archive import Archiver, cold_rows
+from tests.test_jobs import wait_for
+
+
+def test_stats_unchanged_after_archival(client, admin_headers, repos):
+    food = client.post("/api/categories", json={"name": "Food", "type": "expense"}, headers=admin_headers).json()
+    pay = client.post("/api/categories", json={"name": "Pay", "type": "income"}, headers=admin_headers).json()
+    rows = [
+        (100, "income", pay, "2022-01-01T09:00:00"),
+        (12.5, "expense", food, "2022-01-10T09:00:00"),
+        (7.5, "expense", food, "2022-01-20T09:00:00"),
+        (30, "expense", food, "2022-02-14T09:00:00"),
+        (40, "expense", food, "2023-06-01T09:00:00"),
+    ]
+    for amount, type_, category, date in rows:
+        client.post("/api/transactions", headers=admin_headers, json={
+            "amount": amount, "type": type_, "category_id": category["id"], "date": date,
+        })
+    queries = [
+        "/api/dashboard/period-stats?period_type=annual&year=2022",
+        "/api/dashboard/period-stats?period_type=monthly&month=1&year=2022",
+        "/api/dashboard/period-stats?period_type=custom&start_date=2022-01-15&end_date=2022-02-20",
+        "/api/dashboard/period-stats?period_type=custom&start_date=2022-01-05&end_date=2022-01-15",
+        "/api/dashboard/stats?month=3&year=2022",
+        "/api/dashboard/monthly-trend?year=2022",
+    ]
+    before = [client.get(q, headers=admin_headers).json() for q in queries]
+
+    job = client.post("/api/jobs", json={"type": "archive_transactions", "params": {"before": "2023-01"}},
+                      headers=admin_headers).json()
+    job = wait_for(client, job["id"], admin_headers)
+    assert (job["status"], job["result"]) == ("succeeded", {"cutoff": "2023-01", "archived": 4, "months": 2})
+
+    assert [t["date"][:7] for t in client.get("/api/transactions", headers=admin_headers).json()] == ["2023-06"]
+    assert [client.get(q, headers=admin_headers).json() for q in queries] == before
+    assert before[0]["transaction_count"] == 4 and before[2]["total_expense"] == 37.5
+
+    family_id = repos.transactions.table.find()[0]["family_id"]
+    cold = asyncio.run(cold_rows(repos, family_id, datetime(2022, 1, 1), datetime(2022, 3, 1)))
+    # One row per summary: January's income and expense, February's expense
+    assert sorted((r["date"][:7], r["type"], r["count"]) for r in cold) == [
+        ("2022-01", "expense", 2), ("2022-01", "income", 1), ("2022-02", "expense", 1)
+    ]
+
+
+def test_invalid_cutoff_fails_without_retry(client, admin_headers):
+    job = client.post("/api/jobs", json={"type": "archive_transactions", "params": {"before": "2022-13"}},
+                      headers=admin_headers).json()
+    job = wait_for(client, job["id"], admin_headers)
+    assert (job["status"], job["attempts"]) == ("failed", 1)
+
+
+def test_archiver_is_configured_from_the_environment(repos):
+    archiver = Archiver.from_env({"ARCHIVE_HORIZON_MONTHS": "12", "ARCHIVE_BATCH_SIZE": "2"})
+    assert archiver.default_cutoff(datetime(2024, 3, 15)) == "2023-03"
+    assert Archiver.from_env({}).default_cutoff(datetime(2024, 3, 15)) == "2022-03"
+
+    asyncio.run(repos.transactions.insert_many([
+        {"id": f"t{day}", "family_id": "fam-arch", "amount": 1.0, "type": "expense",
+         "category_id": "c", "date": f"2020-01-{day:02d}T09:00:00"}
+        for day in range(1, 6)
+    ]))
+    reported = []
+
+    async def progress(fraction, message):
+        reported.append((fraction, message))
+
+    result = asyncio.run(archiver.archive_family(repos, "fam-arch", "2021-01", progress))
+    assert result["archived"] == 5
+    assert reported == [(0.4, "2 of 5 transactions archived"), (0.8, "4 of 5 transactions archived"),
+                        (1.0, "5 of 5 transactions archived")]
@@ -0,0 +1,167 @@
+"""Coalesced balance updates and their journal."""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from balances import BalanceCoalescer
+from monitoring import subscribe, unsubscribe
+
+
+def test_posts_share_one_account_write(repos, monkeypatch):
+    import server
+    monkeypatch.setenv("BALANCE_COALESCE_MS", "60000")
+    monkeypatch.setenv("BALANCE_COALESCE_BATCH", "4")
+    app = server.create_app(repositories=repos)
+    commands = []
+    listener = subscribe(lambda event: commands.append((event.collection, event.command)))
+    try:
+        with TestClient(app) as client:
+            response = client.post("/api/auth/register", json={
+                "name": "Asha", "email": "asha@example.com", "password": "Secret123!"
+            })
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            category = client.post("/api/categories", json={"name": "Food", "type": "expense"},
+                                   headers=headers).json()
+            account = client.post("/api/accounts", json={"name": "Cash", "type": "cash", "opening_balance": 100},
+                                  headers=headers).json()
+            commands.clear()
+            for amount in (1, 2, 3, 4):
+                client.post("/api/transactions", headers=headers, json={
+                    "amount": amount, "type": "expense", "category_id": category["id"],
+                    "account_id": account["id"], "date": "2025-01-02T00:00:00",
+                })
+            for _ in range(100):  # the fourth post fills the batch
+                if app.state.balances.flushes:
+                    break
+                time.sleep(0.01)
+            assert client.get("/api/accounts", headers=headers).json()[0]["current_balance"] == 90
+            assert commands.count(("accounts", "update")) == 1
+            assert not any(t.get("balance_pending") for t in repos.transactions.table.rows.values())
+    finally:
+        unsubscribe(listener)
+
+
+def test_recovery_replays_journaled_flushes_once(repos):
+    async def scenario():
+        await repos.accounts.insert({"id": "a1", "family_id": "f", "current_balance": 50.0,
+                                     "applied_flushes": ["done"]})
+        await repos.accounts.insert({"id": "a2", "family_id": "f", "current_balance": 0.0})
+        old = (datetime.utcnow() - timedelta(minutes=5)).isoformat()
+        base = {"family_id": "f", "type": "transfer", "date": old, "created_at": old, "balance_pending": True}
+        await repos.transactions.insert_many([
+            # Crashed after a1 applied flush "done" but before a2 and the journal did
+            {**base, "id": "t1", "amount": 10.0, "account_id": "a1", "to_account_id": "a2", "balance_flush": "done"},
+            # Never flushed
+            {**base, "id": "t2", "type": "income", "amount": 5.0, "account_id": "a1"},
+        ])
+        coalescer = BalanceCoalescer(window=0.05)
+        coalescer.start(repos)
+        assert await coalescer.recover() == 2
+        assert await coalescer.recover() == 0
+        return {a["id"]: a["current_balance"] for a in await repos.accounts.list_by_family("f")}
+
+    assert asyncio.run(scenario()) == {"a1": 55.0, "a2": 10.0}
+
+
+
+def test_a_crashed_flush_is_replayed_once_after_many_others(repos, monkeypatch):
+    async def scenario():
+        await repos.accounts.insert({"id": "a1", "family_id": "f", "current_balance": 0.0})
+        old = (datetime.utcnow() - timedelta(minutes=5)).isoformat()
+
+        def expense(n):
+            return {"id": f"t{n}", "family_id": "f", "type": "expense", "amount": 1.0, "account_id": "a1",
+                    "date": old, "created_at": old}
+
+        coalescer = BalanceCoalescer(recovery_after=0)
+        coalescer.start(repos)
+        crashed = expense(0)
+        coalescer.journal(crashed)
+        await repos.transactions.insert(crashed)
+        update_many = repos.transactions.update_many
+
+        async def unavailable(ids, fields):
+            raise RuntimeError("transactions unavailable")
+
+        # The balance moves, then the worker dies before clearing the journal
+        monkeypatch.setattr(repos.transactions, "update_many", unavailable)
+        with pytest.raises(RuntimeError):
+            await coalescer.post(repos, crashed)
+        monkeypatch.setattr(repos.transactions, "update_many", update_many)
+        for n in range(1, 31):
+            doc = expense(n)
+            coalescer.journal(doc)
+            await repos.transactions.insert(doc)
+            await coalescer.post(repos, doc)
+        assert await coalescer.recover() == 1
+        await coalescer.stop()
+        return await repos.accounts.get("a1")
+
+    account = asyncio.run(scenario())
+    assert account["current_balance"] == -31.0
+    # Only flushes still journaled somewhere keep their id on the account
+    assert len(account["applied_flushes"]) <= 2
+
+
+def test_recompute_leaves_journaled_changes_to_the_flush(repos):
+    from jobs import JobContext, JobWorkers, recompute_balances
+
+    async def scenario():
+        await repos.accounts.insert({"id": "a1", "family_id": "f", "opening_balance": 100.0,
+                                     "current_balance": 100.0})
+        coalescer = BalanceCoalescer(window=60)
+        coalescer.start(repos)
+        try:
+            for i, amount in enumerate((10.0, 5.0)):
+                doc = {"id": f"t{i}", "family_id": "f", "type": "expense", "amount": amount, "account_id": "a1",
+                       "date": "2025-01-02T00:00:00", "created_at": datetime.utcnow().isoformat()}
+                coalescer.journal(doc)
+                await repos.transactions.insert(doc)
+                await coalescer.post(repos, doc)
+            job = await JobWorkers().enqueue(repos, "f", "recompute_balances")
+            now = datetime.utcnow()
+            job = await repos.jobs.claim("w1", now, now + timedelta(seconds=60))
+            assert (await recompute_balances(JobContext(repos, job, "w1", 60)))["corrected"] == 0
+            assert await coalescer.flush() == 2
+        finally:
+            await coalescer.stop()
+        return (await repos.accounts.get("a1"))["current_balance"]
+
+    assert asyncio.run(scenario()) == 85.0
+
+
+def test_recompute_retries_an_account_a_post_moved(repos, monkeypatch):
+    from balances import apply_journaled, journal
+    from jobs import JobContext, JobWorkers, recompute_balances
+
+    async def scenario():
+        # 30 off: the recompute has something to correct
+        await repos.accounts.insert({"id": "a1", "family_id": "f", "opening_balance": 100.0,
+                                     "current_balance": 70.0})
+        list_transactions = repos.transactions.list
+        posts = []
+
+        async def list_after_a_post(*args, **kwargs):
+            if not posts:
+                # Posted and flushed between the recompute's account read and its transaction list
+                doc = {"id": "late", "family_id": "f", "type": "income", "amount": 20.0, "account_id": "a1",
+                       "date": "2025-01-02T00:00:00", "created_at": datetime.utcnow().isoformat()}
+                journal([doc], doc["id"])
+                await repos.transactions.insert(doc)
+                await apply_journaled(repos, doc["id"], [doc])
+                posts.append(doc)
+            return await list_transactions(*args, **kwargs)
+
+        monkeypatch.setattr(repos.transactions, "list", list_after_a_post)
+        await JobWorkers().enqueue(repos, "f", "recompute_balances")
+        now = datetime.utcnow()
+        job = await repos.jobs.claim("w1", now, now + timedelta(seconds=60))
+        result = await recompute_balances(JobContext(repos, job, "w1", 60))
+        return result, (await repos.accounts.get("a1"))["current_balance"]
+
+    result, balance = asyncio.run(scenario())
+    assert result == {"accounts": 1, "corrected": 1, "skipped": 0}
+    assert balance == 120.0
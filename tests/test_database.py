@@ -0,0 +1,44 @@
+from fastapi.testclient import TestClient
+
+import database
+from database import MongoSettings
+
+
+def test_settings_from_env():
+    settings = MongoSettings.from_env({
+        "MONGO_URL": "mongodb://db:27017",
+        "DB_NAME": "tracker",
+        "MONGO_MAX_POOL_SIZE": "50",
+        "MONGO_COMPRESSORS": "zstd, zlib",
+        "MONGO_READ_CONCERN": "majority",
+        "MONGO_WRITE_CONCERN_W": "majority",
+        "MONGO_WRITE_CONCERN_TIMEOUT_MS": "2500",
+        "MONGO_RETRY_WRITES": "false",
+    })
+    kwargs = settings.client_kwargs()
+    assert kwargs["maxPoolSize"] == 50
+    assert kwargs["compressors"] == "zstd,zlib"
+    assert kwargs["retryWrites"] is False
+    assert settings.read_concern_obj().level == "majority"
+    assert settings.write_concern_obj().document == {"w": "majority", "wtimeout": 2500}
+
+
+def test_settings_defaults():
+    settings = MongoSettings.from_env({})
+    assert settings.url == "mongodb://localhost:27017"
+    assert settings.write_concern_obj() is None
+    assert "compressors" not in settings.client_kwargs()
+
+
+def test_lifespan_shares_one_client():
+    import server
+
+    settings = MongoSettings(url="mongodb://localhost:1", db_name="lifespan_test", ensure_indexes=False)
+    app = server.create_app(settings)
+    with TestClient(app):
+        client = database.get_client()
+        assert database.connect() is database.get_db()
+        assert database.get_client() is client
+        assert app.state.repositories.users.collection.database.name == "lifespan_test"
+    assert database._client is None
+    assert app.state.repositories is None
@@ -0,0 +1,94 @@
+"""Spending distribution statistics and endpoint."""
+import asyncio
+from datetime import datetime
+
+import numpy as np
+
+import cache
+import distribution
+from analytics import AnalyticsEngine, TransactionFrame
+from distribution import Distributions
+
+CATEGORIES = [{"id": "food", "name": "Food"}, {"id": "rent", "name": "Rent"}]
+
+
+def rows():
+    rng = np.random.default_rng(7)
+    result = []
+    for i, amount in enumerate(rng.gamma(2.0, 30.0, 200).round(2)):
+        # 2025-03-03 is a Monday
+        result.append({"date": f"2025-03-{3 + i % 7:02d}T{8 + i % 12:02d}:30:00", "amount": float(amount),
+                       "type": "expense", "category_id": "food", "user_id": "u1" if i % 2 else "u2"})
+    result.append({"date": "2025-03-01T00:00:00", "amount": 1200.0, "type": "expense", "category_id": "rent",
+                   "user_id": "u1"})
+    result.append({"date": "2025-03-02T10:00:00", "amount": 5000.0, "type": "income", "category_id": None,
+                   "user_id": "u1"})
+    return result
+
+
+def test_percentiles_match_numpy():
+    data = rows()
+    body = distribution.compute(TransactionFrame.build(data, CATEGORIES), bins=10)
+    food = np.array([r["amount"] for r in data if r["category_id"] == "food"])
+    everything = np.array([r["amount"] for r in data if r["type"] == "expense"])
+    assert body["transactions"] == 201
+    assert [c["category_name"] for c in body["categories"]] == ["Food", "Rent"]
+    by_name = {c["category_name"]: c for c in body["categories"]}
+    for q in distribution.PERCENTILES:
+        assert by_name["Food"][f"p{q}"] == round(float(np.percentile(food, q)), 2)
+        assert body["overall"][f"p{q}"] == round(float(np.percentile(everything, q)), 2)
+    assert by_name["Rent"]["p50"] == by_name["Rent"]["p99"] == 1200.0
+    assert sum(by_name["Food"]["histogram"]["counts"]) == 200
+    assert len(by_name["Food"]["histogram"]["edges"]) == 11
+
+
+def test_time_profiles():
+    body = distribution.compute(TransactionFrame.build(rows(), CATEGORIES), user_id="u1")
+    assert body["transactions"] == 101
+    days = {d["day"]: d["count"] for d in body["day_of_week"]}
+    # Rent fell on a Saturday; food is spread over Monday to Sunday
+    assert days["Saturday"] == 1 + sum(1 for i in range(1, 200, 2) if i % 7 == 5)
+    assert days["Monday"] == sum(1 for i in range(1, 200, 2) if i % 7 == 0)
+    hours = {h["hour"]: h["count"] for h in body["hour_of_day"]}
+    assert hours[0] == 1 and sum(hours.values()) == 101
+
+
+def test_summarized_rows_are_counted_apart():
+    data = rows() + [{"date": "2025-02-01T00:00:00", "amount": 900.0, "type": "expense",
+                      "category_id": "food", "user_id": "u1", "count": 12}]
+    body = distribution.compute(TransactionFrame.build(data, CATEGORIES))
+    assert body["transactions"] == 201
+    assert body["summarized_transactions"] == 12
+
+
+def test_results_are_cached_until_a_write(repos):
+    async def scenario():
+        for t in rows():
+            await repos.transactions.insert({**t, "family_id": "fam-dist"})
+        distributions = Distributions(AnalyticsEngine())
+        start, end = datetime(2025, 3, 1), datetime(2025, 4, 1)
+        first = await distributions.get(repos, "fam-dist", start, end)
+        assert await distributions.get(repos, "fam-dist", start, end) is first
+        cache.invalidate_family("fam-dist")
+        assert await distributions.get(repos, "fam-dist", start, end) is not first
+        return distributions.computed
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_distribution_endpoint(client, admin_headers):
+    category = client.post("/api/categories", json={"name": "Food", "type": "expense"},
+                           headers=admin_headers).json()
+    for amount in (10, 20, 30, 40):
+        client.post("/api/transactions", headers=admin_headers, json={
+            "amount": amount, "type": "expense", "category_id": category["id"], "date": "2025-05-06T12:00:00",
+        })
+    params = {"period_type": "monthly", "month": 5, "year": 2025, "bins": 5}
+    body = client.get("/api/dashboard/distribution", params=params, headers=admin_headers).json()
+    assert body["start_date"] == "2025-05-01T00:00:00"
+    assert body["overall"]["p50"] == 25.0
+    assert body["categories"][0]["category_name"] == "Food"
+    assert {d["day"]: d["count"] for d in body["day_of_week"]}["Tuesday"] == 4
+    assert body["hour_of_day"][12]["total"] == 100.0
+    assert client.get("/api/dashboard/distribution", params={**params, "bins": 0},
+                      headers=admin_headers).status_code == 422
@@ -0,0 +1,93 @@
+"""Event bus and the server-sent event stream."""
+import asyncio
+from datetime import datetime
+
+import events
+
+
+def drain(queue):
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return [(e["type"], e["data"]) for e in items]
+
+
+def test_mutations_publish_family_and_user_events(client, app, admin_headers, register):
+    family = client.get("/api/auth/family", headers=admin_headers).json()
+    family_queue = app.state.events.subscribe([events.family_topic(family["family_id"])])
+
+    member_headers = register("Ravi", family_code=family["family_code"])
+    me = client.get("/api/auth/me", headers=member_headers).json()
+    user_queue = app.state.events.subscribe([events.user_topic(me["id"])])
+    [(kind, request)] = drain(family_queue)
+    assert kind == "join_request.created" and request["user_id"] == me["id"]
+
+    client.post("/api/auth/approve-request", json={"request_id": request["id"]}, headers=admin_headers)
+    assert [kind for kind, _ in drain(family_queue)] == ["join_request.approved"]
+    assert [kind for kind, _ in drain(user_queue)] == ["join_request.approved"]
+
+    category = client.post("/api/categories", json={"name": "Food", "type": "expense", "budget_limit": 100},
+                           headers=admin_headers).json()
+    for amount in (50, 45, 10):
+        client.post("/api/transactions", headers=admin_headers, json={
+            "amount": amount, "type": "expense", "category_id": category["id"], "date": datetime.now().isoformat(),
+        })
+    published = drain(family_queue)
+    assert [kind for kind, _ in published] == [
+        "transaction.created", "transaction.created", "budget.threshold", "transaction.created", "budget.threshold",
+    ]
+    assert [data["level"] for kind, data in published if kind == "budget.threshold"] == [0.9, 1.0]
+
+
+def test_bus_drops_oldest_for_slow_subscribers():
+    bus = events.EventBus(queue_size=2)
+    queue = bus.subscribe(["family:f1"])
+    for i in range(3):
+        bus.publish("family:f1", "tick", {"i": i})
+    bus.publish("family:other", "tick", {"i": 99})
+    assert [data["i"] for _, data in drain(queue)] == [1, 2]
+    bus.unsubscribe(queue)
+    assert bus.subscriber_count("family:f1") == 0
+
+
+def test_stream_relays_events():
+    class ConnectedRequest:
+        async def is_disconnected(self):
+            return False
+
+    async def scenario():
+        bus = events.EventBus()
+        user = {"user_id": "u1", "family_id": "f1", "role": "admin"}
+        response = await events.stream_events(ConnectedRequest(), current_user=user, bus=bus)
+        assert response.media_type == "text/event-stream"
+        chunks = response.body_iterator
+        assert (await chunks.__anext__()).startswith(b"retry: ")
+        bus.publish("family:f1", "transaction.deleted", {"id": "t1"})
+        chunk = await chunks.__anext__()
+        await chunks.aclose()
+        assert bus.subscriber_count("family:f1") == 0
+        return chunk
+
+    assert asyncio.run(scenario()) == b'id: 1\nevent: transaction.deleted\ndata: {"id":"t1"}\n\n'
+
+
+def test_stream_requires_token(client):
+    assert client.get("/api/events/stream").status_code == 401
+
+
+
+def test_stream_takes_only_stream_tokens_in_the_url(client, admin_headers):
+    access_token = admin_headers["Authorization"].split()[1]
+    assert client.get("/api/events/stream", params={"token": access_token}).status_code == 401
+    issued = client.post("/api/events/token", headers=admin_headers).json()
+    assert issued["expires_in"] == events.STREAM_TOKEN_SECONDS
+    # A stream token opens nothing else
+    stream_headers = {"Authorization": f"Bearer {issued['token']}"}
+    assert client.get("/api/auth/me", headers=stream_headers).status_code == 401
+
+    async def scenario():
+        user = await events.get_stream_user(token=issued["token"], credentials=None)
+        me = client.get("/api/auth/me", headers=admin_headers).json()
+        return user["user_id"] == me["id"]
+
+    assert asyncio.run(scenario())
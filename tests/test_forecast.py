@@ -0,0 +1,71 @@
+"""Cash-flow forecast models and endpoint."""
+import asyncio
+from datetime import datetime
+
+import numpy as np
+
+import cache
+import forecast
+from analytics import AnalyticsEngine, TransactionFrame
+from forecast import Forecaster
+
+CATEGORIES = [{"id": "salary", "name": "Salary"}, {"id": "food", "name": "Food"}]
+
+
+def history(months=24):
+    """Flat salary and food spending that grows by 10 a month, with a December spike."""
+    rows = []
+    for step in range(months):
+        year, month = forecast.from_month_index(forecast.month_index(2024, 1) + step)
+        rows.append({"date": f"{year}-{month:02d}-01T09:00:00", "amount": 1000.0, "type": "income",
+                     "category_id": "salary", "user_id": "u1"})
+        rows.append({"date": f"{year}-{month:02d}-15T09:00:00", "type": "expense", "category_id": "food",
+                     "amount": 300.0 + 10 * step + (120.0 if month == 12 else 0.0), "user_id": "u1"})
+    return rows
+
+
+def test_trend_and_season():
+    frame = TransactionFrame.build(history(), CATEGORIES)
+    model = forecast.build_model(frame, forecast.month_index(2026, 1))
+    rows = model.months(12)
+    assert (rows[0]["year"], rows[0]["month"]) == (2026, 1)
+    assert [row["income"] for row in rows] == [1000.0] * 12
+    expenses = np.array([row["expense"] for row in rows])
+    # The December spike stands out over the trend
+    assert expenses[11] - expenses[10] > 100
+    assert np.all(np.diff(expenses[:11]) > 0)
+    assert rows[0]["expense_by_category"]["Food"] == rows[0]["expense"]
+    assert rows[0]["closing_balance"] == round(rows[0]["income"] - rows[0]["expense"], 2)
+
+
+def test_model_is_refit_only_on_new_data(repos):
+    async def scenario():
+        for t in history(6):
+            await repos.transactions.insert({**t, "family_id": "fam-forecast"})
+        forecaster = Forecaster(AnalyticsEngine())
+        now = datetime(2024, 7, 10)
+        first = await forecaster.model(repos, "fam-forecast", now)
+        assert await forecaster.model(repos, "fam-forecast", now) is first
+        cache.invalidate_family("fam-forecast")
+        assert await forecaster.model(repos, "fam-forecast", now) is not first
+        return forecaster.fits
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_forecast_endpoint(client, admin_headers):
+    assert client.get("/api/dashboard/forecast", params={"months": 0}, headers=admin_headers).status_code == 422
+    empty = client.get("/api/dashboard/forecast", params={"months": 3}, headers=admin_headers).json()
+    assert [row["income"] for row in empty["forecast"]] == [0.0, 0.0, 0.0]
+
+    category = client.post("/api/categories", json={"name": "Salary", "type": "income"},
+                           headers=admin_headers).json()
+    now = datetime.now()
+    year, month = (now.year, now.month - 1) if now.month > 1 else (now.year - 1, 12)
+    client.post("/api/transactions", headers=admin_headers, json={
+        "amount": 500, "type": "income", "category_id": category["id"], "date": f"{year}-{month:02d}-02T09:00:00",
+    })
+    result = client.get("/api/dashboard/forecast", params={"months": 2}, headers=admin_headers).json()
+    assert result["history_end"] == f"{year}-{month:02d}"
+    assert [row["income"] for row in result["forecast"]] == [500.0, 500.0]
+    assert result["forecast"][0]["income_by_category"] == {"Salary": 500.0}
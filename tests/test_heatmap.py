@@ -0,0 +1,66 @@
+"""Daily totals for the calendar heatmap."""
+import asyncio
+from datetime import datetime
+
+import cache
+from archive import archive_family
+from heatmap import CalendarHeatmap
+
+
+def test_days_of_the_year(repos):
+    async def scenario():
+        for day, amount, type_, user in [("2024-02-29", 10.0, "expense", "u1"), ("2024-02-29", 5.5, "expense", "u2"),
+                                         ("2024-12-31", 100.0, "income", "u1"), ("2024-06-01", 50.0, "transfer", "u1"),
+                                         ("2025-01-01", 99.0, "expense", "u1")]:
+            await repos.transactions.insert({"family_id": "fam-cal", "date": f"{day}T23:59:00", "amount": amount,
+                                             "type": type_, "user_id": user})
+        heatmap = CalendarHeatmap()
+        family = await heatmap.get(repos, "fam-cal", 2024)
+        member = await heatmap.get(repos, "fam-cal", 2024, "u2")
+        return family, member
+
+    family, member = asyncio.run(scenario())
+    days = {day["date"]: day for day in family["days"]}
+    assert len(family["days"]) == 366
+    assert days["2024-02-29"] == {"date": "2024-02-29", "income": 0.0, "expense": 15.5, "count": 2}
+    assert days["2024-12-31"]["income"] == family["max_income"] == 100.0
+    assert days["2024-06-01"]["count"] == 0
+    assert sum(day["count"] for day in member["days"]) == 1
+
+
+def test_archived_days_and_caching(repos):
+    async def scenario():
+        for day in ("2021-03-04", "2021-03-04", "2021-11-20"):
+            await repos.transactions.insert({"family_id": "fam-cal2", "date": f"{day}T09:00:00", "amount": 20.0,
+                                             "type": "expense", "user_id": "u1"})
+        await archive_family(repos, "fam-cal2", "2021-06")
+        heatmap = CalendarHeatmap()
+        first = await heatmap.get(repos, "fam-cal2", 2021)
+        assert await heatmap.get(repos, "fam-cal2", 2021) is first
+        cache.invalidate_family("fam-cal2")
+        assert await heatmap.get(repos, "fam-cal2", 2021) is not first
+        return first, heatmap.computed
+
+    body, computed = asyncio.run(scenario())
+    days = {day["date"]: day for day in body["days"]}
+    assert days["2021-03-04"]["expense"] == 40.0
+    assert days["2021-11-20"]["expense"] == 20.0
+    assert computed == 2
+
+
+def test_calendar_endpoint(client, admin_headers):
+    category = client.post("/api/categories", json={"name": "Food", "type": "expense"},
+                           headers=admin_headers).json()
+    client.post("/api/transactions", headers=admin_headers, json={
+        "amount": 12, "type": "expense", "category_id": category["id"], "date": "2023-07-14T12:00:00",
+    })
+    body = client.get("/api/dashboard/calendar", params={"year": 2023}, headers=admin_headers).json()
+    assert len(body["days"]) == 365
+    assert body["days"][194] == {"date": "2023-07-14", "income": 0.0, "expense": 12.0, "count": 1}
+    client.post("/api/transactions", headers=admin_headers, json={
+        "amount": 8, "type": "expense", "category_id": category["id"], "date": "2023-07-14T18:00:00",
+    })
+    body = client.get("/api/dashboard/calendar", params={"year": 2023}, headers=admin_headers).json()
+    assert body["days"][194]["expense"] == 20.0
+    current = client.get("/api/dashboard/calendar", headers=admin_headers).json()
+    assert current["year"] == datetime.now().year
@@ -0,0 +1,97 @@
+"""Idempotency-Key replays of POST /api/transactions."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import sync
+from idempotency import fingerprint, record_id
+from models import TransactionCreate
+
+
+def test_retry_replays_the_first_response(app, client, admin_headers, repos):
+    category = client.post("/api/categories", json={"name": "Food", "type": "expense"}, headers=admin_headers).json()
+    account = client.post("/api/accounts", json={"name": "Bank", "type": "bank", "opening_balance": 100},
+                          headers=admin_headers).json()
+    body = {"amount": 25, "type": "expense", "category_id": category["id"], "account_id": account["id"],
+            "date": "2025-03-01T09:00:00"}
+    headers = {**admin_headers, "Idempotency-Key": "k-1"}
+
+    first = client.post("/api/transactions", json=body, headers=headers)
+    second = client.post("/api/transactions", json=body, headers=headers)
+    app.state.idempotency._cache.clear()  # as if the retry reached another worker
+    third = client.post("/api/transactions", json=body, headers=headers)
+
+    assert first.status_code == second.status_code == third.status_code == 200
+    assert first.json() == second.json() == third.json()
+    assert "Idempotent-Replayed" not in first.headers and third.headers["Idempotent-Replayed"] == "true"
+    assert len(client.get("/api/transactions", headers=admin_headers).json()) == 1
+    assert client.get("/api/accounts", headers=admin_headers).json()[0]["current_balance"] == 75
+
+    changed = client.post("/api/transactions", json={**body, "amount": 30}, headers=headers)
+    assert changed.status_code == 422
+    # Without a key every request posts
+    assert client.post("/api/transactions", json=body, headers=admin_headers).json()["id"] != first.json()["id"]
+
+
+def test_failed_request_releases_key_and_in_progress_conflicts(client, admin_headers, repos):
+    headers = {**admin_headers, "Idempotency-Key": "k-2"}
+    missing = {"amount": 5, "type": "expense", "category_id": "nope", "date": "2025-03-01T09:00:00"}
+    assert client.post("/api/transactions", json=missing, headers=headers).status_code == 404
+    assert repos.idempotency.table.rows == {}
+
+    user_id = client.get("/api/auth/me", headers=admin_headers).json()["id"]
+    now = datetime.utcnow()
+    asyncio.run(repos.idempotency.reserve({
+        "id": record_id(user_id, "k-3"), "user_id": user_id, "fingerprint": fingerprint(TransactionCreate(**missing).model_dump_json()), "status": "pending",
+        "locked_until": (now + timedelta(seconds=60)).isoformat(), "expires_at": now + timedelta(hours=1),
+    }))
+    busy = client.post("/api/transactions", json=missing, headers={**admin_headers, "Idempotency-Key": "k-3"})
+    assert busy.status_code == 409
+    other = client.post("/api/transactions", json={**missing, "amount": 6},
+                        headers={**admin_headers, "Idempotency-Key": "k-3"})
+    assert other.status_code == 422
+
+
+def test_retry_after_a_failure_past_the_insert(app, client, admin_headers, repos, monkeypatch):
+    category = client.post("/api/categories", json={"name": "Food", "type": "expense"}, headers=admin_headers).json()
+    account = client.post("/api/accounts", json={"name": "Bank", "type": "bank", "opening_balance": 100},
+                          headers=admin_headers).json()
+    body = {"amount": 25, "type": "expense", "category_id": category["id"], "account_id": account["id"],
+            "date": "2025-03-01T09:00:00"}
+    headers = {**admin_headers, "Idempotency-Key": "k-4"}
+    record = sync.record
+    failures = []
+
+    async def fail_once(repos, family_id, changes):
+        if not failures and any(collection == "transactions" for collection, _, _ in changes):
+            failures.append(family_id)
+            raise RuntimeError("change log unavailable")
+        return await record(repos, family_id, changes)
+
+    monkeypatch.setattr(sync, "record", fail_once)
+    with pytest.raises(RuntimeError):
+        client.post("/api/transactions", json=body, headers=headers)
+    # The key is held, not released, once the transaction exists
+    assert client.post("/api/transactions", json=body, headers=headers).status_code == 409
+
+    for row in repos.idempotency.table.rows.values():  # the first attempt's lock runs out
+        row["locked_until"] = (datetime.utcnow() - timedelta(seconds=1)).isoformat()
+    published = []
+    monkeypatch.setattr(app.state.events, "publish", lambda topic, type, data=None: published.append(type))
+    retry = client.post("/api/transactions", json=body, headers=headers)
+    assert retry.status_code == 200 and retry.headers["Idempotent-Replayed"] == "true"
+    assert len(client.get("/api/transactions", headers=admin_headers).json()) == 1
+    assert client.get("/api/accounts", headers=admin_headers).json()[0]["current_balance"] == 75
+    changes = asyncio.run(repos.changes.since(retry.json()["family_id"], 0))
+    assert ("transactions", retry.json()["id"]) in {(c["collection"], c["doc_id"]) for c in changes}
+    # The steps after the insert run as for a first attempt
+    assert "transaction.created" in published
+
+    # Once the record expired, the key is free for a new request, which posts a new transaction
+    repos.idempotency.table.rows.clear()
+    app.state.idempotency._cache.clear()
+    reused = client.post("/api/transactions", json={**body, "amount": 5}, headers=headers)
+    assert reused.status_code == 200 and "Idempotent-Replayed" not in reused.headers
+    assert reused.json()["id"] != retry.json()["id"]
+    assert client.get("/api/accounts", headers=admin_headers).json()[0]["current_balance"] == 70
@@ -0,0 +1,66 @@
+"""Cross-process cache invalidation bookkeeping."""
+import asyncio
+
+import pytest
+
+import cache
+from invalidation import InvalidationBus
+
+
+def test_own_bumps_are_skipped_and_others_applied():
+    bus = InvalidationBus(mode="poll")
+    me, other = bus.worker_id, "other-worker"
+    cache.on_invalidate(bus._local)
+    try:
+        bus.observe("fam-bus", 4, other)  # first value seen for the family: assume it is news
+        start = cache.family_version("fam-bus")
+
+        cache.invalidate_family("fam-bus")  # a local write, published as one bump
+        assert bus._pending == {"fam-bus": 1}
+        bus._pending.clear()
+        bus._written("fam-bus", 5, 1)  # the publish was acknowledged at version 5
+        assert bus.observe("fam-bus", 5, me) is False  # our own bump coming back
+        assert cache.family_version("fam-bus") == start + 1
+
+        assert bus.observe("fam-bus", 5, me) is False  # seen already (polling re-reads a window)
+        cache.invalidate_family("fam-bus")
+        bus._pending.clear()
+        bus._written("fam-bus", 7, 1)
+        assert bus.observe("fam-bus", 7, me) is True  # ours at 7 after one from another worker at 6
+        assert cache.family_version("fam-bus") == start + 3
+        # Applying a remote bump does not publish it again
+        assert bus._pending == {}
+        assert bus.applied == 2
+    finally:
+        cache.remove_listener(bus._local)
+
+
+def test_a_foreign_bump_is_not_taken_for_an_unpublished_own_one():
+    bus = InvalidationBus(mode="poll")
+    cache.on_invalidate(bus._local)
+    try:
+        bus.observe("fam-race", 1, "other-worker")
+        cache.invalidate_family("fam-race")  # ours, not published yet
+        start = cache.family_version("fam-race")
+        assert bus.observe("fam-race", 2, "other-worker") is True
+        assert cache.family_version("fam-race") == start + 1
+
+        # Seen before its publish was acknowledged: applied, and not counted again afterwards
+        assert bus.observe("fam-race", 3, bus.worker_id) is True
+        bus._written("fam-race", 3, 1)
+        assert bus._own["fam-race"] == set()
+        assert bus.observe("fam-race", 4, "other-worker") is True
+    finally:
+        cache.remove_listener(bus._local)
+
+
+def test_disabled_without_mongo(repos):
+    async def scenario():
+        bus = InvalidationBus()
+        bus.start(repos)
+        assert bus.active_mode is None and bus._tasks == []
+        await bus.stop()
+
+    asyncio.run(scenario())
+    with pytest.raises(ValueError):
+        InvalidationBus(mode="redis")
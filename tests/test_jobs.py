@@ -0,0 +1,147 @@
+"""Background job queue, leases and retries."""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from jobs import JobContext, JobFailed, JobWorkers, import_transactions, job_handler
+
+
+def test_claim_lease_and_retry(repos, monkeypatch):
+    calls = []
+
+    @job_handler("flaky")
+    async def flaky(job):
+        calls.append(job.job["attempts"])
+        await job.progress(0.5, "halfway")
+        if len(calls) < 2:
+            raise RuntimeError("boom")
+        return {"ok": True}
+
+    async def scenario():
+        workers = JobWorkers(backoff_seconds=60)
+        workers.repositories = repos
+        job = await workers.enqueue(repos, "f1", "flaky")
+        assert await workers.run_once("w1")
+        retry = await repos.jobs.get(job["id"])
+        assert (retry["status"], retry["error"]) == ("queued", "boom")
+        # Backing off: nothing is due yet
+        assert not await workers.run_once("w1")
+        repos.jobs.table.update(job["id"], {"run_at": datetime.utcnow().isoformat()})
+        assert await workers.run_once("w2")
+        return await repos.jobs.get(job["id"])
+
+    try:
+        done = asyncio.run(scenario())
+    finally:
+        jobs.HANDLERS.pop("flaky")
+    assert calls == [1, 2]
+    assert (done["status"], done["progress"], done["result"]) == ("succeeded", 1.0, {"ok": True})
+
+
+def test_expired_lease_is_reclaimed(repos):
+    async def scenario():
+        workers = JobWorkers()
+        job = await workers.enqueue(repos, "f1", "recompute_balances")
+        now = datetime.utcnow()
+        assert (await repos.jobs.claim("dead", now, now + timedelta(seconds=1)))["attempts"] == 1
+        assert await repos.jobs.claim("w2", now, now + timedelta(seconds=60)) is None
+        taken = await repos.jobs.claim("w2", now + timedelta(seconds=2), now + timedelta(seconds=60))
+        assert (taken["id"], taken["attempts"]) == (job["id"], 2)
+        # The old worker lost its lease and can no longer write
+        assert not await repos.jobs.update_leased(job["id"], "dead", {"progress": 0.9})
+
+    asyncio.run(scenario())
+
+
+def wait_for(client, job_id, headers):
+    for _ in range(100):
+        job = client.get(f"/api/jobs/{job_id}", headers=headers).json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish: {job}")
+
+
+def test_jobs_endpoints(client, admin_headers, register):
+    category = client.post("/api/categories", json={"name": "Salary", "type": "income"},
+                           headers=admin_headers).json()
+    account = client.post("/api/accounts", json={"name": "Bank", "type": "bank", "opening_balance": 10},
+                          headers=admin_headers).json()
+    rows = [{"amount": 100, "type": "income", "category_id": category["id"], "account_id": account["id"],
+             "date": f"2025-0{month}-01T09:00:00"} for month in range(1, 4)]
+
+    assert client.post("/api/jobs", json={"type": "nope"}, headers=admin_headers).status_code == 400
+    created = client.post("/api/jobs", json={"type": "import_transactions", "params": {"transactions": rows}},
+                          headers=admin_headers)
+    assert created.status_code == 202
+    job = wait_for(client, created.json()["id"], admin_headers)
+    assert (job["status"], job["result"]) == ("succeeded", {"rows": 3, "inserted": 3})
+    assert len(client.get("/api/transactions", headers=admin_headers).json()) == 3
+    assert client.get("/api/accounts", headers=admin_headers).json()[0]["current_balance"] == 310
+
+    job = client.post("/api/jobs", json={"type": "rebuild_carryovers"}, headers=admin_headers).json()
+    job = wait_for(client, job["id"], admin_headers)
+    assert job["status"] == "succeeded" and job["result"]["closing_balance"] == 300
+
+    bad = client.post("/api/jobs", json={"type": "import_transactions", "params": {"transactions": [{"amount": 1}]}},
+                      headers=admin_headers).json()
+    bad = wait_for(client, bad["id"], admin_headers)
+    assert (bad["status"], bad["attempts"]) == ("failed", 1) and bad["error"].startswith("Row 0")
+    assert [j["type"] for j in client.get("/api/jobs", headers=admin_headers).json()][-1] == "import_transactions"
+
+    outsider = register("Ravi")
+    assert client.get(f"/api/jobs/{job['id']}", headers=outsider).status_code == 404
+
+
+def test_import_retry_applies_balances_once(repos, monkeypatch):
+    async def scenario():
+        await repos.accounts.insert({"id": "acc", "family_id": "f1", "current_balance": 0.0})
+        await repos.categories.insert({"id": "c", "family_id": "f1", "name": "Salary", "type": "income"})
+        rows = [{"amount": 10.0 * (n + 1), "type": "income", "category_id": "c", "account_id": "acc",
+                 "date": "2025-01-01T09:00:00"} for n in range(3)]
+        await JobWorkers().enqueue(repos, "f1", "import_transactions", {"transactions": rows})
+        now = datetime.utcnow()
+        context = JobContext(repos, await repos.jobs.claim("w1", now, now + timedelta(seconds=60)), "w1", 60)
+        adjust = repos.accounts.adjust_balances
+
+        async def unavailable(deltas, flush_id=None):
+            raise RuntimeError("accounts unavailable")
+
+        monkeypatch.setattr(repos.accounts, "adjust_balances", unavailable)
+        with pytest.raises(RuntimeError):
+            await import_transactions(context)
+        monkeypatch.setattr(repos.accounts, "adjust_balances", adjust)
+        # The retry finds every row inserted, and applies their journaled change once
+        assert (await import_transactions(context))["inserted"] == 0
+        assert (await import_transactions(context))["inserted"] == 0
+        return (await repos.accounts.get("acc"))["current_balance"]
+
+    assert asyncio.run(scenario()) == 60.0
+
+
+def test_import_rejects_rows_outside_the_family(repos):
+    async def scenario():
+        await repos.accounts.insert({"id": "own", "family_id": "f1", "current_balance": 0.0})
+        await repos.accounts.insert({"id": "foreign", "family_id": "f2", "current_balance": 0.0})
+        await repos.categories.insert({"id": "c", "family_id": "f1", "name": "Salary", "type": "income"})
+        rows = [
+            {"amount": 10.0, "type": "income", "category_id": "c", "account_id": "own", "date": "2025-01-01"},
+            {"amount": 99.0, "type": "transfer", "account_id": "own", "to_account_id": "foreign",
+             "date": "2025-01-02"},
+        ]
+        failures = []
+        for bad in (rows, [rows[0], {**rows[0], "category_id": None}]):
+            await JobWorkers().enqueue(repos, "f1", "import_transactions", {"transactions": bad})
+            now = datetime.utcnow()
+            context = JobContext(repos, await repos.jobs.claim("w1", now, now + timedelta(seconds=60)), "w1", 60)
+            with pytest.raises(JobFailed) as failed:
+                await import_transactions(context)
+            failures.append(str(failed.value))
+        return failures, (await repos.accounts.get("foreign"))["current_balance"]
+
+    failures, foreign_balance = asyncio.run(scenario())
+    assert failures == ["Row 1: Account not found", "Row 1: Category required for this transaction type"]
+    assert foreign_balance == 0.0
@@ -0,0 +1,44 @@
+"""Prometheus metrics endpoint and registry."""
+import metrics
+
+
+def sample(text, name, **labels):
+    """Value of the sample ``name{labels}`` in an exposition, or 0 if absent."""
+    wanted = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    prefix = f"{name}{{{wanted}}} " if labels else f"{name} "
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return 0.0
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.register(metrics.Histogram("demo_seconds", "Demo.", ("op",), (0.1, 1.0)))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, op='say "hi"')
+
+    text = registry.render()
+    assert "# TYPE demo_seconds histogram" in text
+    assert sample(text, "demo_seconds_bucket", op='say \\"hi\\"', le="0.1") == 1
+    assert sample(text, "demo_seconds_bucket", op='say \\"hi\\"', le="1.0") == 2
+    assert sample(text, "demo_seconds_bucket", op='say \\"hi\\"', le="+Inf") == 3
+    assert sample(text, "demo_seconds_count", op='say \\"hi\\"') == 3
+
+
+def test_metrics_endpoint_reports_routes_and_db_commands(client, admin_headers):
+    labels = dict(method="DELETE", route="/api/transactions/{transaction_id}", status="404")
+    before = sample(client.get("/metrics").text, "http_request_duration_seconds_count", **labels)
+
+    client.delete("/api/transactions/missing-1", headers=admin_headers)
+    client.delete("/api/transactions/missing-2", headers=admin_headers)
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert sample(text, "http_request_duration_seconds_count", **labels) == before + 2
+    assert sample(text, "http_requests_in_progress", method="GET", route="/metrics") == 1
+    assert sample(text, "http_response_size_bytes_count", method="DELETE",
+                  route="/api/transactions/{transaction_id}") >= 2
+    assert sample(text, "mongodb_command_duration_seconds_count", collection="transactions", command="find") >= 2
+    assert "/api/transactions/missing-1" not in text
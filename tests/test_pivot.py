@@ -0,0 +1,123 @@
+"""Pivot query compiler, the in-memory pipeline evaluator and the query endpoint."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from archive import archive_family
+from models import PivotQuery
+from pivot import PivotEngine, compile_pipeline, normalize
+
+ROWS = [
+    ("2024-05-15T09:00:00", 10.0, "expense", "food", "u1"),
+    ("2024-05-20T09:00:00", 30.0, "expense", "food", "u2"),
+    ("2024-06-01T09:00:00", 25.0, "expense", "rent", "u1"),
+    ("2024-12-30T09:00:00", 5.0, "expense", "food", "u1"),
+    ("2024-06-03T09:00:00", 1000.0, "income", None, "u1"),
+]
+
+
+async def insert_rows(repos, family_id):
+    for date, amount, type_, category, user in ROWS:
+        await repos.transactions.insert({"family_id": family_id, "date": date, "amount": amount, "type": type_,
+                                         "category_id": category, "user_id": user})
+
+
+def test_pipeline_leads_with_the_indexed_match():
+    query = normalize(PivotQuery(dimensions=["category", "month"], filters={
+        "start_date": "2024-01-01T00:00:00Z", "end_date": "2025-01-01", "types": ["expense", "expense"],
+    }))
+    pipeline = compile_pipeline("fam", query, limit=10)
+    assert pipeline[0] == {"$match": {
+        "family_id": "fam", "date": {"$gte": "2024-01-01T00:00:00", "$lt": "2025-01-01T00:00:00"},
+        "type": {"$in": ["expense"]},
+    }}
+    assert list(pipeline[1]["$group"]["_id"]) == ["category", "month"]
+    assert pipeline[-1] == {"$limit": 11}
+
+
+def test_equivalent_queries_normalize_alike():
+    a = PivotQuery(measures=["avg", "sum"], filters={"user_ids": ["u2", "u1"]})
+    b = PivotQuery(measures=["sum", "avg", "sum"], filters={"user_ids": ["u1", "u2", "u1"]})
+    assert normalize(a) == normalize(b)
+
+
+def test_date_dimensions(repos):
+    async def scenario():
+        await insert_rows(repos, "fam-pivot")
+        engine = PivotEngine()
+        query = PivotQuery(measures=["sum", "count"], dimensions=["quarter", "week"], filters={"types": ["expense"]})
+        return await engine.run(repos, "fam-pivot", query)
+
+    rows = asyncio.run(scenario())["rows"]
+    assert [(r["quarter"], r["week"], r["sum"], r["count"]) for r in rows] == [
+        ("2024-Q2", "2024-W20", 10.0, 1),
+        ("2024-Q2", "2024-W21", 30.0, 1),
+        ("2024-Q2", "2024-W22", 25.0, 1),
+        ("2024-Q4", "2025-W01", 5.0, 1),
+    ]
+
+
+def test_result_size_guard(repos):
+    async def scenario():
+        await insert_rows(repos, "fam-guard")
+        engine = PivotEngine(max_groups=3)
+        await engine.run(repos, "fam-guard", PivotQuery(dimensions=["type"]))
+        await engine.run(repos, "fam-guard", PivotQuery(dimensions=["day"]))
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(scenario())
+    assert raised.value.status_code == 422
+
+
+def test_archived_rows_are_merged(repos):
+    async def scenario():
+        await insert_rows(repos, "fam-cold")
+        engine = PivotEngine()
+        query = PivotQuery(measures=["sum", "count", "avg"], dimensions=["category"], filters={"types": ["expense"]})
+        before = await engine.run(repos, "fam-cold", query)
+        await archive_family(repos, "fam-cold", "2024-06")
+        assert len(await repos.transactions.list("fam-cold", type="expense")) == 2
+        after = await engine.run(repos, "fam-cold", query)
+        return before, after, engine.computed
+
+    before, after, computed = asyncio.run(scenario())
+    assert computed == 2
+    assert after == before
+    assert after["rows"][0] == {"category": "food", "sum": 45.0, "count": 3, "avg": 15.0, "category_name": None}
+
+
+def test_query_endpoint(client, admin_headers):
+    food = client.post("/api/categories", json={"name": "Food", "type": "expense"}, headers=admin_headers).json()
+    for amount, date in [(10, "2024-01-05T09:00:00"), (20, "2024-01-25T09:00:00"), (40, "2024-02-02T09:00:00")]:
+        client.post("/api/transactions", headers=admin_headers, json={
+            "amount": amount, "type": "expense", "category_id": food["id"], "date": date,
+        })
+    query = {"measures": ["sum", "avg"], "dimensions": ["category", "month"]}
+    body = client.post("/api/analytics/query", json=query, headers=admin_headers).json()
+    assert body["rows"] == [
+        {"category": food["id"], "month": "2024-01", "sum": 30.0, "avg": 15.0, "category_name": "Food"},
+        {"category": food["id"], "month": "2024-02", "sum": 40.0, "avg": 40.0, "category_name": "Food"},
+    ]
+    client.post("/api/transactions", headers=admin_headers, json={
+        "amount": 5, "type": "expense", "category_id": food["id"], "date": "2024-02-10T09:00:00",
+    })
+    body = client.post("/api/analytics/query", json=query, headers=admin_headers).json()
+    assert body["rows"][1]["sum"] == 45.0
+    bad = client.post("/api/analytics/query", json={"dimensions": ["colour"]}, headers=admin_headers)
+    assert bad.status_code == 422
+
+
+def test_account_labels_follow_account_changes(client, admin_headers):
+    food = client.post("/api/categories", json={"name": "Food", "type": "expense"}, headers=admin_headers).json()
+    account = client.post("/api/accounts", json={"name": "Zeta Bank", "type": "bank"}, headers=admin_headers).json()
+    client.post("/api/transactions", headers=admin_headers, json={
+        "amount": 15, "type": "expense", "category_id": food["id"], "account_id": account["id"],
+        "date": "2025-01-03T09:00:00",
+    })
+    query = {"dimensions": ["account"]}
+    rows = client.post("/api/analytics/query", json=query, headers=admin_headers).json()["rows"]
+    assert rows[0]["account_name"] == "Zeta Bank"
+    client.delete(f"/api/accounts/{account['id']}", headers=admin_headers)
+    rows = client.post("/api/analytics/query", json=query, headers=admin_headers).json()["rows"]
+    assert rows[0]["account_name"] is None
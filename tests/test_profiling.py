@@ -0,0 +1,43 @@
+"""Per-request profiling hook."""
+import json
+import os
+
+
+def test_admin_gets_inline_profile(client, admin_headers):
+    client.post("/api/categories", json={"name": "Food", "type": "expense"}, headers=admin_headers)
+
+    response = client.get("/api/categories?profile=inline", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers["x-profiled-status"] == "200"
+    report = response.json()
+    assert report["request"]["path"] == "/api/categories"
+    assert report["db"]["commands"][0]["collection"] == "categories"
+    assert report["db"]["commands"][0]["n_returned"] == 1
+    assert report["memory"]["peak_bytes"] > 0
+    assert any("get_categories" in row["function"] for row in report["functions"])
+
+
+def test_saved_profile_keeps_response(client, admin_headers, tmp_path):
+    middleware = client.app.middleware_stack
+    while not hasattr(middleware, "directory"):
+        middleware = middleware.app
+    middleware.directory = str(tmp_path)
+
+    response = client.get("/api/accounts", headers={**admin_headers, "X-Profile": "save"})
+    assert response.json() == []
+    path = response.headers["x-profile-report"]
+    assert os.path.dirname(path) == str(tmp_path)
+    with open(path) as fh:
+        assert json.load(fh)["request"]["path"] == "/api/accounts"
+    assert os.path.exists(path.replace(".json", ".prof"))
+
+
+def test_profile_flag_ignored_for_members(client, admin_headers):
+    from auth import create_access_token
+
+    me = client.get("/api/auth/me", headers=admin_headers).json()
+    token = create_access_token({"sub": me["id"], "family_id": "f1", "role": "member"})
+
+    response = client.get("/api/auth/me?profile=inline", headers={"Authorization": f"Bearer {token}"})
+    assert "x-profiled-status" not in response.headers
+    assert response.json()["name"] == "Asha"
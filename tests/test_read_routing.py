@@ -0,0 +1,86 @@
+"""Read preference routing of the dashboard and budget routes."""
+import asyncio
+import os
+import uuid
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import cache
+from read_routing import ReadRouting, parse_preference
+from repositories import MotorRepositories
+
+
+def test_preferences_from_env():
+    routing = ReadRouting.from_env({
+        "ANALYTICS_READ_PREFERENCE": "secondaryPreferred",
+        "ANALYTICS_MAX_STALENESS_SECONDS": "120",
+        "ANALYTICS_READ_PREFERENCE_BUDGET": "primary",
+    })
+    assert routing.preferences == {"dashboard": ("secondaryPreferred", 120), "budget": ("primary", None)}
+    assert ReadRouting.from_env({}).preferences["dashboard"] == ("primary", None)
+    assert parse_preference("nearest:300") == ("nearest", 300)
+    for bad in ("secondary:30", "fastest"):
+        with pytest.raises(ValueError):
+            parse_preference(bad)
+
+
+def test_views_and_pinning_after_writes(repos):
+    async def scenario():
+        primary = MotorRepositories(AsyncIOMotorClient("mongodb://localhost:27017", connect=False).tracker)
+        routing = ReadRouting({"dashboard": ("secondaryPreferred", 90)})
+        routing.start()
+        try:
+            view = routing.repositories(primary, "dashboard", "fam-r")
+            preference = view.transactions.collection.read_preference
+            assert preference.mongos_mode == "secondaryPreferred" and preference.max_staleness == 90
+            assert routing.repositories(primary, "dashboard", "fam-r") is view
+            assert routing.repositories(primary, "budget", "fam-r") is primary
+
+            cache.invalidate_family("fam-r")
+            assert routing.repositories(primary, "dashboard", "fam-r") is primary
+            assert routing.repositories(primary, "dashboard", "fam-other") is view
+            assert routing.pinned == 1
+            # The in-memory backend has no replicas
+            assert routing.repositories(repos, "dashboard", "fam-x") is repos
+        finally:
+            routing.stop()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.skipif(not os.environ.get("MONGO_REPLICA_SET_URL"), reason="needs MONGO_REPLICA_SET_URL")
+def test_dashboard_reads_from_a_secondary(monkeypatch):
+    """Against a local three-member replica set, e.g. mongodb://localhost:27017/?replicaSet=rs0."""
+    from fastapi.testclient import TestClient
+    from database import MongoSettings
+    import database
+    import server
+
+    monkeypatch.setenv("ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+    settings = MongoSettings(url=os.environ["MONGO_REPLICA_SET_URL"], db_name=f"read_routing_{uuid.uuid4().hex[:8]}")
+    app = server.create_app(mongo_settings=settings)
+    with TestClient(app) as client:
+        try:
+            response = client.post("/api/auth/register", json={
+                "name": "Asha", "email": "asha@example.com", "password": "Secret123!"
+            })
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            routing = app.state.read_routing
+            assert client.get("/api/dashboard/stats", headers=headers).status_code == 200
+            assert routing.pinned == 0  # nothing written to the family yet
+
+            category = client.post("/api/categories", headers=headers, json={
+                "name": "Food", "type": "expense", "is_shared": True
+            }).json()
+            created = client.post("/api/transactions", headers=headers, json={
+                "amount": 10, "type": "expense", "category_id": category["id"],
+                "description": "x", "date": "2024-01-05T00:00:00",
+            })
+            assert created.status_code == 200, created.text
+            stats = client.get("/api/dashboard/stats?month=1&year=2024", headers=headers)
+            # Pinned to the primary right after the write, so the new transaction is counted
+            assert routing.pinned >= 1
+            assert stats.json()["total_expense"] == 10
+        finally:
+            client.portal.call(database.get_client().drop_database, settings.db_name)
@@ -0,0 +1,119 @@
+"""Recurring transaction schedules and the materialization scheduler."""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from balances import BalanceCoalescer
+from monitoring import subscribe, unsubscribe
+from recurring import CronSchedule, RecurringScheduler, first_run
+
+
+def test_cron_schedule():
+    monthly = CronSchedule.parse("0 9 1 * *")
+    assert monthly.next_at_or_after(datetime(2025, 1, 1, 9, 0)) == datetime(2025, 1, 1, 9, 0)
+    assert monthly.next_after(datetime(2025, 1, 1, 9, 0)) == datetime(2025, 2, 1, 9, 0)
+    weekdays = CronSchedule.parse("30 8 * * 1-5")
+    assert weekdays.next_after(datetime(2025, 3, 7, 9, 0)) == datetime(2025, 3, 10, 8, 30)  # Friday -> Monday
+    assert CronSchedule.parse("@yearly").next_after(datetime(2025, 6, 1)) == datetime(2026, 1, 1)
+    assert CronSchedule.parse("0 0 29 2 *").next_after(datetime(2025, 1, 1)) == datetime(2028, 2, 29)
+    # Both day fields restricted: either matches
+    assert CronSchedule.parse("0 0 15 * 0").next_after(datetime(2025, 3, 10)) == datetime(2025, 3, 15)
+    assert first_run("0 0 1 * *", datetime(2025, 1, 2), end=datetime(2025, 1, 31)) is None
+    for bad in ("0 9 * *", "61 * * * *", "* * 0 * *", "a * * * *", "*/0 * * * *"):
+        with pytest.raises(ValueError):
+            CronSchedule.parse(bad)
+
+
+def template(template_id, family_id, **fields):
+    return {
+        "id": template_id, "family_id": family_id, "user_id": "u1", "amount": 100.0, "type": "expense",
+        "category_id": "rent", "account_id": "acc", "schedule": "0 0 1 * *", "start_date": "2025-01-01T00:00:00",
+        "end_date": None, "next_run": "2025-01-01T00:00:00", "active": True, **fields,
+    }
+
+
+def test_scheduler_batches_and_is_idempotent(repos):
+    commands = []
+    listener = subscribe(lambda event: commands.append((event.collection, event.command)))
+
+    async def scenario():
+        await repos.accounts.insert({"id": "acc", "family_id": "f1", "current_balance": 0.0})
+        for n in range(5):
+            await repos.recurring.insert(template(f"t{n}", f"f{n % 2}"))
+        await repos.recurring.insert(template("salary", "f1", type="income", amount=1000.0, end_date="2025-02-15"))
+        scheduler = RecurringScheduler(batch_size=4)
+        scheduler.repositories = repos
+        commands.clear()
+        posted = await scheduler.run_once(datetime(2025, 3, 20))
+        # Two batches, five commands each (clearing the balance journal is the fifth),
+        # however many templates and occurrences
+        batch_commands = [c for c in commands if c[0] in ("recurring_transactions", "transactions")
+                          or c == ("accounts", "update")]
+        assert len(batch_commands) == 10
+        # Pretend the templates were never advanced (a crash before the last step): nothing is re-posted
+        for n in range(5):
+            await repos.recurring.set_next_runs({f"t{n}": datetime(2025, 1, 1)})
+        reposted = await scheduler.run_once(datetime(2025, 3, 20))
+        return posted, reposted
+
+    try:
+        posted, reposted = asyncio.run(scenario())
+    finally:
+        unsubscribe(listener)
+    assert (posted, reposted) == (5 * 3 + 2, 0)
+    account = asyncio.run(repos.accounts.get("acc"))
+    assert account["current_balance"] == 2 * 1000.0 - 5 * 3 * 100.0
+    salary = asyncio.run(repos.recurring.get("salary"))
+    assert salary["active"] is False and salary["next_run"] is None
+    assert asyncio.run(repos.recurring.get("t0"))["next_run"] == "2025-04-01T00:00:00"
+
+
+def test_balances_of_a_failed_batch_are_recovered(repos, monkeypatch):
+    async def scenario():
+        await repos.accounts.insert({"id": "acc", "family_id": "f1", "current_balance": 0.0})
+        await repos.recurring.insert(template("t0", "f1"))
+        scheduler = RecurringScheduler()
+        scheduler.repositories = repos
+
+        async def unavailable(deltas, flush_id=None):
+            raise RuntimeError("accounts unavailable")
+
+        with monkeypatch.context() as patch:
+            patch.setattr(repos.accounts, "adjust_balances", unavailable)
+            with pytest.raises(RuntimeError):
+                await scheduler.run_once(datetime(2025, 3, 20))
+        # The rows are posted; the next run skips them as duplicates, the journal still holds their change
+        assert await scheduler.run_once(datetime(2025, 3, 20)) == 0
+        coalescer = BalanceCoalescer(recovery_after=0)
+        coalescer.start(repos)
+        assert await coalescer.recover() == 3
+        assert await coalescer.recover() == 0
+        await coalescer.stop()
+        return (await repos.accounts.get("acc"))["current_balance"]
+
+    assert asyncio.run(scenario()) == -300.0
+
+
+def test_recurring_endpoints(client, app, admin_headers):
+    category = client.post("/api/categories", json={"name": "Rent", "type": "expense"},
+                           headers=admin_headers).json()
+    payload = {"amount": 900, "type": "expense", "category_id": category["id"], "schedule": "0 9 1 * *",
+               "start_date": "2025-01-01T00:00:00", "description": "Rent"}
+    assert client.post("/api/recurring", json={**payload, "schedule": "every day"},
+                       headers=admin_headers).status_code == 400
+    created = client.post("/api/recurring", json=payload, headers=admin_headers)
+    assert created.status_code == 200, created.text
+    assert created.json()["next_run"] == "2025-01-01T09:00:00"
+
+    posted = client.portal.call(app.state.recurring.run_once, datetime(2025, 2, 10))
+    assert posted == 2
+    transactions = client.get("/api/transactions", params={"year": 2025}, headers=admin_headers).json()
+    assert [t["date"] for t in transactions] == ["2025-02-01T09:00:00", "2025-01-01T09:00:00"]
+    assert {t["recurring_id"] for t in transactions} == {created.json()["id"]}
+
+    templates = client.get("/api/recurring", headers=admin_headers).json()
+    assert templates[0]["next_run"] == "2025-03-01T09:00:00"
+    template_id = templates[0]["id"]
+    assert client.delete(f"/api/recurring/{template_id}", headers=admin_headers).status_code == 200
+    assert client.get("/api/recurring", headers=admin_headers).json() == []
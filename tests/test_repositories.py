@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from repositories import InMemoryRepositories
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_transaction_date_range_and_copies():
+    repos = InMemoryRepositories()
+    for day, amount in [(1, 10), (15, 20), (31, 30)]:
+        run(repos.transactions.insert({
+            "id": f"t{day}", "family_id": "f1", "type": "expense", "amount": amount,
+            "category_id": "c1", "date": datetime(2025, 1, day, 8).isoformat(),
+        }))
+    run(repos.transactions.insert({
+        "id": "t-next", "family_id": "f1", "type": "expense", "amount": 5,
+        "category_id": "c1", "date": "2025-02-01T00:00:00+00:00",
+    }))
+
+    january = run(repos.transactions.list("f1", start=datetime(2025, 1, 1), end=datetime(2025, 2, 1)))
+    assert [t["id"] for t in january] == ["t1", "t15", "t31"]
+
+    january[0]["amount"] = 999
+    assert run(repos.transactions.get("t1"))["amount"] == 10
+
+    by_category = run(repos.transactions.list_by_category("c1", "expense", start=datetime(2025, 2, 1)))
+    assert [t["id"] for t in by_category] == ["t-next"]
+
+
+def test_indexes_follow_updates_and_deletes():
+    repos = InMemoryRepositories()
+    run(repos.users.insert({"id": "u1", "email": "a@example.com", "name": "A"}))
+    with pytest.raises(DuplicateKeyError):
+        run(repos.users.insert({"id": "u2", "email": "a@example.com", "name": "B"}))
+
+    run(repos.users.update("u1", {"email": "b@example.com"}))
+    assert run(repos.users.get_by_email("a@example.com")) is None
+    assert run(repos.users.get_by_email("b@example.com"))["id"] == "u1"
+
+    run(repos.members.insert({"id": "m1", "family_id": "f1", "user_id": "u1", "role": "admin"}))
+    assert run(repos.members.remove("f2", "u1")) == 0
+    assert run(repos.members.remove("f1", "u1")) == 1
+    assert run(repos.members.list_by_family("f1")) == []
+
+
+def test_balances_are_scoped_by_user():
+    repos = InMemoryRepositories()
+    run(repos.balances.upsert("f1", 3, 2025, None, {"closing_balance": 100}))
+    run(repos.balances.upsert("f1", 3, 2025, "u1", {"closing_balance": 40}))
+    run(repos.balances.upsert("f1", 3, 2025, None, {"closing_balance": 120}))
+    assert run(repos.balances.get("f1", 3, 2025))["closing_balance"] == 120
+    assert run(repos.balances.get("f1", 3, 2025, "u1"))["closing_balance"] == 40
+
+
+def test_memory_tables_publish_command_events():
+    import monitoring
+
+    events = []
+    listener = monitoring.subscribe(events.append)
+    try:
+        repos = InMemoryRepositories()
+        run(repos.transactions.insert({"id": "t1", "family_id": "f1", "type": "expense", "date": "2025-01-02"}))
+        run(repos.transactions.list("f1", type="expense"))
+    finally:
+        monitoring.unsubscribe(listener)
+
+    assert [(e.collection, e.command) for e in events] == [("transactions", "insert"), ("transactions", "find")]
+    assert events[1].n_returned == 1
+    assert events[1].filter == {"family_id": "f1", "type": "expense"}
@@ -0,0 +1,62 @@
+"""Fast list serialization."""
+from models import Category
+from responses import model_rows
+
+
+def test_model_rows_projects_and_fills_defaults():
+    row = {"id": "c1", "name": "Food", "type": "expense", "family_id": "f1",
+           "created_at": "2025-01-01T00:00:00", "_legacy": True}
+    [item] = model_rows([row], Category)
+    assert list(item) == list(Category.model_fields)
+    assert item["color"] == "#3B82F6" and item["is_shared"] is True
+    assert "_legacy" not in item
+    assert item["created_at"] == "2025-01-01T00:00:00"
+
+
+def test_list_endpoints_match_model_serialization(client, admin_headers):
+    created = client.post("/api/categories", json={"name": "Food", "type": "expense", "budget_limit": 500},
+                          headers=admin_headers).json()
+    listed = client.get("/api/categories", headers=admin_headers).json()
+    assert listed == [created]
+
+
+def test_columnar_and_msgpack_encodings(client, admin_headers):
+    import msgpack
+    from responses import COLUMNAR_JSON, COLUMNAR_MSGPACK
+
+    category = client.post("/api/categories", json={"name": "Salary", "type": "income"},
+                           headers=admin_headers).json()
+    for amount in (10, 20, 30):
+        response = client.post("/api/transactions", headers=admin_headers, json={
+            "amount": amount, "type": "income", "category_id": category["id"],
+            "date": f"2025-03-0{amount // 10}T09:00:00",
+        })
+        assert response.status_code == 200
+    rows = client.get("/api/transactions", headers=admin_headers).json()
+
+    response = client.get("/api/transactions", headers={**admin_headers, "Accept": COLUMNAR_JSON})
+    assert response.headers["content-type"] == COLUMNAR_JSON
+    assert response.headers["vary"] == "Accept"
+    table = response.json()
+    assert table["count"] == 3
+    assert table["columns"]["amount"] == [row["amount"] for row in rows]
+    assert table["dictionaries"]["user_name"] == ["Asha"]
+    assert table["columns"]["user_name"] == [0, 0, 0]
+    assert "id" not in table["dictionaries"]
+
+    accept = f"application/json;q=0.5, {COLUMNAR_MSGPACK}"
+    response = client.get("/api/transactions", headers={**admin_headers, "Accept": accept})
+    assert msgpack.unpackb(response.content) == table
+    response = client.get("/api/transactions", headers={**admin_headers, "Accept": "application/x-msgpack"})
+    assert msgpack.unpackb(response.content) == rows
+
+
+def test_large_responses_are_gzipped(client, admin_headers):
+    for i in range(20):
+        client.post("/api/categories", json={"name": f"Category {i}", "type": "expense"}, headers=admin_headers)
+    response = client.get("/api/categories", headers={**admin_headers, "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 20
+
+    small = client.get("/api/accounts", headers={**admin_headers, "Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
@@ -0,0 +1,69 @@
+"""Transaction search index and endpoint."""
+from search import FamilyIndex
+
+
+def test_ranking_and_prefixes():
+    index = FamilyIndex(0, {"c1": "Utilities"}, {"a1": "HDFC Savings"})
+    index.add({"id": "t1", "date": "2025-01-05", "description": "Electricity bill", "category_id": "c1"})
+    index.add({"id": "t2", "date": "2025-02-05", "description": "Electricity bill electricity", "category_id": "c1"})
+    index.add({"id": "t3", "date": "2025-03-05", "description": "Water bill", "account_id": "a1"})
+    assert [key[2] for key, _ in index.search("electricity bill")] == ["t2", "t1"]
+    assert [key[2] for key, _ in index.search("elec")] == ["t2", "t1"]
+    assert [key[2] for key, _ in index.search("hdfc bill")] == ["t3"]
+    assert [key[2] for key, _ in index.search("utilities")] == ["t2", "t1"]  # same score, newest first
+    index.remove("t2")
+    index.add({"id": "t1", "date": "2025-01-05", "description": "Gas", "category_id": "c1"})
+    assert index.search("electricity") == []
+    assert "electricity" not in index.postings
+
+
+def test_search_endpoint_pages_and_tracks_writes(client, app, admin_headers):
+    category = client.post("/api/categories", json={"name": "Utilities", "type": "expense"},
+                           headers=admin_headers).json()
+    ids = []
+    for day in range(1, 6):
+        created = client.post("/api/transactions", headers=admin_headers, json={
+            "amount": 10 * day, "type": "expense", "category_id": category["id"],
+            "description": f"Electricity bill {day}", "date": f"2025-01-0{day}T09:00:00",
+        })
+        ids.append(created.json()["id"])
+
+    def search(**params):
+        response = client.get("/api/transactions/search", params=params, headers=admin_headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    first = search(q="electricity", limit=2)
+    assert first["total"] == 5
+    assert [r["description"] for r in first["results"]] == ["Electricity bill 5", "Electricity bill 4"]
+    seen = [r["id"] for r in first["results"]]
+    cursor = first["next_cursor"]
+    while cursor:
+        page = search(q="electricity", limit=2, cursor=cursor)
+        seen += [r["id"] for r in page["results"]]
+        cursor = page["next_cursor"]
+    assert seen == ids[::-1]
+
+    # Writes are applied to the built index without rebuilding it
+    client.delete(f"/api/transactions/{ids[0]}", headers=admin_headers)
+    client.put(f"/api/transactions/{ids[1]}", headers=admin_headers, json={
+        "amount": 20, "type": "expense", "category_id": category["id"], "description": "Internet",
+        "date": "2025-01-02T09:00:00",
+    })
+    assert search(q="electricity")["total"] == 3
+    assert [r["id"] for r in search(q="internet utilities")["results"]] == [ids[1]]
+    assert app.state.search.builds == 1
+    assert client.get("/api/transactions/search", params={"q": "bill", "cursor": "nope"},
+                      headers=admin_headers).status_code == 400
+
+
+def test_new_account_names_are_searchable(client, admin_headers):
+    food = client.post("/api/categories", json={"name": "Food", "type": "expense"}, headers=admin_headers).json()
+    assert client.get("/api/transactions/search", params={"q": "zeta"}, headers=admin_headers).json()["total"] == 0
+    account = client.post("/api/accounts", json={"name": "Zeta Bank", "type": "bank"}, headers=admin_headers).json()
+    client.post("/api/transactions", headers=admin_headers, json={
+        "amount": 15, "type": "expense", "category_id": food["id"], "account_id": account["id"],
+        "date": "2025-01-03T09:00:00",
+    })
+    found = client.get("/api/transactions/search", params={"q": "zeta"}, headers=admin_headers).json()
+    assert found["total"] == 1
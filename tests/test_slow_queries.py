@@ -0,0 +1,37 @@
+"""Slow-query log."""
+import time
+
+from slow_queries import SlowQueryLog, query_shape, summarize_plan
+
+
+def test_summarize_mongo_explain():
+    explain = {
+        "queryPlanner": {"winningPlan": {"stage": "COLLSCAN", "filter": {}}},
+        "executionStats": {"nReturned": 12, "totalDocsExamined": 5000, "totalKeysExamined": 0},
+    }
+    assert summarize_plan(explain) == {
+        "plan": "COLLSCAN", "collscan": True, "docs_examined": 5000, "keys_examined": 0, "n_returned": 12,
+    }
+    assert query_shape({"family_id": "f1", "date": {"$gte": "2025"}}) == {"date": {"$gte": 1}, "family_id": 1}
+
+
+def test_slow_reads_logged_with_route_and_plan(app, admin_headers, client, caplog):
+    slow_queries = app.state.slow_queries
+    slow_queries.threshold = 0
+    client.get("/api/categories", headers=admin_headers)
+
+    deadline = time.time() + 2
+    while time.time() < deadline and not any(e["plan"] for e in slow_queries.recent):
+        time.sleep(0.01)
+    entry = next(e for e in slow_queries.recent if e["collection"] == "categories")
+    assert entry["route"] == "GET /api/categories"
+    assert entry["filter"]["family_id"]
+    assert entry["plan"]["plan"] == "FETCH <- IXSCAN family_id"
+    assert not entry["plan"]["collscan"]
+    assert "Slow find on categories" in caplog.text
+
+
+def test_from_env():
+    log = SlowQueryLog.from_env({"SLOW_QUERY_MS": "250", "SLOW_QUERY_EXPLAIN": "false"})
+    assert log.threshold == 0.25
+    assert log.explain is False
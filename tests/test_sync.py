@@ -0,0 +1,106 @@
+"""Change log and delta sync endpoint."""
+import asyncio
+from datetime import datetime, timedelta
+
+from monitoring import subscribe, unsubscribe
+from sync import ChangeFeed, cursor
+
+
+def test_change_log_keeps_latest_change_and_compacts(repos):
+    async def scenario():
+        await repos.changes.record("f1", [("transactions", "t1", {"id": "t1", "amount": 1})])
+        await repos.changes.record("f1", [("transactions", "t2", {"id": "t2"}), ("transactions", "t1", None)])
+        assert [(c["doc_id"], c["seq"], c["deleted"]) for c in await repos.changes.since("f1", 0)] == [
+            ("t2", 2, False), ("t1", 3, True)
+        ]
+        assert await repos.changes.compact(datetime.utcnow() - timedelta(days=1)) == 0
+        assert await repos.changes.compact(datetime.utcnow() + timedelta(seconds=1)) == 1
+        return await repos.changes.state("f1"), await repos.changes.since("f1", 0)
+
+    state, remaining = asyncio.run(scenario())
+    assert state == {"seq": 3, "horizon": 3}
+    assert [c["doc_id"] for c in remaining] == ["t2"]
+
+
+def test_cursor_stops_before_an_in_flight_change(repos):
+    async def scenario():
+        await repos.changes.record("f1", [("transactions", "t1", {"id": "t1"})])
+        # A concurrent record took seq 2 and has not written its entry yet
+        counter = repos.changes.counters.find_one(family_id="f1")
+        repos.changes.counters.increment(counter["id"], "seq", 1)
+        await repos.changes.record("f1", [("transactions", "t3", {"id": "t3"})])
+        read = await repos.changes.since("f1", 0)
+        assert [c["seq"] for c in read] == [1, 3]
+        held = cursor(read, 0)
+        # With no settle window configured, an in-flight gap is not waited for
+        assert ChangeFeed.from_env({"SYNC_SETTLE_SECONDS": "0"}).cursor(read, 0) == 3
+        # Once settled, the gap is taken for an entry that moved forward
+        later = cursor(read, 0, now=datetime.utcnow() + timedelta(minutes=1))
+        repos.changes.table.upsert(
+            {"family_id": "f1", "collection": "transactions", "doc_id": "t2"},
+            {"seq": 2, "deleted": False, "doc": {"id": "t2"}, "at": datetime.utcnow().isoformat()}
+        )
+        after = await repos.changes.since("f1", held)
+        return held, later, [c["doc_id"] for c in after], cursor(after, held)
+
+    assert asyncio.run(scenario()) == (1, 3, ["t2", "t3"], 3)
+
+
+def test_sync_endpoint(client, app, admin_headers):
+    category = client.post("/api/categories", json={"name": "Food", "type": "expense"},
+                           headers=admin_headers).json()
+    account = client.post("/api/accounts", json={"name": "Wallet", "type": "cash", "opening_balance": 100},
+                          headers=admin_headers).json()
+    full = client.get("/api/sync", headers=admin_headers).json()
+    assert full["reset"] is True
+    assert [c["id"] for c in full["categories"]["upserted"]] == [category["id"]]
+    seq = full["seq"]
+
+    created = client.post("/api/transactions", headers=admin_headers, json={
+        "amount": 30, "type": "expense", "category_id": category["id"], "account_id": account["id"],
+        "date": "2025-01-05T09:00:00",
+    }).json()
+    response = client.get("/api/sync", params={"since": seq}, headers=admin_headers)
+    delta = response.json()
+    assert delta["reset"] is False
+    assert [t["id"] for t in delta["transactions"]["upserted"]] == [created["id"]]
+    assert delta["accounts"]["upserted"][0]["current_balance"] == 70
+    assert delta["categories"] == {"upserted": [], "deleted": []}
+    assert len(response.content) < 1000
+
+    client.delete(f"/api/transactions/{created['id']}", headers=admin_headers)
+    delta = client.get("/api/sync", params={"since": delta["seq"]}, headers=admin_headers).json()
+    assert delta["transactions"] == {"upserted": [], "deleted": [created["id"]]}
+    assert client.get("/api/sync", params={"since": delta["seq"]}, headers=admin_headers).json()["transactions"] == {
+        "upserted": [], "deleted": []
+    }
+
+    # Once the tombstone is compacted away, an older cursor gets a full snapshot
+    assert client.portal.call(app.state.change_log_compactor.run_once, datetime.utcnow() + timedelta(days=31)) == 1
+    assert client.get("/api/sync", params={"since": seq}, headers=admin_headers).json()["reset"] is True
+
+
+def test_account_snapshots_are_read_once_per_flush(repos):
+    from balances import apply_journaled, journal
+
+    commands = []
+    listener = subscribe(lambda event: commands.append((event.collection, event.command)))
+
+    async def scenario():
+        for account_id in ("a1", "a2"):
+            await repos.accounts.insert({"id": account_id, "family_id": "fam", "current_balance": 0.0})
+        await repos.accounts.insert({"id": "other", "family_id": "fam-2", "current_balance": 0.0})
+        doc = {"id": "t1", "family_id": "fam", "type": "transfer", "amount": 30.0, "account_id": "a1",
+               "to_account_id": "a2", "date": "2025-01-01T00:00:00", "created_at": "2025-01-01T00:00:00"}
+        journal([doc], doc["id"])
+        await repos.transactions.insert(doc)
+        commands.clear()
+        await apply_journaled(repos, doc["id"], [doc])
+        return await repos.changes.since("fam", 0)
+
+    try:
+        changes = asyncio.run(scenario())
+    finally:
+        unsubscribe(listener)
+    assert commands.count(("accounts", "find")) == 1
+    assert {c["doc_id"] for c in changes if c["collection"] == "accounts"} == {"a1", "a2"}